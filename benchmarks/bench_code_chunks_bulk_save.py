@@ -0,0 +1,72 @@
+"""
+Compares the two write paths of TortoiseCodeChunksStore:
+  - bulk_save:      Tortoise models + bulk_create (multi-row INSERTs)
+  - bulk_copy_save: binary COPY (copy_records_to_table)
+Both send the float32 np.ndarray embeddings through the pgvector binary codec, without a round trip
+through Python lists or the text format, so the difference is INSERT vs COPY.
+
+Usage:
+    DEVDOX_BENCH_DB_URL=postgres://... python -m benchmarks.bench_code_chunks_bulk_save [sizes...]
+
+sizes default to 10000 100000 1000000, chunks are produced and written in batches of --batch-size.
+"""
+
+import argparse
+import asyncio
+
+from benchmarks.common import (
+    Stopwatch,
+    bench_database,
+    iter_chunk_batches,
+    print_table,
+    truncate_code_chunks,
+)
+from models_src.repositories.code_chunks import TortoiseCodeChunksStore
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+
+async def time_path(store: TortoiseCodeChunksStore, path: str, total: int, batch_size: int) -> float:
+    await truncate_code_chunks()
+
+    stopwatch = Stopwatch()
+    for batch in iter_chunk_batches(total, batch_size):
+        with stopwatch:
+            await getattr(store, path)(batch)
+
+    return stopwatch.elapsed
+
+
+async def main(sizes, batch_size: int) -> None:
+    store = TortoiseCodeChunksStore()
+    rows = []
+
+    async with bench_database():
+        for total in sizes:
+            insert_s = await time_path(store, "bulk_save", total, batch_size)
+            copy_s = await time_path(store, "bulk_copy_save", total, batch_size)
+            rows.append(
+                (
+                    f"{total:,}",
+                    f"{insert_s:.2f}",
+                    f"{total / insert_s:,.0f}",
+                    f"{copy_s:.2f}",
+                    f"{total / copy_s:,.0f}",
+                    f"{insert_s / copy_s:.1f}x",
+                )
+            )
+        await truncate_code_chunks()
+
+    print_table(
+        ("chunks", "bulk_save s", "rows/s", "bulk_copy_save s", "rows/s", "speedup"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", nargs="*", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.sizes, args.batch_size))
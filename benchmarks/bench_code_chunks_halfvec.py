@@ -0,0 +1,134 @@
+"""
+Compares the vector (float32) and halfvec (float16) storage modes of code_chunks.embedding:
+table + HNSW index size, and recall@k of the index-served search against the exact float32 top-k.
+
+Steps: load --rows chunks as vector(768), take the exact top-k of --queries random queries as ground
+truth, build the HNSW index and measure, then migrate the rows with
+convert_code_chunks_embedding_storage(HALFVEC) and measure again. The scratch table is converted
+back to vector and truncated at the end.
+
+Usage:
+    DEVDOX_BENCH_DB_URL=postgres://... python -m benchmarks.bench_code_chunks_halfvec [--rows N]
+"""
+
+import argparse
+import asyncio
+
+from tortoise import connections
+
+from benchmarks.common import (
+    Stopwatch,
+    bench_database,
+    iter_chunk_batches,
+    print_table,
+    random_embeddings,
+    truncate_code_chunks,
+)
+from models_src.dto.code_chunks import ChunkSearchStrategy, CodeChunksSearchOptions
+from models_src.models.custom_indexes import (
+    EmbeddingStorage,
+    VectorIndexMethod,
+    code_chunks_embedding_hnsw_idx,
+    convert_code_chunks_embedding_storage,
+    create_code_chunks_embedding_index,
+    drop_code_chunks_embedding_index,
+)
+from models_src.repositories.code_chunks import (
+    TortoiseCodeChunksStore,
+    TortoiseHalfVecCodeChunksStore,
+)
+
+USER_ID = "bench-user"
+REPO_ID = "bench-repo"
+
+
+async def relation_sizes() -> tuple[int, int]:
+    rows = await connections.get("default").execute_query_dict(
+        "SELECT pg_table_size('public.code_chunks') AS table_bytes, "
+        f"pg_relation_size('public.{code_chunks_embedding_hnsw_idx}') AS index_bytes"
+    )
+    return rows[0]["table_bytes"], rows[0]["index_bytes"]
+
+
+async def top_k_ids(store, queries, k: int, options: CodeChunksSearchOptions) -> list[set]:
+    results = []
+    for query in queries:
+        rows = await store.get_user_repo_chunks_multi(
+            user_id=USER_ID,
+            repo_id=REPO_ID,
+            query_embeddings=[query.tolist()],
+            emb_dim=len(query),
+            limit=k,
+            options=options,
+        )
+        results.append({row["id"] for row in rows})
+    return results
+
+
+async def measure(store, queries, truth, k: int, ef_search: int) -> tuple[int, int, float, float]:
+    options = CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, ef_search=ef_search)
+    stopwatch = Stopwatch()
+    with stopwatch:
+        found = await top_k_ids(store, queries, k, options)
+    recall = sum(len(f & t) for f, t in zip(found, truth)) / sum(len(t) for t in truth)
+    table_bytes, index_bytes = await relation_sizes()
+    return table_bytes, index_bytes, recall, stopwatch.elapsed * 1000 / len(queries)
+
+
+async def main(total: int, n_queries: int, k: int, ef_search: int, batch_size: int) -> None:
+    vector_store = TortoiseCodeChunksStore()
+    halfvec_store = TortoiseHalfVecCodeChunksStore()
+    queries = random_embeddings(n_queries, seed=1_000_000)
+    rows = []
+
+    async with bench_database():
+        await convert_code_chunks_embedding_storage(EmbeddingStorage.VECTOR)
+        await drop_code_chunks_embedding_index(VectorIndexMethod.HNSW, concurrently=False)
+        await truncate_code_chunks()
+        try:
+            for batch in iter_chunk_batches(total, batch_size, user_id=USER_ID, repo_id=REPO_ID):
+                await vector_store.bulk_copy_save(batch)
+
+            exact = CodeChunksSearchOptions(strategy=ChunkSearchStrategy.EXACT)
+            truth = await top_k_ids(vector_store, queries, k, exact)
+
+            with Stopwatch() as build:
+                await create_code_chunks_embedding_index(VectorIndexMethod.HNSW, concurrently=False)
+            rows.append(("vector", "-", f"{build.elapsed:.1f}", await measure(vector_store, queries, truth, k, ef_search)))
+
+            with Stopwatch() as migrate:
+                await convert_code_chunks_embedding_storage(EmbeddingStorage.HALFVEC)
+            rows.append(("halfvec", f"{migrate.elapsed:.1f}", "-", await measure(halfvec_store, queries, truth, k, ef_search)))
+        finally:
+            await truncate_code_chunks()
+            await convert_code_chunks_embedding_storage(EmbeddingStorage.VECTOR)
+
+    base_total = rows[0][3][0] + rows[0][3][1]
+    print_table(
+        ("storage", "migrate s", "index build s", "table MB", "index MB", "saved", f"recall@{k}", "ms/query"),
+        [
+            (
+                storage,
+                migrate_s,
+                build_s,
+                f"{table_bytes / 2**20:,.1f}",
+                f"{index_bytes / 2**20:,.1f}",
+                f"{1 - (table_bytes + index_bytes) / base_total:.0%}",
+                f"{recall:.4f}",
+                f"{ms:.2f}",
+            )
+            for storage, migrate_s, build_s, (table_bytes, index_bytes, recall, ms) in rows
+        ],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.queries, args.k, args.ef_search, args.batch_size))
@@ -0,0 +1,151 @@
+"""
+Compares the layouts of code_chunks at scale: one table, HASH partitions and LIST (per repo)
+partitions on repo_id, see models_src.models.partitioning.
+
+For each layout the table is recreated empty and migrated to the layout (LIST also gets one
+partition per repo), --rows chunks spread over --repos repos are loaded with bulk_copy_save, then
+the HNSW index is built (cascading to every partition). Measured: load and index build time, the
+latency of the index-served search of one repo, and the time to delete one repo.
+
+The default of 100M rows needs a few hundred GB of disk, start with --rows 1000000.
+
+Usage:
+    DEVDOX_BENCH_DB_URL=postgres://... python -m benchmarks.bench_code_chunks_partitioning [--rows N] [--repos N]
+"""
+
+import argparse
+import asyncio
+import statistics
+
+from tortoise import Tortoise, connections
+
+from benchmarks.common import (
+    Stopwatch,
+    bench_database,
+    iter_chunk_batches,
+    print_table,
+    random_embeddings,
+)
+from models_src.dto.code_chunks import ChunkSearchStrategy, CodeChunksSearchOptions
+from models_src.models.custom_indexes import (
+    VectorIndexMethod,
+    create_code_chunks_embedding_index,
+    drop_code_chunks_embedding_index,
+)
+from models_src.models.partitioning import (
+    CodeChunksPartitioning,
+    code_chunks_unpartitioned_table,
+    create_code_chunks_repo_partition,
+    migrate_code_chunks_to_partitioned,
+)
+from models_src.repositories.code_chunks import TortoiseCodeChunksStore
+
+USER_ID = "bench-user"
+LAYOUTS = ("none", CodeChunksPartitioning.HASH.value, CodeChunksPartitioning.LIST.value)
+
+
+def repo_id(index: int) -> str:
+    return f"bench-repo-{index}"
+
+
+async def reset_table() -> None:
+    await connections.get("default").execute_script(
+        "DROP TABLE IF EXISTS public.code_chunks CASCADE;\n"
+        f"DROP TABLE IF EXISTS public.{code_chunks_unpartitioned_table};"
+    )
+    await Tortoise.generate_schemas(safe=True)
+
+
+async def prepare_layout(layout: str, repos: int, partitions: int) -> TortoiseCodeChunksStore:
+    await reset_table()
+
+    store = TortoiseCodeChunksStore()
+    if layout != "none":
+        partitioning = CodeChunksPartitioning(layout)
+        await migrate_code_chunks_to_partitioned(partitioning, partitions=partitions, drop_unpartitioned=True)
+        if partitioning == CodeChunksPartitioning.LIST:
+            for index in range(repos):
+                await create_code_chunks_repo_partition(repo_id(index))
+        store.partitioning = partitioning
+
+    # built once the rows are in, see load()
+    await drop_code_chunks_embedding_index(VectorIndexMethod.HNSW, concurrently=False)
+    return store
+
+
+async def load(store: TortoiseCodeChunksStore, total: int, repos: int, batch_size: int) -> None:
+    per_repo = max(1, total // repos)
+    for index in range(repos):
+        for batch in iter_chunk_batches(
+            per_repo, batch_size, user_id=USER_ID, repo_id=repo_id(index), seed=index * 1_000_000
+        ):
+            await store.bulk_copy_save(batch)
+
+
+async def search_latencies_ms(store: TortoiseCodeChunksStore, repos: int, n_queries: int, k: int) -> list:
+    options = CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, iterative_scan="relaxed_order")
+    latencies = []
+    for i, query in enumerate(random_embeddings(n_queries, seed=7)):
+        stopwatch = Stopwatch()
+        with stopwatch:
+            await store.get_user_repo_chunks_multi(
+                user_id=USER_ID,
+                repo_id=repo_id(i % repos),
+                query_embeddings=[query.tolist()],
+                emb_dim=len(query),
+                limit=k,
+                options=options,
+            )
+        latencies.append(stopwatch.elapsed * 1000)
+    return latencies
+
+
+async def main(total: int, repos: int, partitions: int, n_queries: int, k: int, batch_size: int) -> None:
+    rows = []
+
+    async with bench_database():
+        try:
+            for layout in LAYOUTS:
+                store = await prepare_layout(layout, repos, partitions)
+
+                with Stopwatch() as load_time:
+                    await load(store, total, repos, batch_size)
+                with Stopwatch() as build_time:
+                    await create_code_chunks_embedding_index(VectorIndexMethod.HNSW, concurrently=False)
+
+                latencies = await search_latencies_ms(store, repos, n_queries, k)
+
+                with Stopwatch() as delete_time:
+                    deleted = await store.delete_all_by_repo_id(repo_id(0))
+
+                rows.append(
+                    (
+                        layout,
+                        f"{load_time.elapsed:,.0f}",
+                        f"{build_time.elapsed:,.0f}",
+                        f"{statistics.median(latencies):.2f}",
+                        f"{statistics.quantiles(latencies, n=100)[98]:.2f}",
+                        f"{deleted:,}",
+                        f"{delete_time.elapsed:.2f}",
+                    )
+                )
+        finally:
+            await reset_table()
+
+    print_table(
+        ("layout", "load s", "index build s", "p50 ms", "p99 ms", "repo rows", "repo delete s"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    parser.add_argument("--repos", type=int, default=1000)
+    parser.add_argument("--partitions", type=int, default=32, help="HASH layout only")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.repos, args.partitions, args.queries, args.k, args.batch_size))
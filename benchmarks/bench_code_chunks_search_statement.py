@@ -0,0 +1,107 @@
+"""
+Measures what the fixed-shape search statement saves: the parse and plan paid by every search when
+the connection has no prepared statement for it.
+
+Steps: load --rows chunks in one repo, then run --searches get_user_repo_chunks_multi statements on
+one pooled connection, with a number of query vectors cycling through 1..--max-vectors:
+- "re-prepared": the codecs are registered before every search, as PgVectorConnection used to do on
+  every acquire, which empties asyncpg's statement cache so each search is parsed and planned again;
+- "prepared once": the codecs stay registered, every search hits the statement prepared on the
+  first call, whatever its number of query vectors.
+The server side planning time of one search (EXPLAIN ANALYZE) is printed as well.
+
+Usage:
+    DEVDOX_BENCH_DB_URL=postgres://... python -m benchmarks.bench_code_chunks_search_statement [--rows N]
+"""
+
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import (
+    EMBED_DIM,
+    Stopwatch,
+    bench_database,
+    iter_chunk_batches,
+    print_table,
+    random_embeddings,
+    truncate_code_chunks,
+)
+from models_src.dto.code_chunks import ChunkSearchStrategy, CodeChunksSearchOptions
+from models_src.models.db import PgVectorConnection, ensure_vector_codecs, register_vector_codecs
+from models_src.repositories.code_chunks import TortoiseCodeChunksStore
+
+USER_ID = "bench-user"
+REPO_ID = "bench-repo"
+
+
+def search_statements(store, n_searches: int, max_vectors: int, options: CodeChunksSearchOptions) -> list:
+    queries = random_embeddings(n_searches * max_vectors, seed=1_000_000)
+    statements = []
+    for i in range(n_searches):
+        n = i % max_vectors + 1
+        vectors = [q.tolist() for q in queries[i * max_vectors : i * max_vectors + n]]
+        sql, params, _, _ = store._prepare_repo_search(USER_ID, REPO_ID, vectors, EMBED_DIM, 10, options)
+        statements.append((sql, params))
+    return statements
+
+
+async def run(conn, statements: list, reregister: bool) -> float:
+    stopwatch = Stopwatch()
+    for sql, params in statements:
+        with stopwatch:
+            if reregister:
+                await register_vector_codecs(conn)
+            else:
+                await ensure_vector_codecs(conn)
+            await conn.fetch(sql, *params)
+    return stopwatch.elapsed * 1000 / len(statements)
+
+
+async def planning_ms(conn, sql: str, params: list) -> float:
+    plan = await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql.rstrip().rstrip(';')}", *params)
+    return json.loads(plan)[0]["Planning Time"]
+
+
+async def main(total: int, n_searches: int, max_vectors: int, batch_size: int) -> None:
+    store = TortoiseCodeChunksStore()
+    rows = []
+
+    async with bench_database():
+        await truncate_code_chunks()
+        try:
+            for batch in iter_chunk_batches(total, batch_size, user_id=USER_ID, repo_id=REPO_ID):
+                await store.bulk_copy_save(batch)
+
+            async with PgVectorConnection() as conn:
+                for strategy in (ChunkSearchStrategy.EXACT, ChunkSearchStrategy.CANDIDATES):
+                    statements = search_statements(
+                        store, n_searches, max_vectors, CodeChunksSearchOptions(strategy=strategy)
+                    )
+                    # warm up the buffers, then once per mode
+                    await run(conn, statements[:max_vectors], reregister=False)
+                    before = await run(conn, statements, reregister=True)
+                    after = await run(conn, statements, reregister=False)
+                    planning = await planning_ms(conn, *statements[-1])
+                    rows.append((strategy.value, before, after, planning))
+        finally:
+            await truncate_code_chunks()
+
+    print_table(
+        ("strategy", "re-prepared ms/search", "prepared once ms/search", "saved", "planning ms (EXPLAIN)"),
+        [
+            (strategy, f"{before:.2f}", f"{after:.2f}", f"{1 - after / before:.0%}", f"{planning:.2f}")
+            for strategy, before, after, planning in rows
+        ],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--max-vectors", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.searches, args.max_vectors, args.batch_size))
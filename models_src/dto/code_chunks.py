@@ -1,7 +1,11 @@
 import dataclasses
 import datetime
+import hashlib
 import uuid
-from typing import Any, Optional
+from enum import Enum
+from typing import Any, List, Optional, Set
+
+import numpy as np
 
 
 @dataclasses.dataclass
@@ -14,13 +18,16 @@ class CodeChunksResponseDTO:
     user_id: Optional[str] = None
     repo_id: Optional[str] = None
     content: Optional[str] = None
+    content_hash: Optional[str] = None
     file_name: Optional[str] = None
     file_path: Optional[str] = None
     file_size: Optional[int] = None
     commit_number: Optional[str] = None
+    # np.ndarray (float32) when read from the database, test with `is not None`
     embedding: Optional[Any] = None
     metadata: Optional[dict] = None
     created_at: Optional[datetime.datetime] = None
+    chunk_ordinal: Optional[int] = None
 
 
 @dataclasses.dataclass
@@ -44,3 +51,268 @@ class CodeChunksRequestDTO:
 
     embedding: Optional[Any] = None
     metadata: dict = dataclasses.field(default_factory=dict)
+    # Filled from content (see compute_content_hash) when left empty
+    content_hash: Optional[str] = None
+    # Position of the chunk inside its file, lets get_repo_file_content reassemble the file
+    chunk_ordinal: Optional[int] = None
+
+
+def compute_content_hash(content: str) -> str:
+    """Key under which identical chunk contents share one embedding, across chunks, commits and repos."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def quantize_embedding(embedding: Any) -> bytes:
+    """
+    Binary quantization of an embedding: 1 bit per dimension (1 when > 0, like pgvector's
+    binary_quantize), packed most significant bit first, which is the layout of PostgreSQL's bit(n).
+    """
+    if len(embedding) % 8:
+        raise ValueError("embedding dimensions must be a multiple of 8 to be bit packed")
+    return np.packbits(np.asarray(embedding) > 0).tobytes()
+
+
+def hamming_distance(a: bytes, b: bytes) -> int:
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).bit_count()
+
+
+@dataclasses.dataclass
+class EmbeddingReuseStats:
+    """Counters of the content hash embedding lookups, to measure the embedding calls saved."""
+
+    lookups: int = 0
+    requested: int = 0
+    hits: int = 0
+
+    @property
+    def misses(self) -> int:
+        return self.requested - self.hits
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.requested if self.requested else 0.0
+
+    def record(self, requested: int, hits: int) -> None:
+        self.lookups += 1
+        self.requested += requested
+        self.hits += hits
+
+    def reset(self) -> None:
+        self.lookups = self.requested = self.hits = 0
+
+
+@dataclasses.dataclass
+class SearchCacheStats:
+    """Counters of the search result cache of CachedCodeChunksStore."""
+
+    hits: int = 0
+    misses: int = 0
+    # entries dropped to respect the maximum size (LRU) / because their TTL ran out
+    evictions: int = 0
+    expirations: int = 0
+    # entries dropped because their repo got written to
+    invalidations: int = 0
+    # results not cached because their repo got written to while the search ran
+    stale_fills: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def reset(self) -> None:
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        self.stale_fills = 0
+
+
+@dataclasses.dataclass
+class SimilarityPruningStats:
+    """Counters of the searches run with a min_similarity threshold, to tune it."""
+
+    searches: int = 0
+    # (chunk, query vector) similarities computed, and dropped by the threshold before the fusion
+    scored: int = 0
+    pruned: int = 0
+
+    @property
+    def prune_rate(self) -> float:
+        return self.pruned / self.scored if self.scored else 0.0
+
+    def record(self, scored: int, pruned: int) -> None:
+        self.searches += 1
+        self.scored += scored
+        self.pruned += pruned
+
+    def reset(self) -> None:
+        self.searches = self.scored = self.pruned = 0
+
+
+@dataclasses.dataclass
+class CodeChunksStatsDTO:
+    """
+    Counters of the chunks of a repo, or of the chunks of a repo written for `commit_number`.
+    file_count counts distinct file paths.
+    """
+
+    repo_id: Optional[str] = None
+    commit_number: Optional[str] = None
+    chunk_count: int = 0
+    embedded_count: int = 0
+    content_bytes: int = 0
+    file_count: int = 0
+    updated_at: Optional[datetime.datetime] = None
+
+
+@dataclasses.dataclass
+class CodeChunksPurgeProgressDTO:
+    """
+    Progress of ICodeChunksStore.purge_repo_chunks, reported after every batch. total_estimate is
+    the chunk count of the repo stats when the purge started (None without stats).
+    """
+
+    repo_id: str
+    deleted_count: int = 0
+    batches: int = 0
+    total_estimate: Optional[int] = None
+    done: bool = False
+
+
+@dataclasses.dataclass
+class CodeChunksIngestionProgressDTO:
+    """Chunks written so far by a CodeChunksIngestionPipeline run, bytes as estimated for batching."""
+
+    rows: int = 0
+    embeddings: int = 0
+    files: int = 0
+    bytes: int = 0
+    batches: int = 0
+    done: bool = False
+
+
+@dataclasses.dataclass
+class CodeChunksFileDiffRequestDTO:
+    """
+    Files touched between the indexed commit and `commit_number`, plus the freshly chunked content
+    of the changed and added files. Files outside the three sets are left untouched.
+    """
+
+    user_id: str
+    repo_id: str
+    commit_number: str
+
+    changed_file_paths: Set[str] = dataclasses.field(default_factory=set)
+    added_file_paths: Set[str] = dataclasses.field(default_factory=set)
+    deleted_file_paths: Set[str] = dataclasses.field(default_factory=set)
+
+    # chunks of the changed + added files at commit_number
+    chunks: List[CodeChunksRequestDTO] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class CodeChunksFileDiffResponseDTO:
+    deleted_count: int = 0
+    saved: List[CodeChunksResponseDTO] = dataclasses.field(default_factory=list)
+
+
+class ChunkSearchStrategy(str, Enum):
+    # Scores every chunk of the repo against every query vector, exact but linear in repo size
+    EXACT = "exact"
+    # Index-served top-K per query vector, only the candidate sets get fused
+    CANDIDATES = "candidates"
+    # Like CANDIDATES, but the top-K per query vector is taken by exact cosine re-ranking of the
+    # top (K * oversampling) chunks by Hamming distance over the bit quantized embeddings
+    BINARY = "binary"
+
+
+class ChunkFusion(str, Enum):
+    SUM = "sum"
+    MAX = "max"
+    # Reciprocal rank fusion: SUM(1 / (rrf_k + rank of the chunk within each query's candidates))
+    RRF = "rrf"
+
+
+class ChunkProjection(str, Enum):
+    """
+    Columns of the search result rows, on top of id, created_at, fusion_score and max_sim (and
+    repo_id for the multi repo search). IDS/METADATA keep the chunk bodies off the wire, fetch
+    them afterwards for the hits actually used with ICodeChunksStore.fetch_contents_by_ids.
+    """
+
+    IDS = "ids"
+    METADATA = "metadata"
+    CONTENT = "content"
+
+
+SEARCH_PROJECTION_COLUMNS = {
+    ChunkProjection.IDS: (),
+    ChunkProjection.METADATA: ("file_name", "file_path", "metadata"),
+    ChunkProjection.CONTENT: ("file_name", "file_path", "content"),
+}
+
+
+class FileLookupMode(str, Enum):
+    """
+    How get_repo_file_chunks matches file_name (case insensitive). CONTAINS is the historical
+    unindexed substring filter, the other modes are served by the indexes of
+    create_code_chunks_file_lookup_indexes and return the chunks in source order.
+    """
+
+    CONTAINS = "contains"
+    EXACT = "exact"
+    PREFIX = "prefix"
+    # substring match through the pg_trgm index, selective from 3 characters on
+    TRIGRAM = "trigram"
+
+
+@dataclasses.dataclass(frozen=True)
+class CodeChunksSearchOptions:
+    """
+    Per-call tuning knobs of the chunk similarity search, they let callers trade recall for latency
+    on each request. Knobs left as None keep the database/session defaults.
+    """
+
+    # hnsw.ef_search: size of the candidate list of an HNSW index scan (pgvector default 40, max 1000)
+    ef_search: Optional[int] = None
+    # ivfflat.probes: number of inverted lists visited by an IVFFLAT index scan (pgvector default 1)
+    probes: Optional[int] = None
+    # hnsw.iterative_scan (pgvector >= 0.8): "off", "strict_order" or "relaxed_order", keeps scanning
+    # the index until enough rows pass the user/repo filter
+    iterative_scan: Optional[str] = None
+
+    strategy: ChunkSearchStrategy = ChunkSearchStrategy.EXACT
+    # EXACT only supports SUM
+    fusion: ChunkFusion = ChunkFusion.SUM
+    # CANDIDATES/BINARY: top-K taken per query vector, defaults to max(limit * 4, 40)
+    candidates_per_query: Optional[int] = None
+    rrf_k: int = 60
+    # BINARY: rows picked by the Hamming prefilter per query vector = candidates_per_query * oversampling
+    oversampling: int = 10
+
+    projection: ChunkProjection = ChunkProjection.CONTENT
+
+    # MMR diversification (see repositories/code_chunks_mmr.py), off while both are None.
+    # mmr_lambda: 1 ranks by relevance only, 0 by novelty only (0.5 to 0.7 is usual)
+    mmr_lambda: Optional[float] = None
+    # at most this many rows per file_path
+    max_chunks_per_file: Optional[int] = None
+    # candidates over-fetched (with their embeddings) to diversify from, defaults to max(limit * 4, 40)
+    mmr_pool_size: Optional[int] = None
+
+    # cosine similarity under which a (chunk, query vector) match is dropped before the fusion,
+    # between -1 and 1. CANDIDATES/BINARY apply it to the top-K of each query vector.
+    min_similarity: Optional[float] = None
+
+    # keyset pagination (see repositories/code_chunks_cursor.py): cursor of the last row of the
+    # previous page, the search returns the rows ranked after it
+    after: Optional[str] = None
+
+
+@dataclasses.dataclass
+class CodeChunksSearchRequestDTO:
+    """One get_user_repo_chunks_multi call, for the batched search of ICodeChunksStore."""
+
+    user_id: str
+    repo_id: str
+    query_embeddings: List[List[float]]
+    limit: int = 10
+    options: Optional[CodeChunksSearchOptions] = None
@@ -33,6 +33,7 @@ class RepoResponseDTO:
     relative_path: Optional[str] = None
     total_files: Optional[int] = None
     total_chunks: Optional[int] = None
+    total_embeddings: Optional[int] = None
     processing_start_time: Optional[datetime.datetime] = None
     processing_end_time: Optional[datetime.datetime] = None
     error_message: Optional[str] = None
@@ -13,3 +13,6 @@ REPOSITORY_DOESNT_EXIST_MESSAGE = "Repository doesn't exist"
 
 REPO_ALREADY_EXISTS_TITLE = "REPO_ALREADY_EXISTS"
 REPO_ALREADY_EXISTS_MESSAGE = "Repo Already Exists"
+
+INVALID_FILE_DIFF_TITLE = "INVALID_FILE_DIFF"
+INVALID_FILE_DIFF_MESSAGE = "Code chunks file diff is inconsistent"
@@ -3,6 +3,8 @@ from enum import Enum
 
 from models_src.exceptions.base_exceptions import DevDoxModelsException
 from models_src.exceptions.exception_constants import (
+    INVALID_FILE_DIFF_MESSAGE,
+    INVALID_FILE_DIFF_TITLE,
     LABEL_ALREADY_EXISTS_MESSAGE,
     LABEL_ALREADY_EXISTS_TITLE,
     MISSING_API_KEY_USER_ID_LOG_MESSAGE,
@@ -65,3 +67,11 @@ class ApiKeysErrors(Enum):
         "error_type": MISSING_USER_ID_TITLE,
         "log_message": MISSING_API_KEY_USER_ID_LOG_MESSAGE,
     }
+
+
+class CodeChunksErrors(Enum):
+    INVALID_FILE_DIFF = {
+        "error_type": INVALID_FILE_DIFF_TITLE,
+        "log_message": INVALID_FILE_DIFF_MESSAGE,
+        "log_level": logging.ERROR,
+    }
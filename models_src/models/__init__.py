@@ -3,6 +3,11 @@ from .repo import Repo
 from .user import User
 from .api_key import APIKEY
 from .code_chunks import CodeChunks
+from .code_chunks_stats import (
+    CodeChunksCommitStats,
+    CodeChunksFileStats,
+    CodeChunksRepoStats,
+)
 from .queue_job_claim_registry import (
     QueueProcessingRegistry,
     QRegistryStat,
@@ -14,6 +19,9 @@ __all__ = [
     "User",
     "APIKEY",
     "CodeChunks",
+    "CodeChunksRepoStats",
+    "CodeChunksCommitStats",
+    "CodeChunksFileStats",
     "QueueProcessingRegistry",
     "QRegistryStat",
 ]
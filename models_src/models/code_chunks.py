@@ -1,7 +1,8 @@
 import uuid
 from tortoise.models import Model
 from tortoise import fields
-from tortoise_vector.field import VectorField
+
+from models_src.models.fields import BitVectorField, Float32VectorField
 
 
 class CodeChunks(Model):
@@ -17,8 +18,19 @@ class CodeChunks(Model):
         required=True, max_length=255, null=False, description="Repo identifier"
     )
     content = fields.TextField(required=True, null=False)
+    content_hash = fields.CharField(
+        max_length=64,
+        null=True,
+        db_index=True,
+        description="sha256 hex digest of content, used to reuse embeddings of identical chunks",
+    )
 
-    embedding = VectorField(vector_size=768, null=True)
+    embedding = Float32VectorField(vector_size=768, null=True)
+    embedding_bits = BitVectorField(
+        bit_size=768,
+        null=True,
+        description="Binary quantized embedding, Hamming prefilter of the BINARY search strategy",
+    )
 
     metadata = fields.JSONField(default=dict)
     file_name = fields.CharField(
@@ -31,6 +43,11 @@ class CodeChunks(Model):
         required=True,
     )
 
+    chunk_ordinal = fields.IntField(
+        null=True,
+        description="Position of the chunk inside its file (0 based), gives back the source order",
+    )
+
     commit_number = fields.CharField(
         description="Commit number of the repo",
         max_length=255,
@@ -0,0 +1,63 @@
+from tortoise import fields
+from tortoise.models import Model
+
+
+class CodeChunksRepoStats(Model):
+    """
+    Counters of the code chunks of a repo, maintained by the chunk store writes in the same
+    transaction as the chunks themselves. The three stats tables have to exist before any chunk
+    write, the writes fail without them.
+    """
+
+    id = fields.IntField(primary_key=True)
+    repo_id = fields.CharField(max_length=255, unique=True, description="Repo identifier")
+
+    chunk_count = fields.BigIntField(default=0, description="Chunks of the repo")
+    embedded_count = fields.BigIntField(default=0, description="Chunks having an embedding")
+    content_bytes = fields.BigIntField(default=0, description="UTF-8 size of the chunk contents")
+    file_count = fields.BigIntField(default=0, description="Distinct file paths having chunks")
+
+    updated_at = fields.DatetimeField(auto_now=True, description="Last counter update")
+
+    class Meta:
+        table = "code_chunks_repo_stats"
+        table_description = "Per repo counters of code_chunks"
+
+
+class CodeChunksCommitStats(Model):
+    """Counters of the code chunks of a repo written for one commit_number"""
+
+    id = fields.IntField(primary_key=True)
+    repo_id = fields.CharField(max_length=255, description="Repo identifier")
+    commit_number = fields.CharField(max_length=255, description="Commit number of the chunks")
+
+    chunk_count = fields.BigIntField(default=0)
+    embedded_count = fields.BigIntField(default=0)
+    content_bytes = fields.BigIntField(default=0)
+    file_count = fields.BigIntField(default=0)
+
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "code_chunks_commit_stats"
+        table_description = "Per repo and commit counters of code_chunks"
+        unique_together = (("repo_id", "commit_number"),)
+
+
+class CodeChunksFileStats(Model):
+    """
+    Chunk count per file path and commit, only there to keep the distinct file counts of
+    code_chunks_repo_stats and code_chunks_commit_stats exact under deletes
+    """
+
+    id = fields.IntField(primary_key=True)
+    repo_id = fields.CharField(max_length=255)
+    commit_number = fields.CharField(max_length=255)
+    file_path = fields.CharField(max_length=255)
+
+    chunk_count = fields.BigIntField(default=0)
+
+    class Meta:
+        table = "code_chunks_file_stats"
+        table_description = "Per file counters backing the distinct file counts of code_chunks"
+        unique_together = (("repo_id", "commit_number", "file_path"),)
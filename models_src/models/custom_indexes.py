@@ -0,0 +1,306 @@
+"""
+Raw SQL index definitions that Tortoise ORM cannot express through ``Meta.indexes``
+(access methods other than btree, operator classes, storage parameters, ...).
+
+These have to be applied manually, e.g. during migrations or system bootstrapping.
+"""
+
+from enum import Enum
+from typing import List
+
+from tortoise import connections
+
+
+class VectorIndexMethod(str, Enum):
+    HNSW = "hnsw"
+    IVFFLAT = "ivfflat"
+
+
+class EmbeddingStorage(str, Enum):
+    """Column type of code_chunks.embedding, halfvec stores 2 bytes per dimension instead of 4."""
+
+    VECTOR = "vector"
+    HALFVEC = "halfvec"
+
+
+CODE_CHUNKS_EMBEDDING_DIM = 768
+
+# Operator class serving the `<=>` (cosine distance) operator for each storage type
+EMBEDDING_COSINE_OPS = {
+    EmbeddingStorage.VECTOR: "vector_cosine_ops",
+    EmbeddingStorage.HALFVEC: "halfvec_cosine_ops",
+}
+
+
+# Names of the ANN indexes serving the `<=>` (cosine distance) operator on code_chunks.embedding
+code_chunks_embedding_hnsw_idx = "code_chunks_embedding_hnsw_idx"
+code_chunks_embedding_ivfflat_idx = "code_chunks_embedding_ivfflat_idx"
+
+CODE_CHUNKS_EMBEDDING_INDEX_NAMES = {
+    VectorIndexMethod.HNSW: code_chunks_embedding_hnsw_idx,
+    VectorIndexMethod.IVFFLAT: code_chunks_embedding_ivfflat_idx,
+}
+
+# Full text search over code_chunks.content. The 'simple' configuration lowercases but doesn't stem
+# or drop stop words, which keeps code identifiers intact. Queries must use the exact same
+# to_tsvector expression for the planner to pick the index.
+CODE_CHUNKS_TEXT_SEARCH_CONFIG = "simple"
+CODE_CHUNKS_CONTENT_TSVECTOR = f"to_tsvector('{CODE_CHUNKS_TEXT_SEARCH_CONFIG}', content)"
+code_chunks_content_tsv_idx = "code_chunks_content_tsv_idx"
+
+# File lookups of get_repo_file_chunks (EXACT/PREFIX on lower(file_name), TRIGRAM through pg_trgm)
+# and the ordered reads of get_repo_file_content, the chunks of a file come in chunk_ordinal order
+code_chunks_file_name_idx = "code_chunks_file_name_idx"
+code_chunks_file_name_trgm_idx = "code_chunks_file_name_trgm_idx"
+code_chunks_file_path_idx = "code_chunks_file_path_idx"
+
+# pgvector defaults
+DEFAULT_HNSW_M = 16
+DEFAULT_HNSW_EF_CONSTRUCTION = 64
+DEFAULT_IVFFLAT_LISTS = 100
+
+
+def code_chunks_embedding_index_sql(
+    method: VectorIndexMethod = VectorIndexMethod.HNSW,
+    *,
+    m: int = DEFAULT_HNSW_M,
+    ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+    lists: int = DEFAULT_IVFFLAT_LISTS,
+    concurrently: bool = True,
+    storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+) -> str:
+    """
+    Builds the CREATE INDEX statement for the vector index of code_chunks.embedding.
+
+    Args:
+        method: HNSW (better recall/latency, slower build) or IVFFLAT (fast build, needs
+            data in the table before creation and a rebuild once the data grows).
+        m: HNSW max connections per layer.
+        ef_construction: HNSW size of the dynamic candidate list used while building.
+        lists: IVFFLAT number of inverted lists, rows / 1000 is a good start for up to 1M rows.
+        concurrently: Build without blocking writes, can't be run inside a transaction.
+        storage: Current column type of code_chunks.embedding, picks the operator class.
+    """
+    method = VectorIndexMethod(method)
+    storage = EmbeddingStorage(storage)
+
+    if method == VectorIndexMethod.HNSW:
+        if m < 2 or ef_construction < 2 * m:
+            raise ValueError("HNSW requires m >= 2 and ef_construction >= 2 * m")
+        with_params = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    else:
+        if lists < 1:
+            raise ValueError("IVFFLAT requires lists >= 1")
+        with_params = f"lists = {int(lists)}"
+
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"{CODE_CHUNKS_EMBEDDING_INDEX_NAMES[method]} "
+        f"ON public.code_chunks USING {method.value} (embedding {EMBEDDING_COSINE_OPS[storage]}) "
+        f"WITH ({with_params});"
+    )
+
+
+def code_chunks_embedding_reindex_sql(
+    method: VectorIndexMethod = VectorIndexMethod.HNSW, *, concurrently: bool = True
+) -> str:
+    method = VectorIndexMethod(method)
+    return (
+        f"REINDEX INDEX {'CONCURRENTLY ' if concurrently else ''}"
+        f"public.{CODE_CHUNKS_EMBEDDING_INDEX_NAMES[method]};"
+    )
+
+
+def code_chunks_embedding_drop_index_sql(
+    method: VectorIndexMethod = VectorIndexMethod.HNSW, *, concurrently: bool = True
+) -> str:
+    method = VectorIndexMethod(method)
+    return (
+        f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS "
+        f"public.{CODE_CHUNKS_EMBEDDING_INDEX_NAMES[method]};"
+    )
+
+
+def code_chunks_embedding_storage_sql(
+    storage: EmbeddingStorage, *, dim: int = CODE_CHUNKS_EMBEDDING_DIM
+) -> str:
+    """
+    Builds the ALTER TABLE statement converting code_chunks.embedding to `storage`. It rewrites the
+    table under an ACCESS EXCLUSIVE lock, and the vector indexes have to be dropped beforehand since
+    their operator class is tied to the column type.
+    """
+    storage = EmbeddingStorage(storage)
+    if dim < 1:
+        raise ValueError("dim must be >= 1")
+    column_type = f"{storage.value}({int(dim)})"
+    return (
+        f"ALTER TABLE public.code_chunks ALTER COLUMN embedding TYPE {column_type} "
+        f"USING embedding::{column_type};"
+    )
+
+
+def code_chunks_content_search_index_sql(*, concurrently: bool = True) -> str:
+    """Builds the CREATE INDEX statement for the GIN full text index of code_chunks.content."""
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+        f"{code_chunks_content_tsv_idx} "
+        f"ON public.code_chunks USING gin (({CODE_CHUNKS_CONTENT_TSVECTOR}));"
+    )
+
+
+async def create_code_chunks_content_search_index(
+    *, concurrently: bool = True, alias: str = "default"
+) -> None:
+    """Creates the full text index serving TortoiseCodeChunksStore.get_user_repo_chunks_hybrid."""
+    await connections.get(alias).execute_script(
+        code_chunks_content_search_index_sql(concurrently=concurrently)
+    )
+
+
+def code_chunks_file_lookup_indexes_sql(*, concurrently: bool = True) -> List[str]:
+    """
+    Builds the statements creating the file lookup indexes of code_chunks. text_pattern_ops lets
+    the btree serve the prefix ranges (`~>=~` / `~<~`) of FileLookupMode.PREFIX under any collation.
+    """
+    create = f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS"
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+        f"{create} {code_chunks_file_name_idx} "
+        "ON public.code_chunks (repo_id, user_id, lower(file_name) text_pattern_ops, chunk_ordinal);",
+        f"{create} {code_chunks_file_name_trgm_idx} "
+        "ON public.code_chunks USING gin (file_name gin_trgm_ops);",
+        f"{create} {code_chunks_file_path_idx} "
+        "ON public.code_chunks (repo_id, user_id, file_path, chunk_ordinal);",
+    ]
+
+
+def code_chunks_file_lookup_drop_indexes_sql(*, concurrently: bool = True) -> List[str]:
+    return [
+        f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS public.{name};"
+        for name in (code_chunks_file_name_idx, code_chunks_file_name_trgm_idx, code_chunks_file_path_idx)
+    ]
+
+
+async def code_chunks_is_partitioned(alias: str = "default") -> bool:
+    """Whether code_chunks is the parent of a partitioned layout (see models/partitioning.py)."""
+    rows = await connections.get(alias).execute_query_dict(
+        "SELECT relkind = 'p' AS partitioned FROM pg_class WHERE oid = to_regclass('public.code_chunks')"
+    )
+    return bool(rows and rows[0]["partitioned"])
+
+
+async def create_code_chunks_file_lookup_indexes(
+    *, concurrently: bool = True, alias: str = "default"
+) -> None:
+    """
+    Creates the indexes serving TortoiseCodeChunksStore.get_repo_file_chunks (EXACT, PREFIX and
+    TRIGRAM modes) and get_repo_file_content. Run one statement at a time, CONCURRENTLY can't be
+    part of a multi-statement script. On a partitioned code_chunks they are built without
+    CONCURRENTLY, which PostgreSQL rejects on a partitioned table.
+    """
+    if concurrently and await code_chunks_is_partitioned(alias):
+        concurrently = False
+
+    conn = connections.get(alias)
+    for statement in code_chunks_file_lookup_indexes_sql(concurrently=concurrently):
+        await conn.execute_script(statement)
+
+
+# Fills embedding_bits of the rows written before the column existed, with the same quantization
+# as quantize_embedding (1 bit per dimension, set when > 0)
+code_chunks_embedding_bits_backfill_sql = (
+    "UPDATE public.code_chunks "
+    f"SET embedding_bits = binary_quantize(embedding)::bit({CODE_CHUNKS_EMBEDDING_DIM}) "
+    "WHERE embedding_bits IS NULL AND embedding IS NOT NULL;"
+)
+
+
+async def backfill_code_chunks_embedding_bits(alias: str = "default") -> None:
+    await connections.get(alias).execute_script(code_chunks_embedding_bits_backfill_sql)
+
+
+async def create_code_chunks_embedding_index(
+    method: VectorIndexMethod = VectorIndexMethod.HNSW,
+    *,
+    m: int = DEFAULT_HNSW_M,
+    ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+    lists: int = DEFAULT_IVFFLAT_LISTS,
+    concurrently: bool = True,
+    storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+    alias: str = "default",
+) -> None:
+    """Creates the vector index of code_chunks.embedding if it doesn't exist yet."""
+    sql = code_chunks_embedding_index_sql(
+        method,
+        m=m,
+        ef_construction=ef_construction,
+        lists=lists,
+        concurrently=concurrently,
+        storage=storage,
+    )
+    await connections.get(alias).execute_script(sql)
+
+
+async def rebuild_code_chunks_embedding_index(
+    method: VectorIndexMethod = VectorIndexMethod.HNSW,
+    *,
+    concurrently: bool = True,
+    alias: str = "default",
+) -> None:
+    """
+    Rebuilds the vector index of code_chunks.embedding in place, needed for IVFFLAT once the
+    table has grown well past the data its lists were trained on, or to compact an HNSW graph
+    after heavy deletes.
+    """
+    await connections.get(alias).execute_script(
+        code_chunks_embedding_reindex_sql(method, concurrently=concurrently)
+    )
+
+
+async def drop_code_chunks_embedding_index(
+    method: VectorIndexMethod = VectorIndexMethod.HNSW,
+    *,
+    concurrently: bool = True,
+    alias: str = "default",
+) -> None:
+    await connections.get(alias).execute_script(
+        code_chunks_embedding_drop_index_sql(method, concurrently=concurrently)
+    )
+
+
+async def convert_code_chunks_embedding_storage(
+    storage: EmbeddingStorage,
+    method: VectorIndexMethod = VectorIndexMethod.HNSW,
+    *,
+    m: int = DEFAULT_HNSW_M,
+    ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+    lists: int = DEFAULT_IVFFLAT_LISTS,
+    alias: str = "default",
+) -> None:
+    """
+    Migrates the existing rows of code_chunks.embedding to `storage` (vector -> halfvec to halve
+    the table and index size, or back) and rebuilds the `method` index with the matching operator
+    class. Runs as a single transaction: drop the vector indexes, rewrite the column, build the
+    index. The table is locked for the whole duration, plan it as a maintenance window.
+
+    The stores must then be switched to the same storage, see TortoiseHalfVecCodeChunksStore.
+    """
+    index_sql = code_chunks_embedding_index_sql(
+        method,
+        m=m,
+        ef_construction=ef_construction,
+        lists=lists,
+        concurrently=False,
+        storage=storage,
+    )
+    statements = [
+        *(
+            code_chunks_embedding_drop_index_sql(index_method, concurrently=False)
+            for index_method in VectorIndexMethod
+        ),
+        code_chunks_embedding_storage_sql(storage),
+        index_sql,
+    ]
+    await connections.get(alias).execute_script(
+        "\n".join(["BEGIN;", *statements, "COMMIT;"])
+    )
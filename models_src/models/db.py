@@ -1,9 +1,84 @@
+import weakref
+
 import asyncpg
 from tortoise import connections, Tortoise
+from tortoise.backends.base.config_generator import expand_db_url
 from pgvector.asyncpg import register_vector
 
+from models_src.models.vector_codec import register_binary_vector_codec
+
+# Physical connections already holding the codecs
+_codec_connections: "weakref.WeakSet[asyncpg.Connection]" = weakref.WeakSet()
+
+
+def _physical_connection(conn: asyncpg.Connection) -> asyncpg.Connection:
+    # a pooled connection is handed out behind a new proxy on every acquire
+    return getattr(conn, "_con", conn)
+
+
+async def register_vector_codecs(conn: asyncpg.Connection) -> None:
+    """
+    pgvector codecs (halfvec, sparsevec), with `vector` sent and received as float32 arrays in the
+    binary format. Also usable as the asyncpg pool `init` hook.
+    """
+    await register_vector(conn)
+    await register_binary_vector_codec(conn)
+    _codec_connections.add(_physical_connection(conn))
+
+
+async def ensure_vector_codecs(conn: asyncpg.Connection) -> None:
+    """
+    register_vector_codecs, unless the connection already has them. asyncpg clears the prepared
+    statement cache of a connection on every set_type_codec, registering on each acquire would
+    parse and plan every query again.
+    """
+    if _physical_connection(conn) not in _codec_connections:
+        await register_vector_codecs(conn)
+
+
+def with_vector_codecs(config: dict) -> dict:
+    """
+    Installs register_vector_codecs as the pool `init` hook of every asyncpg connection of a
+    Tortoise config (URL or dict connections). The ORM writes embeddings as float32 arrays, which
+    asyncpg can only send on a connection holding the binary codec, so every Tortoise.init of the
+    models must go through this. An `init` hook already in the credentials still runs, after it.
+    """
+    connections_config = {}
+    for alias, connection in config.get("connections", {}).items():
+        if isinstance(connection, str):
+            connection = expand_db_url(connection)
+        else:
+            connection = {**connection, "credentials": dict(connection.get("credentials", {}))}
+
+        if connection["engine"].endswith("asyncpg"):
+            credentials = connection["credentials"]
+            credentials["init"] = _chain_init(credentials.get("init"))
+        connections_config[alias] = connection
+
+    return {**config, "connections": connections_config}
+
+
+def _chain_init(init):
+    if init is None or init is register_vector_codecs:
+        return register_vector_codecs
+
+    async def init_with_vector_codecs(conn: asyncpg.Connection) -> None:
+        await register_vector_codecs(conn)
+        await init(conn)
+
+    return init_with_vector_codecs
+
+
 async def init_db(db_url: str, models: list[str]):
-    await Tortoise.init(db_url=db_url, modules={"models": models})
+    # every pooled connection gets the codecs, the ORM then reads and writes embeddings in binary
+    await Tortoise.init(
+        config=with_vector_codecs(
+            {
+                "connections": {"default": db_url},
+                "apps": {"models": {"models": models, "default_connection": "default"}},
+            }
+        )
+    )
     await Tortoise.generate_schemas()
 
 
@@ -15,16 +90,16 @@ class PgVectorConnection:
     def __init__(self, alias: str = "default"):
         self.db = connections.get(alias)
         self.raw = None  # type: ignore
-    
+
     async def __aenter__(self) -> asyncpg.Connection:
         # Acquire a raw asyncpg.Connection
         self.raw = await self.db._pool.acquire()
-        
-        # tell asyncpg how to handle pgvector
-        await register_vector(self.raw)
-        
+
+        # tell asyncpg how to handle pgvector, once per connection
+        await ensure_vector_codecs(self.raw)
+
         return self.raw
-    
+
     async def __aexit__(self, exc_type, exc, tb):
         await self.db._pool.release(self.raw)
         self.raw = None
\ No newline at end of file
@@ -0,0 +1,63 @@
+from typing import Any, Optional
+
+import numpy as np
+from tortoise.fields.base import Field
+from tortoise.models import Model
+from tortoise_vector.field import VectorField
+
+
+class BitVectorField(Field, bytes):  # type: ignore
+    """
+    Defines a `bit(n)` column, as used by pgvector for binary quantized vectors (Hamming `<~>`).
+    Values are the packed bits as bytes (most significant bit first, see quantize_embedding),
+    which asyncpg sends as is in the binary format of the bit type.
+    """
+
+    indexable = False
+
+    def __init__(self, bit_size: int, *args, **kwargs) -> None:
+        if bit_size < 1 or bit_size % 8:
+            raise ValueError("bit_size must be a positive multiple of 8")
+        super().__init__(*args, **kwargs)
+        self._bit_size = bit_size
+
+    @property
+    def SQL_TYPE(self) -> str:  # type: ignore
+        return f"bit({self._bit_size})"
+
+    def to_db_value(self, value: Optional[bytes], instance: type[Model] | Model) -> Optional[bytes]:
+        if value is not None and len(value) * 8 != self._bit_size:
+            raise ValueError(f"expected {self._bit_size // 8} bytes, got {len(value)}")
+        return value
+
+    def to_python_value(self, value: Any) -> Optional[bytes]:
+        # asyncpg decodes bit columns to asyncpg.BitString
+        if value is not None and not isinstance(value, bytes):
+            return bytes(value.bytes)
+        return value
+
+
+class Float32VectorField(VectorField):
+    """
+    `vector` column holding NumPy float32 arrays. Values go to asyncpg as arrays and come back as
+    arrays, the binary codec of models_src.models.vector_codec doing the conversion, which the pool
+    connections must have registered: init_db, init_tortoise and any config passed through
+    with_vector_codecs install it as the pool `init` hook. On a connection without it, asyncpg
+    rejects the arrays ("expected str, got ndarray").
+    """
+
+    def to_db_value(self, value: Any, instance: type[Model] | Model) -> Optional[np.ndarray]:
+        if value is None:
+            return None
+        return np.asarray(value, dtype=np.float32)
+
+    def to_python_value(self, value: Any) -> Optional[np.ndarray]:
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, str):
+            # text format, from a connection without the binary codec
+            return np.array(value.strip("[]").split(","), dtype=np.float32)
+        to_numpy = getattr(value, "to_numpy", None)  # pgvector.HalfVector of a halfvec column
+        if to_numpy is not None:
+            value = to_numpy()
+        return np.asarray(value, dtype=np.float32)
@@ -0,0 +1,221 @@
+"""
+Optional partitioned layout of code_chunks, partitioned on repo_id: every query of
+TortoiseCodeChunksStore filters on `repo_id = ...`, so the planner prunes the search down to one
+partition and its own (much smaller) vector index.
+
+- HASH: a fixed number of partitions, repos are spread by hash(repo_id). Keeps the partition count
+  and the planning time bounded whatever the number of repos.
+- LIST: one partition per repo (see create_code_chunks_repo_partition) plus a DEFAULT partition
+  holding the repos without their own. Deleting a repo is then a DROP TABLE instead of a DELETE
+  that leaves every index of the table to vacuum.
+
+Like custom_indexes, these have to be applied manually during migrations. Indexes created on the
+partitioned table afterwards (create_code_chunks_embedding_index, ...) cascade to every partition,
+but can't be built CONCURRENTLY.
+"""
+
+import hashlib
+from enum import Enum
+from typing import List
+
+from tortoise import connections
+
+from models_src.models.custom_indexes import (
+    DEFAULT_HNSW_EF_CONSTRUCTION,
+    DEFAULT_HNSW_M,
+    DEFAULT_IVFFLAT_LISTS,
+    EmbeddingStorage,
+    VectorIndexMethod,
+    code_chunks_content_search_index_sql,
+    code_chunks_content_tsv_idx,
+    code_chunks_embedding_drop_index_sql,
+    code_chunks_embedding_index_sql,
+    code_chunks_file_lookup_drop_indexes_sql,
+    code_chunks_file_lookup_indexes_sql,
+)
+
+
+class CodeChunksPartitioning(str, Enum):
+    HASH = "hash"
+    LIST = "list"
+
+
+DEFAULT_CODE_CHUNKS_HASH_PARTITIONS = 32
+
+# The original table is renamed to this by migrate_code_chunks_to_partitioned
+code_chunks_unpartitioned_table = "code_chunks_unpartitioned"
+code_chunks_default_partition = "code_chunks_default"
+
+# Indexes of the partitioned table on top of the vector/text ones
+code_chunks_repo_id_user_id_idx = "code_chunks_repo_id_user_id_idx"
+code_chunks_content_hash_idx = "code_chunks_content_hash_idx"
+
+
+def code_chunks_hash_partition_name(remainder: int) -> str:
+    return f"code_chunks_p{int(remainder)}"
+
+
+def code_chunks_repo_partition_name(repo_id: str) -> str:
+    """
+    Name of the LIST partition of a repo. Repo ids aren't valid identifiers (and may exceed the 63
+    bytes limit), so the name is derived from their digest.
+    """
+    return f"code_chunks_r_{hashlib.sha256(str(repo_id).encode('utf-8')).hexdigest()[:24]}"
+
+
+def _literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def code_chunks_partitioned_layout_sql(
+    partitioning: CodeChunksPartitioning,
+    *,
+    partitions: int = DEFAULT_CODE_CHUNKS_HASH_PARTITIONS,
+    method: VectorIndexMethod = VectorIndexMethod.HNSW,
+    m: int = DEFAULT_HNSW_M,
+    ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+    lists: int = DEFAULT_IVFFLAT_LISTS,
+    storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+    drop_unpartitioned: bool = False,
+) -> List[str]:
+    """
+    Builds the statements moving code_chunks to the partitioned layout:
+    rename the table (and drop its vector/text/file lookup indexes, their names move to the new
+    table), create the partitioned one with the same columns, copy the rows, then build the
+    indexes, once the data is in since that's much faster than maintaining them during the copy.
+
+    The primary key becomes (id, repo_id), PostgreSQL requires the partition key in it.
+
+    Args:
+        partitions: HASH number of partitions, LIST starts with the DEFAULT partition only.
+        method/m/ef_construction/lists/storage: vector index built on every partition, see
+            code_chunks_embedding_index_sql.
+        drop_unpartitioned: Drop the original table at the end instead of keeping it as
+            code_chunks_unpartitioned for a rollback.
+    """
+    partitioning = CodeChunksPartitioning(partitioning)
+    if partitioning == CodeChunksPartitioning.HASH and partitions < 1:
+        raise ValueError("HASH partitioning requires partitions >= 1")
+
+    statements = [
+        *(
+            code_chunks_embedding_drop_index_sql(index_method, concurrently=False)
+            for index_method in VectorIndexMethod
+        ),
+        f"DROP INDEX IF EXISTS public.{code_chunks_content_tsv_idx};",
+        *code_chunks_file_lookup_drop_indexes_sql(concurrently=False),
+        f"ALTER TABLE public.code_chunks RENAME TO {code_chunks_unpartitioned_table};",
+        f"ALTER INDEX public.code_chunks_pkey RENAME TO {code_chunks_unpartitioned_table}_pkey;",
+        (
+            f"CREATE TABLE public.code_chunks (LIKE public.{code_chunks_unpartitioned_table} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY {partitioning.value.upper()} (repo_id);"
+        ),
+        "ALTER TABLE public.code_chunks ADD PRIMARY KEY (id, repo_id);",
+    ]
+
+    if partitioning == CodeChunksPartitioning.HASH:
+        statements.extend(
+            f"CREATE TABLE public.{code_chunks_hash_partition_name(remainder)} PARTITION OF public.code_chunks "
+            f"FOR VALUES WITH (MODULUS {int(partitions)}, REMAINDER {remainder});"
+            for remainder in range(int(partitions))
+        )
+    else:
+        statements.append(
+            f"CREATE TABLE public.{code_chunks_default_partition} PARTITION OF public.code_chunks DEFAULT;"
+        )
+
+    statements.extend(
+        [
+            f"INSERT INTO public.code_chunks SELECT * FROM public.{code_chunks_unpartitioned_table};",
+            f"CREATE INDEX {code_chunks_repo_id_user_id_idx} ON public.code_chunks (repo_id, user_id, created_at);",
+            f"CREATE INDEX {code_chunks_content_hash_idx} ON public.code_chunks (content_hash);",
+            code_chunks_embedding_index_sql(
+                method,
+                m=m,
+                ef_construction=ef_construction,
+                lists=lists,
+                concurrently=False,
+                storage=storage,
+            ),
+            code_chunks_content_search_index_sql(concurrently=False),
+            *code_chunks_file_lookup_indexes_sql(concurrently=False),
+        ]
+    )
+
+    if drop_unpartitioned:
+        statements.append(f"DROP TABLE public.{code_chunks_unpartitioned_table};")
+
+    return statements
+
+
+def code_chunks_repo_partition_sql(repo_id: str) -> List[str]:
+    """
+    Builds the statements giving a repo its own LIST partition. The rows it already has in the
+    DEFAULT partition are moved first, PostgreSQL refuses to attach the partition otherwise.
+    Attaching builds the partition's copy of every index of code_chunks.
+    """
+    name = code_chunks_repo_partition_name(repo_id)
+    value = _literal(repo_id)
+    return [
+        f"CREATE TABLE public.{name} (LIKE public.code_chunks INCLUDING DEFAULTS INCLUDING CONSTRAINTS);",
+        f"INSERT INTO public.{name} SELECT * FROM public.{code_chunks_default_partition} WHERE repo_id = {value};",
+        f"DELETE FROM public.{code_chunks_default_partition} WHERE repo_id = {value};",
+        f"ALTER TABLE public.code_chunks ATTACH PARTITION public.{name} FOR VALUES IN ({value});",
+    ]
+
+
+def code_chunks_repo_partition_drop_sql(repo_id: str) -> str:
+    return f"DROP TABLE IF EXISTS public.{code_chunks_repo_partition_name(repo_id)};"
+
+
+async def migrate_code_chunks_to_partitioned(
+    partitioning: CodeChunksPartitioning = CodeChunksPartitioning.HASH,
+    *,
+    partitions: int = DEFAULT_CODE_CHUNKS_HASH_PARTITIONS,
+    method: VectorIndexMethod = VectorIndexMethod.HNSW,
+    m: int = DEFAULT_HNSW_M,
+    ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+    lists: int = DEFAULT_IVFFLAT_LISTS,
+    storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+    drop_unpartitioned: bool = False,
+    alias: str = "default",
+) -> None:
+    """
+    Moves code_chunks to the partitioned layout in a single transaction, the table is locked for
+    the whole duration (copy + index builds), plan it as a maintenance window.
+
+    The stores must then be told about the layout, see TortoiseCodeChunksStore.partitioning.
+    """
+    statements = code_chunks_partitioned_layout_sql(
+        partitioning,
+        partitions=partitions,
+        method=method,
+        m=m,
+        ef_construction=ef_construction,
+        lists=lists,
+        storage=storage,
+        drop_unpartitioned=drop_unpartitioned,
+    )
+    await connections.get(alias).execute_script("\n".join(["BEGIN;", *statements, "COMMIT;"]))
+
+
+async def code_chunks_repo_partition_exists(repo_id: str, alias: str = "default") -> bool:
+    rows = await connections.get(alias).execute_query_dict(
+        "SELECT to_regclass($1) IS NOT NULL AS found",
+        [f"public.{code_chunks_repo_partition_name(repo_id)}"],
+    )
+    return bool(rows and rows[0]["found"])
+
+
+async def create_code_chunks_repo_partition(repo_id: str, alias: str = "default") -> bool:
+    """
+    LIST layout: gives the repo its own partition, best called when the repo gets registered,
+    before its chunks are written. Returns False if it already had one.
+    """
+    if await code_chunks_repo_partition_exists(repo_id, alias):
+        return False
+
+    await connections.get(alias).execute_script(
+        "\n".join(["BEGIN;", *code_chunks_repo_partition_sql(repo_id), "COMMIT;"])
+    )
+    return True
@@ -0,0 +1,44 @@
+"""
+Binary codec of the pgvector `vector` type for asyncpg, mapping it to NumPy float32 arrays.
+
+The wire format is a big-endian header (uint16 dimensions, uint16 unused) followed by the values as
+big-endian float32. Encoding and decoding go through NumPy buffers only: an embedding never turns
+into a list of Python floats, neither on the way in nor on the way out.
+"""
+
+import struct
+from typing import Any
+
+import numpy as np
+
+VECTOR_HEADER = struct.Struct(">HH")
+VECTOR_WIRE_DTYPE = np.dtype(">f4")
+
+
+def encode_vector(value: Any) -> bytes:
+    """Encodes a float32 array, a buffer of float32 or a sequence of floats to the pgvector binary format."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = np.frombuffer(value, dtype=np.float32)
+
+    values = np.asarray(value, dtype=VECTOR_WIRE_DTYPE)
+    if values.ndim != 1:
+        raise ValueError("expected ndim to be 1")
+
+    return VECTOR_HEADER.pack(values.shape[0], 0) + values.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """Decodes the pgvector binary format to a native float32 array (one buffer copy, no Python floats)."""
+    dim, _ = VECTOR_HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=VECTOR_WIRE_DTYPE, count=dim, offset=VECTOR_HEADER.size).astype(np.float32)
+
+
+async def register_binary_vector_codec(conn, schema: str = "public") -> None:
+    """Makes asyncpg send and receive `vector` in binary, as float32 arrays."""
+    await conn.set_type_codec(
+        "vector",
+        schema=schema,
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary",
+    )
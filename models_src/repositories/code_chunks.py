@@ -1,13 +1,272 @@
+import asyncio
+import dataclasses
+import datetime
+import functools
+import inspect
+import json
 import logging
 import uuid
 from abc import abstractmethod
 from dataclasses import asdict
-from typing import Any, Dict, List, Protocol
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Protocol, Sequence
 
-from models_src.dto.code_chunks import CodeChunksRequestDTO, CodeChunksResponseDTO
+import asyncpg
+from tortoise.transactions import in_transaction
+
+from models_src.dto.code_chunks import (
+    SEARCH_PROJECTION_COLUMNS,
+    ChunkFusion,
+    ChunkProjection,
+    ChunkSearchStrategy,
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksFileDiffResponseDTO,
+    CodeChunksPurgeProgressDTO,
+    CodeChunksRequestDTO,
+    CodeChunksResponseDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+    CodeChunksStatsDTO,
+    EmbeddingReuseStats,
+    FileLookupMode,
+    SimilarityPruningStats,
+    compute_content_hash,
+    quantize_embedding,
+)
 from models_src.dto.utils import TortoiseModelMapper
-from models_src.models import CodeChunks
+from models_src.exceptions.utils import CodeChunksErrors, internal_error
+from models_src.models import CodeChunks, CodeChunksCommitStats, CodeChunksRepoStats
+from models_src.models.custom_indexes import (
+    CODE_CHUNKS_CONTENT_TSVECTOR,
+    CODE_CHUNKS_TEXT_SEARCH_CONFIG,
+    EmbeddingStorage,
+)
 from models_src.models.db import PgVectorConnection
+from models_src.models.partitioning import (
+    CodeChunksPartitioning,
+    code_chunks_repo_partition_drop_sql,
+    code_chunks_repo_partition_name,
+)
+from models_src.repositories.code_chunks_cursor import SearchCursor, resolve_search_cursor, search_row_key
+from models_src.repositories.code_chunks_mmr import (
+    diversify_search_rows,
+    reject_diversification,
+    resolve_mmr_pool_size,
+)
+from models_src.repositories.code_chunks_stats import (
+    CODE_CHUNKS_DELETE_WITH_STATS_SQL,
+    CODE_CHUNKS_FILE_STATS_PRUNE_SQL,
+    CODE_CHUNKS_STATS_LOCK_SQL,
+    CODE_CHUNKS_STATS_TABLES,
+    CODE_CHUNKS_STATS_UPDATE_SQL,
+    ChunkStatsDeltas,
+    chunk_stats_deltas,
+    code_chunks_stats_lock_params,
+    code_chunks_stats_update_params,
+    deleted_chunk_stats_deltas,
+    merge_chunk_stats_deltas,
+)
+
+# Column order of the rows sent by TortoiseCodeChunksStore.bulk_copy_save
+COPY_COLUMNS = (
+    "id",
+    "user_id",
+    "repo_id",
+    "content",
+    "content_hash",
+    "embedding",
+    "embedding_bits",
+    "metadata",
+    "file_name",
+    "file_path",
+    "file_size",
+    "commit_number",
+    "created_at",
+    "chunk_ordinal",
+)
+
+# Columns that can be projected by stream_all_by_repo_id
+STREAMABLE_COLUMNS = tuple(f.name for f in dataclasses.fields(CodeChunksResponseDTO))
+DEFAULT_STREAM_FETCH_SIZE = 1000
+
+HNSW_MAX_EF_SEARCH = 1000
+HNSW_ITERATIVE_SCAN_MODES = ("off", "strict_order", "relaxed_order")
+
+# Last Unicode code point, no upper bound can follow it in a prefix range
+MAX_CODE_POINT = "\U0010ffff"
+SURROGATES_START, SURROGATES_END = 0xD800, 0xDFFF
+
+# purge_repo_chunks: rows deleted per transaction, and the pause between two of them
+DEFAULT_PURGE_BATCH_SIZE = 5000
+DEFAULT_PURGE_PAUSE_SECONDS = 0.05
+
+# Called with the progress after every batch of purge_repo_chunks, may be a coroutine function
+PurgeProgressCallback = Callable[[CodeChunksPurgeProgressDTO], Any]
+
+# Counters returned on the rows of a min_similarity search, see _take_pruning_counts
+PRUNING_COLUMNS = ("scored_count", "pruned_count")
+
+# Default candidate set per query vector of the CANDIDATES strategy: max(limit * 4, 40)
+DEFAULT_CANDIDATES_PER_LIMIT = 4
+DEFAULT_MIN_CANDIDATES = 40
+
+
+def decode_embedding(value: Any) -> Any:
+    """
+    halfvec columns come back from the pgvector codec as HalfVector, hand them out as float32
+    arrays like the vector ones so callers don't depend on the storage mode.
+    """
+    to_numpy = getattr(value, "to_numpy", None)  # pgvector.HalfVector
+    if to_numpy is not None:
+        return to_numpy().astype("float32")
+    return value
+
+
+def validate_file_diff(diff: CodeChunksFileDiffRequestDTO) -> None:
+    """
+    A file can only be in one of the diff sets, and the chunks have to belong to the changed/added
+    files of the same user, repo and commit.
+    """
+    problems = []
+
+    if not diff.user_id or not diff.repo_id or not diff.commit_number:
+        problems.append("user_id, repo_id and commit_number are required")
+
+    overlapping = (
+        (diff.changed_file_paths & diff.added_file_paths)
+        | (diff.changed_file_paths & diff.deleted_file_paths)
+        | (diff.added_file_paths & diff.deleted_file_paths)
+    )
+    if overlapping:
+        problems.append(f"files in more than one diff set: {sorted(overlapping)}")
+
+    chunked_paths = diff.changed_file_paths | diff.added_file_paths
+    for chunk in diff.chunks:
+        if (chunk.user_id, chunk.repo_id, chunk.commit_number) != (
+            diff.user_id,
+            diff.repo_id,
+            diff.commit_number,
+        ):
+            problems.append(f"chunk of {chunk.file_path} doesn't belong to the diff's user/repo/commit")
+        elif chunk.file_path not in chunked_paths:
+            problems.append(f"chunk of {chunk.file_path} isn't a changed or added file")
+
+    if problems:
+        raise internal_error(
+            **CodeChunksErrors.INVALID_FILE_DIFF.value,
+            internal_context={
+                "repo_id": diff.repo_id,
+                "commit_number": diff.commit_number,
+                "problems": problems,
+            },
+        )
+
+
+def resolve_stream_columns(columns: Optional[Sequence[str]]) -> Sequence[str]:
+    """Validates a streaming column projection, defaults to every column of CodeChunksResponseDTO."""
+    if not columns:
+        return STREAMABLE_COLUMNS
+
+    unknown = set(columns) - set(STREAMABLE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown code_chunks columns: {sorted(unknown)}")
+
+    return tuple(dict.fromkeys(columns))
+
+
+def resolve_candidates_per_query(options: CodeChunksSearchOptions, limit: int) -> int:
+    """
+    Validates the strategy related search options (shared by every ICodeChunksStore implementation)
+    and returns the size of the per query vector candidate set used by the CANDIDATES/BINARY strategies.
+    """
+    if options.strategy == ChunkSearchStrategy.EXACT and options.fusion != ChunkFusion.SUM:
+        raise ValueError("The EXACT strategy only supports the SUM fusion")
+
+    if options.rrf_k < 1:
+        raise ValueError("rrf_k must be >= 1")
+
+    if options.oversampling < 1:
+        raise ValueError("oversampling must be >= 1")
+
+    if options.candidates_per_query is None:
+        return max(limit * DEFAULT_CANDIDATES_PER_LIMIT, DEFAULT_MIN_CANDIDATES)
+
+    if options.candidates_per_query < limit:
+        raise ValueError("candidates_per_query must be >= limit")
+
+    return int(options.candidates_per_query)
+
+
+def setting_knob(statement: str) -> tuple[str, str]:
+    """(name, value) of a `SET LOCAL <name> = <value>` statement."""
+    return statement.split()[2], statement.split("=", 1)[1].strip()
+
+
+def file_name_prefix_predicate(prefix: str, param: int) -> str:
+    """
+    Predicate of the file names whose lowercase starts with the prefix bound to `$param`, as the
+    [lower, upper) range served by the text_pattern_ops index (code point order). Both bounds are
+    computed by PostgreSQL from lower($param), the same lower() as the indexed expression. U+10FFFF
+    has no successor: trailing ones are dropped before incrementing the last character, and a
+    prefix made only of them (or empty) leaves the range open-ended. The successor of U+D7FF skips
+    the surrogates, which chr() rejects.
+    """
+    lowered = f"lower(${param}::text)"
+    predicate = f"lower(file_name) ~>=~ {lowered}"
+    if not prefix.rstrip(MAX_CODE_POINT):
+        return predicate
+    stem = f"rtrim({lowered}, chr({ord(MAX_CODE_POINT)}))"
+    last = f"ascii(right({stem}, 1))"
+    successor = f"chr(CASE WHEN {last} = {SURROGATES_START - 1} THEN {SURROGATES_END + 1} ELSE {last} + 1 END)"
+    return predicate + f" AND lower(file_name) ~<~ (left({stem}, -1) || {successor})"
+
+
+def escape_like(value: str) -> str:
+    """Escapes the LIKE wildcards of `value`, with the default `\\` escape character."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def file_name_matches(candidate: str, file_name: str, mode: FileLookupMode) -> bool:
+    """In-memory equivalent of the EXACT/PREFIX/TRIGRAM predicates, for the non SQL stores."""
+    candidate, file_name = candidate.lower(), file_name.lower()
+    if mode == FileLookupMode.EXACT:
+        return candidate == file_name
+    if mode == FileLookupMode.PREFIX:
+        return candidate.startswith(file_name)
+    return file_name in candidate
+
+
+def validate_purge_arguments(batch_size: int, pause: float) -> None:
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    if pause < 0:
+        raise ValueError("pause must be >= 0")
+
+
+async def report_progress(on_progress: Optional[Callable[[Any], Any]], progress: Any) -> None:
+    """Hands a copy of the progress dataclass to a sync or async callback."""
+    if on_progress is None:
+        return
+    result = on_progress(dataclasses.replace(progress))
+    if inspect.isawaitable(result):
+        await result
+
+
+def query_vectors_param(query_embeddings: Sequence[Sequence[float]]) -> List[tuple]:
+    """
+    The query vectors as the single `vector[]` parameter ($1) of the searches. asyncpg reads nested
+    lists as extra array dimensions, tuples reach the vector codec as one value each.
+    """
+    return [tuple(vector) for vector in query_embeddings]
+
+
+def validate_min_similarity(options: CodeChunksSearchOptions) -> None:
+    if options.min_similarity is not None and not -1.0 <= options.min_similarity <= 1.0:
+        raise ValueError("min_similarity must be between -1 and 1")
+
+
+def validate_per_repo_limit(per_repo_limit: Optional[int]) -> None:
+    if per_repo_limit is not None and per_repo_limit < 1:
+        raise ValueError("per_repo_limit must be >= 1")
 
 
 class ICodeChunksStore(Protocol):
@@ -19,15 +278,86 @@ class ICodeChunksStore(Protocol):
     
     @abstractmethod
     async def bulk_save(self, create_model: list[CodeChunksRequestDTO]) -> List[CodeChunksResponseDTO]: ...
+
+    @abstractmethod
+    async def bulk_copy_save(self, create_model: list[CodeChunksRequestDTO]) -> List[uuid.UUID]: ...
     
+    @abstractmethod
+    async def save_commit_file_diff(
+        self, diff: CodeChunksFileDiffRequestDTO
+    ) -> CodeChunksFileDiffResponseDTO: ...
+
+    @abstractmethod
+    async def find_embeddings_by_content_hashes(
+        self, content_hashes: Sequence[str], user_id: Optional[str] = None
+    ) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    async def delete_all_by_repo_id(self, repo_id: str) -> int: ...
+
+    @abstractmethod
+    async def purge_repo_chunks(
+        self,
+        repo_id: str,
+        batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+        pause: float = DEFAULT_PURGE_PAUSE_SECONDS,
+        on_progress: Optional[PurgeProgressCallback] = None,
+    ) -> CodeChunksPurgeProgressDTO: ...
+
+    def purge_repo_chunks_in_background(
+        self,
+        repo_id: str,
+        batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+        pause: float = DEFAULT_PURGE_PAUSE_SECONDS,
+        on_progress: Optional[PurgeProgressCallback] = None,
+    ) -> "asyncio.Task[CodeChunksPurgeProgressDTO]":
+        """
+        Runs purge_repo_chunks as an asyncio task of the running loop. Keep a reference to the task
+        until it's done. Cancelling it stops the purge between two batches, nothing is lost: calling
+        purge_repo_chunks again resumes it.
+        """
+        return asyncio.create_task(
+            self.purge_repo_chunks(repo_id, batch_size=batch_size, pause=pause, on_progress=on_progress),
+            name=f"purge_repo_chunks:{repo_id}",
+        )
+
     @abstractmethod
     async def find_all_by_repo_id_with_limit(
         self, repo_id: str, limit: int = 100
     ) -> List[CodeChunksResponseDTO]: ...
+
+    @abstractmethod
+    def stream_all_by_repo_id(
+        self,
+        repo_id: str,
+        fetch_size: int = DEFAULT_STREAM_FETCH_SIZE,
+        columns: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[CodeChunksResponseDTO]: ...
     
     @abstractmethod
-    async def get_repo_file_chunks(self,  user_id : str | uuid.UUID , repo_id: str | uuid.UUID,  file_name:str="readme") -> List[dict]: ...
+    async def fetch_contents_by_ids(
+        self,
+        user_id: str | uuid.UUID,
+        ids: Sequence[str | uuid.UUID],
+        repo_id: Optional[str | uuid.UUID] = None,
+    ) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def get_repo_file_chunks(self,  user_id : str | uuid.UUID , repo_id: str | uuid.UUID,  file_name:str="readme", mode: FileLookupMode = FileLookupMode.CONTAINS) -> List[dict]: ...
+
+    @abstractmethod
+    async def get_repo_file_content(
+        self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_path: str
+    ) -> Optional[str]: ...
     
+    @abstractmethod
+    async def get_repo_chunk_stats(self, repo_id: str) -> Optional[CodeChunksStatsDTO]: ...
+
+    @abstractmethod
+    async def get_commit_chunk_stats(
+        self, repo_id: str, commit_number: str
+    ) -> Optional[CodeChunksStatsDTO]: ...
+
     @abstractmethod
     async def get_user_repo_chunks_multi(
             self,
@@ -36,6 +366,36 @@ class ICodeChunksStore(Protocol):
             query_embeddings: List[List[float]],
             emb_dim: int,
             limit: int = 10,
+            options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def batch_get_user_repo_chunks_multi(
+            self, requests: Sequence[CodeChunksSearchRequestDTO], emb_dim: int
+    ) -> List[List[Dict[str, Any]]]: ...
+
+    @abstractmethod
+    async def get_user_repos_chunks_multi(
+            self,
+            user_id: str | uuid.UUID,
+            repo_ids: Optional[Sequence[str | uuid.UUID]],
+            query_embeddings: List[List[float]],
+            emb_dim: int,
+            limit: int = 10,
+            per_repo_limit: Optional[int] = None,
+            options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def get_user_repo_chunks_hybrid(
+            self,
+            user_id: str | uuid.UUID,
+            repo_id: str | uuid.UUID,
+            query_text: str,
+            query_embeddings: List[List[float]],
+            emb_dim: int,
+            limit: int = 10,
+            options: Optional[CodeChunksSearchOptions] = None,
     ) -> List[Dict[str, Any]]: ...
 
 
@@ -44,6 +404,16 @@ class TortoiseCodeChunksStore(ICodeChunksStore):
     model = CodeChunks
     model_mapper = TortoiseModelMapper
 
+    # Process wide on purpose: FastAPI's Depends() builds a new store per request
+    embedding_reuse_stats = EmbeddingReuseStats()
+    similarity_pruning_stats = SimilarityPruningStats()
+
+    # Has to match the column type of code_chunks.embedding, see convert_code_chunks_embedding_storage
+    embedding_storage = EmbeddingStorage.VECTOR
+
+    # Layout of code_chunks, see migrate_code_chunks_to_partitioned. None when not partitioned
+    partitioning: Optional[CodeChunksPartitioning] = None
+
     def __init__(self):
         """
         Have to add this as an empty __init__ to override it, because when using it with Depends(),
@@ -57,19 +427,293 @@ class TortoiseCodeChunksStore(ICodeChunksStore):
         pass
 
     async def save(self, create_model: CodeChunksRequestDTO) -> CodeChunksResponseDTO:
-        data = await self.model.create(**asdict(create_model))
+        async with in_transaction() as conn:
+            data = await self.model.create(**self._model_values(create_model), using_db=conn)
+            await self._update_stats(conn, chunk_stats_deltas([create_model]))
         return self.model_mapper.map_model_to_dataclass(data, CodeChunksResponseDTO)
 
     async def bulk_save(self, create_model: list[CodeChunksRequestDTO]) -> List[CodeChunksResponseDTO]:
         objs = [
-            self.model(**asdict(r))
+            self.model(**self._model_values(r))
             for r in create_model
         ]
 
-        _ = await self.model.bulk_create(objs, batch_size=1000)
+        async with in_transaction() as conn:
+            _ = await self.model.bulk_create(objs, batch_size=1000, using_db=conn)
+            await self._update_stats(conn, chunk_stats_deltas(create_model))
 
         return self.model_mapper.map_models_to_dataclasses_list(objs, CodeChunksResponseDTO)
 
+    @staticmethod
+    async def _update_stats(conn, deltas: ChunkStatsDeltas) -> None:
+        """Applies the stats deltas of a write on the connection of its transaction."""
+        if not deltas:
+            return
+
+        await conn.execute_query(CODE_CHUNKS_STATS_LOCK_SQL, code_chunks_stats_lock_params(deltas))
+        await conn.execute_query(CODE_CHUNKS_STATS_UPDATE_SQL, code_chunks_stats_update_params(deltas))
+        if any(delta[0] < 0 for delta in deltas.values()):
+            repo_ids = sorted({key[0] for key in deltas})
+            await conn.execute_query(CODE_CHUNKS_FILE_STATS_PRUNE_SQL, [repo_ids])
+
+    async def bulk_copy_save(self, create_model: list[CodeChunksRequestDTO]) -> List[uuid.UUID]:
+        """
+        Bulk ingest through the binary COPY protocol instead of multi-row INSERTs, embeddings are
+        sent in the pgvector binary format. Ids are generated client side (as the model default
+        does) so only they are returned, nothing is read back from the database.
+        """
+        if not create_model:
+            return []
+
+        ids = [uuid.uuid4() for _ in create_model]
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+
+        records = (
+            self._copy_record(id_, chunk, created_at)
+            for id_, chunk in zip(ids, create_model)
+        )
+
+        async with PgVectorConnection("default") as conn:
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    self.model._meta.db_table,
+                    schema_name="public",
+                    columns=COPY_COLUMNS,
+                    records=records,
+                )
+                deltas = chunk_stats_deltas(create_model)
+                await conn.execute(CODE_CHUNKS_STATS_LOCK_SQL, *code_chunks_stats_lock_params(deltas))
+                await conn.execute(CODE_CHUNKS_STATS_UPDATE_SQL, *code_chunks_stats_update_params(deltas))
+
+        return ids
+
+    @staticmethod
+    def _model_values(chunk: CodeChunksRequestDTO) -> dict:
+        values = asdict(chunk)
+        if not values.get("content_hash"):
+            values["content_hash"] = compute_content_hash(chunk.content)
+        if chunk.embedding is not None:
+            values["embedding_bits"] = quantize_embedding(chunk.embedding)
+        return values
+
+    @staticmethod
+    def _copy_record(
+        id_: uuid.UUID, chunk: CodeChunksRequestDTO, created_at: datetime.datetime
+    ) -> tuple:
+        """One COPY row, in the order of COPY_COLUMNS."""
+        return (
+            id_,
+            chunk.user_id,
+            chunk.repo_id,
+            chunk.content,
+            chunk.content_hash or compute_content_hash(chunk.content),
+            chunk.embedding,
+            quantize_embedding(chunk.embedding) if chunk.embedding is not None else None,
+            json.dumps(chunk.metadata or {}),
+            chunk.file_name,
+            chunk.file_path,
+            chunk.file_size,
+            chunk.commit_number,
+            created_at,
+            chunk.chunk_ordinal,
+        )
+
+    async def save_commit_file_diff(
+        self, diff: CodeChunksFileDiffRequestDTO
+    ) -> CodeChunksFileDiffResponseDTO:
+        """
+        Commit-incremental re-indexing: in one transaction, drops the chunks of every file in the
+        diff and inserts the new chunks of the changed/added files. Added files are cleared as
+        well, so replaying the same diff after a failure is idempotent.
+        """
+        validate_file_diff(diff)
+
+        touched_paths = diff.changed_file_paths | diff.added_file_paths | diff.deleted_file_paths
+        if not touched_paths:
+            return CodeChunksFileDiffResponseDTO()
+
+        objs = [self.model(**self._model_values(r)) for r in diff.chunks]
+
+        delete_sql = CODE_CHUNKS_DELETE_WITH_STATS_SQL.format(
+            delete="DELETE FROM public.code_chunks "
+            "WHERE user_id = $1 AND repo_id = $2 AND file_path = ANY($3::text[])"
+        )
+
+        async with in_transaction() as conn:
+            deleted = await conn.execute_query_dict(
+                delete_sql, [diff.user_id, diff.repo_id, sorted(touched_paths)]
+            )
+            deleted_count = sum(int(row["chunks"]) for row in deleted)
+
+            if objs:
+                await self.model.bulk_create(objs, batch_size=1000, using_db=conn)
+
+            await self._update_stats(
+                conn,
+                merge_chunk_stats_deltas(
+                    deleted_chunk_stats_deltas(deleted), chunk_stats_deltas(diff.chunks)
+                ),
+            )
+
+        return CodeChunksFileDiffResponseDTO(
+            deleted_count=deleted_count,
+            saved=self.model_mapper.map_models_to_dataclasses_list(objs, CodeChunksResponseDTO),
+        )
+
+    async def find_embeddings_by_content_hashes(
+        self, content_hashes: Sequence[str], user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Returns {content_hash: embedding} for the hashes that already have an embedding stored,
+        across chunks, commits and repos (or only the repos of `user_id`), so the ingestion worker
+        can skip the embedding model call for them. Hits/misses feed `embedding_reuse_stats`.
+        """
+        unique_hashes = list(dict.fromkeys(h for h in content_hashes if h))
+        if not unique_hashes:
+            return {}
+
+        sql = """
+            SELECT DISTINCT ON (content_hash) content_hash, embedding
+            FROM public.code_chunks
+            WHERE content_hash = ANY($1::text[])
+              AND embedding IS NOT NULL
+              AND ($2::text IS NULL OR user_id = $2)
+        """
+        async with PgVectorConnection("default") as conn:
+            rows = await conn.fetch(sql, unique_hashes, user_id)
+
+        found = {r["content_hash"]: decode_embedding(r["embedding"]) for r in rows}
+        self.embedding_reuse_stats.record(requested=len(unique_hashes), hits=len(found))
+        return found
+
+    async def delete_all_by_repo_id(self, repo_id: str) -> int:
+        """
+        Deletes every chunk of the repo, returns how many were deleted. With the LIST layout, a repo
+        having its own partition gets it dropped instead, which frees the space at once and spares
+        the vacuum of the vector index.
+        """
+        if not repo_id:
+            return 0
+
+        async with in_transaction() as conn:
+            dropped = 0
+            if self.partitioning == CodeChunksPartitioning.LIST:
+                partition = code_chunks_repo_partition_name(repo_id)
+                found = await conn.execute_query_dict(
+                    "SELECT to_regclass($1) IS NOT NULL AS found", [f"public.{partition}"]
+                )
+                if found and found[0]["found"]:
+                    counted = await conn.execute_query_dict(f"SELECT count(*) AS n FROM public.{partition}")
+                    dropped = counted[0]["n"]
+                    await conn.execute_script(code_chunks_repo_partition_drop_sql(repo_id))
+
+            # rows left in the DEFAULT partition (or the whole table when not partitioned by repo)
+            deleted = await self.model.filter(repo_id=repo_id).using_db(conn).delete()
+
+            for table in CODE_CHUNKS_STATS_TABLES:
+                await conn.execute_query(f"DELETE FROM public.{table} WHERE repo_id = $1", [repo_id])
+
+        return dropped + deleted
+
+    async def purge_repo_chunks(
+        self,
+        repo_id: str,
+        batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+        pause: float = DEFAULT_PURGE_PAUSE_SECONDS,
+        on_progress: Optional[PurgeProgressCallback] = None,
+    ) -> CodeChunksPurgeProgressDTO:
+        """
+        Deletes every chunk of the repo by batches of `batch_size` rows, each one in its own short
+        transaction (with its stats update), sleeping `pause` seconds between two. Row locks,
+        WAL bursts and the vector index maintenance stay bounded, concurrent searches and writes
+        of the other repos keep flowing, and autovacuum can follow.
+
+        Batches follow the primary key order (keyset on id), so each one is an index range scan
+        starting where the previous one stopped. Rows written into the repo during the purge
+        behind that position are left.
+
+        Resumable: every committed batch stays deleted, so after a crash or a cancellation calling
+        it again carries on with the rows left. Returns the final progress, `on_progress` gets it
+        after every batch.
+        """
+        validate_purge_arguments(batch_size, pause)
+
+        progress = CodeChunksPurgeProgressDTO(repo_id=str(repo_id))
+        if not repo_id:
+            progress.done = True
+            return progress
+
+        stats = await self.get_repo_chunk_stats(str(repo_id))
+        progress.total_estimate = stats.chunk_count if stats else None
+
+        # keyset on the primary key: each batch starts after the last id of the previous one, so
+        # it never walks again over the dead tuples of the batches already deleted
+        first_batch_sql = (
+            "SELECT id FROM public.code_chunks WHERE repo_id = $1 ORDER BY id LIMIT $2"
+        )
+        next_batch_sql = (
+            "SELECT id FROM public.code_chunks WHERE repo_id = $1 AND id > $3 ORDER BY id LIMIT $2"
+        )
+        # repo_id prunes the partitioned layouts down to the repo's partition
+        delete_sql = CODE_CHUNKS_DELETE_WITH_STATS_SQL.format(
+            delete="DELETE FROM public.code_chunks WHERE id = ANY($1::uuid[]) AND repo_id = $2"
+        )
+
+        last_id = None
+        while True:
+            async with in_transaction() as conn:
+                if last_id is None:
+                    batch = await conn.execute_query_dict(first_batch_sql, [str(repo_id), batch_size])
+                else:
+                    batch = await conn.execute_query_dict(
+                        next_batch_sql, [str(repo_id), batch_size, last_id]
+                    )
+                ids = [row["id"] for row in batch]
+                deleted = await conn.execute_query_dict(delete_sql, [ids, str(repo_id)]) if ids else []
+                await self._update_stats(conn, deleted_chunk_stats_deltas(deleted))
+
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            progress.deleted_count += sum(int(row["chunks"]) for row in deleted)
+            progress.batches += 1
+            await report_progress(on_progress, progress)
+            if len(ids) < batch_size:
+                break
+            await asyncio.sleep(pause)
+
+        # counters left at zero by the batches
+        async with in_transaction() as conn:
+            for table in CODE_CHUNKS_STATS_TABLES:
+                await conn.execute_query(
+                    f"DELETE FROM public.{table} WHERE repo_id = $1 AND chunk_count <= 0", [str(repo_id)]
+                )
+
+        progress.done = True
+        await report_progress(on_progress, progress)
+        return progress
+
+    async def get_repo_chunk_stats(self, repo_id: str) -> Optional[CodeChunksStatsDTO]:
+        """
+        Counters of the repo's chunks, maintained on every write (one row read, no scan of
+        code_chunks). None when nothing was written for the repo since the counters exist, see
+        rebuild_code_chunks_stats.
+        """
+        if not repo_id:
+            return None
+        row = await CodeChunksRepoStats.filter(repo_id=str(repo_id)).first()
+        return self.model_mapper.map_model_to_dataclass(row, CodeChunksStatsDTO)
+
+    async def get_commit_chunk_stats(
+        self, repo_id: str, commit_number: str
+    ) -> Optional[CodeChunksStatsDTO]:
+        """Counters of the repo's chunks written for `commit_number`."""
+        if not repo_id or not commit_number:
+            return None
+        row = await CodeChunksCommitStats.filter(repo_id=str(repo_id), commit_number=commit_number).first()
+        return self.model_mapper.map_model_to_dataclass(row, CodeChunksStatsDTO)
+
     async def find_all_by_repo_id_with_limit(
         self, repo_id: str, limit: int = 100
     ) -> List[CodeChunksResponseDTO]:
@@ -78,14 +722,146 @@ class TortoiseCodeChunksStore(ICodeChunksStore):
             raw_data, CodeChunksResponseDTO
         )
 
-    async def get_repo_file_chunks(self,  user_id : str | uuid.UUID , repo_id: str | uuid.UUID,  file_name:str="readme") -> List[dict]:
-        """Return chunks of a specific file"""
+    async def stream_all_by_repo_id(
+        self,
+        repo_id: str,
+        fetch_size: int = DEFAULT_STREAM_FETCH_SIZE,
+        columns: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[CodeChunksResponseDTO]:
+        """
+        Walks every chunk of a repo in constant memory through a server-side cursor, `fetch_size`
+        rows are pulled per round trip. `columns` projects the selected columns (e.g. leave out
+        `embedding` for export jobs), the other DTO fields stay None.
+
+        The cursor lives inside a transaction held open until the iteration ends or is closed.
+        """
+        columns = resolve_stream_columns(columns)
+        if fetch_size < 1:
+            raise ValueError("fetch_size must be >= 1")
+
+        if not repo_id:
+            return
+
+        sql = f"""
+            SELECT {", ".join(columns)}
+            FROM public.code_chunks
+            WHERE repo_id = $1
+        """
+
+        async with PgVectorConnection("default") as conn:
+            async with conn.transaction():
+                async for record in conn.cursor(sql, str(repo_id), prefetch=fetch_size):
+                    yield self._record_to_dto(record)
+
+    @staticmethod
+    def _record_to_dto(record) -> CodeChunksResponseDTO:
+        """Maps a raw asyncpg record, jsonb comes back as text since only pgvector codecs are registered."""
+        data = dict(record)
+        if isinstance(data.get("metadata"), str):
+            data["metadata"] = json.loads(data["metadata"])
+        if "embedding" in data:
+            data["embedding"] = decode_embedding(data["embedding"])
+        return CodeChunksResponseDTO(**data)
+
+    async def fetch_contents_by_ids(
+        self,
+        user_id: str | uuid.UUID,
+        ids: Sequence[str | uuid.UUID],
+        repo_id: Optional[str | uuid.UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Second step of a search run with ChunkProjection.IDS/METADATA: the file_name, file_path and
+        content of the chunks `ids` of the user, in the order of `ids` (unknown ids are skipped).
+        Passing the repo_id lets a partitioned table prune the lookup to the repo's partition.
+        """
+        if not user_id or not ids:
+            return []
+
+        filters = {"user_id": str(user_id), "id__in": list(dict.fromkeys(str(i) for i in ids))}
+        if repo_id:
+            filters["repo_id"] = str(repo_id)
+
         try:
-            result = await self.model.filter( file_name__icontains=file_name,  user_id=user_id, repo_id=repo_id).order_by("-created_at").values("content")
-            return result
+            rows = await self.model.filter(**filters).values("id", "file_name", "file_path", "content")
+        except Exception:
+            logging.exception(f"{self.fetch_contents_by_ids.__name__} failed")
+            return []
+
+        by_id = {str(row["id"]): row for row in rows}
+        return [by_id[key] for key in dict.fromkeys(str(i) for i in ids) if key in by_id]
+
+    async def get_repo_file_chunks(self,  user_id : str | uuid.UUID , repo_id: str | uuid.UUID,  file_name:str="readme", mode: FileLookupMode = FileLookupMode.CONTAINS) -> List[dict]:
+        """
+        Return chunks of a specific file.
+
+        mode = CONTAINS (default) keeps the substring filter, newest chunks first, rows are
+        {"content"}. EXACT, PREFIX and TRIGRAM are served by the file lookup indexes (see
+        create_code_chunks_file_lookup_indexes) and return {"file_path", "chunk_ordinal", "content"}
+        rows in source order: by file_path, then chunk_ordinal.
+        """
+        mode = FileLookupMode(mode)
+        try:
+            if mode == FileLookupMode.CONTAINS:
+                result = await self.model.filter( file_name__icontains=file_name,  user_id=user_id, repo_id=repo_id).order_by("-created_at").values("content")
+                return result
+
+            sql, params = self._file_lookup_query(str(user_id), str(repo_id), file_name, mode)
+            async with PgVectorConnection("default") as conn:
+                rows = await conn.fetch(sql, *params)
+            return [dict(r) for r in rows]
         except Exception:
             logging.exception(f"{self.get_repo_file_chunks.__name__} failed")
             return []  # Return empty list on error
+
+    @staticmethod
+    def _file_lookup_query(user_id: str, repo_id: str, file_name: str, mode: FileLookupMode) -> tuple[str, list]:
+        params: list = [repo_id, user_id]
+        if mode == FileLookupMode.EXACT:
+            params.append(file_name.lower())
+            predicate = "lower(file_name) = $3"
+        elif mode == FileLookupMode.PREFIX:
+            # explicit range rather than LIKE: a bound pattern can't be turned into an index range
+            # by generic plans, the range can
+            params.append(file_name)
+            predicate = file_name_prefix_predicate(file_name, 3)
+        else:
+            params.append(f"%{escape_like(file_name)}%")
+            predicate = "file_name ILIKE $3"
+
+        sql = f"""
+            SELECT file_path, chunk_ordinal, content
+            FROM public.code_chunks
+            WHERE repo_id = $1
+              AND user_id = $2
+              AND {predicate}
+            ORDER BY file_path, chunk_ordinal NULLS LAST, created_at
+        """
+        return sql, params
+
+    async def get_repo_file_content(
+        self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_path: str
+    ) -> Optional[str]:
+        """
+        The file at `file_path` reassembled from its chunks in chunk_ordinal order, in one query over
+        code_chunks_file_path_idx. None when the file has no chunks. The chunks are concatenated as
+        is, which gives back the file when the chunker splits without overlap.
+        """
+        if not user_id or not repo_id or not file_path:
+            return None
+
+        sql = """
+            SELECT string_agg(content, '' ORDER BY chunk_ordinal NULLS LAST, created_at) AS content
+            FROM public.code_chunks
+            WHERE repo_id = $1
+              AND user_id = $2
+              AND file_path = $3
+        """
+        try:
+            async with PgVectorConnection("default") as conn:
+                return await conn.fetchval(sql, str(repo_id), str(user_id), file_path)
+        except Exception:
+            logging.exception(f"{self.get_repo_file_content.__name__} failed")
+            return None
     
     async def get_user_repo_chunks_multi(
         self,
@@ -94,6 +870,7 @@ class TortoiseCodeChunksStore(ICodeChunksStore):
         query_embeddings: List[List[float]],
         emb_dim: int,
         limit: int = 10,
+        options: Optional[CodeChunksSearchOptions] = None,
     ) -> List[Dict[str, Any]]:
         """
         Multi-query:
@@ -101,27 +878,551 @@ class TortoiseCodeChunksStore(ICodeChunksStore):
         - Computes similarity per (chunk, query).
         - Fuses per-chunk via SUM(sim) as fusion_score.
         - Orders by fusion_score, then max_sim, then created_at.
+        - options.ef_search / options.probes are applied with SET LOCAL, scoped to this query only.
+        - options.strategy = CANDIDATES swaps the exact scan for an index-served top-K per query
+          vector, only those candidates are fused (options.fusion) and fetched.
+        - options.strategy = BINARY takes that top-K by exact re-ranking of a Hamming distance
+          prefilter over embedding_bits (top-K * options.oversampling rows per query vector).
+        - options.mmr_lambda / options.max_chunks_per_file diversify the results: the query
+          returns options.mmr_pool_size rows with their embeddings, `limit` of them are picked by
+          MMR (see code_chunks_mmr), in pick order.
+        - options.after (next_search_cursor of the previous page) returns the next `limit` rows,
+          filtered on the ranking tuple so each page costs about the same as the first one.
+        - options.min_similarity drops the (chunk, query vector) similarities under it before the
+          fusion: while scanning for EXACT, right after the top-K index scan for CANDIDATES/BINARY.
+          The computed / dropped counts feed `similarity_pruning_stats`.
         """
-        if not repo_id or not user_id or limit <= 0 or not query_embeddings:
+        prepared = self._prepare_repo_search(user_id, repo_id, query_embeddings, emb_dim, limit, options)
+        if prepared is None:
             return []
 
+        sql, params, settings, finish = prepared
+        try:
+            rows = await self._fetch_with_settings(sql, params, settings)
+            return finish(rows)
+        except Exception:
+            logging.exception("Multi-query similarity search failed")
+            return []
+
+    async def batch_get_user_repo_chunks_multi(
+        self, requests: Sequence[CodeChunksSearchRequestDTO], emb_dim: int
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Runs independent get_user_repo_chunks_multi searches (any user, repo, vectors, limit and
+        options) on a single pooled connection. The requests sharing a statement shape and search
+        knobs are sent together with asyncpg's fetchmany: one prepared statement, bound once per
+        request and pipelined in a single round trip. Each row is tagged with the position of its
+        request. The knobs are set at session level, only when they differ from the previous group,
+        and reset before the connection goes back to the pool.
+
+        Results are aligned with `requests`. Like the single call, an invalid or failed request
+        yields [] at its position. When a pipelined group fails, its requests are retried one by one
+        so the failure only empties the slot of the failing request.
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in requests]
+        groups: Dict[tuple, list] = {}
+        for position, request in enumerate(requests):
+            search = self._prepare_repo_search(
+                request.user_id,
+                request.repo_id,
+                request.query_embeddings,
+                emb_dim,
+                request.limit,
+                request.options,
+            )
+            if search is not None:
+                sql, params, settings, finish = search
+                groups.setdefault((sql, len(params), tuple(settings)), []).append((position, params, finish))
+
+        if not groups:
+            return results
+
+        try:
+            async with PgVectorConnection("default") as conn:
+                knobs: Dict[str, str] = {}
+                try:
+                    for (sql, n_params, settings), members in groups.items():
+                        await self._set_batch_knobs(conn, knobs, dict(setting_knob(s) for s in settings))
+                        tagged_sql = self._batch_search_sql(sql, n_params + 1)
+                        finishers = {position: finish for position, _, finish in members}
+                        for position, rows in await self._fetch_batch_group(conn, tagged_sql, members):
+                            results[position] = finishers[position](rows)
+                finally:
+                    # the pool's RESET ALL on release is the backstop when the connection broke
+                    await self._set_batch_knobs(conn, knobs, {})
+        except Exception:
+            logging.exception("Batched similarity search failed")
+            return [[] for _ in requests]
+
+        return results
+
+    @staticmethod
+    def _batch_search_sql(sql: str, p_position: int) -> str:
+        """Tags every row of a single repo search with its request position, sent as $p_position."""
+        return f"""
+            SELECT ${p_position}::int AS batch_position, s.*
+            FROM ({sql.strip().rstrip(";")}) AS s
+        """
+
+    @staticmethod
+    async def _fetch_batch_group(conn, tagged_sql: str, members: list) -> List[tuple]:
+        """
+        (position, records) of every request of a group the server didn't reject. Only the server
+        errors of a request are retried one by one, anything else fails the whole batch.
+        """
+        try:
+            records = await conn.fetchmany(tagged_sql, [[*params, position] for position, params, _ in members])
+        except asyncpg.PostgresError:
+            # the pipeline runs in one implicit transaction, a failing request fails them all
+            logging.exception("Batched similarity search group failed, retrying its requests one by one")
+            records = []
+            for position, params, _ in members:
+                try:
+                    records.extend(await conn.fetch(tagged_sql, *params, position))
+                except asyncpg.PostgresError:
+                    logging.exception("Batched similarity search %s failed", position)
+
+        by_position: Dict[int, list] = {position: [] for position, _, _ in members}
+        for record in records:
+            row = dict(record)
+            by_position[row.pop("batch_position")].append(row)
+
+        # the subquery's ORDER BY isn't guaranteed to survive the outer SELECT, rank again (the
+        # all-NULL row of an empty min_similarity result has no ranking, it is alone anyway)
+        for rows in by_position.values():
+            rows.sort(key=lambda row: search_row_key(row) if row.get("id") is not None else (), reverse=True)
+        return list(by_position.items())
+
+    @staticmethod
+    async def _set_batch_knobs(conn, knobs: Dict[str, str], wanted: Dict[str, str]) -> None:
+        """
+        Brings the session knobs from `knobs` (updated in place) to `wanted` in one statement,
+        set_config(name, NULL) resetting a knob to its default.
+        """
+        changed = sorted(name for name in knobs.keys() | wanted.keys() if knobs.get(name) != wanted.get(name))
+        if not changed:
+            return
+
+        params = []
+        calls = []
+        for name in changed:
+            params.extend([name, wanted.get(name)])
+            calls.append(f"set_config(${len(params) - 1}, ${len(params)}::text, false)")
+        await conn.fetch(f"SELECT {', '.join(calls)}", *params)
+        knobs.clear()
+        knobs.update(wanted)
+
+    def _prepare_repo_search(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int,
+        options: Optional[CodeChunksSearchOptions],
+    ) -> Optional[tuple]:
+        """
+        Validates a single repo search, returns its (sql, params, settings, finish) or None if it has
+        no results. finish turns the fetched records into the result rows.
+        """
+        if not repo_id or not user_id or limit <= 0 or not query_embeddings:
+            return None
+
         # Guard: consistent dimensions
         if any(len(v) != emb_dim for v in query_embeddings):
             logging.error("Embeddings have inconsistent dimensions.")
+            return None
+
+        options = options or CodeChunksSearchOptions()
+        try:
+            pool_size = resolve_mmr_pool_size(options, limit)
+            # a diversified search fetches its whole pool, then keeps `limit` rows of it
+            fetch_limit = pool_size or limit
+            candidates_per_query = resolve_candidates_per_query(options, fetch_limit)
+            settings = self._index_search_settings(options, candidates_per_query)
+            cursor = resolve_search_cursor(options)
+            validate_min_similarity(options)
+        except ValueError:
+            logging.exception("Invalid search options.")
+            return None
+
+        extra_columns: tuple = ()
+        if pool_size is not None:
+            projected = SEARCH_PROJECTION_COLUMNS[ChunkProjection(options.projection)]
+            extra_columns = tuple(c for c in ("file_path", "embedding") if c not in projected)
+        finish = functools.partial(
+            self._finish_repo_search, limit=limit, options=options, diversify=pool_size is not None,
+            extra_columns=extra_columns,
+        )
+
+        vectors = query_vectors_param(query_embeddings)
+        if options.strategy in (ChunkSearchStrategy.CANDIDATES, ChunkSearchStrategy.BINARY):
+            binary = options.strategy == ChunkSearchStrategy.BINARY
+            params = [vectors, str(user_id), str(repo_id), int(fetch_limit), candidates_per_query]
+            if binary:
+                params.append(candidates_per_query * int(options.oversampling))
+            if options.fusion == ChunkFusion.RRF:
+                params.append(int(options.rrf_k))
+            p_min_similarity = self._min_similarity_param(params, options)
+            sql = self._build_candidates_search_sql(
+                emb_dim,
+                options.fusion,
+                self.embedding_storage,
+                binary_prefilter=binary,
+                projection=options.projection,
+                extra_columns=extra_columns,
+                p_after=len(params) + 1 if cursor else None,
+                p_min_similarity=p_min_similarity,
+            )
+        else:
+            params = [vectors, str(user_id), str(repo_id), int(fetch_limit)]
+            p_min_similarity = self._min_similarity_param(params, options)
+            sql = self._build_exact_search_sql(
+                emb_dim,
+                self.embedding_storage,
+                options.projection,
+                extra_columns=extra_columns,
+                p_after=len(params) + 1 if cursor else None,
+                p_min_similarity=p_min_similarity,
+            )
+        params.extend(self._keyset_params(cursor))
+
+        return sql, params, settings, finish
+
+    def _finish_repo_search(
+        self,
+        records: list,
+        *,
+        limit: int,
+        options: CodeChunksSearchOptions,
+        diversify: bool,
+        extra_columns: Sequence[str],
+    ) -> List[Dict[str, Any]]:
+        """Result rows of a single repo search, diversified out of the fetched pool when asked."""
+        if options.min_similarity is not None:
+            rows = self._take_pruning_counts(records)
+        else:
+            rows = [self._search_row(r) for r in records]
+        if not diversify:
+            return rows
+
+        for row in rows:
+            row["embedding"] = decode_embedding(row.get("embedding"))
+        rows = diversify_search_rows(rows, limit, options)
+        # the columns only fetched for the diversification stay off the result
+        return [{k: v for k, v in row.items() if k not in extra_columns} for row in rows]
+
+    async def get_user_repos_chunks_multi(
+        self,
+        user_id: str | uuid.UUID,
+        repo_ids: Optional[Sequence[str | uuid.UUID]],
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        per_repo_limit: Optional[int] = None,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        get_user_repo_chunks_multi across several repos of the user in a single statement:
+        `repo_ids` restricts the search to those repos, None searches every repo of the user.
+        `per_repo_limit` caps the rows returned per repo, so one large repo can't take all `limit`
+        slots. Rows carry their repo_id on top of the get_user_repo_chunks_multi shape.
+
+        Chunks without an embedding are skipped, and the options behave as for a single repo: with
+        CANDIDATES/BINARY the top-K per query vector is taken across all the searched repos,
+        options.after pages through the results (after the per repo cap) and options.min_similarity
+        prunes the weak matches before the fusion. The results aren't diversified, mmr_lambda and
+        max_chunks_per_file are rejected.
+        """
+        if not user_id or limit <= 0 or not query_embeddings:
+            return []
+        if repo_ids is not None and not repo_ids:
+            return []
+
+        if any(len(v) != emb_dim for v in query_embeddings):
+            logging.error("Embeddings have inconsistent dimensions.")
+            return []
+
+        options = options or CodeChunksSearchOptions()
+        try:
+            validate_per_repo_limit(per_repo_limit)
+            reject_diversification(options, "multi repo search")
+            candidates_per_query = resolve_candidates_per_query(options, limit)
+            settings = self._index_search_settings(options, candidates_per_query)
+            cursor = resolve_search_cursor(options)
+            validate_min_similarity(options)
+        except ValueError:
+            logging.exception("Invalid search options.")
             return []
 
-        # Build VALUES placeholders for each query vector: ($1::vector(dim)), ($2::vector(dim)), ...
-        n = len(query_embeddings)
-        values_sql = ", ".join(f"(${i+1}::vector({emb_dim}))" for i in range(n))
+        sql, params = self._build_multi_repo_search(
+            query_embeddings,
+            emb_dim,
+            str(user_id),
+            None if repo_ids is None else sorted({str(r) for r in repo_ids}),
+            int(limit),
+            per_repo_limit,
+            options,
+            candidates_per_query,
+            self.embedding_storage,
+            cursor,
+        )
 
-        # Next placeholders for user_id, repo_id, limit:
-        p_user   = n + 1
-        p_repo   = n + 2
-        p_limit  = n + 3
+        try:
+            rows = await self._fetch_with_settings(sql, params, settings)
+            if options.min_similarity is not None:
+                return self._take_pruning_counts(rows)
+            return [self._search_row(r) for r in rows]
+        except Exception:
+            logging.exception("Multi-repo similarity search failed")
+            return []
 
+    @staticmethod
+    def _build_multi_repo_search(
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        user_id: str,
+        repo_ids: Optional[List[str]],
+        limit: int,
+        per_repo_limit: Optional[int],
+        options: CodeChunksSearchOptions,
+        candidates_per_query: int,
+        storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+        cursor: Optional[SearchCursor] = None,
+    ) -> tuple[str, list]:
+        """
+        Builds the statement together with its params, the optional parts (repo list, per repo cap,
+        candidate sizes, rrf_k, page cursor) only take a placeholder when they are used.
+        """
+        params: list = [query_vectors_param(query_embeddings)]
+
+        def param(value) -> int:
+            params.append(value)
+            return len(params)
+
+        queries_sql = TortoiseCodeChunksStore._query_vectors_sql(emb_dim, storage)
+
+        p_user = param(user_id)
+        scope_sql = f"c.user_id = ${p_user}"
+        if repo_ids is not None:
+            scope_sql += f" AND c.repo_id = ANY(${param(repo_ids)}::text[])"
+
+        p_min = None if options.min_similarity is None else param(float(options.min_similarity))
+        agg_filter_sql = ""
+        if options.strategy == ChunkSearchStrategy.EXACT:
+            scored_sql = f"""
+            scored AS (
+              SELECT
+                c.id,
+                c.repo_id,
+                c.created_at,
+                1 - (c.embedding <=> q.qvec) AS sim
+              FROM public.code_chunks AS c
+              CROSS JOIN queries AS q
+              WHERE {scope_sql}
+                AND c.embedding IS NOT NULL{TortoiseCodeChunksStore._min_similarity_sql(p_min)}
+            )"""
+            fusion_sql = "SUM(sim)"
+            pruning_sql = TortoiseCodeChunksStore._pruning_sql("scored", p_min, scope_sql)
+        else:
+            p_k = param(candidates_per_query)
+            p_prefilter = None
+            if options.strategy == ChunkSearchStrategy.BINARY:
+                p_prefilter = param(candidates_per_query * int(options.oversampling))
+            candidates_sql = TortoiseCodeChunksStore._vector_candidates_sql(
+                emb_dim, scope_sql, p_k, p_prefilter
+            )
+            scored_sql = f"""
+            scored AS (
+              SELECT
+                k.id,
+                k.repo_id,
+                k.created_at,
+                k.sim,
+                ROW_NUMBER() OVER (PARTITION BY q.qidx ORDER BY k.sim DESC) AS rnk
+              FROM queries AS q
+              CROSS JOIN LATERAL ({candidates_sql}
+              ) AS k
+            )"""
+            fusion_sql = {
+                ChunkFusion.SUM: "SUM(sim)",
+                ChunkFusion.MAX: "MAX(sim)",
+                ChunkFusion.RRF: f"SUM(1.0 / (${param(int(options.rrf_k))}::int + rnk))",
+            }[ChunkFusion(options.fusion)]
+            if p_min is not None:
+                agg_filter_sql = f"\n              WHERE sim >= ${p_min}::float8"
+            pruning_sql = TortoiseCodeChunksStore._pruning_sql("scored", p_min)
+
+        ranking = "fusion_score DESC, max_sim DESC, created_at DESC, id DESC"
+        if per_repo_limit is not None:
+            capped_sql = f"""
+            capped AS (
+              SELECT *
+              FROM (
+                SELECT
+                  agg.*,
+                  ROW_NUMBER() OVER (PARTITION BY repo_id ORDER BY {ranking}) AS repo_rank
+                FROM agg
+              ) AS ranked
+              WHERE repo_rank <= ${param(int(per_repo_limit))}
+            ),"""
+            winners_source = "capped"
+        else:
+            capped_sql = ""
+            winners_source = "agg"
+
+        keyset_sql = ""
+        if cursor is not None:
+            p_after = len(params) + 1
+            params.extend(TortoiseCodeChunksStore._keyset_params(cursor))
+            keyset_sql = f"""
+              WHERE {TortoiseCodeChunksStore._keyset_sql(p_after)}"""
+
+        columns_sql = TortoiseCodeChunksStore._projection_sql(options.projection)
+        pruning_columns, join_open, join_close = TortoiseCodeChunksStore._pruning_join_sql(p_min)
         sql = f"""
-            WITH queries(qvec) AS (
-              VALUES {values_sql}
+            WITH queries(qidx, qvec) AS (
+              {queries_sql}
+            ),{scored_sql},{pruning_sql}
+            agg AS (
+              SELECT
+                id,
+                MAX(repo_id)    AS repo_id,
+                MAX(created_at) AS created_at,
+                {fusion_sql} AS fusion_score,
+                MAX(sim)        AS max_sim
+              FROM scored{agg_filter_sql}
+              GROUP BY id
+            ),{capped_sql}
+            winners AS (
+              SELECT id, repo_id, created_at, fusion_score, max_sim
+              FROM {winners_source}{keyset_sql}
+              ORDER BY {ranking}
+              LIMIT ${param(limit)}
+            )
+            SELECT
+              c.id,
+              c.repo_id,
+{columns_sql}              w.created_at,
+              w.fusion_score,
+              w.max_sim{pruning_columns}
+            FROM {join_open}winners w
+            JOIN public.code_chunks c ON c.id = w.id
+              AND c.user_id = ${p_user}{join_close}
+            ORDER BY w.fusion_score DESC, w.max_sim DESC, w.created_at DESC, w.id DESC;
+        """
+        return sql, params
+
+    async def get_user_repo_chunks_hybrid(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_text: str,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Hybrid lexical + vector search, in a single statement:
+        - Lexical: full text match of `query_text` (websearch syntax) on content, ranked by
+          ts_rank_cd, served by the code_chunks_content_tsv_idx GIN index.
+        - Vector: top-K per query vector, as the CANDIDATES (or BINARY) strategy does.
+        - Both rankings are fused with reciprocal rank fusion (options.rrf_k), since text ranks and
+          cosine similarities aren't on comparable scales, options.fusion is not used.
+
+        Same row shape as get_user_repo_chunks_multi, max_sim is NULL for chunks that only
+        matched lexically. Empty `query_embeddings` makes it a purely lexical search. It isn't
+        paginated nor diversified, options.after, mmr_lambda and max_chunks_per_file are rejected.
+        """
+        if not repo_id or not user_id or limit <= 0 or not query_text or not query_text.strip():
+            return []
+
+        if any(len(v) != emb_dim for v in query_embeddings):
+            logging.error("Embeddings have inconsistent dimensions.")
+            return []
+
+        options = options or CodeChunksSearchOptions()
+        if options.strategy == ChunkSearchStrategy.EXACT:
+            # The vector side is always a top-K per query vector
+            options = dataclasses.replace(
+                options, strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF
+            )
+        try:
+            if options.after is not None:
+                raise ValueError("the hybrid search can't be paginated with `after`")
+            if options.min_similarity is not None:
+                raise ValueError("the hybrid search doesn't support min_similarity")
+            reject_diversification(options, "hybrid search")
+            candidates_per_query = resolve_candidates_per_query(options, limit)
+            settings = (
+                self._index_search_settings(options, candidates_per_query) if query_embeddings else []
+            )
+        except ValueError:
+            logging.exception("Invalid search options.")
+            return []
+
+        binary = options.strategy == ChunkSearchStrategy.BINARY
+        sql = self._build_hybrid_search_sql(
+            bool(query_embeddings),
+            emb_dim,
+            self.embedding_storage,
+            binary_prefilter=binary,
+            projection=options.projection,
+        )
+        params = [
+            *([query_vectors_param(query_embeddings)] if query_embeddings else []),
+            str(user_id),
+            str(repo_id),
+            int(limit),
+            candidates_per_query,
+            query_text,
+            int(options.rrf_k),
+        ]
+        if binary and query_embeddings:
+            params.append(candidates_per_query * int(options.oversampling))
+
+        try:
+            rows = await self._fetch_with_settings(sql, params, settings)
+            return [self._search_row(r) for r in rows]
+        except Exception:
+            logging.exception("Hybrid search failed")
+            return []
+
+    @staticmethod
+    def _build_exact_search_sql(
+        emb_dim: int,
+        storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+        projection: ChunkProjection = ChunkProjection.CONTENT,
+        extra_columns: Sequence[str] = (),
+        p_after: Optional[int] = None,
+        p_min_similarity: Optional[int] = None,
+    ) -> str:
+        """
+        Scores every chunk of the repo against every query vector, exact but no index can serve it.
+        The similarities under $p_min_similarity are dropped while scanning, before the grouping.
+        Params: $1 query vectors array, then user_id, repo_id, limit, (min_similarity when given),
+        (the page cursor from $p_after when given).
+        """
+        queries_sql = TortoiseCodeChunksStore._query_vectors_sql(emb_dim, storage)
+
+        # Placeholders for user_id, repo_id, limit:
+        p_user   = 2
+        p_repo   = 3
+        p_limit  = 4
+
+        keyset_sql = ""
+        if p_after is not None:
+            keyset_sql = f"""
+              AND {TortoiseCodeChunksStore._keyset_sql(p_after, "a.")}"""
+
+        scope_sql = f"c.user_id = ${p_user} AND c.repo_id = ${p_repo}"
+        pruning_sql = TortoiseCodeChunksStore._pruning_sql("scored", p_min_similarity, scope_sql)
+        pruning_columns, join_open, join_close = TortoiseCodeChunksStore._pruning_join_sql(p_min_similarity)
+        columns_sql = TortoiseCodeChunksStore._projection_sql(projection, extra_columns)
+        return f"""
+            WITH queries(qidx, qvec) AS (
+              {queries_sql}
             ),
             scored AS (
               SELECT
@@ -131,10 +1432,8 @@ class TortoiseCodeChunksStore(ICodeChunksStore):
               FROM public.code_chunks AS c
               CROSS JOIN queries AS q
               WHERE c.user_id = ${p_user}
-                AND c.repo_id = ${p_repo}
-                -- OPTIONAL, ENABLE IF YOU WANT TO REMOVE THE LOW RANKED ONES
-                -- AND (1 - (c.embedding <=> q.qvec)) >= 0.20
-            ),
+                AND c.repo_id = ${p_repo}{TortoiseCodeChunksStore._min_similarity_sql(p_min_similarity)}
+            ),{pruning_sql}
             agg AS (
               SELECT
                 id,
@@ -146,25 +1445,431 @@ class TortoiseCodeChunksStore(ICodeChunksStore):
             )
             SELECT
               c.id,
-              c.file_name,
-              c.file_path,
-              c.content,
-              a.created_at,
+{columns_sql}              a.created_at,
               a.fusion_score,
-              a.max_sim
-            FROM agg a
+              a.max_sim{pruning_columns}
+            FROM {join_open}agg a
             JOIN public.code_chunks c ON c.id = a.id
               -- for defensive clarity:
               AND c.user_id = ${p_user}
-              AND c.repo_id = ${p_repo}
-            ORDER BY a.fusion_score DESC, a.max_sim DESC, a.created_at DESC
+              AND c.repo_id = ${p_repo}{keyset_sql}{join_close}
+            -- chunks without an embedding score NULL, last (DESC would put NULLs first)
+            ORDER BY a.fusion_score DESC NULLS LAST, a.max_sim DESC NULLS LAST, a.created_at DESC, a.id DESC
             LIMIT ${p_limit};
         """
-        try:
-            async with PgVectorConnection("default") as conn:
-                params = [*query_embeddings, str(user_id), str(repo_id), int(limit)]
-                rows = await conn.fetch(sql, *params)
-                return [dict(r) for r in rows]
-        except Exception:
-            logging.exception("Multi-query similarity search failed")
-            return []
\ No newline at end of file
+
+    @staticmethod
+    def _build_candidates_search_sql(
+        emb_dim: int,
+        fusion: ChunkFusion,
+        storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+        binary_prefilter: bool = False,
+        projection: ChunkProjection = ChunkProjection.CONTENT,
+        extra_columns: Sequence[str] = (),
+        p_after: Optional[int] = None,
+        p_min_similarity: Optional[int] = None,
+    ) -> str:
+        """
+        Each query vector gets its own `ORDER BY distance LIMIT k` in a LATERAL subquery, which is
+        the shape an HNSW/IVFFLAT index can serve. Only the candidate sets are fused, and only the
+        final winners are joined back to fetch their content.
+
+        With `binary_prefilter`, the LATERAL subquery first picks the closest rows by Hamming
+        distance between embedding_bits and the binary_quantize'd query vector, and only those are
+        re-ranked by exact cosine distance on the full embedding.
+
+        $p_min_similarity drops the candidates under it before the fusion. It is applied outside of
+        the `ORDER BY distance LIMIT k` subquery, so the index scan still stops after k rows.
+
+        Params: $1 query vectors array, then user_id, repo_id, limit, k, (prefilter size when
+        binary_prefilter), (rrf_k when fusion is RRF), (min_similarity when given), (the page cursor
+        from $p_after when given).
+        """
+        queries_sql = TortoiseCodeChunksStore._query_vectors_sql(emb_dim, storage)
+
+        p_user  = 2
+        p_repo  = 3
+        p_limit = 4
+        p_k     = 5
+        p_prefilter = 6
+        p_rrf_k = 7 if binary_prefilter else 6
+
+        fusion_sql = {
+            ChunkFusion.SUM: "SUM(sim)",
+            ChunkFusion.MAX: "MAX(sim)",
+            ChunkFusion.RRF: f"SUM(1.0 / (${p_rrf_k}::int + rnk))",
+        }[ChunkFusion(fusion)]
+
+        candidates_sql = TortoiseCodeChunksStore._vector_candidates_sql(
+            emb_dim, f"c.user_id = ${p_user} AND c.repo_id = ${p_repo}", p_k,
+            p_prefilter if binary_prefilter else None,
+        )
+
+        keyset_sql = ""
+        if p_after is not None:
+            keyset_sql = f"""
+              WHERE {TortoiseCodeChunksStore._keyset_sql(p_after)}"""
+
+        agg_filter_sql = ""
+        if p_min_similarity is not None:
+            agg_filter_sql = f"\n              WHERE sim >= ${p_min_similarity}::float8"
+        pruning_sql = TortoiseCodeChunksStore._pruning_sql("candidates", p_min_similarity)
+        pruning_columns, join_open, join_close = TortoiseCodeChunksStore._pruning_join_sql(p_min_similarity)
+        columns_sql = TortoiseCodeChunksStore._projection_sql(projection, extra_columns)
+        return f"""
+            WITH queries(qidx, qvec) AS (
+              {queries_sql}
+            ),
+            candidates AS (
+              SELECT
+                q.qidx,
+                k.id,
+                k.created_at,
+                k.sim,
+                ROW_NUMBER() OVER (PARTITION BY q.qidx ORDER BY k.sim DESC) AS rnk
+              FROM queries AS q
+              CROSS JOIN LATERAL ({candidates_sql}
+              ) AS k
+            ),{pruning_sql}
+            agg AS (
+              SELECT
+                id,
+                MAX(created_at) AS created_at,
+                {fusion_sql} AS fusion_score,
+                MAX(sim)        AS max_sim
+              FROM candidates{agg_filter_sql}
+              GROUP BY id
+            ),
+            winners AS (
+              SELECT id, created_at, fusion_score, max_sim
+              FROM agg{keyset_sql}
+              ORDER BY fusion_score DESC, max_sim DESC, created_at DESC, id DESC
+              LIMIT ${p_limit}
+            )
+            SELECT
+              c.id,
+{columns_sql}              w.created_at,
+              w.fusion_score,
+              w.max_sim{pruning_columns}
+            FROM {join_open}winners w
+            JOIN public.code_chunks c ON c.id = w.id
+              AND c.user_id = ${p_user}
+              AND c.repo_id = ${p_repo}{join_close}
+            ORDER BY w.fusion_score DESC, w.max_sim DESC, w.created_at DESC, w.id DESC;
+        """
+
+    @staticmethod
+    def _build_hybrid_search_sql(
+        query_vectors: bool,
+        emb_dim: int,
+        storage: EmbeddingStorage = EmbeddingStorage.VECTOR,
+        binary_prefilter: bool = False,
+        projection: ChunkProjection = ChunkProjection.CONTENT,
+    ) -> str:
+        """
+        RRF of the top-k lexical matches and the top-k chunks of each query vector.
+        Params: $1 query vectors array (only with `query_vectors`), then user_id, repo_id, limit, k,
+        query_text, rrf_k, (prefilter size when binary_prefilter and query_vectors).
+        """
+        first = 2 if query_vectors else 1
+        p_user  = first
+        p_repo  = first + 1
+        p_limit = first + 2
+        p_k     = first + 3
+        p_text  = first + 4
+        p_rrf_k = first + 5
+        p_prefilter = first + 6 if binary_prefilter else None
+
+        # Same expression as the GIN index, `content` can only be c.content here
+        tsvector_sql = CODE_CHUNKS_CONTENT_TSVECTOR
+        lexical_sql = f"""
+            lexical_candidates AS (
+              SELECT
+                l.id,
+                l.created_at,
+                NULL::double precision AS sim,
+                ROW_NUMBER() OVER (ORDER BY l.lex_rank DESC, l.created_at DESC) AS rnk
+              FROM (
+                SELECT
+                  c.id,
+                  c.created_at,
+                  ts_rank_cd({tsvector_sql}, tsq.query) AS lex_rank
+                FROM public.code_chunks AS c
+                CROSS JOIN websearch_to_tsquery('{CODE_CHUNKS_TEXT_SEARCH_CONFIG}', ${p_text}::text) AS tsq(query)
+                WHERE c.user_id = ${p_user}
+                  AND c.repo_id = ${p_repo}
+                  AND {tsvector_sql} @@ tsq.query
+                ORDER BY lex_rank DESC, c.created_at DESC
+                LIMIT ${p_k}
+              ) AS l
+            )"""
+
+        if query_vectors:
+            queries_sql = TortoiseCodeChunksStore._query_vectors_sql(emb_dim, storage)
+            candidates_sql = TortoiseCodeChunksStore._vector_candidates_sql(
+                emb_dim, f"c.user_id = ${p_user} AND c.repo_id = ${p_repo}", p_k, p_prefilter
+            )
+            ranked_sql = f"""
+            WITH queries(qidx, qvec) AS (
+              {queries_sql}
+            ),
+            vector_candidates AS (
+              SELECT
+                k.id,
+                k.created_at,
+                k.sim,
+                ROW_NUMBER() OVER (PARTITION BY q.qidx ORDER BY k.sim DESC) AS rnk
+              FROM queries AS q
+              CROSS JOIN LATERAL ({candidates_sql}
+              ) AS k
+            ),{lexical_sql},
+            candidates AS (
+              SELECT id, created_at, sim, rnk FROM vector_candidates
+              UNION ALL
+              SELECT id, created_at, sim, rnk FROM lexical_candidates
+            )"""
+        else:
+            ranked_sql = f"""
+            WITH{lexical_sql},
+            candidates AS (
+              SELECT id, created_at, sim, rnk FROM lexical_candidates
+            )"""
+
+        columns_sql = TortoiseCodeChunksStore._projection_sql(projection)
+        return f"""{ranked_sql},
+            agg AS (
+              SELECT
+                id,
+                MAX(created_at) AS created_at,
+                SUM(1.0 / (${p_rrf_k}::int + rnk)) AS fusion_score,
+                MAX(sim)        AS max_sim
+              FROM candidates
+              GROUP BY id
+            ),
+            winners AS (
+              SELECT id, created_at, fusion_score, max_sim
+              FROM agg
+              ORDER BY fusion_score DESC, max_sim DESC NULLS LAST, created_at DESC, id DESC
+              LIMIT ${p_limit}
+            )
+            SELECT
+              c.id,
+{columns_sql}              w.created_at,
+              w.fusion_score,
+              w.max_sim
+            FROM winners w
+            JOIN public.code_chunks c ON c.id = w.id
+              AND c.user_id = ${p_user}
+              AND c.repo_id = ${p_repo}
+            ORDER BY w.fusion_score DESC, w.max_sim DESC NULLS LAST, w.created_at DESC, w.id DESC;
+        """
+
+    @staticmethod
+    def _query_vectors_sql(emb_dim: int, storage: EmbeddingStorage = EmbeddingStorage.VECTOR) -> str:
+        """
+        Body of the `queries(qidx, qvec)` CTE: the $1 array of query vectors unnested server-side.
+        The statement text doesn't depend on the number of vectors, so each search shape is parsed
+        and planned once per connection and then served by asyncpg's prepared statement cache.
+        """
+        vector_type = EmbeddingStorage(storage).value
+        return f"SELECT u.qidx, u.qvec FROM unnest($1::{vector_type}({emb_dim})[]) WITH ORDINALITY AS u(qvec, qidx)"
+
+    @staticmethod
+    def _min_similarity_param(params: list, options: CodeChunksSearchOptions) -> Optional[int]:
+        """Appends options.min_similarity to `params` when set, returns its placeholder number."""
+        if options.min_similarity is None:
+            return None
+        params.append(float(options.min_similarity))
+        return len(params)
+
+    @staticmethod
+    def _min_similarity_sql(p_min_similarity: Optional[int]) -> str:
+        """Condition of a scan scoring `c` against `q`, dropping the similarities under the threshold."""
+        if p_min_similarity is None:
+            return ""
+        return f"\n                AND 1 - (c.embedding <=> q.qvec) >= ${p_min_similarity}::float8"
+
+    @staticmethod
+    def _pruning_sql(source: str, p_min_similarity: Optional[int], scope_sql: Optional[str] = None) -> str:
+        """
+        `pruning(scored_count, pruned_count)` CTE of a min_similarity search: the (chunk, query
+        vector) similarities computed, and how many the threshold dropped. With `scope_sql` (EXACT)
+        `source` only holds the similarities kept by the scan, the computed ones are counted from
+        the embedded chunks in scope (conditions on `c`) times the query vectors.
+        """
+        if p_min_similarity is None:
+            return ""
+        if scope_sql is None:
+            return f"""
+            pruning AS (
+              SELECT
+                COUNT(*) AS scored_count,
+                COUNT(*) FILTER (WHERE sim < ${p_min_similarity}::float8) AS pruned_count
+              FROM {source}
+            ),"""
+        return f"""
+            pruning AS (
+              SELECT t.scored_count, t.scored_count - (SELECT COUNT(*) FROM {source}) AS pruned_count
+              FROM (
+                SELECT (SELECT COUNT(*) FROM queries) * COUNT(*) AS scored_count
+                FROM public.code_chunks AS c
+                WHERE {scope_sql}
+                  AND c.embedding IS NOT NULL
+              ) AS t
+            ),"""
+
+    @staticmethod
+    def _pruning_join_sql(p_min_similarity: Optional[int]) -> tuple[str, str, str]:
+        """
+        (columns, join opening, join closing) putting the pruning counters on every result row. The
+        LEFT JOIN from the single pruning row still returns them (on an all NULL row) when no chunk
+        passed the threshold.
+        """
+        if p_min_similarity is None:
+            return "", "", ""
+        columns = "".join(f",\n              p.{column}" for column in PRUNING_COLUMNS)
+        return columns, "pruning p\n            LEFT JOIN (", ") ON true"
+
+    def _take_pruning_counts(self, records: list) -> List[Dict[str, Any]]:
+        """
+        Result rows of a min_similarity search, once its pruning counters are recorded into
+        similarity_pruning_stats (and the row standing for an empty result dropped).
+        """
+        rows = [self._search_row(r) for r in records]
+        if rows:
+            self.similarity_pruning_stats.record(
+                scored=int(rows[0]["scored_count"] or 0), pruned=int(rows[0]["pruned_count"] or 0)
+            )
+        return [
+            {k: v for k, v in row.items() if k not in PRUNING_COLUMNS} for row in rows if row["id"] is not None
+        ]
+
+    @staticmethod
+    def _keyset_sql(p_after: int, alias: str = "") -> str:
+        """
+        Keeps the rows ranked after the page cursor sent in $p_after..$p_after+3 (see
+        code_chunks_cursor). NULL scores compare as -Infinity, which is where NULLS LAST ranks them.
+        """
+        return (
+            f"(COALESCE({alias}fusion_score::float8, '-Infinity'), COALESCE({alias}max_sim::float8, '-Infinity'), "
+            f"{alias}created_at, {alias}id) < "
+            f"(${p_after}::float8, ${p_after + 1}::float8, ${p_after + 2}::timestamptz, ${p_after + 3}::uuid)"
+        )
+
+    @staticmethod
+    def _keyset_params(cursor: Optional[SearchCursor]) -> list:
+        return [] if cursor is None else list(cursor.key())
+
+    @staticmethod
+    def _projection_sql(projection: ChunkProjection, extra_columns: Sequence[str] = ()) -> str:
+        """
+        Columns of `c` selected by the final SELECT of the searches, on top of the id and scores.
+        `extra_columns` are needed by a post-processing step (e.g. the diversification).
+        """
+        columns = dict.fromkeys([*SEARCH_PROJECTION_COLUMNS[ChunkProjection(projection)], *extra_columns])
+        return "".join(f"              c.{column},\n" for column in columns)
+
+    @staticmethod
+    def _search_row(record) -> Dict[str, Any]:
+        row = dict(record)
+        if isinstance(row.get("metadata"), str):
+            row["metadata"] = json.loads(row["metadata"])
+        return row
+
+    @staticmethod
+    def _vector_candidates_sql(
+        emb_dim: int, scope_sql: str, p_k: int, p_prefilter: Optional[int] = None
+    ) -> str:
+        """
+        Body of the LATERAL subquery returning the top `$p_k` (id, repo_id, created_at, sim) among
+        the chunks matching `scope_sql` (conditions on `c`) for the query vector `q.qvec`, either
+        index-served or re-ranked from a Hamming prefilter of `$p_prefilter` rows when given.
+        """
+        if p_prefilter is not None:
+            return f"""
+                SELECT
+                  p.id,
+                  p.repo_id,
+                  p.created_at,
+                  1 - (p.embedding <=> q.qvec) AS sim
+                FROM (
+                  SELECT c.id, c.repo_id, c.created_at, c.embedding
+                  FROM public.code_chunks AS c
+                  WHERE {scope_sql}
+                    AND c.embedding_bits IS NOT NULL
+                  ORDER BY c.embedding_bits <~> binary_quantize(q.qvec)::bit({emb_dim})
+                  LIMIT ${p_prefilter}
+                ) AS p
+                ORDER BY p.embedding <=> q.qvec
+                LIMIT ${p_k}"""
+
+        return f"""
+                SELECT
+                  c.id,
+                  c.repo_id,
+                  c.created_at,
+                  1 - (c.embedding <=> q.qvec) AS sim
+                FROM public.code_chunks AS c
+                WHERE {scope_sql}
+                  AND c.embedding IS NOT NULL
+                ORDER BY c.embedding <=> q.qvec
+                LIMIT ${p_k}"""
+
+    @staticmethod
+    def _index_search_settings(
+        options: CodeChunksSearchOptions, candidates_per_query: Optional[int] = None
+    ) -> List[str]:
+        """Translates the search knobs into the SET LOCAL statements understood by pgvector."""
+        settings = []
+
+        ef_search = options.ef_search
+        if (
+            ef_search is None
+            and options.strategy == ChunkSearchStrategy.CANDIDATES
+            and candidates_per_query
+        ):
+            # An HNSW scan never returns more than ef_search rows, widen it to the candidate set
+            ef_search = min(max(candidates_per_query, DEFAULT_MIN_CANDIDATES), HNSW_MAX_EF_SEARCH)
+
+        if ef_search is not None:
+            if not 1 <= ef_search <= HNSW_MAX_EF_SEARCH:
+                raise ValueError(f"ef_search must be between 1 and {HNSW_MAX_EF_SEARCH}")
+            settings.append(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+
+        if options.probes is not None:
+            if options.probes < 1:
+                raise ValueError("probes must be >= 1")
+            settings.append(f"SET LOCAL ivfflat.probes = {int(options.probes)}")
+
+        if options.iterative_scan is not None:
+            if options.iterative_scan not in HNSW_ITERATIVE_SCAN_MODES:
+                raise ValueError(f"iterative_scan must be one of {HNSW_ITERATIVE_SCAN_MODES}")
+            settings.append(f"SET LOCAL hnsw.iterative_scan = {options.iterative_scan}")
+
+        return settings
+
+    @staticmethod
+    async def _fetch_with_settings(sql: str, params: list, settings: List[str]) -> list:
+        """
+        Runs the query on a pgvector-aware connection. SET LOCAL only lives until the end of the
+        transaction, so the knobs never leak into the pooled connection.
+        """
+        async with PgVectorConnection("default") as conn:
+            if not settings:
+                return await conn.fetch(sql, *params)
+
+            async with conn.transaction():
+                for statement in settings:
+                    await conn.execute(statement)
+                return await conn.fetch(sql, *params)
+
+
+class TortoiseHalfVecCodeChunksStore(TortoiseCodeChunksStore):
+    """
+    Same API, for deployments that converted code_chunks.embedding to halfvec(768) with
+    convert_code_chunks_embedding_storage: query vectors are cast to halfvec so the
+    halfvec_cosine_ops index serves the search, and embeddings are read back as float32.
+    Writes need no change, PostgreSQL casts the incoming values to the column type.
+    """
+
+    embedding_storage = EmbeddingStorage.HALFVEC
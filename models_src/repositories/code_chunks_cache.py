@@ -0,0 +1,459 @@
+import array
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from models_src.dto.code_chunks import (
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksFileDiffResponseDTO,
+    CodeChunksPurgeProgressDTO,
+    CodeChunksRequestDTO,
+    CodeChunksResponseDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+    CodeChunksStatsDTO,
+    FileLookupMode,
+    SearchCacheStats,
+)
+from models_src.repositories.code_chunks import (
+    DEFAULT_PURGE_BATCH_SIZE,
+    DEFAULT_PURGE_PAUSE_SECONDS,
+    DEFAULT_STREAM_FETCH_SIZE,
+    ICodeChunksStore,
+    PurgeProgressCallback,
+    TortoiseCodeChunksStore,
+    report_progress,
+)
+
+DEFAULT_SEARCH_CACHE_MAXSIZE = 1024
+DEFAULT_SEARCH_CACHE_TTL_SECONDS = 300.0
+
+
+def hash_query_embeddings(query_embeddings: Sequence[Sequence[float]]) -> str:
+    """Stable digest of the query vectors (as float32, the precision pgvector searches with)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for vector in query_embeddings:
+        digest.update(len(vector).to_bytes(4, "little"))
+        digest.update(array.array("f", vector).tobytes())
+    return digest.hexdigest()
+
+
+class SearchResultCache:
+    """
+    In-process LRU + TTL cache of search results, indexed by repo so that a write to a repo drops
+    all of its entries at once. Safe to share between the stores of concurrent requests.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_SEARCH_CACHE_MAXSIZE,
+        ttl_seconds: float = DEFAULT_SEARCH_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        if ttl_seconds <= 0:
+            raise ValueError("ttl_seconds must be > 0")
+
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.stats = SearchCacheStats()
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, repo_ids, rows)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[str, ...], List[Dict[str, Any]]]]" = OrderedDict()
+        self._keys_by_repo: Dict[str, Set[Hashable]] = {}
+        # bumped on every invalidation, lets put() spot the results computed before a write
+        self._generations: Dict[str, int] = {}
+        self._prefix_generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+
+            expires_at, _, rows = entry
+            if expires_at <= self._clock():
+                self._drop(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            # deep copies, so callers can't alter the cached rows (metadata, embeddings)
+            return copy.deepcopy(rows)
+
+    def generation(self, repo_ids: str | Iterable[str]) -> Hashable:
+        """
+        Token of the invalidations of `repo_ids` so far. Taken before running a search and given
+        back to put(), it keeps a write landing during the search from caching stale rows.
+        """
+        repo_ids = _as_repo_ids(repo_ids)
+        with self._lock:
+            return tuple(self._generations.get(repo_id, 0) for repo_id in repo_ids), self._prefix_generation
+
+    def put(
+        self,
+        key: Hashable,
+        repo_ids: str | Iterable[str],
+        rows: List[Dict[str, Any]],
+        generation: Optional[Hashable] = None,
+    ) -> bool:
+        """
+        Caches `rows`, dropped as soon as any of `repo_ids` gets invalidated. With `generation`
+        (see generation()), nothing is cached if one of them got invalidated since. Returns
+        whether the rows were cached.
+        """
+        repo_ids = _as_repo_ids(repo_ids)
+        rows = copy.deepcopy(rows)
+        with self._lock:
+            current = tuple(self._generations.get(repo_id, 0) for repo_id in repo_ids), self._prefix_generation
+            if generation is not None and generation != current:
+                self.stats.stale_fills += 1
+                return False
+
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = (self._clock() + self.ttl_seconds, repo_ids, rows)
+            for repo_id in repo_ids:
+                self._keys_by_repo.setdefault(repo_id, set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.stats.evictions += 1
+            return True
+
+    def invalidate_repo(self, repo_id: str) -> int:
+        """Drops every entry of the repo, returns how many were dropped."""
+        with self._lock:
+            self._generations[repo_id] = self._generations.get(repo_id, 0) + 1
+            keys = list(self._keys_by_repo.get(repo_id, ()))
+            for key in keys:
+                self._drop(key)
+            self.stats.invalidations += len(keys)
+            return len(keys)
+
+    def invalidate_prefix(self, prefix: str) -> int:
+        """Drops the entries of every repo id (or scope) starting with `prefix`."""
+        with self._lock:
+            # the scopes under the prefix aren't all known, invalidate every search in flight
+            self._prefix_generation += 1
+            keys = {
+                key
+                for repo_id, repo_keys in self._keys_by_repo.items()
+                if repo_id.startswith(prefix)
+                for key in repo_keys
+            }
+            for key in keys:
+                self._drop(key)
+            self.stats.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_repo.clear()
+
+    def _drop(self, key: Hashable) -> None:
+        _, repo_ids, _ = self._entries.pop(key)
+        for repo_id in repo_ids:
+            repo_keys = self._keys_by_repo.get(repo_id)
+            if repo_keys is not None:
+                repo_keys.discard(key)
+                if not repo_keys:
+                    del self._keys_by_repo[repo_id]
+
+
+def _as_repo_ids(repo_ids: str | Iterable[str]) -> Tuple[str, ...]:
+    return (repo_ids,) if isinstance(repo_ids, str) else tuple(dict.fromkeys(repo_ids))
+
+
+def all_repos_scope(user_id) -> str:
+    """Invalidation scope of the results spanning every repo of a user, touched by any of its writes."""
+    return f"*:{user_id}"
+
+
+# Process wide cache used when CachedCodeChunksStore isn't given one
+default_search_cache = SearchResultCache()
+
+
+class CachedCodeChunksStore(ICodeChunksStore):
+    """
+    Caching layer around any ICodeChunksStore: results of the similarity searches are cached per
+    (user_id, repo_id, query vectors digest, limit, search arguments), and every write going
+    through this store drops the cached results of the repos it touched.
+
+    Writes done by other processes (or by stores not wrapped by this class) are only picked up
+    once the TTL runs out. Empty results are not cached, since the stores also return [] when the
+    query failed.
+
+    With FastAPI, provide it through a function so the cache outlives the request, e.g.
+    `def get_code_chunks_store(): return CachedCodeChunksStore(TortoiseCodeChunksStore())`.
+    """
+
+    def __init__(self, store: Optional[ICodeChunksStore] = None, cache: Optional[SearchResultCache] = None):
+        self.store = store if store is not None else TortoiseCodeChunksStore()
+        self.cache = cache if cache is not None else default_search_cache
+
+    @property
+    def stats(self) -> SearchCacheStats:
+        return self.cache.stats
+
+    def _invalidate(self, writes: Iterable[Tuple[Any, Any]]) -> None:
+        """`writes`: the (user_id, repo_id) pairs written to."""
+        scopes = set()
+        for user_id, repo_id in writes:
+            scopes.add(str(repo_id))
+            scopes.add(all_repos_scope(user_id))
+        for scope in scopes:
+            self.cache.invalidate_repo(scope)
+
+    async def _cached_search(self, key: Hashable, repo_ids: Iterable[str], search) -> List[Dict[str, Any]]:
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        repo_ids = list(repo_ids)
+        generation = self.cache.generation(repo_ids)
+        rows = await search()
+        if rows:
+            self.cache.put(key, repo_ids, rows, generation=generation)
+        return rows
+
+    async def save(self, create_model: CodeChunksRequestDTO) -> CodeChunksResponseDTO:
+        try:
+            return await self.store.save(create_model)
+        finally:
+            self._invalidate([(create_model.user_id, create_model.repo_id)])
+
+    async def bulk_save(self, create_model: list[CodeChunksRequestDTO]) -> List[CodeChunksResponseDTO]:
+        try:
+            return await self.store.bulk_save(create_model)
+        finally:
+            self._invalidate((c.user_id, c.repo_id) for c in create_model)
+
+    async def bulk_copy_save(self, create_model: list[CodeChunksRequestDTO]) -> List[uuid.UUID]:
+        try:
+            return await self.store.bulk_copy_save(create_model)
+        finally:
+            self._invalidate((c.user_id, c.repo_id) for c in create_model)
+
+    async def save_commit_file_diff(
+        self, diff: CodeChunksFileDiffRequestDTO
+    ) -> CodeChunksFileDiffResponseDTO:
+        try:
+            return await self.store.save_commit_file_diff(diff)
+        finally:
+            self._invalidate([(diff.user_id, diff.repo_id)])
+
+    async def delete_all_by_repo_id(self, repo_id: str) -> int:
+        try:
+            return await self.store.delete_all_by_repo_id(repo_id)
+        finally:
+            # no user_id at hand: drop every all repos result, they're cheap to recompute
+            self.cache.invalidate_repo(str(repo_id))
+            self.cache.invalidate_prefix(all_repos_scope(""))
+
+    async def purge_repo_chunks(
+        self,
+        repo_id: str,
+        batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+        pause: float = DEFAULT_PURGE_PAUSE_SECONDS,
+        on_progress: Optional[PurgeProgressCallback] = None,
+    ) -> CodeChunksPurgeProgressDTO:
+        async def invalidate_then_report(progress: CodeChunksPurgeProgressDTO) -> None:
+            # every batch changes the results of the repo
+            self.cache.invalidate_repo(str(repo_id))
+            self.cache.invalidate_prefix(all_repos_scope(""))
+            await report_progress(on_progress, progress)
+
+        try:
+            return await self.store.purge_repo_chunks(
+                repo_id, batch_size=batch_size, pause=pause, on_progress=invalidate_then_report
+            )
+        finally:
+            self.cache.invalidate_repo(str(repo_id))
+            self.cache.invalidate_prefix(all_repos_scope(""))
+
+    async def find_embeddings_by_content_hashes(
+        self, content_hashes: Sequence[str], user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return await self.store.find_embeddings_by_content_hashes(content_hashes, user_id=user_id)
+
+    async def find_all_by_repo_id_with_limit(
+        self, repo_id: str, limit: int = 100
+    ) -> List[CodeChunksResponseDTO]:
+        return await self.store.find_all_by_repo_id_with_limit(repo_id, limit=limit)
+
+    def stream_all_by_repo_id(
+        self,
+        repo_id: str,
+        fetch_size: int = DEFAULT_STREAM_FETCH_SIZE,
+        columns: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[CodeChunksResponseDTO]:
+        return self.store.stream_all_by_repo_id(repo_id, fetch_size=fetch_size, columns=columns)
+
+    async def fetch_contents_by_ids(
+        self,
+        user_id: str | uuid.UUID,
+        ids: Sequence[str | uuid.UUID],
+        repo_id: Optional[str | uuid.UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self.store.fetch_contents_by_ids(user_id, ids, repo_id=repo_id)
+
+    async def get_repo_file_chunks(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        file_name: str = "readme",
+        mode: FileLookupMode = FileLookupMode.CONTAINS,
+    ) -> List[dict]:
+        return await self.store.get_repo_file_chunks(user_id, repo_id, file_name=file_name, mode=mode)
+
+    async def get_repo_file_content(
+        self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_path: str
+    ) -> Optional[str]:
+        return await self.store.get_repo_file_content(user_id, repo_id, file_path)
+
+    async def get_repo_chunk_stats(self, repo_id: str) -> Optional[CodeChunksStatsDTO]:
+        return await self.store.get_repo_chunk_stats(repo_id)
+
+    async def get_commit_chunk_stats(
+        self, repo_id: str, commit_number: str
+    ) -> Optional[CodeChunksStatsDTO]:
+        return await self.store.get_commit_chunk_stats(repo_id, commit_number)
+
+    async def get_user_repo_chunks_multi(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        key = self._multi_key(user_id, repo_id, query_embeddings, emb_dim, limit, options)
+        return await self._cached_search(
+            key,
+            [str(repo_id)],
+            lambda: self.store.get_user_repo_chunks_multi(
+                user_id, repo_id, query_embeddings, emb_dim, limit=limit, options=options
+            ),
+        )
+
+    async def batch_get_user_repo_chunks_multi(
+        self, requests: Sequence[CodeChunksSearchRequestDTO], emb_dim: int
+    ) -> List[List[Dict[str, Any]]]:
+        """Serves the cached requests, only the others go to the wrapped store, in one batch."""
+        results: List[Optional[List[Dict[str, Any]]]] = []
+        keys = []
+        for request in requests:
+            key = self._multi_key(
+                request.user_id, request.repo_id, request.query_embeddings, emb_dim, request.limit, request.options
+            )
+            keys.append(key)
+            results.append(self.cache.get(key))
+
+        missing = [position for position, rows in enumerate(results) if rows is None]
+        if missing:
+            generations = {position: self.cache.generation(str(requests[position].repo_id)) for position in missing}
+            fetched = await self.store.batch_get_user_repo_chunks_multi(
+                [requests[position] for position in missing], emb_dim
+            )
+            for position, rows in zip(missing, fetched):
+                if rows:
+                    self.cache.put(
+                        keys[position], [str(requests[position].repo_id)], rows, generation=generations[position]
+                    )
+                results[position] = rows
+
+        return results
+
+    @staticmethod
+    def _multi_key(user_id, repo_id, query_embeddings, emb_dim, limit, options) -> Hashable:
+        return (
+            "multi",
+            str(user_id),
+            str(repo_id),
+            hash_query_embeddings(query_embeddings),
+            emb_dim,
+            limit,
+            options,
+        )
+
+    async def get_user_repos_chunks_multi(
+        self,
+        user_id: str | uuid.UUID,
+        repo_ids: Optional[Sequence[str | uuid.UUID]],
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        per_repo_limit: Optional[int] = None,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        scopes = (
+            [all_repos_scope(user_id)] if repo_ids is None else sorted({str(r) for r in repo_ids})
+        )
+        key = (
+            "repos_multi",
+            str(user_id),
+            tuple(scopes),
+            hash_query_embeddings(query_embeddings),
+            emb_dim,
+            limit,
+            per_repo_limit,
+            options,
+        )
+        return await self._cached_search(
+            key,
+            scopes,
+            lambda: self.store.get_user_repos_chunks_multi(
+                user_id,
+                repo_ids,
+                query_embeddings,
+                emb_dim,
+                limit=limit,
+                per_repo_limit=per_repo_limit,
+                options=options,
+            ),
+        )
+
+    async def get_user_repo_chunks_hybrid(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_text: str,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        key = (
+            "hybrid",
+            str(user_id),
+            str(repo_id),
+            query_text,
+            hash_query_embeddings(query_embeddings),
+            emb_dim,
+            limit,
+            options,
+        )
+        return await self._cached_search(
+            key,
+            [str(repo_id)],
+            lambda: self.store.get_user_repo_chunks_hybrid(
+                user_id, repo_id, query_text, query_embeddings, emb_dim, limit=limit, options=options
+            ),
+        )
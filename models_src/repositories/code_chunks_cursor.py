@@ -0,0 +1,101 @@
+"""
+Keyset pagination of the chunk search results.
+
+The searches rank rows by (fusion_score, max_sim, created_at, id), all descending. A cursor is the
+opaque encoding of that tuple for the last row of a page: passed back as
+`CodeChunksSearchOptions(after=cursor)`, the search only keeps the rows ranked strictly after it, so
+the next page is the top `limit` of what is left instead of a bigger limit re-fetching the previous
+pages. Scores are computed the same way for every page, a chunk written in between may show up on a
+later page but a row is never returned twice.
+
+With CANDIDATES/BINARY the pages walk the fused candidate sets, they end after at most
+candidates_per_query rows per query vector (raise it to page deeper).
+"""
+
+import base64
+import dataclasses
+import datetime
+import json
+import math
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from models_src.dto.code_chunks import CodeChunksSearchOptions
+from models_src.repositories.code_chunks_mmr import diversification_enabled
+
+
+@dataclasses.dataclass(frozen=True)
+class SearchCursor:
+    """Ranking tuple of the last row of a page, scores of rows without one are -inf (ranked last)."""
+
+    fusion_score: float
+    max_sim: float
+    created_at: datetime.datetime
+    id: uuid.UUID
+
+    def key(self) -> tuple:
+        return self.fusion_score, self.max_sim, self.created_at, self.id
+
+
+def search_row_key(row: Dict[str, Any]) -> tuple:
+    """Ranking tuple of a search result row, comparable with SearchCursor.key()."""
+    return (
+        _score(row.get("fusion_score")),
+        _score(row.get("max_sim")),
+        row["created_at"],
+        uuid.UUID(str(row["id"])),
+    )
+
+
+def encode_search_cursor(row: Dict[str, Any]) -> str:
+    """Cursor of the page ending at `row`, a search result row (any projection)."""
+    fusion_score, max_sim, created_at, row_id = search_row_key(row)
+    payload = json.dumps([_json_score(fusion_score), _json_score(max_sim), created_at.isoformat(), str(row_id)])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> SearchCursor:
+    """Raises ValueError when `cursor` was not produced by encode_search_cursor."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        fusion_score, max_sim, created_at, row_id = json.loads(payload)
+        return SearchCursor(
+            fusion_score=_score(fusion_score),
+            max_sim=_score(max_sim),
+            created_at=datetime.datetime.fromisoformat(created_at),
+            id=uuid.UUID(row_id),
+        )
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid search cursor") from e
+
+
+def next_search_cursor(rows: Sequence[Dict[str, Any]], limit: int) -> Optional[str]:
+    """Cursor of the page after `rows`, None when it was the last one (fewer than `limit` rows)."""
+    if not rows or len(rows) < limit:
+        return None
+    return encode_search_cursor(rows[-1])
+
+
+def resolve_search_cursor(options: CodeChunksSearchOptions) -> Optional[SearchCursor]:
+    """Validates options.after, returns its decoded cursor or None for a first page."""
+    if options.after is None:
+        return None
+    if diversification_enabled(options):
+        # the diversified rows are picked out of a pool, they have no ranking to continue from
+        raise ValueError("a diversified search can't be paginated with `after`")
+    return decode_search_cursor(options.after)
+
+
+def rows_after(rows: List[Dict[str, Any]], cursor: Optional[SearchCursor]) -> List[Dict[str, Any]]:
+    """The ranked `rows` placed strictly after `cursor`."""
+    if cursor is None:
+        return rows
+    return [row for row in rows if search_row_key(row) < cursor.key()]
+
+
+def _score(value: Any) -> float:
+    return float("-inf") if value is None else float(value)
+
+
+def _json_score(value: float) -> Optional[float]:
+    return None if math.isinf(value) else value
@@ -0,0 +1,174 @@
+"""
+Concurrent ingestion of a stream of code chunks.
+
+The producer side (chunking, embedding) yields CodeChunksRequestDTO one by one. The pipeline groups
+them in batches closed at `max_batch_rows` rows or `max_batch_bytes` estimated bytes, whichever comes
+first, so batches of big chunks stay small and batches of small chunks stay efficient. `writers`
+tasks write the batches concurrently, each store call running on its own pool connection, while the
+next batch is being produced.
+
+The queue between the two sides holds at most `writers` batches: when the database falls behind the
+producer waits (backpressure) and the memory held is bounded by `max_in_flight_bytes`.
+
+When a repo store is given the Repo progress counters are reset at the start of the run (unless
+`reset_repo_counters` is off) and incremented after every written batch. `on_progress` gets the
+running totals.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterable, Callable, List, Optional, Set, Tuple
+
+from models_src.dto.code_chunks import CodeChunksIngestionProgressDTO, CodeChunksRequestDTO
+from models_src.repositories.code_chunks import ICodeChunksStore, report_progress
+from models_src.repositories.code_chunks_stats import content_bytes
+from models_src.repositories.repo import IRepoStore
+
+DEFAULT_INGESTION_WRITERS = 4
+DEFAULT_INGESTION_BATCH_ROWS = 1000
+DEFAULT_INGESTION_BATCH_BYTES = 8 * 1024 * 1024
+
+# Rough per row cost on top of the content and the embedding (ids, names, metadata, row header)
+CHUNK_ROW_OVERHEAD_BYTES = 256
+
+
+def estimate_chunk_bytes(chunk: CodeChunksRequestDTO) -> int:
+    """Size of the chunk on the wire: content, float32 embedding and a fixed row overhead."""
+    embedding_bytes = 4 * len(chunk.embedding) if chunk.embedding is not None else 0
+    return content_bytes(chunk.content) + embedding_bytes + CHUNK_ROW_OVERHEAD_BYTES
+
+
+class CodeChunksIngestionPipeline:
+    """
+    Streams chunks into `store` with `writers` concurrent batch writes. With `use_copy` (default)
+    the batches go through bulk_copy_save, otherwise through bulk_save.
+
+    `repo_store` and `repo_id` (id of the Repo row, as stored in code_chunks.repo_id) enable the
+    incremental update of Repo.total_files / total_chunks / total_embeddings. Files are counted
+    once per run, on the first batch holding one of their chunks. The counters are set back to 0
+    when the run starts, so running the ingestion of a repo again doesn't add to the totals of the
+    previous run; pass `reset_repo_counters=False` when the run only adds chunks to the ones
+    already counted.
+
+    A failing write cancels the run and its exception is raised (the failures of the other writers
+    are logged), the batches already written stay written (each one is its own transaction).
+    """
+
+    def __init__(
+        self,
+        store: ICodeChunksStore,
+        *,
+        writers: int = DEFAULT_INGESTION_WRITERS,
+        max_batch_rows: int = DEFAULT_INGESTION_BATCH_ROWS,
+        max_batch_bytes: int = DEFAULT_INGESTION_BATCH_BYTES,
+        use_copy: bool = True,
+        repo_store: Optional[IRepoStore] = None,
+        repo_id: Optional[str] = None,
+        reset_repo_counters: bool = True,
+        on_progress: Optional[Callable[[CodeChunksIngestionProgressDTO], Any]] = None,
+    ):
+        if writers < 1:
+            raise ValueError("writers must be >= 1")
+        if max_batch_rows < 1:
+            raise ValueError("max_batch_rows must be >= 1")
+        if max_batch_bytes < 1:
+            raise ValueError("max_batch_bytes must be >= 1")
+        if repo_store is not None and not repo_id:
+            raise ValueError("repo_id is required to update the repo counters")
+
+        self.store = store
+        self.writers = writers
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_bytes = max_batch_bytes
+        self.use_copy = use_copy
+        self.repo_store = repo_store
+        self.repo_id = repo_id
+        self.reset_repo_counters = reset_repo_counters
+        self.on_progress = on_progress
+
+    @property
+    def max_in_flight_bytes(self) -> int:
+        """
+        Upper bound of the batches held at once: one being filled, `writers` queued and `writers`
+        being written. A single chunk bigger than max_batch_bytes still makes a batch of its own.
+        """
+        return (2 * self.writers + 1) * self.max_batch_bytes
+
+    async def run(self, chunks: AsyncIterable[CodeChunksRequestDTO]) -> CodeChunksIngestionProgressDTO:
+        """Consumes the whole stream, returns the totals once every batch is written."""
+        progress = CodeChunksIngestionProgressDTO()
+        seen_files: Set[Tuple[str, str]] = set()
+        queue: asyncio.Queue[Optional[Tuple[List[CodeChunksRequestDTO], int]]] = asyncio.Queue(
+            maxsize=self.writers
+        )
+
+        if self.repo_store is not None and self.reset_repo_counters:
+            await self.repo_store.reset_progress_counters_by_id(self.repo_id)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for _ in range(self.writers):
+                    group.create_task(self._write_batches(queue, progress, seen_files))
+                await self._produce_batches(chunks, queue)
+        except ExceptionGroup as errors:
+            # a single failing batch (or chunk stream) is the usual case, surface it as is
+            first, *others = errors.exceptions
+            for error in others:
+                logging.error("Ingestion writer failed as well", exc_info=error)
+            raise first
+
+        progress.done = True
+        await report_progress(self.on_progress, progress)
+        return progress
+
+    async def _produce_batches(
+        self,
+        chunks: AsyncIterable[CodeChunksRequestDTO],
+        queue: "asyncio.Queue[Optional[Tuple[List[CodeChunksRequestDTO], int]]]",
+    ) -> None:
+        batch: List[CodeChunksRequestDTO] = []
+        batch_bytes = 0
+        async for chunk in chunks:
+            size = estimate_chunk_bytes(chunk)
+            if batch and (len(batch) >= self.max_batch_rows or batch_bytes + size > self.max_batch_bytes):
+                await queue.put((batch, batch_bytes))
+                batch, batch_bytes = [], 0
+            batch.append(chunk)
+            batch_bytes += size
+
+        if batch:
+            await queue.put((batch, batch_bytes))
+        for _ in range(self.writers):
+            await queue.put(None)
+
+    async def _write_batches(
+        self,
+        queue: "asyncio.Queue[Optional[Tuple[List[CodeChunksRequestDTO], int]]]",
+        progress: CodeChunksIngestionProgressDTO,
+        seen_files: Set[Tuple[str, str]],
+    ) -> None:
+        while (item := await queue.get()) is not None:
+            batch, batch_bytes = item
+            if self.use_copy:
+                await self.store.bulk_copy_save(batch)
+            else:
+                await self.store.bulk_save(batch)
+
+            new_files = {(c.repo_id, c.file_path) for c in batch} - seen_files
+            seen_files |= new_files
+            embeddings = sum(1 for c in batch if c.embedding is not None)
+
+            progress.rows += len(batch)
+            progress.embeddings += embeddings
+            progress.files += len(new_files)
+            progress.bytes += batch_bytes
+            progress.batches += 1
+
+            if self.repo_store is not None:
+                await self.repo_store.increment_progress_counters_by_id(
+                    self.repo_id,
+                    total_files=len(new_files),
+                    total_chunks=len(batch),
+                    total_embeddings=embeddings,
+                )
+            await report_progress(self.on_progress, progress)
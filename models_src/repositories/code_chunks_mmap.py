@@ -0,0 +1,888 @@
+"""
+File backed ICodeChunksStore, for offline analysis and air-gapped deployments running without
+PostgreSQL.
+
+Layout of the store directory:
+- embeddings.f32: one row of `dim` float32 per chunk (zeros for chunks without an embedding),
+  memory-mapped by the readers.
+- chunks.jsonl: append-only sidecar, one JSON line per chunk holding every column but the
+  embedding, plus its row in embeddings.f32 and the embedding norm. Deletes append a tombstone
+  line, `{"deleted": [ids]}`, the rows they drop stay in the files.
+- .lock: serializes the writers across processes.
+
+The embeddings are never loaded in RAM: every process maps the same file and the OS page cache is
+shared between them. Each process only keeps a small index per chunk (row, ids, file name, offset of
+its sidecar line), built by streaming the sidecar line by line; content and metadata are read from
+the sidecar for the returned rows only.
+
+Writers append the embedding rows first and the sidecar lines last, a chunk (or a tombstone) is
+visible once its line is complete. A writer that crashed in the middle of an embedding row or of a
+sidecar line leaves a partial one, the next writer truncates it before appending. Other processes
+pick new chunks up on their next call.
+
+The file lock, the file I/O and the scans run in a worker thread, one call at a time per store: a
+writer of another process holding the lock never blocks the event loop.
+"""
+
+import asyncio
+import dataclasses
+import datetime
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, TypeVar
+
+import numpy as np
+
+from models_src.dto.code_chunks import (
+    SEARCH_PROJECTION_COLUMNS,
+    ChunkFusion,
+    ChunkProjection,
+    ChunkSearchStrategy,
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksFileDiffResponseDTO,
+    CodeChunksPurgeProgressDTO,
+    CodeChunksRequestDTO,
+    CodeChunksResponseDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+    CodeChunksStatsDTO,
+    FileLookupMode,
+    SimilarityPruningStats,
+    compute_content_hash,
+)
+from models_src.models.custom_indexes import CODE_CHUNKS_EMBEDDING_DIM
+from models_src.repositories.code_chunks import (
+    DEFAULT_PURGE_BATCH_SIZE,
+    DEFAULT_PURGE_PAUSE_SECONDS,
+    DEFAULT_STREAM_FETCH_SIZE,
+    ICodeChunksStore,
+    PurgeProgressCallback,
+    file_name_matches,
+    resolve_candidates_per_query,
+    report_progress,
+    resolve_stream_columns,
+    validate_file_diff,
+    validate_min_similarity,
+    validate_per_repo_limit,
+    validate_purge_arguments,
+)
+from models_src.repositories.code_chunks_cursor import resolve_search_cursor
+from models_src.repositories.code_chunks_mmr import mmr_select, reject_diversification, resolve_mmr_pool_size
+from models_src.repositories.code_chunks_stats import (
+    ChunkStatsDeltas,
+    CodeChunksStatsCounter,
+    content_bytes,
+)
+
+EMBEDDINGS_FILE = "embeddings.f32"
+SIDECAR_FILE = "chunks.jsonl"
+LOCK_FILE = ".lock"
+
+# Below it an embedding counts as zero and never matches, as in FakeCodeChunksStore
+ZERO_NORM_TOLERANCE = 1e-12
+
+# Bytes read per step when looking for the end of the last complete sidecar line
+SIDECAR_TAIL_READ_SIZE = 64 * 1024
+
+T = TypeVar("T")
+
+
+def _lexical_tokens(text: str) -> List[str]:
+    # what the 'simple' text search config keeps of a text
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+@dataclasses.dataclass(slots=True)
+class _IndexedChunk:
+    row: int
+    offset: int
+    id: str
+    user_id: str
+    repo_id: str
+    file_name: str
+    file_path: str
+    commit_number: str
+    chunk_ordinal: Optional[int]
+    created_at: str
+    norm: float
+    content_bytes: int
+    content_hash: Optional[str]
+    deleted: bool = False
+
+
+class MmapCodeChunksStore(ICodeChunksStore):
+    """
+    Supports every operation of ICodeChunksStore. The vector searches are exact scans,
+    CANDIDATES/BINARY being served as an exact top-K per query vector then fused. The lexical side
+    of get_user_repo_chunks_hybrid matches lowercase alphanumeric tokens (as the 'simple' text
+    search config) by reading the contents of the repo, there is no full text index.
+
+    Deleted chunks are tombstoned, the space they used is not reclaimed.
+    """
+
+    def __init__(self, path: str | os.PathLike, dim: int = CODE_CHUNKS_EMBEDDING_DIM):
+        if dim < 1:
+            raise ValueError("dim must be >= 1")
+
+        self.path = os.fspath(path)
+        self.dim = dim
+        os.makedirs(self.path, exist_ok=True)
+        for name in (EMBEDDINGS_FILE, SIDECAR_FILE, LOCK_FILE):
+            open(self._file(name), "ab").close()
+
+        self._chunks: List[_IndexedChunk] = []
+        self._index_by_id: Dict[str, int] = {}
+        # content_hash -> live chunks with an embedding, oldest first
+        self._index_by_hash: Dict[str, List[int]] = {}
+        self._rows_by_scope: Dict[tuple, List[int]] = {}
+        self._sidecar_offset = 0
+        self._embeddings: Optional[np.memmap] = None
+        # fed by _refresh with the chunks it indexes
+        self._stats = CodeChunksStatsCounter()
+        self.similarity_pruning_stats = SimilarityPruningStats()
+        self._call_lock = threading.Lock()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs `fn` in a worker thread, after the calls of this store already started."""
+
+        def call() -> T:
+            with self._call_lock:
+                return fn(*args)
+
+        return await asyncio.to_thread(call)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        with open(self._file(LOCK_FILE), "rb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Indexes the sidecar lines appended since the last call and remaps the embeddings."""
+        offset = self._sidecar_offset
+        deltas: ChunkStatsDeltas = {}
+        emptied_scopes = set()
+        with open(self._file(SIDECAR_FILE), "rb") as sidecar:
+            sidecar.seek(offset)
+            # one line at a time, the contents are only read again for the returned rows
+            for line in sidecar:
+                if not line.endswith(b"\n"):
+                    # a line being written by another process isn't complete yet
+                    break
+                record = json.loads(line)
+                if "deleted" in record:
+                    for chunk in self._tombstone(record["deleted"]):
+                        emptied_scopes.add((chunk.user_id, chunk.repo_id))
+                        self._count(deltas, chunk, -1)
+                else:
+                    chunk = self._index(record, offset)
+                    self._count(deltas, chunk, 1)
+                offset += len(line)
+
+        self._stats.apply(deltas)
+        for scope in emptied_scopes:
+            self._rows_by_scope[scope] = [i for i in self._rows_by_scope[scope] if not self._chunks[i].deleted]
+
+        if offset != self._sidecar_offset or self._embeddings is None:
+            self._sidecar_offset = offset
+            rows = max((c.row for c in self._chunks), default=-1) + 1
+            self._embeddings = (
+                np.memmap(self._file(EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(rows, self.dim))
+                if rows
+                else None
+            )
+
+    def _index(self, record: Dict[str, Any], offset: int) -> _IndexedChunk:
+        chunk = _IndexedChunk(
+            row=record["row"],
+            offset=offset,
+            id=record["id"],
+            user_id=record["user_id"],
+            repo_id=record["repo_id"],
+            file_name=record["file_name"],
+            file_path=record["file_path"],
+            commit_number=record["commit_number"],
+            chunk_ordinal=record.get("chunk_ordinal"),
+            created_at=record["created_at"],
+            norm=record["norm"],
+            content_bytes=content_bytes(record["content"]),
+            content_hash=record.get("content_hash"),
+        )
+        self._index_by_id[chunk.id] = len(self._chunks)
+        if chunk.content_hash and chunk.norm >= ZERO_NORM_TOLERANCE:
+            self._index_by_hash.setdefault(chunk.content_hash, []).append(len(self._chunks))
+        self._rows_by_scope.setdefault((chunk.user_id, chunk.repo_id), []).append(len(self._chunks))
+        self._chunks.append(chunk)
+        return chunk
+
+    def _tombstone(self, ids: Sequence[str]) -> List[_IndexedChunk]:
+        dropped = []
+        for chunk_id in ids:
+            index = self._index_by_id.pop(chunk_id, None)
+            if index is None:
+                continue
+            chunk = self._chunks[index]
+            chunk.deleted = True
+            dropped.append(chunk)
+            same_content = self._index_by_hash.get(chunk.content_hash)
+            if same_content and index in same_content:
+                same_content.remove(index)
+                if not same_content:
+                    del self._index_by_hash[chunk.content_hash]
+        return dropped
+
+    @staticmethod
+    def _count(deltas: ChunkStatsDeltas, chunk: _IndexedChunk, sign: int) -> None:
+        delta = deltas.setdefault((chunk.repo_id, chunk.commit_number, chunk.file_path), [0, 0, 0])
+        delta[0] += sign
+        delta[1] += sign * (chunk.norm >= ZERO_NORM_TOLERANCE)
+        delta[2] += sign * chunk.content_bytes
+
+    def _live_chunks(self) -> Iterator[_IndexedChunk]:
+        return (c for c in self._chunks if not c.deleted)
+
+    def _scope_chunks(self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID) -> List[_IndexedChunk]:
+        return [self._chunks[i] for i in self._rows_by_scope.get((str(user_id), str(repo_id)), [])]
+
+    def _read_record(self, chunk: _IndexedChunk) -> Dict[str, Any]:
+        with open(self._file(SIDECAR_FILE), "rb") as sidecar:
+            sidecar.seek(chunk.offset)
+            return json.loads(sidecar.readline())
+
+    def _read_records(self, chunks: Sequence[_IndexedChunk]) -> List[Dict[str, Any]]:
+        with open(self._file(SIDECAR_FILE), "rb") as sidecar:
+            records = []
+            for chunk in chunks:
+                sidecar.seek(chunk.offset)
+                records.append(json.loads(sidecar.readline()))
+            return records
+
+    def _to_dto(self, chunk: _IndexedChunk, record: Dict[str, Any], with_embedding: bool = True) -> CodeChunksResponseDTO:
+        embedding = None
+        if with_embedding and chunk.norm >= ZERO_NORM_TOLERANCE:
+            embedding = np.array(self._embeddings[chunk.row])
+        return CodeChunksResponseDTO(
+            id=uuid.UUID(record["id"]),
+            user_id=record["user_id"],
+            repo_id=record["repo_id"],
+            content=record["content"],
+            content_hash=record["content_hash"],
+            file_name=record["file_name"],
+            file_path=record["file_path"],
+            file_size=record["file_size"],
+            commit_number=record["commit_number"],
+            embedding=embedding,
+            metadata=record["metadata"],
+            created_at=datetime.datetime.fromisoformat(record["created_at"]),
+            chunk_ordinal=record.get("chunk_ordinal"),
+        )
+
+    async def save(self, create_model: CodeChunksRequestDTO) -> CodeChunksResponseDTO:
+        return (await self.bulk_save([create_model]))[0]
+
+    async def bulk_save(self, create_model: list[CodeChunksRequestDTO]) -> List[CodeChunksResponseDTO]:
+        if not create_model:
+            return []
+        return await self._run(self._locked_append, create_model)
+
+    def _locked_append(self, create_model: Sequence[CodeChunksRequestDTO]) -> List[CodeChunksResponseDTO]:
+        with self._write_lock():
+            return self._append(create_model)
+
+    def _append(
+        self, create_model: Sequence[CodeChunksRequestDTO], deleted_ids: Sequence[str] = ()
+    ) -> List[CodeChunksResponseDTO]:
+        """
+        Writes the chunks, then the tombstone of `deleted_ids` (when any). The caller holds the
+        write lock.
+        """
+        matrix = np.zeros((len(create_model), self.dim), dtype=np.float32)
+        for i, chunk in enumerate(create_model):
+            if chunk.embedding is not None:
+                if len(chunk.embedding) != self.dim:
+                    raise ValueError(f"expected {self.dim} dimensions, not {len(chunk.embedding)}")
+                matrix[i] = chunk.embedding
+        norms = np.linalg.norm(matrix.astype(np.float64), axis=1)
+
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        saved = []
+        lines = []
+        if create_model:
+            # a writer that crashed mid row left a partial one, the rows written next would all be
+            # shifted from the rows recorded in the sidecar
+            row_size = self.dim * 4
+            embeddings_file = self._file(EMBEDDINGS_FILE)
+            first_row, partial = divmod(os.path.getsize(embeddings_file), row_size)
+            if partial:
+                os.truncate(embeddings_file, first_row * row_size)
+            with open(embeddings_file, "ab") as embeddings:
+                embeddings.write(matrix.tobytes())
+
+            for i, chunk in enumerate(create_model):
+                dto = CodeChunksResponseDTO(
+                    **{
+                        **dataclasses.asdict(chunk),
+                        "id": uuid.uuid4(),
+                        "content_hash": chunk.content_hash or compute_content_hash(chunk.content),
+                        "created_at": created_at,
+                    }
+                )
+                record = {
+                    **dataclasses.asdict(dto),
+                    "id": str(dto.id),
+                    "created_at": created_at.isoformat(),
+                    "row": first_row + i,
+                    "norm": float(norms[i]),
+                }
+                del record["embedding"]
+                lines.append(json.dumps(record, default=str) + "\n")
+                saved.append(dto)
+
+        if deleted_ids:
+            lines.append(json.dumps({"deleted": list(deleted_ids)}) + "\n")
+        # a writer that crashed mid line left a fragment, the next line would be glued to it
+        sidecar_file = self._file(SIDECAR_FILE)
+        complete = self._complete_lines_size(sidecar_file)
+        if complete != os.path.getsize(sidecar_file):
+            os.truncate(sidecar_file, complete)
+        with open(sidecar_file, "ab") as sidecar:
+            sidecar.write("".join(lines).encode("utf-8"))
+
+        return saved
+
+    @staticmethod
+    def _complete_lines_size(path: str) -> int:
+        """Size of the file up to the end of its last complete line, read from the end."""
+        with open(path, "rb") as file:
+            end = file.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - SIDECAR_TAIL_READ_SIZE)
+                file.seek(start)
+                newline = file.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    return start + newline + 1
+                end = start
+        return 0
+
+    async def bulk_copy_save(self, create_model: list[CodeChunksRequestDTO]) -> List[uuid.UUID]:
+        return [dto.id for dto in await self.bulk_save(create_model)]
+
+    async def save_commit_file_diff(self, diff: CodeChunksFileDiffRequestDTO) -> CodeChunksFileDiffResponseDTO:
+        """The new chunks and the tombstone of the replaced ones go in one append."""
+        validate_file_diff(diff)
+
+        touched_paths = diff.changed_file_paths | diff.added_file_paths | diff.deleted_file_paths
+        if not touched_paths:
+            return CodeChunksFileDiffResponseDTO()
+
+        return await self._run(self._replace_files, diff, touched_paths)
+
+    def _replace_files(self, diff: CodeChunksFileDiffRequestDTO, touched_paths: set) -> CodeChunksFileDiffResponseDTO:
+        with self._write_lock():
+            self._refresh()
+            doomed = [c.id for c in self._scope_chunks(diff.user_id, diff.repo_id) if c.file_path in touched_paths]
+            saved = self._append(diff.chunks, deleted_ids=doomed)
+        return CodeChunksFileDiffResponseDTO(deleted_count=len(doomed), saved=saved)
+
+    async def delete_all_by_repo_id(self, repo_id: str) -> int:
+        if not repo_id:
+            return 0
+        return await self._run(self._delete_repo_chunks, repo_id, None)
+
+    def _delete_repo_chunks(self, repo_id: str, batch_size: Optional[int]) -> int:
+        """Tombstones the repo's chunks, at most `batch_size` of them when given."""
+        with self._write_lock():
+            doomed = self._repo_chunk_ids(repo_id)[:batch_size]
+            if doomed:
+                self._append([], deleted_ids=doomed)
+        return len(doomed)
+
+    async def purge_repo_chunks(
+        self,
+        repo_id: str,
+        batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+        pause: float = DEFAULT_PURGE_PAUSE_SECONDS,
+        on_progress: Optional[PurgeProgressCallback] = None,
+    ) -> CodeChunksPurgeProgressDTO:
+        """One tombstone line per batch, the lock is released during the pauses."""
+        validate_purge_arguments(batch_size, pause)
+
+        progress = CodeChunksPurgeProgressDTO(repo_id=str(repo_id))
+        if repo_id:
+            progress.total_estimate = len(await self._run(self._repo_chunk_ids, repo_id))
+
+        while repo_id:
+            deleted = await self._run(self._delete_repo_chunks, repo_id, batch_size)
+            if not deleted:
+                break
+
+            progress.deleted_count += deleted
+            progress.batches += 1
+            await report_progress(on_progress, progress)
+            if deleted < batch_size:
+                break
+            await asyncio.sleep(pause)
+
+        progress.done = True
+        await report_progress(on_progress, progress)
+        return progress
+
+    def _repo_chunk_ids(self, repo_id: str) -> List[str]:
+        self._refresh()
+        return [c.id for c in self._live_chunks() if c.repo_id == str(repo_id)]
+
+    async def find_embeddings_by_content_hashes(
+        self, content_hashes: Sequence[str], user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        wanted = list(dict.fromkeys(content_hashes))
+        if not wanted:
+            return {}
+        return await self._run(self._embeddings_by_content_hashes, wanted, user_id)
+
+    def _embeddings_by_content_hashes(self, content_hashes: Sequence[str], user_id: Optional[str]) -> Dict[str, Any]:
+        self._refresh()
+        found = {}
+        for content_hash in content_hashes:
+            chunk = next(
+                (
+                    self._chunks[i]
+                    for i in self._index_by_hash.get(content_hash, ())
+                    if not user_id or self._chunks[i].user_id == str(user_id)
+                ),
+                None,
+            )
+            if chunk is not None:
+                found[content_hash] = np.array(self._embeddings[chunk.row])
+        return found
+
+    async def get_repo_chunk_stats(self, repo_id: str) -> Optional[CodeChunksStatsDTO]:
+        await self._run(self._refresh)
+        return self._stats.repo_stats(str(repo_id))
+
+    async def get_commit_chunk_stats(self, repo_id: str, commit_number: str) -> Optional[CodeChunksStatsDTO]:
+        await self._run(self._refresh)
+        return self._stats.commit_stats(str(repo_id), commit_number)
+
+    async def find_all_by_repo_id_with_limit(self, repo_id: str, limit: int = 100) -> List[CodeChunksResponseDTO]:
+        return await self._run(self._repo_chunks, repo_id, limit)
+
+    def _repo_chunks(self, repo_id: str, limit: int) -> List[CodeChunksResponseDTO]:
+        self._refresh()
+        chunks = [c for c in self._live_chunks() if c.repo_id == str(repo_id)][:limit]
+        return [self._to_dto(c, r) for c, r in zip(chunks, self._read_records(chunks))]
+
+    async def stream_all_by_repo_id(
+        self,
+        repo_id: str,
+        fetch_size: int = DEFAULT_STREAM_FETCH_SIZE,
+        columns: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[CodeChunksResponseDTO]:
+        columns = resolve_stream_columns(columns)
+        if fetch_size < 1:
+            raise ValueError("fetch_size must be >= 1")
+        if not repo_id:
+            return
+
+        await self._run(self._refresh)
+        chunks = [c for c in self._live_chunks() if c.repo_id == str(repo_id)]
+        for start in range(0, len(chunks), fetch_size):
+            batch = chunks[start:start + fetch_size]
+            for chunk, record in zip(batch, await self._run(self._read_records, batch)):
+                dto = self._to_dto(chunk, record, with_embedding="embedding" in columns)
+                yield CodeChunksResponseDTO(**{name: getattr(dto, name) for name in columns})
+
+    async def fetch_contents_by_ids(
+        self,
+        user_id: str | uuid.UUID,
+        ids: Sequence[str | uuid.UUID],
+        repo_id: Optional[str | uuid.UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        if not user_id or not ids:
+            return []
+        return await self._run(self._contents_by_ids, user_id, ids, repo_id)
+
+    def _contents_by_ids(
+        self,
+        user_id: str | uuid.UUID,
+        ids: Sequence[str | uuid.UUID],
+        repo_id: Optional[str | uuid.UUID],
+    ) -> List[Dict[str, Any]]:
+        self._refresh()
+        by_id = {
+            c.id: c
+            for c in self._live_chunks()
+            if c.user_id == str(user_id) and (not repo_id or c.repo_id == str(repo_id))
+        }
+        chunks = [by_id[key] for key in dict.fromkeys(str(i) for i in ids) if key in by_id]
+        return [
+            {"id": uuid.UUID(r["id"]), "file_name": r["file_name"], "file_path": r["file_path"], "content": r["content"]}
+            for r in self._read_records(chunks)
+        ]
+
+    async def get_repo_file_chunks(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        file_name: str = "readme",
+        mode: FileLookupMode = FileLookupMode.CONTAINS,
+    ) -> List[dict]:
+        """Return chunks of a specific file, same modes and rows as TortoiseCodeChunksStore."""
+        return await self._run(self._file_chunks, user_id, repo_id, file_name, FileLookupMode(mode))
+
+    def _file_chunks(
+        self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_name: str, mode: FileLookupMode
+    ) -> List[dict]:
+        self._refresh()
+        scope = self._scope_chunks(user_id, repo_id)
+
+        if mode == FileLookupMode.CONTAINS:
+            needle = file_name.lower()
+            chunks = [c for c in scope if needle in c.file_name.lower()]
+            # newest first, as the Tortoise store orders by -created_at
+            chunks.sort(key=lambda c: c.created_at, reverse=True)
+            return [{"content": r["content"]} for r in self._read_records(chunks)]
+
+        chunks = sorted((c for c in scope if file_name_matches(c.file_name, file_name, mode)), key=self._source_order)
+        return [
+            {"file_path": c.file_path, "chunk_ordinal": c.chunk_ordinal, "content": r["content"]}
+            for c, r in zip(chunks, self._read_records(chunks))
+        ]
+
+    async def get_repo_file_content(
+        self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_path: str
+    ) -> Optional[str]:
+        return await self._run(self._file_content, user_id, repo_id, file_path)
+
+    def _file_content(self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_path: str) -> Optional[str]:
+        self._refresh()
+        chunks = sorted(
+            (c for c in self._scope_chunks(user_id, repo_id) if c.file_path == file_path), key=self._source_order
+        )
+        if not chunks:
+            return None
+        return "".join(r["content"] for r in self._read_records(chunks))
+
+    @staticmethod
+    def _source_order(chunk: _IndexedChunk) -> tuple:
+        # ORDER BY file_path, chunk_ordinal NULLS LAST, created_at
+        return chunk.file_path, chunk.chunk_ordinal is None, chunk.chunk_ordinal or 0, chunk.created_at
+
+    async def get_user_repo_chunks_multi(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        if not repo_id or not user_id or limit <= 0 or not query_embeddings:
+            return []
+        return await self._run(self._repo_search, user_id, repo_id, query_embeddings, emb_dim, limit, options)
+
+    def _repo_search(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int,
+        options: Optional[CodeChunksSearchOptions],
+    ) -> List[Dict[str, Any]]:
+        self._refresh()
+        indexes = self._rows_by_scope.get((str(user_id), str(repo_id)), [])
+        return self._search(indexes, query_embeddings, emb_dim, limit, None, options, with_repo_id=False)
+
+    async def batch_get_user_repo_chunks_multi(
+        self, requests: Sequence[CodeChunksSearchRequestDTO], emb_dim: int
+    ) -> List[List[Dict[str, Any]]]:
+        return [
+            await self.get_user_repo_chunks_multi(
+                request.user_id, request.repo_id, request.query_embeddings, emb_dim, request.limit, request.options
+            )
+            for request in requests
+        ]
+
+    async def get_user_repos_chunks_multi(
+        self,
+        user_id: str | uuid.UUID,
+        repo_ids: Optional[Sequence[str | uuid.UUID]],
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        per_repo_limit: Optional[int] = None,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        if not user_id or limit <= 0 or not query_embeddings or (repo_ids is not None and not repo_ids):
+            return []
+        try:
+            validate_per_repo_limit(per_repo_limit)
+            reject_diversification(options or CodeChunksSearchOptions(), "multi repo search")
+        except ValueError:
+            logging.exception("Invalid search options.")
+            return []
+        return await self._run(
+            self._repos_search, user_id, repo_ids, query_embeddings, emb_dim, limit, per_repo_limit, options
+        )
+
+    def _repos_search(
+        self,
+        user_id: str | uuid.UUID,
+        repo_ids: Optional[Sequence[str | uuid.UUID]],
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int,
+        per_repo_limit: Optional[int],
+        options: Optional[CodeChunksSearchOptions],
+    ) -> List[Dict[str, Any]]:
+        self._refresh()
+        wanted = None if repo_ids is None else {str(r) for r in repo_ids}
+        indexes = [
+            i
+            for (scope_user, scope_repo), rows in self._rows_by_scope.items()
+            if scope_user == str(user_id) and (wanted is None or scope_repo in wanted)
+            for i in rows
+            if self._chunks[i].norm >= ZERO_NORM_TOLERANCE
+        ]
+        return self._search(indexes, query_embeddings, emb_dim, limit, per_repo_limit, options, with_repo_id=True)
+
+    async def get_user_repo_chunks_hybrid(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_text: str,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int = 10,
+        options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        RRF of the vector candidates and of the lexical matches: every query token has to appear
+        in the content, ranked by the number of occurrences then newest first.
+        """
+        if not repo_id or not user_id or limit <= 0 or not query_text or not query_text.strip():
+            return []
+        if query_embeddings and (emb_dim != self.dim or any(len(v) != emb_dim for v in query_embeddings)):
+            logging.error("Embeddings have inconsistent dimensions.")
+            return []
+
+        options = options or CodeChunksSearchOptions()
+        if options.strategy == ChunkSearchStrategy.EXACT:
+            options = dataclasses.replace(options, strategy=ChunkSearchStrategy.CANDIDATES)
+        options = dataclasses.replace(options, fusion=ChunkFusion.RRF)
+        try:
+            if options.after is not None:
+                raise ValueError("the hybrid search can't be paginated with `after`")
+            if options.min_similarity is not None:
+                raise ValueError("the hybrid search doesn't support min_similarity")
+            reject_diversification(options, "hybrid search")
+            k = resolve_candidates_per_query(options, limit)
+        except ValueError:
+            logging.exception("Invalid search options.")
+            return []
+        return await self._run(
+            self._hybrid_search, user_id, repo_id, query_text, query_embeddings, limit, k, options
+        )
+
+    def _hybrid_search(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_text: str,
+        query_embeddings: List[List[float]],
+        limit: int,
+        k: int,
+        options: CodeChunksSearchOptions,
+    ) -> List[Dict[str, Any]]:
+        self._refresh()
+        chunks = self._scope_chunks(user_id, repo_id)
+        if not chunks:
+            return []
+
+        if query_embeddings:
+            fusion_scores, max_sims = self._fuse(self._cosine(chunks, query_embeddings), k, options)
+        else:
+            fusion_scores, max_sims = np.full(len(chunks), -np.inf), np.full(len(chunks), -np.inf)
+
+        query_tokens = set(_lexical_tokens(query_text))
+        lexical = []
+        for i, record in enumerate(self._read_records(chunks)):
+            tokens = _lexical_tokens(record["content"] or "")
+            if query_tokens <= set(tokens):
+                lexical.append((sum(t in query_tokens for t in tokens), chunks[i].created_at, i))
+        lexical.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        for rank, (_, _, i) in enumerate(lexical[:k], start=1):
+            vector_score = fusion_scores[i] if np.isfinite(fusion_scores[i]) else 0.0
+            fusion_scores[i] = vector_score + 1.0 / (options.rrf_k + rank)
+
+        winners = sorted(
+            (i for i in range(len(chunks)) if np.isfinite(fusion_scores[i])),
+            key=lambda i: self._ranking(chunks[i], fusion_scores[i], max_sims[i]),
+            reverse=True,
+        )[:limit]
+        return self._result_rows(chunks, winners, fusion_scores, max_sims, options, with_repo_id=False)
+
+    def _search(
+        self,
+        indexes: Sequence[int],
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int,
+        per_repo_limit: Optional[int],
+        options: Optional[CodeChunksSearchOptions],
+        with_repo_id: bool,
+    ) -> List[Dict[str, Any]]:
+        if emb_dim != self.dim or any(len(v) != emb_dim for v in query_embeddings):
+            logging.error("Embeddings have inconsistent dimensions.")
+            return []
+
+        options = options or CodeChunksSearchOptions()
+        try:
+            # only the single repo searches get here with diversification options
+            pool_size = None if with_repo_id else resolve_mmr_pool_size(options, limit)
+            candidates_per_query = resolve_candidates_per_query(options, pool_size or limit)
+            cursor = resolve_search_cursor(options)
+            validate_min_similarity(options)
+        except ValueError:
+            logging.exception("Invalid search options.")
+            return []
+
+        if not indexes:
+            return []
+
+        chunks = [self._chunks[i] for i in indexes]
+        sims = self._cosine(chunks, query_embeddings)
+        if options.min_similarity is not None:
+            sims = self._prune(sims, candidates_per_query, options)
+        fusion_scores, max_sims = self._fuse(sims, candidates_per_query, options)
+
+        def ranking(i: int) -> tuple:
+            return self._ranking(chunks[i], fusion_scores[i], max_sims[i])
+
+        # same ordering as the SQL: fusion_score, max_sim, created_at, id, all DESC
+        order = sorted((i for i in range(len(chunks)) if np.isfinite(fusion_scores[i])), key=ranking, reverse=True)
+
+        winners = []
+        per_repo: Dict[str, int] = {}
+        for i in order:
+            if per_repo_limit is not None:
+                if per_repo.get(chunks[i].repo_id, 0) >= per_repo_limit:
+                    continue
+                per_repo[chunks[i].repo_id] = per_repo.get(chunks[i].repo_id, 0) + 1
+            # the cursor applies after the per repo cap, as in SQL
+            if cursor is not None and not ranking(i) < cursor.key():
+                continue
+            winners.append(i)
+            if len(winners) == (pool_size or limit):
+                break
+
+        if pool_size is not None:
+            picked = mmr_select(
+                [fusion_scores[i] for i in winners],
+                [self._embeddings[chunks[i].row] if chunks[i].norm >= ZERO_NORM_TOLERANCE else None for i in winners],
+                limit,
+                mmr_lambda=1.0 if options.mmr_lambda is None else float(options.mmr_lambda),
+                groups=[chunks[i].file_path for i in winners],
+                max_per_group=options.max_chunks_per_file,
+            )
+            winners = [winners[p] for p in picked]
+
+        return self._result_rows(chunks, winners, fusion_scores, max_sims, options, with_repo_id)
+
+    @staticmethod
+    def _ranking(chunk: _IndexedChunk, fusion_score: float, max_sim: float) -> tuple:
+        # same ordering as the SQL: fusion_score, max_sim (NULLS LAST), created_at, id
+        created_at = datetime.datetime.fromisoformat(chunk.created_at)
+        return float(fusion_score), float(max_sim), created_at, uuid.UUID(chunk.id)
+
+    def _result_rows(
+        self,
+        chunks: Sequence[_IndexedChunk],
+        winners: Sequence[int],
+        fusion_scores: np.ndarray,
+        max_sims: np.ndarray,
+        options: CodeChunksSearchOptions,
+        with_repo_id: bool,
+    ) -> List[Dict[str, Any]]:
+        columns = SEARCH_PROJECTION_COLUMNS[ChunkProjection(options.projection)]
+        records = self._read_records([chunks[i] for i in winners]) if columns else [{}] * len(winners)
+
+        rows = []
+        for i, record in zip(winners, records):
+            row: Dict[str, Any] = {"id": uuid.UUID(chunks[i].id)}
+            if with_repo_id:
+                row["repo_id"] = chunks[i].repo_id
+            row.update({column: record[column] for column in columns})
+            row["created_at"] = datetime.datetime.fromisoformat(chunks[i].created_at)
+            row["fusion_score"] = float(fusion_scores[i])
+            # the chunks only matched by the lexical side have no similarity
+            row["max_sim"] = float(max_sims[i]) if np.isfinite(max_sims[i]) else None
+            rows.append(row)
+        return rows
+
+    def _cosine(self, chunks: Sequence[_IndexedChunk], query_embeddings: List[List[float]]) -> np.ndarray:
+        """(chunks, query vectors) cosine similarities, -inf for chunks without an embedding."""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        query_norms = np.linalg.norm(queries.astype(np.float64), axis=1)
+        norms = np.array([c.norm for c in chunks])
+
+        # only the pages of the selected rows get read from the mapped file
+        matrix = self._embeddings[np.array([c.row for c in chunks], dtype=np.intp)]
+        dots = (matrix @ queries.T).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = np.clip(dots / np.outer(norms, query_norms), -1.0, 1.0)
+        valid = np.outer(norms >= ZERO_NORM_TOLERANCE, query_norms >= ZERO_NORM_TOLERANCE)
+        return np.where(valid, sims, -np.inf)
+
+    def _prune(self, sims: np.ndarray, k: int, options: CodeChunksSearchOptions) -> np.ndarray:
+        """
+        Drops the similarities under options.min_similarity and records the counters. They are the
+        tail of each query vector's ranking, so the top-k of what is left is the top-k minus its
+        pruned rows, as the SQL filtering the candidates does.
+        """
+        valid = np.isfinite(sims)
+        kept = sims >= options.min_similarity
+        if options.strategy == ChunkSearchStrategy.EXACT:
+            scored, remaining = int(valid.sum()), int(kept.sum())
+        else:
+            scored = int(np.minimum(valid.sum(axis=0), k).sum())
+            remaining = int(np.minimum(kept.sum(axis=0), k).sum())
+        self.similarity_pruning_stats.record(scored=scored, pruned=scored - remaining)
+        return np.where(kept, sims, -np.inf)
+
+    @staticmethod
+    def _fuse(sims: np.ndarray, k: int, options: CodeChunksSearchOptions) -> tuple[np.ndarray, np.ndarray]:
+        """fusion_score and max_sim per chunk, -inf for the chunks that aren't part of the results."""
+        valid = np.isfinite(sims)
+        if options.strategy == ChunkSearchStrategy.EXACT:
+            fusion = np.where(valid.any(axis=1), np.where(valid, sims, 0.0).sum(axis=1), -np.inf)
+            return fusion, np.where(valid, sims, -np.inf).max(axis=1)
+
+        # CANDIDATES/BINARY: top-k per query vector, only the candidates get fused
+        ranks = np.zeros(sims.shape, dtype=np.int64)
+        for q in range(sims.shape[1]):
+            top = [i for i in np.argsort(-sims[:, q], kind="stable") if valid[i, q]][:k]
+            ranks[top, q] = np.arange(1, len(top) + 1)
+
+        candidate = ranks > 0
+        candidate_sims = np.where(candidate, sims, -np.inf)
+        max_sims = candidate_sims.max(axis=1)
+        if options.fusion == ChunkFusion.RRF:
+            fusion = np.where(candidate, 1.0 / (options.rrf_k + ranks), 0.0).sum(axis=1)
+        elif options.fusion == ChunkFusion.MAX:
+            fusion = max_sims.copy()
+        else:
+            fusion = np.where(candidate, sims, 0.0).sum(axis=1)
+        return np.where(candidate.any(axis=1), fusion, -np.inf), max_sims
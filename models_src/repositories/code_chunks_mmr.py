@@ -0,0 +1,131 @@
+"""
+Maximal marginal relevance (MMR) diversification of the chunk search results.
+
+The search over-fetches a pool of candidates together with their embeddings (same query, no extra
+round trip), then `limit` rows are picked greedily, each time the one maximizing
+
+    mmr_lambda * relevance - (1 - mmr_lambda) * max(cosine similarity to the rows already picked)
+
+so near-duplicate chunks, typically neighbours from one file, don't take every slot. Relevance is
+the fusion_score min-max scaled to [0, 1] over the pool, to be comparable with the similarities
+whatever the fusion. `max_chunks_per_file` additionally caps the picked rows per file_path.
+"""
+
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+from models_src.dto.code_chunks import CodeChunksSearchOptions
+
+# Default pool of a diversified search: max(limit * 4, 40) rows
+DEFAULT_MMR_POOL_PER_LIMIT = 4
+DEFAULT_MMR_MIN_POOL = 40
+
+
+def diversification_enabled(options: CodeChunksSearchOptions) -> bool:
+    return options.mmr_lambda is not None or options.max_chunks_per_file is not None
+
+
+def reject_diversification(options: CodeChunksSearchOptions, search: str) -> None:
+    """Raises for the searches that aren't diversified, rather than silently ignoring the options."""
+    if diversification_enabled(options):
+        raise ValueError(f"the {search} doesn't support mmr_lambda / max_chunks_per_file")
+
+
+def resolve_mmr_pool_size(options: CodeChunksSearchOptions, limit: int) -> Optional[int]:
+    """
+    Validates the diversification options, returns how many rows the search has to over-fetch, or
+    None when the results are not diversified.
+    """
+    if not diversification_enabled(options):
+        return None
+
+    if options.mmr_lambda is not None and not 0.0 <= options.mmr_lambda <= 1.0:
+        raise ValueError("mmr_lambda must be between 0 and 1")
+
+    if options.max_chunks_per_file is not None and options.max_chunks_per_file < 1:
+        raise ValueError("max_chunks_per_file must be >= 1")
+
+    if options.mmr_pool_size is None:
+        return max(limit * DEFAULT_MMR_POOL_PER_LIMIT, DEFAULT_MMR_MIN_POOL)
+
+    if options.mmr_pool_size < limit:
+        raise ValueError("mmr_pool_size must be >= limit")
+
+    return int(options.mmr_pool_size)
+
+
+def mmr_select(
+    relevance: Sequence[float],
+    embeddings: Sequence[Optional[Any]],
+    k: int,
+    mmr_lambda: float = 1.0,
+    groups: Optional[Sequence[Hashable]] = None,
+    max_per_group: Optional[int] = None,
+) -> List[int]:
+    """
+    Indexes of the (up to) `k` picked candidates, in pick order. Candidates without an embedding
+    are treated as dissimilar to everything, ties go to the earliest candidate.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+
+    scores = np.asarray(relevance, dtype=np.float64)
+    finite = np.isfinite(scores)
+    # candidates without a score (no embedding) rank below every scored one
+    relevance_scaled = np.full(n, -1.0)
+    if finite.any():
+        low, high = scores[finite].min(), scores[finite].max()
+        relevance_scaled[finite] = (scores[finite] - low) / (high - low) if high > low else 1.0
+
+    dim = next((len(e) for e in embeddings if e is not None), 0)
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    for i, embedding in enumerate(embeddings):
+        if embedding is not None and len(embedding) == dim:
+            matrix[i] = embedding
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+    gram = (matrix @ matrix.T).astype(np.float64)
+
+    group_ids = None
+    if groups is not None and max_per_group is not None:
+        _, group_ids = np.unique(np.asarray([str(g) for g in groups]), return_inverse=True)
+        group_counts = np.zeros(group_ids.max() + 1, dtype=np.int64)
+
+    available = np.ones(n, dtype=bool)
+    redundancy = np.full(n, -np.inf)
+    picked: List[int] = []
+    while len(picked) < k and available.any():
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        mmr = mmr_lambda * relevance_scaled - (1.0 - mmr_lambda) * penalty
+        candidates = np.flatnonzero(available)
+        best = int(candidates[np.argmax(mmr[candidates])])
+
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, gram[best])
+        if group_ids is not None:
+            group_counts[group_ids[best]] += 1
+            if group_counts[group_ids[best]] >= max_per_group:
+                available &= group_ids != group_ids[best]
+
+    return picked
+
+
+def diversify_search_rows(
+    rows: List[Dict[str, Any]], limit: int, options: CodeChunksSearchOptions
+) -> List[Dict[str, Any]]:
+    """
+    Picks `limit` rows of an over-fetched pool (search rows carrying `embedding` and `file_path`,
+    ranked by relevance), returned in pick order.
+    """
+    picked = mmr_select(
+        [row["fusion_score"] if row.get("fusion_score") is not None else float("-inf") for row in rows],
+        [row.get("embedding") for row in rows],
+        limit,
+        mmr_lambda=1.0 if options.mmr_lambda is None else float(options.mmr_lambda),
+        groups=[row.get("file_path") for row in rows],
+        max_per_group=options.max_chunks_per_file,
+    )
+    return [rows[i] for i in picked]
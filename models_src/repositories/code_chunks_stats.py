@@ -0,0 +1,305 @@
+"""
+Incremental per repo / per commit statistics of the code chunks (chunk count, embedded count,
+content bytes, distinct files), readable in O(1) instead of counting code_chunks.
+
+Every chunk write of TortoiseCodeChunksStore runs CODE_CHUNKS_STATS_UPDATE_SQL in its own
+transaction with the signed deltas of the written/deleted chunks, aggregated per
+(repo_id, commit_number, file_path), after taking the per repo lock of CODE_CHUNKS_STATS_LOCK_SQL. The single statement upserts code_chunks_file_stats, then
+derives the distinct file moves from the counts before/after and upserts the commit and repo rows,
+so the counters commit or roll back together with the chunks.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tortoise.transactions import in_transaction
+
+from models_src.dto.code_chunks import CodeChunksRequestDTO, CodeChunksStatsDTO
+
+# (repo_id, commit_number, file_path) -> [chunks, embedded, content bytes]
+ChunkStatsDeltas = Dict[Tuple[str, str, str], List[int]]
+
+
+def content_bytes(content: Optional[str]) -> int:
+    """Same measure as octet_length(content) in a UTF-8 database."""
+    return len(content.encode("utf-8")) if content else 0
+
+
+def chunk_stats_deltas(chunks: Iterable[CodeChunksRequestDTO], sign: int = 1) -> ChunkStatsDeltas:
+    deltas: ChunkStatsDeltas = {}
+    for chunk in chunks:
+        delta = deltas.setdefault((chunk.repo_id, chunk.commit_number, chunk.file_path), [0, 0, 0])
+        delta[0] += sign
+        delta[1] += sign if chunk.embedding is not None else 0
+        delta[2] += sign * content_bytes(chunk.content)
+    return deltas
+
+
+def merge_chunk_stats_deltas(*deltas: ChunkStatsDeltas) -> ChunkStatsDeltas:
+    merged: ChunkStatsDeltas = {}
+    for part in deltas:
+        for key, (chunks, embedded, size) in part.items():
+            total = merged.setdefault(key, [0, 0, 0])
+            total[0] += chunks
+            total[1] += embedded
+            total[2] += size
+    return {key: value for key, value in merged.items() if any(value)}
+
+
+def code_chunks_stats_update_params(deltas: ChunkStatsDeltas) -> list:
+    """The six arrays bound to CODE_CHUNKS_STATS_UPDATE_SQL, keys sorted to lock rows in one order."""
+    keys = sorted(deltas)
+    return [
+        [k[0] for k in keys],
+        [k[1] for k in keys],
+        [k[2] for k in keys],
+        [deltas[k][0] for k in keys],
+        [deltas[k][1] for k in keys],
+        [deltas[k][2] for k in keys],
+    ]
+
+
+# Run in the write's transaction right before CODE_CHUNKS_STATS_UPDATE_SQL, with the sorted repo
+# ids of its deltas. The repo level file count is decided by looking for another commit holding the
+# same file path: two concurrent writes of one path (e.g. under different commit_numbers) would
+# both see none under READ COMMITTED and both count it. Holding a per repo lock until the commit
+# serializes them, and the update statement, started once the lock is granted, takes a snapshot
+# including the writes committed meanwhile. Both lock keys are int4 (hashtext), namespaced away
+# from the other advisory locks of the database by the first one.
+CODE_CHUNKS_STATS_LOCK_SQL = """
+    SELECT pg_advisory_xact_lock(hashtext('code_chunks_stats'), hashtext(r.repo_id))
+    FROM (SELECT DISTINCT unnest($1::text[]) AS repo_id ORDER BY 1) AS r
+"""
+
+
+def code_chunks_stats_lock_params(deltas: ChunkStatsDeltas) -> list:
+    """The repo ids array bound to CODE_CHUNKS_STATS_LOCK_SQL, sorted so writers lock in one order."""
+    return [sorted({key[0] for key in deltas})]
+
+
+# The sub-statements of a WITH all see the tables as they were before the statement, so the lateral
+# `o` reads the chunk counts of the file paths in the commits left untouched by this write
+CODE_CHUNKS_STATS_UPDATE_SQL = """
+    WITH delta AS (
+        SELECT *
+        FROM unnest($1::text[], $2::text[], $3::text[], $4::bigint[], $5::bigint[], $6::bigint[])
+            AS d(repo_id, commit_number, file_path, chunks, embedded, bytes)
+    ),
+    files AS (
+        INSERT INTO public.code_chunks_file_stats AS f (repo_id, commit_number, file_path, chunk_count)
+        SELECT repo_id, commit_number, file_path, chunks FROM delta
+        ON CONFLICT (repo_id, commit_number, file_path)
+        DO UPDATE SET chunk_count = f.chunk_count + EXCLUDED.chunk_count
+        RETURNING f.repo_id, f.commit_number, f.file_path, f.chunk_count
+    ),
+    moves AS (
+        SELECT
+            d.*,
+            f.chunk_count > 0 AS present_after,
+            f.chunk_count - d.chunks > 0 AS present_before
+        FROM delta d
+        JOIN files f USING (repo_id, commit_number, file_path)
+    ),
+    commits AS (
+        INSERT INTO public.code_chunks_commit_stats AS c
+            (repo_id, commit_number, chunk_count, embedded_count, content_bytes, file_count, updated_at)
+        SELECT
+            repo_id, commit_number, sum(chunks), sum(embedded), sum(bytes),
+            sum(present_after::int - present_before::int), now()
+        FROM moves
+        GROUP BY repo_id, commit_number
+        ON CONFLICT (repo_id, commit_number) DO UPDATE SET
+            chunk_count = c.chunk_count + EXCLUDED.chunk_count,
+            embedded_count = c.embedded_count + EXCLUDED.embedded_count,
+            content_bytes = c.content_bytes + EXCLUDED.content_bytes,
+            file_count = c.file_count + EXCLUDED.file_count,
+            updated_at = EXCLUDED.updated_at
+    ),
+    paths AS (
+        -- a file path counts once per repo, whatever the commits holding chunks of it
+        SELECT
+            m.repo_id,
+            (bool_or(m.present_after) OR coalesce(bool_or(o.present), false))::int
+                - (bool_or(m.present_before) OR coalesce(bool_or(o.present), false))::int AS files
+        FROM moves m
+        LEFT JOIN LATERAL (
+            SELECT true AS present
+            FROM public.code_chunks_file_stats o
+            WHERE o.repo_id = m.repo_id
+              AND o.file_path = m.file_path
+              AND o.chunk_count > 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM delta t
+                  WHERE t.repo_id = o.repo_id
+                    AND t.commit_number = o.commit_number
+                    AND t.file_path = o.file_path
+              )
+            LIMIT 1
+        ) o ON true
+        GROUP BY m.repo_id, m.file_path
+    ),
+    repos AS (
+        SELECT repo_id, sum(chunks) AS chunks, sum(embedded) AS embedded, sum(bytes) AS bytes
+        FROM moves
+        GROUP BY repo_id
+    )
+    INSERT INTO public.code_chunks_repo_stats AS r
+        (repo_id, chunk_count, embedded_count, content_bytes, file_count, updated_at)
+    SELECT
+        repos.repo_id, repos.chunks, repos.embedded, repos.bytes,
+        (SELECT coalesce(sum(p.files), 0) FROM paths p WHERE p.repo_id = repos.repo_id), now()
+    FROM repos
+    ON CONFLICT (repo_id) DO UPDATE SET
+        chunk_count = r.chunk_count + EXCLUDED.chunk_count,
+        embedded_count = r.embedded_count + EXCLUDED.embedded_count,
+        content_bytes = r.content_bytes + EXCLUDED.content_bytes,
+        file_count = r.file_count + EXCLUDED.file_count,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Run after deletes, in the same transaction: file paths left without chunks
+CODE_CHUNKS_FILE_STATS_PRUNE_SQL = (
+    "DELETE FROM public.code_chunks_file_stats WHERE repo_id = ANY($1::text[]) AND chunk_count <= 0"
+)
+
+# Wraps a `DELETE FROM public.code_chunks ...` into a statement returning the (positive) stats of
+# the deleted chunks per (repo_id, commit_number, file_path)
+CODE_CHUNKS_DELETE_WITH_STATS_SQL = """
+    WITH gone AS (
+        {delete}
+        RETURNING repo_id, commit_number, file_path, embedding IS NOT NULL AS embedded,
+                  octet_length(content) AS bytes
+    )
+    SELECT
+        repo_id,
+        commit_number,
+        file_path,
+        count(*) AS chunks,
+        count(*) FILTER (WHERE embedded) AS embedded,
+        coalesce(sum(bytes), 0) AS bytes
+    FROM gone
+    GROUP BY repo_id, commit_number, file_path
+"""
+
+
+def deleted_chunk_stats_deltas(rows: Iterable[dict]) -> ChunkStatsDeltas:
+    """Negative deltas of the rows of CODE_CHUNKS_DELETE_WITH_STATS_SQL."""
+    return {
+        (row["repo_id"], row["commit_number"], row["file_path"]): [
+            -int(row["chunks"]),
+            -int(row["embedded"]),
+            -int(row["bytes"]),
+        ]
+        for row in rows
+    }
+
+CODE_CHUNKS_STATS_TABLES = ("code_chunks_file_stats", "code_chunks_commit_stats", "code_chunks_repo_stats")
+
+
+def code_chunks_stats_rebuild_sql() -> List[str]:
+    """
+    Statements recomputing the counters of one repo ($1) from code_chunks, to initialize them on
+    a table written before they existed or to repair them.
+    """
+    return [
+        *(f"DELETE FROM public.{table} WHERE repo_id = $1" for table in CODE_CHUNKS_STATS_TABLES),
+        """
+        INSERT INTO public.code_chunks_file_stats (repo_id, commit_number, file_path, chunk_count)
+        SELECT repo_id, commit_number, file_path, count(*)
+        FROM public.code_chunks WHERE repo_id = $1
+        GROUP BY repo_id, commit_number, file_path
+        """,
+        """
+        INSERT INTO public.code_chunks_commit_stats
+            (repo_id, commit_number, chunk_count, embedded_count, content_bytes, file_count, updated_at)
+        SELECT
+            repo_id, commit_number, count(*), count(*) FILTER (WHERE embedding IS NOT NULL),
+            coalesce(sum(octet_length(content)), 0), count(DISTINCT file_path), now()
+        FROM public.code_chunks WHERE repo_id = $1
+        GROUP BY repo_id, commit_number
+        """,
+        """
+        INSERT INTO public.code_chunks_repo_stats
+            (repo_id, chunk_count, embedded_count, content_bytes, file_count, updated_at)
+        SELECT
+            repo_id, count(*), count(*) FILTER (WHERE embedding IS NOT NULL),
+            coalesce(sum(octet_length(content)), 0), count(DISTINCT file_path), now()
+        FROM public.code_chunks WHERE repo_id = $1
+        GROUP BY repo_id
+        """,
+    ]
+
+
+async def rebuild_code_chunks_stats(repo_id: str, alias: str = "default") -> None:
+    """Recomputes the counters of the repo in one transaction (full scan of its chunks)."""
+    async with in_transaction(alias) as conn:
+        for statement in code_chunks_stats_rebuild_sql():
+            await conn.execute_query(statement, [repo_id])
+
+
+class CodeChunksStatsCounter:
+    """In memory counterpart of the stats tables, for the stores running without PostgreSQL."""
+
+    def __init__(self) -> None:
+        self._files: Dict[Tuple[str, str, str], int] = {}
+        self._commits: Dict[Tuple[str, str], List[int]] = {}
+        self._repos: Dict[str, List[int]] = {}
+        # (repo_id, file_path) -> commits holding chunks of it
+        self._repo_paths: Dict[Tuple[str, str], int] = {}
+
+    def apply(self, deltas: ChunkStatsDeltas) -> None:
+        for (repo_id, commit_number, file_path), (chunks, embedded, size) in deltas.items():
+            before = self._files.get((repo_id, commit_number, file_path), 0)
+            after = before + chunks
+            file_move = (after > 0) - (before > 0)
+            if after > 0:
+                self._files[(repo_id, commit_number, file_path)] = after
+            else:
+                self._files.pop((repo_id, commit_number, file_path), None)
+
+            holders = self._repo_paths.get((repo_id, file_path), 0)
+            self._repo_paths[(repo_id, file_path)] = holders + file_move
+            repo_file_move = (holders + file_move > 0) - (holders > 0)
+            if holders + file_move <= 0:
+                self._repo_paths.pop((repo_id, file_path), None)
+
+            for counters, files in (
+                (self._commits.setdefault((repo_id, commit_number), [0, 0, 0, 0]), file_move),
+                (self._repos.setdefault(repo_id, [0, 0, 0, 0]), repo_file_move),
+            ):
+                counters[0] += chunks
+                counters[1] += embedded
+                counters[2] += size
+                counters[3] += files
+
+    def add(self, chunks: Iterable[CodeChunksRequestDTO], sign: int = 1) -> None:
+        self.apply(chunk_stats_deltas(chunks, sign))
+
+    def drop_repo(self, repo_id: str) -> None:
+        self._repos.pop(repo_id, None)
+        for store in (self._files, self._commits, self._repo_paths):
+            for key in [k for k in store if k[0] == repo_id]:
+                del store[key]
+
+    def repo_stats(self, repo_id: str) -> Optional[CodeChunksStatsDTO]:
+        counters = self._repos.get(repo_id)
+        return self.__to_dto(counters, repo_id)
+
+    def commit_stats(self, repo_id: str, commit_number: str) -> Optional[CodeChunksStatsDTO]:
+        counters = self._commits.get((repo_id, commit_number))
+        return self.__to_dto(counters, repo_id, commit_number)
+
+    @staticmethod
+    def __to_dto(
+        counters: Optional[List[int]], repo_id: str, commit_number: Optional[str] = None
+    ) -> Optional[CodeChunksStatsDTO]:
+        if counters is None:
+            return None
+        chunk_count, embedded_count, size, file_count = counters
+        return CodeChunksStatsDTO(
+            repo_id=repo_id,
+            commit_number=commit_number,
+            chunk_count=chunk_count,
+            embedded_count=embedded_count,
+            content_bytes=size,
+            file_count=file_count,
+        )
@@ -4,6 +4,7 @@ from dataclasses import asdict
 from typing import List, Optional, Protocol
 
 from tortoise.exceptions import DoesNotExist, IntegrityError
+from tortoise.expressions import F
 
 from models_src.dto.repo import RepoRequestDTO, RepoResponseDTO
 from models_src.dto.utils import TortoiseModelMapper
@@ -54,6 +55,18 @@ class IRepoStore(Protocol):
             total_embeddings: int,
     ) -> int: ...
     
+    @abstractmethod
+    async def increment_progress_counters_by_id(
+            self,
+            id: str,
+            total_files: int = 0,
+            total_chunks: int = 0,
+            total_embeddings: int = 0,
+    ) -> int: ...
+
+    @abstractmethod
+    async def reset_progress_counters_by_id(self, id: str) -> int: ...
+
     @abstractmethod
     async def update_repo_system_reference_by_id(
         self, id: str, repo_system_reference: str
@@ -177,6 +190,40 @@ class TortoiseRepoStore(IRepoStore):
         
         return updated_count
 
+    async def increment_progress_counters_by_id(
+            self,
+            id: str,
+            total_files: int = 0,
+            total_chunks: int = 0,
+            total_embeddings: int = 0,
+    ) -> int:
+        """
+        Adds to the progress counters in one UPDATE (total = total + n), so concurrent ingestion
+        writers can report as they go without losing increments.
+        """
+        if not id or not id.strip():
+            return -1
+
+        if not (total_files or total_chunks or total_embeddings):
+            return 0
+
+        return await self.model.filter(id=id).update(
+            total_files=F("total_files") + total_files,
+            total_chunks=F("total_chunks") + total_chunks,
+            total_embeddings=F("total_embeddings") + total_embeddings,
+        )
+
+    async def reset_progress_counters_by_id(self, id: str) -> int:
+        """Sets the progress counters back to 0 before an ingestion run counts the repo again."""
+        if not id or not id.strip():
+            return -1
+
+        return await self.model.filter(id=id).update(
+            total_files=0,
+            total_chunks=0,
+            total_embeddings=0,
+        )
+
     async def update_repo_system_reference_by_id(
         self, id: str, repo_system_reference: str
     ) -> int:
@@ -1,16 +1,60 @@
+import asyncio
+import dataclasses
 import datetime
-import math
+import re
 import uuid
 from dataclasses import asdict
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set
 from uuid import uuid4
 
-from models_src.dto.code_chunks import CodeChunksRequestDTO, CodeChunksResponseDTO
-from models_src.repositories.code_chunks import ICodeChunksStore
+import numpy as np
+
+from models_src.dto.code_chunks import (
+    SEARCH_PROJECTION_COLUMNS,
+    ChunkFusion,
+    ChunkProjection,
+    ChunkSearchStrategy,
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksFileDiffResponseDTO,
+    CodeChunksPurgeProgressDTO,
+    CodeChunksRequestDTO,
+    CodeChunksResponseDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+    CodeChunksStatsDTO,
+    EmbeddingReuseStats,
+    SimilarityPruningStats,
+    FileLookupMode,
+    compute_content_hash,
+    hamming_distance,
+    quantize_embedding,
+)
+from models_src.repositories.code_chunks import (
+    DEFAULT_PURGE_BATCH_SIZE,
+    DEFAULT_PURGE_PAUSE_SECONDS,
+    DEFAULT_STREAM_FETCH_SIZE,
+    ICodeChunksStore,
+    PurgeProgressCallback,
+    file_name_matches,
+    resolve_candidates_per_query,
+    report_progress,
+    resolve_stream_columns,
+    validate_file_diff,
+    validate_min_similarity,
+    validate_per_repo_limit,
+    validate_purge_arguments,
+)
+from models_src.repositories.code_chunks_cursor import resolve_search_cursor, rows_after
+from models_src.repositories.code_chunks_mmr import (
+    diversify_search_rows,
+    reject_diversification,
+    resolve_mmr_pool_size,
+)
+from models_src.repositories.code_chunks_stats import CodeChunksStatsCounter
 from models_src.test_doubles.repositories.bases import FakeBase, StubPlanMixin
+from models_src.test_doubles.repositories.similarity import EmbeddingMatrix
 
 EMBED_DIM = 768
-ZERO_NORM_TOLERANCE = 1e-12
 
 class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
 
@@ -18,6 +62,8 @@ class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
         super().__init__()
         self.data_store: List[CodeChunksResponseDTO] = []
         self.total_count = 0
+        self.embedding_reuse_stats = EmbeddingReuseStats()
+        self.similarity_pruning_stats = SimilarityPruningStats()
 
     def __get_data_store(self):
         return self.data_store
@@ -30,13 +76,20 @@ class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
         self.data_store.extend(fake_data)
         self.total_count = len(self.data_store)
 
+    @staticmethod
+    def __to_row(model: CodeChunksRequestDTO) -> CodeChunksResponseDTO:
+        v = CodeChunksResponseDTO(**asdict(model))
+        v.id = uuid4()
+        v.created_at = datetime.datetime.now(datetime.timezone.utc)
+        if not v.content_hash:
+            v.content_hash = compute_content_hash(v.content)
+        return v
+
     async def save(self, create_model: CodeChunksRequestDTO) -> CodeChunksResponseDTO:
 
         self._before(self.save, create_model=create_model)
 
-        response = CodeChunksResponseDTO(**asdict(create_model))
-        response.id = uuid4()
-        response.created_at = datetime.datetime.now(datetime.timezone.utc)
+        response = self.__to_row(create_model)
 
         self.data_store.append(response)
         self.total_count = len(self.data_store)
@@ -48,9 +101,7 @@ class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
 
         response = []
         for model in create_model:
-            v = CodeChunksResponseDTO(**asdict(model))
-            v.id = uuid4()
-            v.created_at = datetime.datetime.now(datetime.timezone.utc)
+            v = self.__to_row(model)
 
             response.append(v)
 
@@ -59,6 +110,120 @@ class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
 
         return response
 
+    async def bulk_copy_save(self, create_model: list[CodeChunksRequestDTO]) -> List[uuid.UUID]:
+        self._before(self.bulk_copy_save, create_model=create_model)
+
+        ids = []
+        for model in create_model:
+            v = self.__to_row(model)
+
+            self.data_store.append(v)
+            ids.append(v.id)
+
+        self.total_count = len(self.data_store)
+
+        return ids
+
+    async def save_commit_file_diff(
+        self, diff: CodeChunksFileDiffRequestDTO
+    ) -> CodeChunksFileDiffResponseDTO:
+        self._before(self.save_commit_file_diff, diff=diff)
+
+        validate_file_diff(diff)
+
+        touched_paths = diff.changed_file_paths | diff.added_file_paths | diff.deleted_file_paths
+        if not touched_paths:
+            return CodeChunksFileDiffResponseDTO()
+
+        kept = [
+            row for row in self.data_store
+            if not (
+                str(row.user_id) == str(diff.user_id)
+                and str(row.repo_id) == str(diff.repo_id)
+                and row.file_path in touched_paths
+            )
+        ]
+        deleted_count = len(self.data_store) - len(kept)
+
+        saved = []
+        for model in diff.chunks:
+            v = self.__to_row(model)
+            saved.append(v)
+
+        self.__set_data_store(kept + saved)
+
+        return CodeChunksFileDiffResponseDTO(deleted_count=deleted_count, saved=saved)
+
+    async def find_embeddings_by_content_hashes(
+        self, content_hashes: Sequence[str], user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        self._before(self.find_embeddings_by_content_hashes, content_hashes=content_hashes, user_id=user_id)
+
+        unique_hashes = list(dict.fromkeys(h for h in content_hashes if h))
+        if not unique_hashes:
+            return {}
+
+        wanted = set(unique_hashes)
+        found: Dict[str, Any] = {}
+        for row in self.__get_data_store():
+            row_hash = row.content_hash or compute_content_hash(row.content)
+            if (
+                row_hash in wanted
+                and row_hash not in found
+                and row.embedding is not None
+                and (user_id is None or str(row.user_id) == str(user_id))
+            ):
+                found[row_hash] = row.embedding
+
+        self.embedding_reuse_stats.record(requested=len(unique_hashes), hits=len(found))
+        return found
+
+    async def delete_all_by_repo_id(self, repo_id: str) -> int:
+        self._before(self.delete_all_by_repo_id, repo_id=repo_id)
+
+        if not repo_id:
+            return 0
+
+        data = self.__get_data_store()
+        kept = [row for row in data if str(row.repo_id) != str(repo_id)]
+        self.__set_data_store(kept)
+        return len(data) - len(kept)
+
+    async def purge_repo_chunks(
+        self,
+        repo_id: str,
+        batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+        pause: float = DEFAULT_PURGE_PAUSE_SECONDS,
+        on_progress: Optional[PurgeProgressCallback] = None,
+    ) -> CodeChunksPurgeProgressDTO:
+        self._before(
+            self.purge_repo_chunks, repo_id=repo_id, batch_size=batch_size, pause=pause, on_progress=on_progress
+        )
+
+        validate_purge_arguments(batch_size, pause)
+
+        progress = CodeChunksPurgeProgressDTO(repo_id=str(repo_id))
+        if repo_id:
+            progress.total_estimate = sum(1 for row in self.__get_data_store() if str(row.repo_id) == str(repo_id))
+
+        while repo_id:
+            doomed = [row for row in self.__get_data_store() if str(row.repo_id) == str(repo_id)][:batch_size]
+            if not doomed:
+                break
+
+            doomed_ids = {id(row) for row in doomed}
+            self.__set_data_store([row for row in self.__get_data_store() if id(row) not in doomed_ids])
+            progress.deleted_count += len(doomed)
+            progress.batches += 1
+            await report_progress(on_progress, progress)
+            if len(doomed) < batch_size:
+                break
+            await asyncio.sleep(pause)
+
+        progress.done = True
+        await report_progress(on_progress, progress)
+        return progress
+
     async def find_all_by_repo_id_with_limit(
         self, repo_id: str, limit: int = 100
     ) -> List[CodeChunksResponseDTO]:
@@ -78,12 +243,62 @@ class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
 
         return final_result
 
+    async def stream_all_by_repo_id(
+        self,
+        repo_id: str,
+        fetch_size: int = DEFAULT_STREAM_FETCH_SIZE,
+        columns: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[CodeChunksResponseDTO]:
+        self._before(self.stream_all_by_repo_id, repo_id=repo_id, fetch_size=fetch_size, columns=columns)
+
+        columns = resolve_stream_columns(columns)
+        if fetch_size < 1:
+            raise ValueError("fetch_size must be >= 1")
+
+        for row in list(self.__get_data_store()):
+            if row.repo_id == repo_id:
+                yield CodeChunksResponseDTO(**{column: getattr(row, column) for column in columns})
+
+    async def fetch_contents_by_ids(
+        self,
+        user_id: str | uuid.UUID,
+        ids: Sequence[str | uuid.UUID],
+        repo_id: Optional[str | uuid.UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        self._before(self.fetch_contents_by_ids, user_id=user_id, ids=ids, repo_id=repo_id)
+
+        by_id = {
+            str(row.id): row
+            for row in self.__get_data_store()
+            if str(row.user_id) == str(user_id) and (not repo_id or str(row.repo_id) == str(repo_id))
+        }
+        return [
+            {"id": row.id, "file_name": row.file_name, "file_path": row.file_path, "content": row.content}
+            for row in (by_id.get(key) for key in dict.fromkeys(str(i) for i in ids))
+            if row is not None
+        ]
+
     async def get_repo_file_chunks(self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID,
-                                   file_name: str = "readme") -> List[dict]:
+                                   file_name: str = "readme",
+                                   mode: FileLookupMode = FileLookupMode.CONTAINS) -> List[dict]:
 
         self._before(self.get_repo_file_chunks, user_id=user_id, repo_id=repo_id)
 
+        mode = FileLookupMode(mode)
         all_data = self.__get_data_store()
+        if mode != FileLookupMode.CONTAINS:
+            matching = [
+                row
+                for row in all_data
+                if str(user_id) == str(row.user_id)
+                and str(repo_id) == str(row.repo_id)
+                and file_name_matches(row.file_name, file_name, mode)
+            ]
+            return [
+                {"file_path": row.file_path, "chunk_ordinal": row.chunk_ordinal, "content": row.content}
+                for row in sorted(matching, key=self.__source_order)
+            ]
+
         sorted_data = sorted(all_data, key=lambda k: k.created_at, reverse=True)
         returned_data: List[dict] = []
         for data in sorted_data:
@@ -95,21 +310,41 @@ class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
                 returned_data.append({"content": data.content})
         return returned_data
 
-    def calculate_score(self, vec1: List[float] | None, vec2: List[float] | None) -> float:
-        """
-        Attempts to mimic the postgresql cosine distance calculation the "<=>" part
-        """
+    async def get_repo_file_content(
+        self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_path: str
+    ) -> Optional[str]:
+        self._before(self.get_repo_file_content, user_id=user_id, repo_id=repo_id, file_path=file_path)
+
+        chunks = [
+            row
+            for row in self.__get_data_store()
+            if str(row.user_id) == str(user_id) and str(row.repo_id) == str(repo_id) and row.file_path == file_path
+        ]
+        if not chunks:
+            return None
+        return "".join(row.content for row in sorted(chunks, key=self.__source_order))
+
+    async def get_repo_chunk_stats(self, repo_id: str) -> Optional[CodeChunksStatsDTO]:
+        self._before(self.get_repo_chunk_stats, repo_id=repo_id)
+        return self.__stats_counter(repo_id).repo_stats(str(repo_id))
+
+    async def get_commit_chunk_stats(
+        self, repo_id: str, commit_number: str
+    ) -> Optional[CodeChunksStatsDTO]:
+        self._before(self.get_commit_chunk_stats, repo_id=repo_id, commit_number=commit_number)
+        return self.__stats_counter(repo_id).commit_stats(str(repo_id), commit_number)
+
+    def __stats_counter(self, repo_id: str) -> CodeChunksStatsCounter:
+        # counted on read, rows can be injected through set_fake_data
+        counter = CodeChunksStatsCounter()
+        counter.add(row for row in self.__get_data_store() if str(row.repo_id) == str(repo_id))
+        return counter
+
+    @staticmethod
+    def __source_order(row: CodeChunksResponseDTO) -> tuple:
+        # ORDER BY file_path, chunk_ordinal NULLS LAST, created_at
+        return row.file_path, row.chunk_ordinal is None, row.chunk_ordinal or 0, row.created_at
 
-        if not vec1 or not vec2 or len(vec1) != len(vec2):
-            return float("-inf")  # push invalid rows to the bottom
-        n1 = math.sqrt(sum(x * x for x in vec1))
-        n2 = math.sqrt(sum(y * y for y in vec2))
-        if n1 < ZERO_NORM_TOLERANCE or n2 < ZERO_NORM_TOLERANCE:
-            return float("-inf")
-        sim = sum(a * b for a, b in zip(vec1, vec2)) / (n1 * n2)
-        sim = max(-1.0, min(1.0, sim))  # clamp for numerical safety
-        return sim  # score == cosine similarity
-    
     async def get_user_repo_chunks_multi(
             self,
             user_id: str | uuid.UUID,
@@ -117,54 +352,370 @@ class FakeCodeChunksStore(FakeBase, ICodeChunksStore):
             query_embeddings: List[List[float]],
             emb_dim: int,
             limit: int = 10,
+            options: Optional[CodeChunksSearchOptions] = None,
     ) -> List[Dict[str, Any]]:
+        """
+        options: index knobs (ef_search/probes) are ignored, the fake always does an exact scan
+        """
         self._before(
             self.get_user_repo_chunks_multi,
             user_id=user_id, repo_id=repo_id,
-            query_embeddings=query_embeddings, emb_dim=emb_dim, limit=limit
+            query_embeddings=query_embeddings, emb_dim=emb_dim, limit=limit, options=options
         )
-        
+        return self.__search_repo(user_id, repo_id, query_embeddings, emb_dim, limit, options)
+
+    async def batch_get_user_repo_chunks_multi(
+        self, requests: Sequence[CodeChunksSearchRequestDTO], emb_dim: int
+    ) -> List[List[Dict[str, Any]]]:
+        self._before(self.batch_get_user_repo_chunks_multi, requests=requests, emb_dim=emb_dim)
+
+        return [
+            self.__search_repo(
+                request.user_id, request.repo_id, request.query_embeddings, emb_dim, request.limit, request.options
+            )
+            for request in requests
+        ]
+
+    def __search_repo(
+        self,
+        user_id: str | uuid.UUID,
+        repo_id: str | uuid.UUID,
+        query_embeddings: List[List[float]],
+        emb_dim: int,
+        limit: int,
+        options: Optional[CodeChunksSearchOptions],
+    ) -> List[Dict[str, Any]]:
         if not repo_id or not user_id or limit <= 0 or not query_embeddings:
             return []
         if any(len(v) != emb_dim for v in query_embeddings):
             return []
         if emb_dim != EMBED_DIM:  # keep fake strict to catch mismatches in tests
             return []
-        
-        out: List[Dict[str, Any]] = []
-        for row in self.__get_data_store():
-            if str(row.user_id) != str(user_id) or str(row.repo_id) != str(repo_id):
+
+        options = options or CodeChunksSearchOptions()
+        try:
+            pool_size = resolve_mmr_pool_size(options, limit)
+            candidates_per_query = resolve_candidates_per_query(options, pool_size or limit)
+            cursor = resolve_search_cursor(options)
+            validate_min_similarity(options)
+        except ValueError:
+            return []
+
+        rows = [
+            row for row in self.__get_data_store()
+            if str(row.user_id) == str(user_id) and str(row.repo_id) == str(repo_id)
+        ]
+        out = self.__score_rows(rows, query_embeddings, candidates_per_query, options)
+        if pool_size is None:
+            return self.__project(rows_after(self.__sort_search_rows(out), cursor)[: max(1, int(limit))], options)
+
+        embeddings = {row.id: row.embedding for row in rows}
+        pool = [{**r, "embedding": embeddings[r["id"]]} for r in self.__sort_search_rows(out)[:pool_size]]
+        picked = diversify_search_rows(pool, int(limit), options)
+        return self.__project([{k: v for k, v in r.items() if k != "embedding"} for r in picked], options)
+
+    async def get_user_repos_chunks_multi(
+            self,
+            user_id: str | uuid.UUID,
+            repo_ids: Optional[Sequence[str | uuid.UUID]],
+            query_embeddings: List[List[float]],
+            emb_dim: int,
+            limit: int = 10,
+            per_repo_limit: Optional[int] = None,
+            options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        self._before(
+            self.get_user_repos_chunks_multi,
+            user_id=user_id, repo_ids=repo_ids, query_embeddings=query_embeddings, emb_dim=emb_dim,
+            limit=limit, per_repo_limit=per_repo_limit, options=options
+        )
+
+        if not user_id or limit <= 0 or not query_embeddings or (repo_ids is not None and not repo_ids):
+            return []
+        if any(len(v) != emb_dim for v in query_embeddings) or emb_dim != EMBED_DIM:
+            return []
+
+        options = options or CodeChunksSearchOptions()
+        try:
+            validate_per_repo_limit(per_repo_limit)
+            reject_diversification(options, "multi repo search")
+            candidates_per_query = resolve_candidates_per_query(options, limit)
+            cursor = resolve_search_cursor(options)
+            validate_min_similarity(options)
+        except ValueError:
+            return []
+
+        wanted_repos = None if repo_ids is None else {str(r) for r in repo_ids}
+        rows = [
+            row for row in self.__get_data_store()
+            if str(row.user_id) == str(user_id)
+            and (wanted_repos is None or str(row.repo_id) in wanted_repos)
+            and row.embedding is not None
+        ]
+        repo_by_id = {row.id: row.repo_id for row in rows}
+
+        out = []
+        per_repo_counts: Dict[str, int] = {}
+        for result in self.__sort_search_rows(self.__score_rows(rows, query_embeddings, candidates_per_query, options)):
+            repo_id = repo_by_id[result["id"]]
+            if per_repo_limit is not None and per_repo_counts.get(repo_id, 0) >= per_repo_limit:
                 continue
-            
-            sims = [self.calculate_score(getattr(row, "embedding", None), qv) for qv in query_embeddings]
-            valid_sims = [s for s in sims if s != float("-inf")]
-            if valid_sims:
-                fusion_score = sum(valid_sims)
-                max_sim = max(valid_sims)
-            else:
-                fusion_score = float("-inf")
-                max_sim = float("-inf")
-            
-            out.append({
-                "id": row.id,
-                "file_name": row.file_name,
-                "file_path": row.file_path,
-                "content": row.content,
-                "created_at": row.created_at,
-                "fusion_score": fusion_score,
-                "max_sim": max_sim,
-            })
-        
+            per_repo_counts[repo_id] = per_repo_counts.get(repo_id, 0) + 1
+            out.append({**result, "repo_id": repo_id})
+        # the cursor applies after the per repo cap, as in SQL
+        return self.__project(rows_after(out, cursor)[:limit], options)
+
+    def __score_rows(
+            self,
+            rows: List[CodeChunksResponseDTO],
+            query_embeddings: List[List[float]],
+            candidates_per_query: int,
+            options: CodeChunksSearchOptions,
+    ) -> List[Dict[str, Any]]:
+        sims_per_row = self.__similarities(rows, query_embeddings)
+
+        if options.strategy in (ChunkSearchStrategy.CANDIDATES, ChunkSearchStrategy.BINARY):
+            prefilter_per_query = None
+            if options.strategy == ChunkSearchStrategy.BINARY:
+                prefilter_per_query = self.__hamming_prefilter(
+                    rows, query_embeddings, candidates_per_query * options.oversampling
+                )
+            return self.__fuse_candidates(
+                rows, sims_per_row, len(query_embeddings), candidates_per_query, options, prefilter_per_query
+            )
+
+        if options.min_similarity is not None:
+            scored = np.isfinite(sims_per_row)
+            sims_per_row = np.where(sims_per_row >= options.min_similarity, sims_per_row, -np.inf)
+            self.similarity_pruning_stats.record(
+                scored=int(scored.sum()), pruned=int(scored.sum() - np.isfinite(sims_per_row).sum())
+            )
+
+        # SUM/MAX skip the rows' unusable sims, like SQL aggregates skip NULLs
+        valid = np.isfinite(sims_per_row)
+        has_valid = valid.any(axis=1)
+        fusion_scores = np.where(has_valid, np.where(valid, sims_per_row, 0.0).sum(axis=1), -np.inf)
+        max_sims = np.where(valid, sims_per_row, -np.inf).max(axis=1, initial=-np.inf)
+
+        return [
+            self.__to_search_row(row, float(fusion_score), float(max_sim))
+            for row, fusion_score, max_sim, kept in zip(rows, fusion_scores, max_sims, has_valid)
+            # a chunk whose every similarity was pruned isn't a result anymore
+            if kept or options.min_similarity is None
+        ]
+
+    def __similarities(self, rows: List[CodeChunksResponseDTO], query_embeddings: List[List[float]]) -> np.ndarray:
+        """
+        (rows, query vectors) cosine similarities. The matrix is built on every call: tests mutate
+        the rows and their embeddings in place, a cached one could hand out stale scores.
+        """
+        return EmbeddingMatrix([row.embedding for row in rows], EMBED_DIM).cosine(query_embeddings)
+
+    @staticmethod
+    def __sort_search_rows(out: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         default_dt = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
-        out.sort(
+        return sorted(
+            out,
             key=lambda r: (
                 r.get("fusion_score", float("-inf")),
                 r.get("max_sim", float("-inf")),
                 r.get("created_at", default_dt),
+                str(r.get("id")),
+            ),
+            reverse=True,
+        )
+
+    @staticmethod
+    def __project(out: List[Dict[str, Any]], options: CodeChunksSearchOptions) -> List[Dict[str, Any]]:
+        """Keeps the columns of options.projection, the rows are built with all of them."""
+        dropped = set(SEARCH_PROJECTION_COLUMNS[ChunkProjection.CONTENT]) | set(
+            SEARCH_PROJECTION_COLUMNS[ChunkProjection.METADATA]
+        )
+        dropped -= set(SEARCH_PROJECTION_COLUMNS[ChunkProjection(options.projection)])
+        return [{k: v for k, v in row.items() if k not in dropped} for row in out]
+
+    @staticmethod
+    def __to_search_row(row: CodeChunksResponseDTO, fusion_score: float, max_sim: float) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "file_name": row.file_name,
+            "file_path": row.file_path,
+            "content": row.content,
+            "metadata": row.metadata,
+            "created_at": row.created_at,
+            "fusion_score": fusion_score,
+            "max_sim": max_sim,
+        }
+
+    @staticmethod
+    def __hamming_prefilter(
+            rows: List[CodeChunksResponseDTO],
+            query_embeddings: List[List[float]],
+            size: int,
+    ) -> List[Set[int]]:
+        """Mimics the BINARY prefilter: per query vector, the `size` rows closest by Hamming distance."""
+        row_bits = [
+            (i, quantize_embedding(row.embedding))
+            for i, row in enumerate(rows)
+            if row.embedding is not None and len(row.embedding) == EMBED_DIM
+        ]
+        prefilters = []
+        for qv in query_embeddings:
+            query_bits = quantize_embedding(qv)
+            closest = sorted(row_bits, key=lambda item: hamming_distance(item[1], query_bits))[:size]
+            prefilters.append({i for i, _ in closest})
+        return prefilters
+
+    def __fuse_candidates(
+            self,
+            rows: List[CodeChunksResponseDTO],
+            sims_per_row: np.ndarray,
+            n_queries: int,
+            k: int,
+            options: CodeChunksSearchOptions,
+            prefilter_per_query: Optional[List[Set[int]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Mimics the CANDIDATES strategy: top-k rows per query vector (rows without a usable
+        embedding never become candidates), then fuses only the candidates of each row.
+        """
+        candidate_sims = self.__rank_candidates(sims_per_row, n_queries, k, prefilter_per_query)
+        if options.min_similarity is not None:
+            # applied to the top-k of each query vector, as in SQL
+            scored = sum(len(hits) for hits in candidate_sims.values())
+            candidate_sims = {
+                i: kept
+                for i, hits in candidate_sims.items()
+                if (kept := [(sim, rank) for sim, rank in hits if sim >= options.min_similarity])
+            }
+            remaining = sum(len(hits) for hits in candidate_sims.values())
+            self.similarity_pruning_stats.record(scored=scored, pruned=scored - remaining)
+
+        out = []
+        for i, hits in candidate_sims.items():
+            sims = [sim for sim, _ in hits]
+            if options.fusion == ChunkFusion.RRF:
+                fusion_score = sum(1.0 / (options.rrf_k + rank) for _, rank in hits)
+            elif options.fusion == ChunkFusion.MAX:
+                fusion_score = max(sims)
+            else:
+                fusion_score = sum(sims)
+
+            out.append(self.__to_search_row(rows[i], fusion_score, max(sims)))
+
+        return out
+
+    @staticmethod
+    def __rank_candidates(
+            sims_per_row: np.ndarray,
+            n_queries: int,
+            k: int,
+            prefilter_per_query: Optional[List[Set[int]]] = None,
+    ) -> Dict[int, List[tuple[float, int]]]:
+        """
+        Top-k row indexes per query vector, as {row index: [(sim, rank within the query), ...]}.
+        `prefilter_per_query` restricts the rows each query vector can rank (BINARY strategy).
+        """
+        candidate_sims: Dict[int, List[tuple[float, int]]] = {}
+        for q in range(n_queries):
+            sims = sims_per_row[:, q]
+            eligible = np.isfinite(sims)
+            if prefilter_per_query is not None:
+                in_prefilter = np.zeros(len(sims), dtype=bool)
+                in_prefilter[list(prefilter_per_query[q])] = True
+                eligible &= in_prefilter
+
+            # stable, so ties keep the data store order
+            ranked = [i for i in np.argsort(-sims, kind="stable") if eligible[i]][:k]
+            for rank, i in enumerate(ranked, start=1):
+                candidate_sims.setdefault(int(i), []).append((float(sims[i]), rank))
+
+        return candidate_sims
+
+    async def get_user_repo_chunks_hybrid(
+            self,
+            user_id: str | uuid.UUID,
+            repo_id: str | uuid.UUID,
+            query_text: str,
+            query_embeddings: List[List[float]],
+            emb_dim: int,
+            limit: int = 10,
+            options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Lexical side approximated by the 'simple' text search config: lowercase alphanumeric tokens,
+        every query token has to appear, ranked by the number of occurrences.
+        """
+        self._before(
+            self.get_user_repo_chunks_hybrid,
+            user_id=user_id, repo_id=repo_id, query_text=query_text,
+            query_embeddings=query_embeddings, emb_dim=emb_dim, limit=limit, options=options
+        )
+
+        if not repo_id or not user_id or limit <= 0 or not query_text or not query_text.strip():
+            return []
+        if any(len(v) != emb_dim for v in query_embeddings):
+            return []
+        if query_embeddings and emb_dim != EMBED_DIM:
+            return []
+
+        options = options or CodeChunksSearchOptions()
+        if options.strategy == ChunkSearchStrategy.EXACT:
+            options = dataclasses.replace(
+                options, strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF
+            )
+        try:
+            if options.after is not None:
+                raise ValueError("the hybrid search can't be paginated with `after`")
+            if options.min_similarity is not None:
+                raise ValueError("the hybrid search doesn't support min_similarity")
+            reject_diversification(options, "hybrid search")
+            k = resolve_candidates_per_query(options, limit)
+        except ValueError:
+            return []
+
+        rows = [
+            row for row in self.__get_data_store()
+            if str(row.user_id) == str(user_id) and str(row.repo_id) == str(repo_id)
+        ]
+
+        prefilter_per_query = None
+        if query_embeddings and options.strategy == ChunkSearchStrategy.BINARY:
+            prefilter_per_query = self.__hamming_prefilter(rows, query_embeddings, k * options.oversampling)
+        sims_per_row = self.__similarities(rows, query_embeddings)
+        hits = self.__rank_candidates(sims_per_row, len(query_embeddings), k, prefilter_per_query)
+
+        query_tokens = set(self.__lexical_tokens(query_text))
+        lexical = []
+        for i, row in enumerate(rows):
+            tokens = self.__lexical_tokens(row.content or "")
+            if query_tokens and query_tokens <= set(tokens):
+                lexical.append((sum(t in query_tokens for t in tokens), row.created_at, i))
+        lexical.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        for rank, (_, _, i) in enumerate(lexical[:k], start=1):
+            hits.setdefault(i, []).append((None, rank))
+
+        out = []
+        for i, row_hits in hits.items():
+            sims = [sim for sim, _ in row_hits if sim is not None]
+            fusion_score = sum(1.0 / (options.rrf_k + rank) for _, rank in row_hits)
+            out.append(self.__to_search_row(rows[i], fusion_score, max(sims) if sims else None))
+
+        default_dt = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+        out.sort(
+            key=lambda r: (
+                r["fusion_score"],
+                r["max_sim"] if r["max_sim"] is not None else float("-inf"),
+                r["created_at"] or default_dt,
+                str(r["id"]),
             ),
             reverse=True,
         )
-        return out[: max(1, int(limit))]
+        return self.__project(out[:limit], options)
+
+    @staticmethod
+    def __lexical_tokens(text: str) -> List[str]:
+        return re.findall(r"[a-z0-9]+", text.lower())
 
 
 class StubCodeChunksStore(StubPlanMixin, ICodeChunksStore):
@@ -175,6 +726,20 @@ class StubCodeChunksStore(StubPlanMixin, ICodeChunksStore):
     async def save(self, create_model: CodeChunksRequestDTO) -> CodeChunksResponseDTO:
         return await self._stub(self.save, create_model=create_model)
 
+    async def delete_all_by_repo_id(self, repo_id: str) -> int:
+        return await self._stub(self.delete_all_by_repo_id, repo_id=repo_id)
+
+    async def purge_repo_chunks(
+        self,
+        repo_id: str,
+        batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+        pause: float = DEFAULT_PURGE_PAUSE_SECONDS,
+        on_progress: Optional[PurgeProgressCallback] = None,
+    ) -> CodeChunksPurgeProgressDTO:
+        return await self._stub(
+            self.purge_repo_chunks, repo_id=repo_id, batch_size=batch_size, pause=pause, on_progress=on_progress
+        )
+
     async def find_all_by_repo_id_with_limit(
         self, repo_id: str, limit: int = 100
     ) -> List[CodeChunksResponseDTO]:
@@ -182,12 +747,58 @@ class StubCodeChunksStore(StubPlanMixin, ICodeChunksStore):
             self.find_all_by_repo_id_with_limit, repo_id=repo_id, limit=limit
         )
 
+    async def save_commit_file_diff(
+        self, diff: CodeChunksFileDiffRequestDTO
+    ) -> CodeChunksFileDiffResponseDTO:
+        return await self._stub(self.save_commit_file_diff, diff=diff)
+
+    async def find_embeddings_by_content_hashes(
+        self, content_hashes: Sequence[str], user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return await self._stub(
+            self.find_embeddings_by_content_hashes, content_hashes=content_hashes, user_id=user_id
+        )
+
+    async def stream_all_by_repo_id(
+        self,
+        repo_id: str,
+        fetch_size: int = DEFAULT_STREAM_FETCH_SIZE,
+        columns: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[CodeChunksResponseDTO]:
+        rows = await self._stub(
+            self.stream_all_by_repo_id, repo_id=repo_id, fetch_size=fetch_size, columns=columns
+        )
+        for row in rows:
+            yield row
+
+    async def fetch_contents_by_ids(
+        self,
+        user_id: str | uuid.UUID,
+        ids: Sequence[str | uuid.UUID],
+        repo_id: Optional[str | uuid.UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._stub(self.fetch_contents_by_ids, user_id=user_id, ids=ids, repo_id=repo_id)
+
     async def get_repo_file_chunks(self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID,
-                                   file_name: str = "readme") -> List[dict]:
+                                   file_name: str = "readme",
+                                   mode: FileLookupMode = FileLookupMode.CONTAINS) -> List[dict]:
         return await self._stub(
-            self.get_repo_file_chunks, user_id=user_id, repo_id=repo_id, file_name=file_name
+            self.get_repo_file_chunks, user_id=user_id, repo_id=repo_id, file_name=file_name, mode=mode
         )
+
+    async def get_repo_file_content(
+        self, user_id: str | uuid.UUID, repo_id: str | uuid.UUID, file_path: str
+    ) -> Optional[str]:
+        return await self._stub(self.get_repo_file_content, user_id=user_id, repo_id=repo_id, file_path=file_path)
     
+    async def get_repo_chunk_stats(self, repo_id: str) -> Optional[CodeChunksStatsDTO]:
+        return await self._stub(self.get_repo_chunk_stats, repo_id=repo_id)
+
+    async def get_commit_chunk_stats(
+        self, repo_id: str, commit_number: str
+    ) -> Optional[CodeChunksStatsDTO]:
+        return await self._stub(self.get_commit_chunk_stats, repo_id=repo_id, commit_number=commit_number)
+
     async def get_user_repo_chunks_multi(
             self,
             user_id: str | uuid.UUID,
@@ -195,10 +806,49 @@ class StubCodeChunksStore(StubPlanMixin, ICodeChunksStore):
             query_embeddings: List[List[float]],
             emb_dim: int,
             limit: int = 10,
+            options: Optional[CodeChunksSearchOptions] = None,
     ) -> List[Dict[str, Any]]:
         return await self._stub(
             self.get_user_repo_chunks_multi,
-            user_id=user_id, repo_id=repo_id, query_embeddings=query_embeddings, emb_dim=emb_dim, limit=limit
+            user_id=user_id, repo_id=repo_id, query_embeddings=query_embeddings, emb_dim=emb_dim, limit=limit,
+            options=options
+        )
+
+    async def batch_get_user_repo_chunks_multi(
+        self, requests: Sequence[CodeChunksSearchRequestDTO], emb_dim: int
+    ) -> List[List[Dict[str, Any]]]:
+        return await self._stub(self.batch_get_user_repo_chunks_multi, requests=requests, emb_dim=emb_dim)
+
+    async def get_user_repo_chunks_hybrid(
+            self,
+            user_id: str | uuid.UUID,
+            repo_id: str | uuid.UUID,
+            query_text: str,
+            query_embeddings: List[List[float]],
+            emb_dim: int,
+            limit: int = 10,
+            options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._stub(
+            self.get_user_repo_chunks_hybrid,
+            user_id=user_id, repo_id=repo_id, query_text=query_text, query_embeddings=query_embeddings,
+            emb_dim=emb_dim, limit=limit, options=options
+        )
+
+    async def get_user_repos_chunks_multi(
+            self,
+            user_id: str | uuid.UUID,
+            repo_ids: Optional[Sequence[str | uuid.UUID]],
+            query_embeddings: List[List[float]],
+            emb_dim: int,
+            limit: int = 10,
+            per_repo_limit: Optional[int] = None,
+            options: Optional[CodeChunksSearchOptions] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._stub(
+            self.get_user_repos_chunks_multi,
+            user_id=user_id, repo_ids=repo_ids, query_embeddings=query_embeddings, emb_dim=emb_dim,
+            limit=limit, per_repo_limit=per_repo_limit, options=options
         )
 
     async def bulk_save(
@@ -208,3 +858,11 @@ class StubCodeChunksStore(StubPlanMixin, ICodeChunksStore):
             self.bulk_save,
             create_model=create_model
         )
+
+    async def bulk_copy_save(
+        self, create_model: list[CodeChunksRequestDTO]
+    ) -> List[uuid.UUID]:
+        return await self._stub(
+            self.bulk_copy_save,
+            create_model=create_model
+        )
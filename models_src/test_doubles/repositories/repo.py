@@ -144,6 +144,49 @@ class FakeRepoStore(FakeBase, IRepoStore):
 
         return updated
 
+    async def increment_progress_counters_by_id(
+            self,
+            id: str,
+            total_files: int = 0,
+            total_chunks: int = 0,
+            total_embeddings: int = 0,
+    ) -> int:
+        self._before(
+            self.increment_progress_counters_by_id, id=id, total_files=total_files, total_chunks=total_chunks, total_embeddings=total_embeddings
+        )
+
+        if not id or not id.strip():
+            return -1
+
+        if not (total_files or total_chunks or total_embeddings):
+            return 0
+
+        for obj_list in self.__get_data_store().values():
+            match = next((obj for obj in obj_list if str(obj.id) == id), None)
+            if match:
+                match.total_files = (match.total_files or 0) + total_files
+                match.total_chunks = (match.total_chunks or 0) + total_chunks
+                match.total_embeddings = (match.total_embeddings or 0) + total_embeddings
+                return 1
+
+        return 0
+
+    async def reset_progress_counters_by_id(self, id: str) -> int:
+        self._before(self.reset_progress_counters_by_id, id=id)
+
+        if not id or not id.strip():
+            return -1
+
+        for obj_list in self.__get_data_store().values():
+            match = next((obj for obj in obj_list if str(obj.id) == id), None)
+            if match:
+                match.total_files = 0
+                match.total_chunks = 0
+                match.total_embeddings = 0
+                return 1
+
+        return 0
+
     async def find_by_user_id_and_html_url(
         self, user_id: str, html_url: str
     ) -> Optional[RepoResponseDTO]:
@@ -287,6 +330,23 @@ class StubRepoStore(StubPlanMixin, IRepoStore):
                                 total_embeddings=total_embeddings,
                                 )
 
+    async def increment_progress_counters_by_id(
+            self,
+            id: str,
+            total_files: int = 0,
+            total_chunks: int = 0,
+            total_embeddings: int = 0,
+    ) -> int:
+        return await self._stub(self.increment_progress_counters_by_id,
+                                id=id,
+                                total_files=total_files,
+                                total_chunks=total_chunks,
+                                total_embeddings=total_embeddings,
+                                )
+
+    async def reset_progress_counters_by_id(self, id: str) -> int:
+        return await self._stub(self.reset_progress_counters_by_id, id=id)
+
     async def find_by_user_id_and_html_url(
         self, user_id: str, html_url: str
     ) -> Optional[RepoResponseDTO]:
@@ -0,0 +1,54 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Below it a vector counts as zero, it never matches (pgvector returns NaN for it)
+ZERO_NORM_TOLERANCE = 1e-12
+
+
+class EmbeddingMatrix:
+    """
+    Similarity engine of FakeCodeChunksStore: the embeddings are kept as one contiguous float32
+    matrix (float32 being what pgvector stores) with their norms precomputed, so scoring every
+    query vector against every row is a single matmul instead of a Python loop per pair.
+
+    Rows without a usable embedding (missing, wrong dimension or zero norm) score -inf against
+    every query vector, which pushes them below every real candidate.
+    """
+
+    def __init__(self, embeddings: Sequence[Optional[Sequence[float]]], dim: int):
+        self.dim = dim
+        self.matrix = np.zeros((len(embeddings), dim), dtype=np.float32)
+        for i, embedding in enumerate(embeddings):
+            if embedding is not None and len(embedding) == dim:
+                self.matrix[i] = embedding
+
+        # norms in float64, the division then only carries the float32 rounding of the inputs
+        self.norms = np.linalg.norm(self.matrix.astype(np.float64), axis=1)
+        self.valid = self.norms >= ZERO_NORM_TOLERANCE
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def cosine(self, queries: Sequence[Sequence[float]], rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Cosine similarities as a (rows, queries) float64 array, clamped to [-1, 1].
+        `rows` restricts the result to those row indexes (in that order).
+        """
+        query_matrix = np.zeros((len(queries), self.dim), dtype=np.float32)
+        for j, query in enumerate(queries):
+            if query is not None and len(query) == self.dim:
+                query_matrix[j] = query
+        query_norms = np.linalg.norm(query_matrix.astype(np.float64), axis=1)
+        valid_queries = query_norms >= ZERO_NORM_TOLERANCE
+
+        if rows is None:
+            matrix, norms, valid = self.matrix, self.norms, self.valid
+        else:
+            index = np.asarray(rows, dtype=np.intp)
+            matrix, norms, valid = self.matrix[index], self.norms[index], self.valid[index]
+
+        dots = (matrix @ query_matrix.T).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = np.clip(dots / np.outer(norms, query_norms), -1.0, 1.0)
+        return np.where(np.outer(valid, valid_queries), sims, -np.inf)
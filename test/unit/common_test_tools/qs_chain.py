@@ -12,13 +12,13 @@ def make_qs_chain(
 ):
     """
     Chainable queryset mock with the bits we use:
-      .filter(...).order_by(...).offset(...).limit(...)
+      .filter(...).order_by(...).offset(...).limit(...).using_db(...)
       .all()/.first()/.count()/.exists()/.update()/.delete()/.values(...)
     """
     qs = MagicMock(name="QuerySetMock")
 
     # chainables
-    for name in ("filter", "order_by", "offset", "limit"):
+    for name in ("filter", "order_by", "offset", "limit", "using_db"):
         setattr(qs, name, MagicMock(return_value=qs))
 
     # terminals
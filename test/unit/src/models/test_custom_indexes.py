@@ -0,0 +1,155 @@
+import pytest
+
+import models_src.models.custom_indexes as idx_mod
+from models_src.models.custom_indexes import EmbeddingStorage, VectorIndexMethod
+
+
+class TestCodeChunksEmbeddingIndexSql:
+    def test_hnsw_defaults(self):
+        sql = idx_mod.code_chunks_embedding_index_sql()
+        assert sql == (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS code_chunks_embedding_hnsw_idx "
+            "ON public.code_chunks USING hnsw (embedding vector_cosine_ops) "
+            "WITH (m = 16, ef_construction = 64);"
+        )
+
+    def test_ivfflat_not_concurrent(self):
+        sql = idx_mod.code_chunks_embedding_index_sql(
+            VectorIndexMethod.IVFFLAT, lists=250, concurrently=False
+        )
+        assert sql == (
+            "CREATE INDEX IF NOT EXISTS code_chunks_embedding_ivfflat_idx "
+            "ON public.code_chunks USING ivfflat (embedding vector_cosine_ops) "
+            "WITH (lists = 250);"
+        )
+
+    def test_halfvec_storage_uses_halfvec_operator_class(self):
+        sql = idx_mod.code_chunks_embedding_index_sql(storage=EmbeddingStorage.HALFVEC)
+        assert "USING hnsw (embedding halfvec_cosine_ops)" in sql
+
+    def test_storage_conversion(self):
+        assert idx_mod.code_chunks_embedding_storage_sql(EmbeddingStorage.HALFVEC) == (
+            "ALTER TABLE public.code_chunks ALTER COLUMN embedding TYPE halfvec(768) "
+            "USING embedding::halfvec(768);"
+        )
+        assert "TYPE vector(768)" in idx_mod.code_chunks_embedding_storage_sql("vector")
+
+    def test_content_search_index(self):
+        assert idx_mod.code_chunks_content_search_index_sql() == (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS code_chunks_content_tsv_idx "
+            "ON public.code_chunks USING gin ((to_tsvector('simple', content)));"
+        )
+
+    def test_accepts_plain_string_method(self):
+        assert "USING ivfflat" in idx_mod.code_chunks_embedding_index_sql("ivfflat")
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"method": VectorIndexMethod.HNSW, "m": 1},
+            {"method": VectorIndexMethod.HNSW, "m": 16, "ef_construction": 20},
+            {"method": VectorIndexMethod.IVFFLAT, "lists": 0},
+        ],
+    )
+    def test_rejects_invalid_build_parameters(self, kwargs):
+        with pytest.raises(ValueError):
+            idx_mod.code_chunks_embedding_index_sql(**kwargs)
+
+    def test_reindex_and_drop(self):
+        assert (
+            idx_mod.code_chunks_embedding_reindex_sql(VectorIndexMethod.HNSW)
+            == "REINDEX INDEX CONCURRENTLY public.code_chunks_embedding_hnsw_idx;"
+        )
+        assert (
+            idx_mod.code_chunks_embedding_drop_index_sql(VectorIndexMethod.IVFFLAT, concurrently=False)
+            == "DROP INDEX IF EXISTS public.code_chunks_embedding_ivfflat_idx;"
+        )
+
+
+class TestCodeChunksEmbeddingIndexHelpers:
+    class FakeClient:
+        def __init__(self, partitioned=False):
+            self.scripts = []
+            self.partitioned = partitioned
+
+        async def execute_script(self, sql):
+            self.scripts.append(sql)
+
+        async def execute_query_dict(self, sql, values=None):
+            assert "relkind = 'p'" in sql
+            return [{"partitioned": self.partitioned}]
+
+    @pytest.mark.asyncio
+    async def test_create_rebuild_drop_run_on_the_given_alias(self, monkeypatch):
+        client = self.FakeClient()
+        aliases = []
+
+        def fake_get(alias):
+            aliases.append(alias)
+            return client
+
+        monkeypatch.setattr(idx_mod.connections, "get", fake_get)
+
+        await idx_mod.create_code_chunks_embedding_index(VectorIndexMethod.HNSW, m=32, ef_construction=128, alias="x")
+        await idx_mod.rebuild_code_chunks_embedding_index(VectorIndexMethod.HNSW, alias="x")
+        await idx_mod.drop_code_chunks_embedding_index(VectorIndexMethod.HNSW, alias="x")
+
+        assert aliases == ["x", "x", "x"]
+        assert "WITH (m = 32, ef_construction = 128)" in client.scripts[0]
+        assert client.scripts[1].startswith("REINDEX INDEX CONCURRENTLY")
+        assert client.scripts[2].startswith("DROP INDEX CONCURRENTLY")
+
+    @pytest.mark.asyncio
+    async def test_convert_storage_drops_rewrites_and_rebuilds_in_one_transaction(self, monkeypatch):
+        client = self.FakeClient()
+        monkeypatch.setattr(idx_mod.connections, "get", lambda alias: client)
+
+        await idx_mod.convert_code_chunks_embedding_storage(EmbeddingStorage.HALFVEC)
+
+        assert len(client.scripts) == 1
+        lines = client.scripts[0].splitlines()
+        assert lines[0] == "BEGIN;" and lines[-1] == "COMMIT;"
+        assert lines[1:3] == [
+            "DROP INDEX IF EXISTS public.code_chunks_embedding_hnsw_idx;",
+            "DROP INDEX IF EXISTS public.code_chunks_embedding_ivfflat_idx;",
+        ]
+        assert lines[3].startswith("ALTER TABLE public.code_chunks ALTER COLUMN embedding TYPE halfvec(768)")
+        assert lines[4].startswith("CREATE INDEX IF NOT EXISTS code_chunks_embedding_hnsw_idx")
+        assert "halfvec_cosine_ops" in lines[4]
+
+    @pytest.mark.asyncio
+    async def test_backfill_embedding_bits_only_touches_missing_rows(self, monkeypatch):
+        client = self.FakeClient()
+        monkeypatch.setattr(idx_mod.connections, "get", lambda alias: client)
+
+        await idx_mod.backfill_code_chunks_embedding_bits()
+
+        assert client.scripts == [
+            "UPDATE public.code_chunks SET embedding_bits = binary_quantize(embedding)::bit(768) "
+            "WHERE embedding_bits IS NULL AND embedding IS NOT NULL;"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_file_lookup_indexes_run_one_statement_at_a_time(self, monkeypatch):
+        client = self.FakeClient()
+        monkeypatch.setattr(idx_mod.connections, "get", lambda alias: client)
+
+        await idx_mod.create_code_chunks_file_lookup_indexes()
+
+        assert client.scripts == idx_mod.code_chunks_file_lookup_indexes_sql()
+        assert client.scripts[0] == "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
+        assert (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS code_chunks_file_name_idx ON public.code_chunks "
+            "(repo_id, user_id, lower(file_name) text_pattern_ops, chunk_ordinal);"
+        ) in client.scripts
+        assert any("USING gin (file_name gin_trgm_ops)" in s for s in client.scripts)
+        assert all("CONCURRENTLY" not in s for s in idx_mod.code_chunks_file_lookup_indexes_sql(concurrently=False))
+
+    @pytest.mark.asyncio
+    async def test_file_lookup_indexes_are_not_concurrent_on_a_partitioned_table(self, monkeypatch):
+        client = self.FakeClient(partitioned=True)
+        monkeypatch.setattr(idx_mod.connections, "get", lambda alias: client)
+
+        await idx_mod.create_code_chunks_file_lookup_indexes()
+
+        assert client.scripts == idx_mod.code_chunks_file_lookup_indexes_sql(concurrently=False)
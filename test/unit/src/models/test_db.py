@@ -28,8 +28,8 @@ class TestInitCloseDb:
     async def test_init_db_calls_tortoise_init_and_generate(self, monkeypatch):
         called = {"init": None, "gen": None}
 
-        async def fake_init(*, db_url, modules):
-            called["init"] = (db_url, modules)
+        async def fake_init(*, config):
+            called["init"] = config
 
         async def fake_gen():
             called["gen"] = True
@@ -38,7 +38,13 @@ class TestInitCloseDb:
         monkeypatch.setattr(db_mod.Tortoise, "generate_schemas", fake_gen)
 
         await db_mod.init_db("postgres://u:p@h:5432/db", ["models_src.models"])
-        assert called["init"] == ("postgres://u:p@h:5432/db", {"models": ["models_src.models"]})
+        connection = called["init"]["connections"]["default"]
+        assert connection["engine"] == "tortoise.backends.asyncpg"
+        assert connection["credentials"]["database"] == "db"
+        assert connection["credentials"]["init"] is db_mod.register_vector_codecs
+        assert called["init"]["apps"] == {
+            "models": {"models": ["models_src.models"], "default_connection": "default"}
+        }
         assert called["gen"] is True
 
     @pytest.mark.asyncio
@@ -53,6 +59,44 @@ class TestInitCloseDb:
         assert called["closed"] is True
 
 
+class TestWithVectorCodecs:
+    def test_installs_the_init_hook_on_url_and_dict_connections(self):
+        credentials = {"host": "h", "database": "db"}
+        config = {
+            "connections": {
+                "url": "postgres://u:p@h:5432/db",
+                "dict": {"engine": "tortoise.backends.asyncpg", "credentials": credentials},
+                "sqlite": {"engine": "tortoise.backends.sqlite", "credentials": {"file_path": ":memory:"}},
+            },
+            "apps": {},
+        }
+
+        out = db_mod.with_vector_codecs(config)
+
+        assert out["connections"]["url"]["credentials"]["init"] is db_mod.register_vector_codecs
+        assert out["connections"]["dict"]["credentials"]["init"] is db_mod.register_vector_codecs
+        assert "init" not in out["connections"]["sqlite"]["credentials"]
+        # the caller's config is left as is
+        assert "init" not in credentials and out["apps"] is config["apps"]
+
+    @pytest.mark.asyncio
+    async def test_keeps_an_existing_init_hook(self, monkeypatch):
+        calls = []
+
+        async def fake_register(conn):
+            calls.append("codecs")
+
+        async def own_init(conn):
+            calls.append("own")
+
+        monkeypatch.setattr(db_mod, "register_vector_codecs", fake_register)
+        config = {"connections": {"default": {"engine": "tortoise.backends.asyncpg", "credentials": {"init": own_init}}}}
+
+        await db_mod.with_vector_codecs(config)["connections"]["default"]["credentials"]["init"](object())
+
+        assert calls == ["codecs", "own"]
+
+
 class TestPgVectorConnection:
     class FakePool:
         def __init__(self, conn):
@@ -71,10 +115,17 @@ class TestPgVectorConnection:
         def __init__(self, pool):
             self._pool = pool
 
+    class FakeRaw:
+        """Physical connection, handed out behind a new proxy on every acquire like asyncpg does."""
+
+    class FakeProxy:
+        def __init__(self, con):
+            self._con = con
+
     @pytest.mark.asyncio
     async def test_enter_registers_and_returns_raw_then_exit_releases(self, monkeypatch):
         # Arrange: fake raw connection, pool, db, and register_vector
-        raw = object()
+        raw = self.FakeRaw()
         pool = self.FakePool(raw)
         db = self.FakeDb(pool)
 
@@ -89,6 +140,10 @@ class TestPgVectorConnection:
 
         monkeypatch.setattr(db_mod.connections, "get", fake_get)
         monkeypatch.setattr(db_mod, "register_vector", fake_register_vector)
+        codec_calls = []
+        async def fake_register_binary_vector_codec(conn):
+            codec_calls.append(conn)
+        monkeypatch.setattr(db_mod, "register_binary_vector_codec", fake_register_binary_vector_codec)
 
         cm = db_mod.PgVectorConnection(alias="secondary")
         assert cm.raw is None
@@ -100,21 +155,61 @@ class TestPgVectorConnection:
             assert cm.raw is raw
             assert pool.acquire_calls == 1
             assert reg_calls["conn"] is raw
+            assert codec_calls == [raw]
 
         # Assert: __aexit__ released and nulled
         assert pool.release_args is raw
         assert cm.raw is None
         assert captured["alias"] == "secondary"
 
+    @pytest.mark.asyncio
+    async def test_codecs_are_registered_once_per_physical_connection(self, monkeypatch):
+        physical = self.FakeRaw()
+        proxies = [self.FakeProxy(physical), self.FakeProxy(physical)]
+
+        class Pool:
+            async def acquire(self):
+                return proxies.pop(0)
+
+            async def release(self, conn):
+                pass
+
+        monkeypatch.setattr(db_mod.connections, "get", lambda alias: self.FakeDb(Pool()))
+        register = AsyncMock(return_value=None)
+        monkeypatch.setattr(db_mod, "register_vector", register)
+        monkeypatch.setattr(db_mod, "register_binary_vector_codec", AsyncMock(return_value=None))
+
+        for _ in range(2):
+            async with db_mod.PgVectorConnection():
+                pass
+
+        # set_type_codec drops the statement cache, a second registration would discard it
+        assert register.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_pool_init_hook_counts_as_registration(self, monkeypatch):
+        raw = self.FakeRaw()
+        monkeypatch.setattr(db_mod.connections, "get", lambda alias: self.FakeDb(self.FakePool(raw)))
+        register = AsyncMock(return_value=None)
+        monkeypatch.setattr(db_mod, "register_vector", register)
+        monkeypatch.setattr(db_mod, "register_binary_vector_codec", AsyncMock(return_value=None))
+
+        await db_mod.register_vector_codecs(raw)
+        async with db_mod.PgVectorConnection():
+            pass
+
+        assert register.await_count == 1
+
     @pytest.mark.asyncio
     async def test_exit_still_releases_on_exception(self, monkeypatch):
-        raw = object()
+        raw = self.FakeRaw()
         pool = self.FakePool(raw)
         db = self.FakeDb(pool)
 
         monkeypatch.setattr(db_mod.connections, "get", lambda alias: db)
         # we don't care about register_vector here, but keep it async
         monkeypatch.setattr(db_mod, "register_vector", AsyncMock(return_value=None))
+        monkeypatch.setattr(db_mod, "register_binary_vector_codec", AsyncMock(return_value=None))
 
         cm = db_mod.PgVectorConnection()
         with pytest.raises(RuntimeError):
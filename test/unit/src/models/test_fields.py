@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from models_src.dto.code_chunks import hamming_distance, quantize_embedding
+from models_src.models.fields import BitVectorField, Float32VectorField
+
+
+class TestBitVectorField:
+    def test_sql_type(self):
+        assert BitVectorField(bit_size=768).SQL_TYPE == "bit(768)"
+
+    def test_rejects_sizes_that_cannot_be_byte_packed(self):
+        with pytest.raises(ValueError):
+            BitVectorField(bit_size=10)
+
+    def test_to_db_value_checks_the_packed_length(self):
+        field = BitVectorField(bit_size=16)
+        assert field.to_db_value(b"\x01\x02", None) == b"\x01\x02"
+        assert field.to_db_value(None, None) is None
+        with pytest.raises(ValueError):
+            field.to_db_value(b"\x01", None)
+
+    def test_to_python_value_unpacks_asyncpg_bitstrings(self):
+        class BitStringLike:  # asyncpg.BitString exposes the packed bits as .bytes
+            bytes = b"\x80\x01"
+
+        field = BitVectorField(bit_size=16)
+        assert field.to_python_value(BitStringLike()) == b"\x80\x01"
+        assert field.to_python_value(b"\x80\x01") == b"\x80\x01"
+
+
+class TestQuantizeEmbedding:
+    def test_positive_dimensions_set_bits_most_significant_first(self):
+        assert quantize_embedding([0.3, -0.1, 0.0, 2.0, -5.0, 0.1, 0.1, -0.2]) == bytes([0b10010110])
+
+    def test_matches_the_postgres_bit_layout(self):
+        bits = quantize_embedding([1.0] * 8 + [-1.0] * 8)
+        # bit(n) text form, first dimension first
+        assert format(int.from_bytes(bits, "big"), "016b") == "1111111100000000"
+
+    def test_rejects_dimensions_that_cannot_be_packed(self):
+        with pytest.raises(ValueError):
+            quantize_embedding([1.0] * 7)
+
+    def test_hamming_distance(self):
+        assert hamming_distance(bytes([0b1010_0000]), bytes([0b0110_0001])) == 3
+
+
+class TestFloat32VectorField:
+    def test_to_db_value_hands_float32_arrays_to_the_codec(self):
+        field = Float32VectorField(vector_size=3)
+
+        value = field.to_db_value([1, 2.5, -3], None)
+
+        assert isinstance(value, np.ndarray) and value.dtype == np.float32
+        assert value.tolist() == [1.0, 2.5, -3.0]
+        assert field.to_db_value(None, None) is None
+
+    def test_to_python_value_returns_float32_arrays(self):
+        class HalfVectorLike:
+            def to_numpy(self):
+                return np.array([0.5, 1.0], dtype=np.float16)
+
+        field = Float32VectorField(vector_size=2)
+        decoded = np.array([1.0, 2.0], dtype=np.float32)
+
+        assert field.to_python_value(decoded) is decoded
+        assert field.to_python_value("[1,2.5]").tolist() == [1.0, 2.5]
+        assert field.to_python_value(HalfVectorLike()).dtype == np.float32
+        assert field.to_python_value(None) is None
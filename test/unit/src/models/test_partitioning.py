@@ -0,0 +1,119 @@
+import pytest
+
+import models_src.models.partitioning as part_mod
+from models_src.models.custom_indexes import EmbeddingStorage
+from models_src.models.partitioning import CodeChunksPartitioning
+
+
+class TestCodeChunksPartitionedLayoutSql:
+    def test_hash_layout(self):
+        statements = part_mod.code_chunks_partitioned_layout_sql(CodeChunksPartitioning.HASH, partitions=4)
+
+        assert "ALTER TABLE public.code_chunks RENAME TO code_chunks_unpartitioned;" in statements
+        assert (
+            "CREATE TABLE public.code_chunks (LIKE public.code_chunks_unpartitioned "
+            "INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY HASH (repo_id);"
+        ) in statements
+        assert "ALTER TABLE public.code_chunks ADD PRIMARY KEY (id, repo_id);" in statements
+
+        partitions = [s for s in statements if "PARTITION OF" in s]
+        assert partitions == [
+            f"CREATE TABLE public.code_chunks_p{r} PARTITION OF public.code_chunks "
+            f"FOR VALUES WITH (MODULUS 4, REMAINDER {r});"
+            for r in range(4)
+        ]
+        assert not any(s.startswith("DROP TABLE") for s in statements)
+
+    def test_indexes_are_dropped_before_the_rename_and_built_after_the_copy(self):
+        statements = part_mod.code_chunks_partitioned_layout_sql("hash", storage=EmbeddingStorage.HALFVEC)
+
+        def position(prefix):
+            return next(i for i, s in enumerate(statements) if s.startswith(prefix))
+
+        rename = position("ALTER TABLE public.code_chunks RENAME")
+        copy = position("INSERT INTO public.code_chunks SELECT")
+        assert position("DROP INDEX IF EXISTS public.code_chunks_embedding_hnsw_idx") < rename
+        assert position("DROP INDEX IF EXISTS public.code_chunks_content_tsv_idx") < rename
+        assert copy < position("CREATE INDEX IF NOT EXISTS code_chunks_embedding_hnsw_idx")
+        assert copy < position("CREATE INDEX code_chunks_repo_id_user_id_idx")
+        assert "halfvec_cosine_ops" in statements[position("CREATE INDEX IF NOT EXISTS code_chunks_embedding")]
+        # the file lookup indexes move to the partitioned table too
+        for name in ("code_chunks_file_name_idx", "code_chunks_file_name_trgm_idx", "code_chunks_file_path_idx"):
+            assert position(f"DROP INDEX IF EXISTS public.{name}") < rename
+            assert copy < position(f"CREATE INDEX IF NOT EXISTS {name}")
+        assert all("CONCURRENTLY" not in s for s in statements)
+
+    def test_list_layout_starts_with_the_default_partition(self):
+        statements = part_mod.code_chunks_partitioned_layout_sql(
+            CodeChunksPartitioning.LIST, drop_unpartitioned=True
+        )
+
+        assert [s for s in statements if "PARTITION OF" in s] == [
+            "CREATE TABLE public.code_chunks_default PARTITION OF public.code_chunks DEFAULT;"
+        ]
+        assert any(s.endswith("PARTITION BY LIST (repo_id);") for s in statements)
+        assert statements[-1] == "DROP TABLE public.code_chunks_unpartitioned;"
+
+    def test_rejects_invalid_hash_partitions(self):
+        with pytest.raises(ValueError):
+            part_mod.code_chunks_partitioned_layout_sql(CodeChunksPartitioning.HASH, partitions=0)
+
+
+class TestCodeChunksRepoPartition:
+    def test_partition_name_is_a_stable_short_identifier(self):
+        name = part_mod.code_chunks_repo_partition_name("org/some repo-" + "x" * 100)
+
+        assert name == part_mod.code_chunks_repo_partition_name("org/some repo-" + "x" * 100)
+        assert name != part_mod.code_chunks_repo_partition_name("org/other")
+        assert name.replace("_", "").isalnum() and len(name) <= 63
+
+    def test_moves_default_rows_then_attaches_with_quoted_value(self):
+        name = part_mod.code_chunks_repo_partition_name("o'brien")
+
+        assert part_mod.code_chunks_repo_partition_sql("o'brien") == [
+            f"CREATE TABLE public.{name} (LIKE public.code_chunks INCLUDING DEFAULTS INCLUDING CONSTRAINTS);",
+            f"INSERT INTO public.{name} SELECT * FROM public.code_chunks_default WHERE repo_id = 'o''brien';",
+            "DELETE FROM public.code_chunks_default WHERE repo_id = 'o''brien';",
+            f"ALTER TABLE public.code_chunks ATTACH PARTITION public.{name} FOR VALUES IN ('o''brien');",
+        ]
+        assert part_mod.code_chunks_repo_partition_drop_sql("o'brien") == f"DROP TABLE IF EXISTS public.{name};"
+
+
+class TestCodeChunksPartitioningHelpers:
+    class FakeClient:
+        def __init__(self, found=False):
+            self.scripts = []
+            self.queries = []
+            self.found = found
+
+        async def execute_script(self, sql):
+            self.scripts.append(sql)
+
+        async def execute_query_dict(self, sql, values=None):
+            self.queries.append((sql, values))
+            return [{"found": self.found}]
+
+    @pytest.mark.asyncio
+    async def test_migration_runs_in_one_transaction(self, monkeypatch):
+        client = self.FakeClient()
+        monkeypatch.setattr(part_mod.connections, "get", lambda alias: client)
+
+        await part_mod.migrate_code_chunks_to_partitioned(CodeChunksPartitioning.HASH, partitions=2)
+
+        assert len(client.scripts) == 1
+        lines = client.scripts[0].splitlines()
+        assert lines[0] == "BEGIN;" and lines[-1] == "COMMIT;"
+        assert lines[1:-1] == part_mod.code_chunks_partitioned_layout_sql(CodeChunksPartitioning.HASH, partitions=2)
+
+    @pytest.mark.asyncio
+    async def test_create_repo_partition_only_once(self, monkeypatch):
+        missing, existing = self.FakeClient(found=False), self.FakeClient(found=True)
+
+        monkeypatch.setattr(part_mod.connections, "get", lambda alias: missing)
+        assert await part_mod.create_code_chunks_repo_partition("r1") is True
+        assert missing.queries[0][1] == [f"public.{part_mod.code_chunks_repo_partition_name('r1')}"]
+        assert missing.scripts[0].splitlines()[1:-1] == part_mod.code_chunks_repo_partition_sql("r1")
+
+        monkeypatch.setattr(part_mod.connections, "get", lambda alias: existing)
+        assert await part_mod.create_code_chunks_repo_partition("r1") is False
+        assert existing.scripts == []
@@ -0,0 +1,41 @@
+import struct
+
+import numpy as np
+import pytest
+
+from models_src.models.vector_codec import decode_vector, encode_vector, register_binary_vector_codec
+
+
+class TestVectorCodec:
+    def test_encodes_the_pgvector_binary_format(self):
+        data = encode_vector(np.array([1.0, -2.5], dtype=np.float32))
+
+        assert data == struct.pack(">HH", 2, 0) + struct.pack(">ff", 1.0, -2.5)
+        assert encode_vector([1.0, -2.5]) == data
+        assert encode_vector(np.array([1.0, -2.5], dtype=np.float32).tobytes()) == data
+
+    def test_round_trip_to_native_float32(self):
+        values = np.random.default_rng(0).standard_normal(768).astype(np.float32)
+
+        decoded = decode_vector(encode_vector(values))
+
+        assert decoded.dtype == np.float32 and decoded.dtype.isnative
+        assert np.array_equal(decoded, values)
+
+    def test_rejects_multidimensional_values(self):
+        with pytest.raises(ValueError):
+            encode_vector([[1.0], [2.0]])
+
+    @pytest.mark.asyncio
+    async def test_registers_a_binary_codec(self):
+        calls = []
+
+        class Conn:
+            async def set_type_codec(self, typename, **kwargs):
+                calls.append((typename, kwargs))
+
+        await register_binary_vector_codec(Conn())
+
+        assert calls == [
+            ("vector", {"schema": "public", "encoder": encode_vector, "decoder": decode_vector, "format": "binary"})
+        ]
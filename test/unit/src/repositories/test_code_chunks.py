@@ -1,14 +1,63 @@
+import dataclasses
+import datetime
 import uuid
+import asyncpg
 import pytest
 from unittest.mock import MagicMock, AsyncMock
 
-from models_src.dto.code_chunks import CodeChunksRequestDTO, CodeChunksResponseDTO
+from models_src.dto.code_chunks import (
+    ChunkFusion,
+    ChunkProjection,
+    ChunkSearchStrategy,
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksRequestDTO,
+    CodeChunksResponseDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+    FileLookupMode,
+    compute_content_hash,
+)
+from models_src.exceptions.base_exceptions import DevDoxModelsException
+from models_src.models.partitioning import CodeChunksPartitioning, code_chunks_repo_partition_name
 from models_src.repositories.code_chunks import TortoiseCodeChunksStore
+from models_src.repositories.code_chunks_cursor import decode_search_cursor, encode_search_cursor
 import models_src.repositories.code_chunks as repo_mod  # to patch PgVectorConnection or class symbol when needed
 from test.unit.common_test_tools.model_factories import make_codechunk
 from test.unit.common_test_tools.qs_chain import make_qs_chain
 
 
+class StatsTxConn:
+    """Transaction connection recording the raw statements of the chunk stats maintenance."""
+
+    def __init__(self, query_dict_rows=None):
+        self.query_dict_rows = query_dict_rows or []
+        self.executed = []
+
+    async def execute_query(self, sql, values=None):
+        self.executed.append((sql, values))
+        return 0, []
+
+    async def execute_query_dict(self, sql, values=None):
+        self.executed.append((sql, values))
+        return self.query_dict_rows
+
+
+def patch_transaction(monkeypatch, conn, events=None):
+    class FakeTransaction:
+        async def __aenter__(self):
+            if events is not None:
+                events.append("BEGIN")
+            return conn
+
+        async def __aexit__(self, exc_type, exc, tb):
+            if events is not None:
+                events.append("COMMIT")
+            return False
+
+    monkeypatch.setattr(repo_mod, "in_transaction", lambda *a, **k: FakeTransaction())
+    return conn
+
+
 class TestSave:
     @pytest.mark.asyncio
     async def test_save_returns_dto_with_real_model_instance(self, monkeypatch):
@@ -18,6 +67,7 @@ class TestSave:
         model = MagicMock()
         model.create = AsyncMock(return_value=make_codechunk(user_id="u", repo_id="r"))
         monkeypatch.setattr(store, "model", model)
+        conn = patch_transaction(monkeypatch, StatsTxConn())
 
         req = CodeChunksRequestDTO(
             user_id="u",
@@ -35,6 +85,39 @@ class TestSave:
         assert isinstance(dto, CodeChunksResponseDTO)
         assert dto.user_id == "u" and dto.repo_id == "r"
         model.create.assert_awaited_once()
+        assert model.create.await_args.kwargs["content_hash"] == compute_content_hash("x = 1")
+        assert model.create.await_args.kwargs["using_db"] is conn
+        assert "embedding_bits" not in model.create.await_args.kwargs
+        # stats of the chunk updated in the same transaction
+        assert conn.executed == [
+            (repo_mod.CODE_CHUNKS_STATS_LOCK_SQL, [["r"]]),
+            (repo_mod.CODE_CHUNKS_STATS_UPDATE_SQL, [["r"], ["c1"], ["src/file.py"], [1], [0], [5]]),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_save_fills_the_quantized_embedding(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+
+        model = MagicMock()
+        model.create = AsyncMock(return_value=make_codechunk(user_id="u", repo_id="r"))
+        monkeypatch.setattr(store, "model", model)
+        patch_transaction(monkeypatch, StatsTxConn())
+
+        embedding = [1.0, -1.0] * 384
+        await store.save(
+            CodeChunksRequestDTO(
+                user_id="u",
+                repo_id="r",
+                content="x = 1",
+                file_name="file.py",
+                file_path="src/file.py",
+                file_size=3,
+                commit_number="c1",
+                embedding=embedding,
+            )
+        )
+
+        assert model.create.await_args.kwargs["embedding_bits"] == b"\xaa" * 96
 
 
 class TestBulkSave:
@@ -46,6 +129,7 @@ class TestBulkSave:
         # Patch classmethod on the class symbol used by the store
         from models_src.repositories import code_chunks as repo_mod
         monkeypatch.setattr(repo_mod.CodeChunks, "bulk_create", AsyncMock(return_value=None))
+        conn = patch_transaction(monkeypatch, StatsTxConn())
         
         reqs = [
             CodeChunksRequestDTO(
@@ -66,6 +150,455 @@ class TestBulkSave:
         assert all(isinstance(x, CodeChunksResponseDTO) for x in out)
         # ensure contents came through the mapper
         assert {o.content for o in out} == {"chunk-0", "chunk-1"}
+        assert repo_mod.CodeChunks.bulk_create.await_args.kwargs["using_db"] is conn
+        assert conn.executed == [
+            (repo_mod.CODE_CHUNKS_STATS_LOCK_SQL, [["r"]]),
+            (
+                repo_mod.CODE_CHUNKS_STATS_UPDATE_SQL,
+                [["r", "r"], ["c1", "c1"], ["src/0.py", "src/1.py"], [1, 1], [0, 0], [7, 7]],
+            )
+        ]
+
+
+class TestBulkCopySave:
+
+    @pytest.mark.asyncio
+    async def test_copies_binary_records_and_returns_generated_ids(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+
+        class FakeTransaction:
+            async def __aenter__(self):
+                captured.setdefault("events", []).append("BEGIN")
+            async def __aexit__(self, exc_type, exc, tb):
+                captured["events"].append("COMMIT")
+                return False
+
+        class FakeConn:
+            def __init__(self, alias): ...
+            async def __aenter__(self): return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+            def transaction(self): return FakeTransaction()
+            async def copy_records_to_table(self, table_name, *, records, columns=None, schema_name=None):
+                captured["events"].append("COPY")
+                captured["table"] = table_name
+                captured["schema"] = schema_name
+                captured["columns"] = columns
+                captured["records"] = list(records)
+            async def execute(self, sql, *params):
+                if sql == repo_mod.CODE_CHUNKS_STATS_LOCK_SQL:
+                    captured["events"].append("LOCK")
+                    captured["lock_params"] = params
+                    return
+                captured["events"].append("STATS")
+                captured["stats_params"] = params
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", FakeConn)
+
+        emb = [0.5] * 768
+        reqs = [
+            CodeChunksRequestDTO(
+                user_id="u",
+                repo_id="r",
+                content=f"chunk-{i}",
+                file_name="f.py",
+                file_path="src/f.py",
+                file_size=10,
+                commit_number="c1",
+                embedding=emb,
+                metadata={"i": i},
+            )
+            for i in range(3)
+        ]
+
+        ids = await store.bulk_copy_save(reqs)
+
+        assert len(ids) == 3 and all(isinstance(i, uuid.UUID) for i in ids)
+        assert captured["table"] == "code_chunks" and captured["schema"] == "public"
+        assert captured["columns"] == repo_mod.COPY_COLUMNS
+
+        records = captured["records"]
+        assert [r[0] for r in records] == ids
+        first = dict(zip(repo_mod.COPY_COLUMNS, records[0]))
+        assert first["content"] == "chunk-0"
+        assert first["content_hash"] == compute_content_hash("chunk-0")
+        assert first["embedding"] is emb
+        assert first["embedding_bits"] == b"\xff" * 96
+        assert first["metadata"] == '{"i": 0}'
+        assert first["created_at"].tzinfo is not None
+
+        # the repo's stats lock is taken right before the update, in the same transaction
+        assert captured["events"] == ["BEGIN", "COPY", "LOCK", "STATS", "COMMIT"]
+        assert captured["lock_params"] == (["r"],)
+        assert captured["stats_params"] == (["r"], ["c1"], ["src/f.py"], [3], [3], [21])
+
+    @pytest.mark.asyncio
+    async def test_empty_input_does_not_touch_the_database(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+        assert await store.bulk_copy_save([]) == []
+
+
+def make_diff_chunk(file_path, commit="c2"):
+    return CodeChunksRequestDTO(
+        user_id="u",
+        repo_id="r",
+        content=f"content of {file_path}",
+        file_name=file_path.rsplit("/", 1)[-1],
+        file_path=file_path,
+        file_size=10,
+        commit_number=commit,
+    )
+
+
+class TestSaveCommitFileDiff:
+
+    @pytest.mark.asyncio
+    async def test_deletes_touched_files_and_inserts_new_chunks_in_one_transaction(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        events = []
+        # chunks deleted per (repo, commit, file)
+        tx_conn = StatsTxConn(
+            [
+                {"repo_id": "r", "commit_number": "c1", "file_path": "src/a.py", "chunks": 3, "embedded": 3, "bytes": 30},
+                {"repo_id": "r", "commit_number": "c1", "file_path": "src/gone.py", "chunks": 1, "embedded": 0, "bytes": 5},
+            ]
+        )
+        patch_transaction(monkeypatch, tx_conn, events)
+
+        async def fake_bulk_create(objs, batch_size, using_db):
+            events.append(("INSERT", [o.file_path for o in objs], using_db))
+
+        monkeypatch.setattr(repo_mod.CodeChunks, "bulk_create", AsyncMock(side_effect=fake_bulk_create))
+
+        diff = CodeChunksFileDiffRequestDTO(
+            user_id="u",
+            repo_id="r",
+            commit_number="c2",
+            changed_file_paths={"src/a.py"},
+            added_file_paths={"src/new.py"},
+            deleted_file_paths={"src/gone.py"},
+            chunks=[make_diff_chunk("src/a.py"), make_diff_chunk("src/new.py")],
+        )
+
+        out = await store.save_commit_file_diff(diff)
+
+        delete_sql, delete_params = tx_conn.executed[0]
+        assert delete_sql.lstrip().startswith("WITH gone AS (")
+        assert "DELETE FROM public.code_chunks" in delete_sql and "RETURNING repo_id, commit_number" in delete_sql
+        assert delete_params == ["u", "r", ["src/a.py", "src/gone.py", "src/new.py"]]
+        assert events == ["BEGIN", ("INSERT", ["src/a.py", "src/new.py"], tx_conn), "COMMIT"]
+        assert out.deleted_count == 4
+
+        # removed chunks and new chunks fused in one stats update, then the emptied files pruned
+        assert tx_conn.executed[1] == (repo_mod.CODE_CHUNKS_STATS_LOCK_SQL, [["r"]])
+        assert tx_conn.executed[2] == (
+            repo_mod.CODE_CHUNKS_STATS_UPDATE_SQL,
+            [
+                ["r", "r", "r", "r"],
+                ["c1", "c1", "c2", "c2"],
+                ["src/a.py", "src/gone.py", "src/a.py", "src/new.py"],
+                [-3, -1, 1, 1],
+                [-3, 0, 0, 0],
+                [-30, -5, 19, 21],
+            ],
+        )
+        assert tx_conn.executed[3] == (repo_mod.CODE_CHUNKS_FILE_STATS_PRUNE_SQL, [["r"]])
+        assert [c.file_path for c in out.saved] == ["src/a.py", "src/new.py"]
+        assert all(isinstance(c, CodeChunksResponseDTO) for c in out.saved)
+
+    @pytest.mark.asyncio
+    async def test_empty_diff_is_a_no_op(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        monkeypatch.setattr(repo_mod, "in_transaction", MagicMock(side_effect=AssertionError("no tx expected")))
+
+        out = await store.save_commit_file_diff(
+            CodeChunksFileDiffRequestDTO(user_id="u", repo_id="r", commit_number="c2")
+        )
+        assert out.deleted_count == 0 and out.saved == []
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "diff",
+        [
+            # same file both changed and deleted
+            CodeChunksFileDiffRequestDTO(
+                user_id="u", repo_id="r", commit_number="c2",
+                changed_file_paths={"a.py"}, deleted_file_paths={"a.py"},
+            ),
+            # chunk of an untouched file
+            CodeChunksFileDiffRequestDTO(
+                user_id="u", repo_id="r", commit_number="c2",
+                changed_file_paths={"a.py"}, chunks=[make_diff_chunk("b.py")],
+            ),
+            # chunk of another commit
+            CodeChunksFileDiffRequestDTO(
+                user_id="u", repo_id="r", commit_number="c2",
+                added_file_paths={"a.py"}, chunks=[make_diff_chunk("a.py", commit="c1")],
+            ),
+            # missing commit
+            CodeChunksFileDiffRequestDTO(user_id="u", repo_id="r", commit_number=""),
+        ],
+        ids=["overlapping sets", "untouched file chunk", "other commit chunk", "missing commit"],
+    )
+    async def test_inconsistent_diff_raises(self, diff):
+        store = TortoiseCodeChunksStore()
+        with pytest.raises(DevDoxModelsException) as exc_info:
+            await store.save_commit_file_diff(diff)
+        assert exc_info.value.error_type == "INVALID_FILE_DIFF"
+
+
+class TestFindEmbeddingsByContentHashes:
+    @staticmethod
+    def _fetch_conn(captured, rows):
+        class FakeConn:
+            def __init__(self, alias): ...
+            async def __aenter__(self): return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+            async def fetch(self, sql, *params):
+                captured["sql"] = sql
+                captured["params"] = params
+                return rows
+
+        return FakeConn
+
+    @pytest.mark.asyncio
+    async def test_dedupes_hashes_returns_hits_and_records_stats(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        monkeypatch.setattr(TortoiseCodeChunksStore, "embedding_reuse_stats", repo_mod.EmbeddingReuseStats())
+        captured = {}
+        rows = [{"content_hash": "h1", "embedding": [0.1, 0.2]}]
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._fetch_conn(captured, rows))
+
+        out = await store.find_embeddings_by_content_hashes(["h1", "h2", "h1", ""], user_id="u")
+
+        assert out == {"h1": [0.1, 0.2]}
+        assert captured["params"] == (["h1", "h2"], "u")
+        assert "DISTINCT ON (content_hash)" in captured["sql"]
+        assert "embedding IS NOT NULL" in captured["sql"]
+
+        stats = store.embedding_reuse_stats
+        assert (stats.lookups, stats.requested, stats.hits, stats.misses) == (1, 2, 1, 1)
+        assert stats.hit_rate == 0.5
+
+    @pytest.mark.asyncio
+    async def test_no_hashes_does_not_touch_the_database(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+        assert await store.find_embeddings_by_content_hashes([]) == {}
+
+
+class TestDeleteAllByRepoId:
+    class FakeTxConn:
+        def __init__(self, partition_found):
+            self.partition_found = partition_found
+            self.queries = []
+            self.scripts = []
+            self.stats_deletes = []
+
+        async def execute_query_dict(self, sql, values=None):
+            self.queries.append((sql, values))
+            if sql.startswith("SELECT to_regclass"):
+                return [{"found": self.partition_found}]
+            return [{"n": 7}]
+
+        async def execute_script(self, sql):
+            self.scripts.append(sql)
+
+        async def execute_query(self, sql, values=None):
+            self.stats_deletes.append((sql, values))
+
+    def _patch(self, monkeypatch, conn, delete_value):
+        class FakeTransaction:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, exc_type, exc, tb):
+                return False
+
+        monkeypatch.setattr(repo_mod, "in_transaction", lambda *a, **k: FakeTransaction())
+        qs = make_qs_chain(delete_value=delete_value)
+        monkeypatch.setattr(repo_mod.CodeChunks, "filter", MagicMock(return_value=qs))
+        return qs
+
+    @pytest.mark.asyncio
+    async def test_not_partitioned_deletes_the_rows(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        conn = self.FakeTxConn(partition_found=True)
+        qs = self._patch(monkeypatch, conn, delete_value=3)
+
+        assert await store.delete_all_by_repo_id("r") == 3
+        repo_mod.CodeChunks.filter.assert_called_once_with(repo_id="r")
+        qs.using_db.assert_called_once_with(conn)
+        assert conn.queries == [] and conn.scripts == []
+        assert conn.stats_deletes == [
+            ("DELETE FROM public.code_chunks_file_stats WHERE repo_id = $1", ["r"]),
+            ("DELETE FROM public.code_chunks_commit_stats WHERE repo_id = $1", ["r"]),
+            ("DELETE FROM public.code_chunks_repo_stats WHERE repo_id = $1", ["r"]),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_list_partitioned_drops_the_repo_partition(self, monkeypatch):
+        monkeypatch.setattr(TortoiseCodeChunksStore, "partitioning", CodeChunksPartitioning.LIST)
+        store = TortoiseCodeChunksStore()
+        conn = self.FakeTxConn(partition_found=True)
+        self._patch(monkeypatch, conn, delete_value=1)
+
+        # 7 rows in the dropped partition + 1 left in the DEFAULT partition
+        assert await store.delete_all_by_repo_id("r") == 8
+        partition = code_chunks_repo_partition_name("r")
+        assert conn.queries[0][1] == [f"public.{partition}"]
+        assert conn.queries[1][0] == f"SELECT count(*) AS n FROM public.{partition}"
+        assert conn.scripts == [f"DROP TABLE IF EXISTS public.{partition};"]
+
+    @pytest.mark.asyncio
+    async def test_list_partitioned_without_own_partition_falls_back_to_delete(self, monkeypatch):
+        monkeypatch.setattr(TortoiseCodeChunksStore, "partitioning", CodeChunksPartitioning.LIST)
+        store = TortoiseCodeChunksStore()
+        conn = self.FakeTxConn(partition_found=False)
+        self._patch(monkeypatch, conn, delete_value=2)
+
+        assert await store.delete_all_by_repo_id("r") == 2
+        assert conn.scripts == []
+
+    @pytest.mark.asyncio
+    async def test_empty_repo_id_is_a_no_op(self, monkeypatch):
+        monkeypatch.setattr(repo_mod, "in_transaction", MagicMock(side_effect=AssertionError("no tx expected")))
+        assert await TortoiseCodeChunksStore().delete_all_by_repo_id("") == 0
+
+
+class TestPurgeRepoChunks:
+    class BatchConn(StatsTxConn):
+        """Hands out the ids selected, then the rows deleted, by each successive batch."""
+
+        def __init__(self, batches):
+            super().__init__()
+            self.batches = list(batches)
+            self.next_id = 0
+
+        async def execute_query_dict(self, sql, values=None):
+            self.executed.append((sql, values))
+            if "WITH gone AS" in sql:
+                return self.batches.pop(0)
+            if not self.batches:
+                return []
+            count = sum(row["chunks"] for row in self.batches[0])
+            ids = [{"id": f"id{self.next_id + i}"} for i in range(count)]
+            self.next_id += count
+            return ids
+
+    @staticmethod
+    def deleted(chunks, commit="c1"):
+        return [{"repo_id": "r", "commit_number": commit, "file_path": "a.py", "chunks": chunks, "embedded": chunks, "bytes": 10 * chunks}]
+
+    def _patch(self, monkeypatch, conn, stats=None):
+        events = []
+        patch_transaction(monkeypatch, conn, events)
+        monkeypatch.setattr(TortoiseCodeChunksStore, "get_repo_chunk_stats", AsyncMock(return_value=stats))
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+
+        monkeypatch.setattr(repo_mod.asyncio, "sleep", fake_sleep)
+        return events, sleeps
+
+    @pytest.mark.asyncio
+    async def test_deletes_by_bounded_batches_in_their_own_transactions(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        conn = self.BatchConn([self.deleted(2), self.deleted(2), self.deleted(1)])
+        events, sleeps = self._patch(
+            monkeypatch, conn, repo_mod.CodeChunksStatsDTO(repo_id="r", chunk_count=5)
+        )
+        reported = []
+
+        out = await store.purge_repo_chunks("r", batch_size=2, pause=0.5, on_progress=reported.append)
+
+        assert (out.deleted_count, out.batches, out.total_estimate, out.done) == (5, 3, 5, True)
+        assert [(p.deleted_count, p.done) for p in reported] == [(2, False), (4, False), (5, False), (5, True)]
+        # the short last batch ends the purge without one more round trip
+        assert events == ["BEGIN", "COMMIT"] * 4 and sleeps == [0.5, 0.5]
+
+        # every batch starts after the last id of the previous one
+        selects = [(sql, values) for sql, values in conn.executed if sql.startswith("SELECT id")]
+        assert [values for _, values in selects] == [["r", 2], ["r", 2, "id1"], ["r", 2, "id3"]]
+        assert "ORDER BY id LIMIT $2" in selects[0][0] and "id > $3" in selects[1][0]
+        deletes = [(sql, values) for sql, values in conn.executed if "WITH gone AS" in sql]
+        assert [values for _, values in deletes] == [[["id0", "id1"], "r"], [["id2", "id3"], "r"], [["id4"], "r"]]
+        assert "WHERE id = ANY($1::uuid[]) AND repo_id = $2" in deletes[0][0]
+        # every batch updates the stats in its transaction
+        updates = [values for sql, values in conn.executed if sql == repo_mod.CODE_CHUNKS_STATS_UPDATE_SQL]
+        assert [u[3] for u in updates] == [[-2], [-2], [-1]]
+        assert conn.executed[-1] == (
+            "DELETE FROM public.code_chunks_repo_stats WHERE repo_id = $1 AND chunk_count <= 0", ["r"]
+        )
+
+    @pytest.mark.asyncio
+    async def test_resumes_with_the_rows_left(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        self._patch(monkeypatch, self.BatchConn([]))
+
+        async def report(progress):
+            reported.append(progress)
+
+        reported = []
+        out = await store.purge_repo_chunks("r", batch_size=10, on_progress=report)
+
+        assert (out.deleted_count, out.batches, out.total_estimate, out.done) == (0, 0, None, True)
+        assert len(reported) == 1
+
+    @pytest.mark.asyncio
+    async def test_runs_as_a_background_task(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        self._patch(monkeypatch, self.BatchConn([self.deleted(3)]))
+
+        task = store.purge_repo_chunks_in_background("r", batch_size=5)
+
+        assert task.get_name() == "purge_repo_chunks:r"
+        assert (await task).deleted_count == 3
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("kwargs", [{"batch_size": 0}, {"pause": -1}])
+    async def test_invalid_arguments_raise(self, kwargs):
+        with pytest.raises(ValueError):
+            await TortoiseCodeChunksStore().purge_repo_chunks("r", **kwargs)
+
+
+class TestChunkStats:
+    @pytest.mark.asyncio
+    async def test_repo_stats_read_one_counter_row(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        row = repo_mod.CodeChunksRepoStats(
+            repo_id="r", chunk_count=10, embedded_count=8, content_bytes=512, file_count=3
+        )
+        qs = make_qs_chain(result_for_first=row)
+        monkeypatch.setattr(repo_mod.CodeChunksRepoStats, "filter", MagicMock(return_value=qs))
+
+        stats = await store.get_repo_chunk_stats("r")
+
+        repo_mod.CodeChunksRepoStats.filter.assert_called_once_with(repo_id="r")
+        assert (stats.repo_id, stats.commit_number) == ("r", None)
+        assert (stats.chunk_count, stats.embedded_count, stats.content_bytes, stats.file_count) == (10, 8, 512, 3)
+
+    @pytest.mark.asyncio
+    async def test_commit_stats_missing_row_is_none(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        qs = make_qs_chain(result_for_first=None)
+        monkeypatch.setattr(repo_mod.CodeChunksCommitStats, "filter", MagicMock(return_value=qs))
+
+        assert await store.get_commit_chunk_stats("r", "c1") is None
+        repo_mod.CodeChunksCommitStats.filter.assert_called_once_with(repo_id="r", commit_number="c1")
+        assert await store.get_commit_chunk_stats("r", "") is None
 
 
 class TestFindAllByRepoIdWithLimit:
@@ -88,6 +621,162 @@ class TestFindAllByRepoIdWithLimit:
         qs.all.assert_awaited_once()
 
 
+class TestStreamAllByRepoId:
+    @staticmethod
+    def _cursor_conn(captured, records):
+        class FakeTx:
+            async def __aenter__(self):
+                captured["in_tx"] = True
+            async def __aexit__(self, exc_type, exc, tb):
+                captured["in_tx"] = False
+                return False
+
+        class FakeCursor:
+            def __init__(self, items):
+                self._items = iter(items)
+            def __aiter__(self): return self
+            async def __anext__(self):
+                assert captured["in_tx"], "server-side cursors need a transaction"
+                try:
+                    return next(self._items)
+                except StopIteration:
+                    raise StopAsyncIteration
+
+        class FakeConn:
+            def __init__(self, alias): ...
+            async def __aenter__(self): return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+            def transaction(self): return FakeTx()
+            def cursor(self, sql, *params, prefetch=None):
+                captured["sql"] = sql
+                captured["params"] = params
+                captured["prefetch"] = prefetch
+                return FakeCursor(records)
+
+        return FakeConn
+
+    @pytest.mark.asyncio
+    async def test_streams_projected_rows_through_a_cursor(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        ids = [uuid.uuid4(), uuid.uuid4()]
+        records = [
+            {"id": ids[0], "file_path": "a.py", "metadata": '{"k": 1}'},
+            {"id": ids[1], "file_path": "b.py", "metadata": "{}"},
+        ]
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._cursor_conn(captured, records))
+
+        out = [
+            dto
+            async for dto in store.stream_all_by_repo_id(
+                "r", fetch_size=250, columns=["id", "file_path", "metadata"]
+            )
+        ]
+
+        assert [d.id for d in out] == ids
+        assert all(isinstance(d, CodeChunksResponseDTO) for d in out)
+        assert out[0].metadata == {"k": 1} and out[0].content is None and out[0].embedding is None
+        assert "SELECT id, file_path, metadata" in captured["sql"]
+        assert captured["params"] == ("r",)
+        assert captured["prefetch"] == 250
+        assert captured["in_tx"] is False
+
+    @pytest.mark.asyncio
+    async def test_default_projection_is_every_dto_column(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._cursor_conn(captured, []))
+
+        out = [dto async for dto in store.stream_all_by_repo_id("r")]
+
+        assert out == []
+        assert f"SELECT {', '.join(repo_mod.STREAMABLE_COLUMNS)}" in captured["sql"]
+        assert captured["prefetch"] == repo_mod.DEFAULT_STREAM_FETCH_SIZE
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "kwargs",
+        [{"columns": ["id", "password"]}, {"fetch_size": 0}],
+    )
+    async def test_rejects_unknown_columns_and_bad_fetch_size(self, kwargs):
+        store = TortoiseCodeChunksStore()
+        with pytest.raises(ValueError):
+            async for _ in store.stream_all_by_repo_id("r", **kwargs):
+                pass
+
+
+class TestFetchContentsByIds:
+    @pytest.mark.asyncio
+    async def test_returns_rows_in_the_order_of_the_ids(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        id1, id2, id3 = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        qs = make_qs_chain(result_for_values=[{"id": id1, "content": "one"}, {"id": id2, "content": "two"}])
+        model = MagicMock()
+        model.filter.return_value = qs
+        monkeypatch.setattr(store, "model", model)
+
+        out = await store.fetch_contents_by_ids("u", [id2, id3, id1, id2], repo_id="r")
+
+        assert [row["content"] for row in out] == ["two", "one"]
+        model.filter.assert_called_once_with(
+            user_id="u", id__in=[str(id2), str(id3), str(id1)], repo_id="r"
+        )
+        qs.values.assert_awaited_once_with("id", "file_name", "file_path", "content")
+
+    @pytest.mark.asyncio
+    async def test_no_ids_or_failure_returns_empty_list(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        model = MagicMock()
+        model.filter.side_effect = Exception("boom")
+        monkeypatch.setattr(store, "model", model)
+
+        assert await store.fetch_contents_by_ids("u", []) == []
+        assert await store.fetch_contents_by_ids("u", [uuid.uuid4()]) == []
+
+
+class TestSearchProjection:
+    @pytest.mark.asyncio
+    async def test_ids_projection_selects_no_chunk_columns(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+        options = CodeChunksSearchOptions(projection=ChunkProjection.IDS)
+
+        await store.get_user_repo_chunks_multi("u", "r", [[0.1] * 768], 768, options=options)
+        assert "c.content" not in captured["sql"] and "c.file_name" not in captured["sql"]
+        assert "c.id,\n              a.created_at" in captured["sql"]
+
+        for strategy in (ChunkSearchStrategy.CANDIDATES, ChunkSearchStrategy.BINARY):
+            await store.get_user_repo_chunks_multi(
+                "u", "r", [[0.1] * 768], 768, options=dataclasses.replace(options, strategy=strategy)
+            )
+            assert "c.content" not in captured["sql"]
+
+        await store.get_user_repos_chunks_multi("u", None, [[0.1] * 768], 768, options=options)
+        assert "c.content" not in captured["sql"] and "c.repo_id," in captured["sql"]
+
+        await store.get_user_repo_chunks_hybrid("u", "r", "parse", [[0.1] * 768], 768, options=options)
+        assert "c.content," not in captured["sql"]
+
+    @pytest.mark.asyncio
+    async def test_metadata_projection_decodes_the_jsonb_metadata(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        rows = [{"id": 1, "file_name": "a.py", "file_path": "src/a.py", "metadata": '{"lang": "py"}'}]
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured, rows)
+        )
+
+        out = await store.get_user_repo_chunks_multi(
+            "u", "r", [[0.1] * 768], 768, options=CodeChunksSearchOptions(projection=ChunkProjection.METADATA)
+        )
+
+        assert out == [{"id": 1, "file_name": "a.py", "file_path": "src/a.py", "metadata": {"lang": "py"}}]
+        assert "c.metadata," in captured["sql"] and "c.content" not in captured["sql"]
+
+
 class TestGetRepoFileChunks:
     @pytest.mark.asyncio
     async def test_happy_path_filters_orders_and_values(self, monkeypatch):
@@ -127,29 +816,191 @@ class TestGetRepoFileChunks:
         assert out == []
         assert "get_repo_file_chunks" in logged.get("msg", "")
 
-class TestGetUserRepoChunksMulti:
+class TestSearchDiversification:
     @pytest.mark.asyncio
-    async def test_executes_sql_via_fake_pgvector_connection(self, monkeypatch):
-        """
-        We fake PgVectorConnection; assert the param ordering matches:
-        [*query_embeddings, user_id, repo_id, limit]
-        """
+    async def test_pool_is_fetched_with_embeddings_in_the_same_query(self, monkeypatch):
         store = TortoiseCodeChunksStore()
-
-        captured = {"sql": None, "params": None}
+        captured = {}
         rows = [
-            {"id": uuid.uuid4(), "content": "x", "fusion_score": 1.23, "max_sim": 0.9, "created_at": None},
-            {"id": uuid.uuid4(), "content": "y", "fusion_score": 1.10, "max_sim": 0.8, "created_at": None},
+            {"id": 1, "fusion_score": 0.9, "max_sim": 0.9, "embedding": [1.0, 0.0], "file_path": "a.py"},
+            {"id": 2, "fusion_score": 0.8, "max_sim": 0.8, "embedding": [1.0, 0.01], "file_path": "a.py"},
+            {"id": 3, "fusion_score": 0.5, "max_sim": 0.5, "embedding": [0.0, 1.0], "file_path": "b.py"},
         ]
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured, rows)
+        )
+        options = CodeChunksSearchOptions(projection=ChunkProjection.IDS, mmr_lambda=0.5, mmr_pool_size=30)
 
-        class FakeConn:
-            def __init__(self, alias): self.alias = alias
-            async def __aenter__(self): return self
-            async def __aexit__(self, exc_type, exc, tb): return False
-            async def fetch(self, sql, *params):
-                captured["sql"] = sql
-                captured["params"] = params
-                return rows
+        out = await store.get_user_repo_chunks_multi("u", "r", [[0.1] * 768], 768, limit=2, options=options)
+
+        assert [r["id"] for r in out] == [1, 3]
+        assert all("embedding" not in r and "file_path" not in r for r in out)
+        assert "c.file_path,\n              c.embedding," in captured["sql"]
+        assert captured["params"][-1] == 30
+
+    @pytest.mark.asyncio
+    async def test_candidates_strategy_widens_k_to_the_pool(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+        options = CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, max_chunks_per_file=2)
+
+        await store.get_user_repo_chunks_multi("u", "r", [[0.1] * 768], 768, limit=5, options=options)
+
+        # limit, then k: pool max(5 * 4, 40) and k max(40 * 4, 40)
+        assert captured["params"][-2:] == (40, 160)
+        assert "c.embedding," in captured["sql"] and captured["sql"].count("c.file_path,") == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_diversification_options_return_empty(self):
+        store = TortoiseCodeChunksStore()
+
+        out = await store.get_user_repo_chunks_multi(
+            "u", "r", [[0.1] * 768], 768, options=CodeChunksSearchOptions(mmr_lambda=2.0)
+        )
+
+        assert out == []
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "options", [CodeChunksSearchOptions(mmr_lambda=0.5), CodeChunksSearchOptions(max_chunks_per_file=1)]
+    )
+    async def test_undiversified_searches_reject_the_options(self, monkeypatch, options):
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+        store = TortoiseCodeChunksStore()
+
+        assert await store.get_user_repos_chunks_multi("u", None, [[0.1] * 768], 768, options=options) == []
+        assert await store.get_user_repo_chunks_hybrid("u", "r", "parse", [[0.1] * 768], 768, options=options) == []
+
+
+class TestGetRepoFileChunksLookupModes:
+    @staticmethod
+    def _fetch_conn(captured, rows=(), value=None):
+        class FakeConn:
+            def __init__(self, alias):
+                pass
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def fetch(self, sql, *params):
+                captured["sql"], captured["params"] = sql, params
+                return list(rows)
+
+            async def fetchval(self, sql, *params):
+                captured["sql"], captured["params"] = sql, params
+                return value
+
+        return FakeConn
+
+    @pytest.mark.asyncio
+    async def test_exact_mode_matches_the_lowercased_name_in_source_order(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        rows = [{"file_path": "README.md", "chunk_ordinal": 0, "content": "# t"}]
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._fetch_conn(captured, rows))
+
+        out = await store.get_repo_file_chunks("u", "r", "README.md", mode=FileLookupMode.EXACT)
+
+        assert out == rows
+        assert captured["params"] == ("r", "u", "readme.md")
+        assert "lower(file_name) = $3" in captured["sql"]
+        assert "ORDER BY file_path, chunk_ordinal NULLS LAST, created_at" in captured["sql"]
+
+    @pytest.mark.asyncio
+    async def test_prefix_mode_uses_an_index_range(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._fetch_conn(captured))
+
+        await store.get_repo_file_chunks("u", "r", "Parse", mode="prefix")
+
+        # lowercased by PostgreSQL, like the indexed expression
+        assert captured["params"] == ("r", "u", "Parse")
+        assert "lower(file_name) ~>=~ lower($3::text) AND lower(file_name) ~<~ (" in captured["sql"]
+        assert "ELSE ascii(right(rtrim(lower($3::text), chr(1114111)), 1)) + 1 END" in captured["sql"]
+        # the successor of U+D7FF skips the surrogates
+        assert "= 55295 THEN 57344" in captured["sql"]
+
+    @pytest.mark.parametrize("prefix", ["", "\U0010ffff", "\U0010ffff\U0010ffff"])
+    def test_prefix_without_successor_is_open_ended(self, prefix):
+        assert repo_mod.file_name_prefix_predicate(prefix, 3) == "lower(file_name) ~>=~ lower($3::text)"
+        assert "~<~" in repo_mod.file_name_prefix_predicate("a\U0010ffff", 3)
+
+    @pytest.mark.asyncio
+    async def test_trigram_mode_escapes_like_wildcards(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._fetch_conn(captured))
+
+        await store.get_repo_file_chunks("u", "r", "50%_done", mode=FileLookupMode.TRIGRAM)
+
+        assert captured["params"][2] == "%50\\%\\_done%"
+        assert "file_name ILIKE $3" in captured["sql"]
+
+    @pytest.mark.asyncio
+    async def test_get_repo_file_content_aggregates_in_chunk_order(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._fetch_conn(captured, value="ab"))
+
+        assert await store.get_repo_file_content("u", "r", "src/a.py") == "ab"
+        assert captured["params"] == ("r", "u", "src/a.py")
+        assert "string_agg(content, '' ORDER BY chunk_ordinal NULLS LAST, created_at)" in captured["sql"]
+        assert await store.get_repo_file_content("u", "r", "") is None
+
+    @pytest.mark.asyncio
+    async def test_failures_are_logged_and_empty(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+
+        class BoomConn:
+            def __init__(self, alias):
+                pass
+
+            async def __aenter__(self):
+                raise RuntimeError("db down")
+
+            async def __aexit__(self, *exc):
+                return False
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+
+        assert await store.get_repo_file_chunks("u", "r", "a.py", mode=FileLookupMode.EXACT) == []
+        assert await store.get_repo_file_content("u", "r", "src/a.py") is None
+
+
+class TestGetUserRepoChunksMulti:
+    @pytest.mark.asyncio
+    async def test_executes_sql_via_fake_pgvector_connection(self, monkeypatch):
+        """
+        We fake PgVectorConnection; assert the param ordering matches:
+        [query vectors array, user_id, repo_id, limit]
+        """
+        store = TortoiseCodeChunksStore()
+
+        captured = {"sql": None, "params": None}
+        rows = [
+            {"id": uuid.uuid4(), "content": "x", "fusion_score": 1.23, "max_sim": 0.9, "created_at": None},
+            {"id": uuid.uuid4(), "content": "y", "fusion_score": 1.10, "max_sim": 0.8, "created_at": None},
+        ]
+
+        class FakeConn:
+            def __init__(self, alias): self.alias = alias
+            async def __aenter__(self): return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+            async def fetch(self, sql, *params):
+                captured["sql"] = sql
+                captured["params"] = params
+                return rows
 
         monkeypatch.setattr(repo_mod, "PgVectorConnection", FakeConn)
 
@@ -164,15 +1015,15 @@ class TestGetUserRepoChunksMulti:
         )
         assert out == rows
 
-        # Params layout: [emb1, emb2, "u", "r", 5]
-        assert captured["params"][0] is emb1
-        assert captured["params"][1] is emb2
-        assert captured["params"][2] == "u"
-        assert captured["params"][3] == "r"
-        assert captured["params"][4] == 5
+        # Params layout: [[emb1, emb2], "u", "r", 5], the vectors as one array parameter
+        assert captured["params"][0] == [tuple(emb1), tuple(emb2)]
+        assert captured["params"][1] == "u"
+        assert captured["params"][2] == "r"
+        assert captured["params"][3] == 5
 
         # (Optional) Sanity check sql contains the CTEs we expect
-        assert "WITH queries(qvec) AS" in captured["sql"]
+        assert "WITH queries(qidx, qvec) AS" in captured["sql"]
+        assert "unnest($1::vector(768)[]) WITH ORDINALITY" in captured["sql"]
         assert "CROSS JOIN queries" in captured["sql"]
         assert "SUM(sim)        AS fusion_score" in captured["sql"]
     
@@ -191,6 +1042,7 @@ class TestGetUserRepoChunksMulti:
         # inconsistent dims
         bad = [0.0] * 10
         assert await store.get_user_repo_chunks_multi(user_id="u", repo_id="r", query_embeddings=[e1, bad], emb_dim=768, limit=5) == []
+        assert await store.get_user_repo_chunks_multi(user_id="u", repo_id="r", query_embeddings=[e1, e2], emb_dim=10, limit=5) == []
     
     @pytest.mark.asyncio
     async def test_multi_failure_logs_error_and_returns_empty_list(self, monkeypatch):
@@ -216,3 +1068,729 @@ class TestGetUserRepoChunksMulti:
         )
         assert out == []
         assert "Multi-query similarity search failed" in (logged["msg"] or "")
+
+    @pytest.mark.asyncio
+    async def test_index_knobs_are_set_locally_inside_a_transaction(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+
+        calls = []
+
+        class FakeTx:
+            async def __aenter__(self):
+                calls.append("BEGIN")
+            async def __aexit__(self, exc_type, exc, tb):
+                calls.append("COMMIT")
+                return False
+
+        class FakeConn:
+            def __init__(self, alias): ...
+            async def __aenter__(self): return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+            def transaction(self): return FakeTx()
+            async def execute(self, sql):
+                calls.append(sql)
+            async def fetch(self, sql, *params):
+                calls.append("FETCH")
+                return []
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", FakeConn)
+
+        out = await store.get_user_repo_chunks_multi(
+            user_id="u",
+            repo_id="r",
+            query_embeddings=[[0.1] * 768],
+            emb_dim=768,
+            limit=5,
+            options=CodeChunksSearchOptions(ef_search=200, probes=10),
+        )
+
+        assert out == []
+        assert calls == [
+            "BEGIN",
+            "SET LOCAL hnsw.ef_search = 200",
+            "SET LOCAL ivfflat.probes = 10",
+            "FETCH",
+            "COMMIT",
+        ]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "options",
+        [
+            CodeChunksSearchOptions(ef_search=0),
+            CodeChunksSearchOptions(ef_search=5000),
+            CodeChunksSearchOptions(probes=0),
+        ],
+    )
+    async def test_invalid_index_knobs_return_empty_list(self, monkeypatch, options):
+        store = TortoiseCodeChunksStore()
+
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+
+        out = await store.get_user_repo_chunks_multi(
+            user_id="u", repo_id="r", query_embeddings=[[0.1] * 768], emb_dim=768, limit=3, options=options
+        )
+        assert out == []
+
+
+class TestGetUserRepoChunksMultiCandidates:
+    @staticmethod
+    def _capturing_conn(captured, rows=None):
+        class FakeTx:
+            async def __aenter__(self): return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+
+        class FakeConn:
+            def __init__(self, alias): ...
+            async def __aenter__(self): return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+            def transaction(self): return FakeTx()
+            async def execute(self, sql):
+                captured.setdefault("settings", []).append(sql)
+            async def fetch(self, sql, *params):
+                captured["sql"] = sql
+                captured["params"] = params
+                return rows or []
+
+        return FakeConn
+
+    @pytest.mark.asyncio
+    async def test_candidates_rrf_uses_lateral_top_k_and_widens_ef_search(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._capturing_conn(captured))
+
+        emb1, emb2 = [0.0] * 768, [0.1] * 768
+        await store.get_user_repo_chunks_multi(
+            user_id="u",
+            repo_id="r",
+            query_embeddings=[emb1, emb2],
+            emb_dim=768,
+            limit=5,
+            options=CodeChunksSearchOptions(
+                strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF, candidates_per_query=100
+            ),
+        )
+
+        # Params layout: [[emb1, emb2], user, repo, limit, k, rrf_k]
+        assert captured["params"] == ([tuple(emb1), tuple(emb2)], "u", "r", 5, 100, 60)
+        assert "CROSS JOIN LATERAL" in captured["sql"]
+        assert "ORDER BY c.embedding <=> q.qvec" in captured["sql"]
+        assert "SUM(1.0 / ($6::int + rnk)) AS fusion_score" in captured["sql"]
+        assert "CROSS JOIN queries" not in captured["sql"]
+        assert captured["settings"] == ["SET LOCAL hnsw.ef_search = 100"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "fusion,expected",
+        [(ChunkFusion.SUM, "SUM(sim) AS fusion_score"), (ChunkFusion.MAX, "MAX(sim) AS fusion_score")],
+    )
+    async def test_candidates_default_k_and_fusions(self, monkeypatch, fusion, expected):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._capturing_conn(captured))
+
+        await store.get_user_repo_chunks_multi(
+            user_id="u",
+            repo_id="r",
+            query_embeddings=[[0.1] * 768],
+            emb_dim=768,
+            limit=20,
+            options=CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, fusion=fusion, ef_search=300),
+        )
+
+        # default k = max(limit * 4, 40), no rrf_k param
+        assert captured["params"][1:] == ("u", "r", 20, 80)
+        assert expected in captured["sql"]
+        assert captured["settings"] == ["SET LOCAL hnsw.ef_search = 300"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "options",
+        [
+            CodeChunksSearchOptions(fusion=ChunkFusion.RRF),
+            CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, candidates_per_query=2),
+            CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, rrf_k=0),
+            CodeChunksSearchOptions(iterative_scan="sometimes"),
+        ],
+    )
+    async def test_invalid_strategy_options_return_empty_list(self, options):
+        store = TortoiseCodeChunksStore()
+        out = await store.get_user_repo_chunks_multi(
+            user_id="u", repo_id="r", query_embeddings=[[0.1] * 768], emb_dim=768, limit=5, options=options
+        )
+        assert out == []
+
+
+class TestGetUserRepoChunksMultiBinary:
+    @pytest.mark.asyncio
+    async def test_binary_prefilters_by_hamming_distance_then_reranks(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+
+        emb = [0.1] * 768
+        await store.get_user_repo_chunks_multi(
+            user_id="u",
+            repo_id="r",
+            query_embeddings=[emb],
+            emb_dim=768,
+            limit=10,
+            options=CodeChunksSearchOptions(
+                strategy=ChunkSearchStrategy.BINARY, fusion=ChunkFusion.RRF, oversampling=8
+            ),
+        )
+
+        # Params layout: [[emb], user, repo, limit, k, prefilter, rrf_k]
+        assert captured["params"] == ([tuple(emb)], "u", "r", 10, 40, 320, 60)
+        sql = captured["sql"]
+        assert "ORDER BY c.embedding_bits <~> binary_quantize(q.qvec)::bit(768)" in sql
+        assert "LIMIT $6" in sql and "SUM(1.0 / ($7::int + rnk))" in sql
+        assert "ORDER BY p.embedding <=> q.qvec" in sql
+        # the Hamming scan doesn't go through the HNSW index
+        assert "settings" not in captured
+
+    @pytest.mark.asyncio
+    async def test_invalid_oversampling_returns_empty_list(self):
+        store = TortoiseCodeChunksStore()
+        out = await store.get_user_repo_chunks_multi(
+            user_id="u",
+            repo_id="r",
+            query_embeddings=[[0.1] * 768],
+            emb_dim=768,
+            limit=5,
+            options=CodeChunksSearchOptions(strategy=ChunkSearchStrategy.BINARY, oversampling=0),
+        )
+        assert out == []
+
+
+class TestGetUserRepoChunksHybrid:
+    @pytest.mark.asyncio
+    async def test_fuses_lexical_and_vector_ranks_in_one_statement(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        rows = [{"id": uuid.uuid4(), "content": "def get_user(): ...", "fusion_score": 0.03, "max_sim": None}]
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured, rows)
+        )
+
+        emb1, emb2 = [0.1] * 768, [0.2] * 768
+        out = await store.get_user_repo_chunks_hybrid(
+            user_id="u", repo_id="r", query_text="get_user", query_embeddings=[emb1, emb2], emb_dim=768, limit=5
+        )
+
+        assert out == rows
+        # Params layout: [[emb1, emb2], user, repo, limit, k, query_text, rrf_k]
+        assert captured["params"] == ([tuple(emb1), tuple(emb2)], "u", "r", 5, 40, "get_user", 60)
+        sql = captured["sql"]
+        assert "websearch_to_tsquery('simple', $6::text)" in sql
+        assert "to_tsvector('simple', content) @@ tsq.query" in sql
+        assert "ORDER BY c.embedding <=> q.qvec" in sql
+        assert "SUM(1.0 / ($7::int + rnk)) AS fusion_score" in sql
+        assert "max_sim DESC NULLS LAST" in sql
+        # EXACT falls back to the index-served vector candidates
+        assert captured["settings"] == ["SET LOCAL hnsw.ef_search = 40"]
+
+    @pytest.mark.asyncio
+    async def test_lexical_only_and_binary_param_layouts(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+
+        await store.get_user_repo_chunks_hybrid(
+            user_id="u", repo_id="r", query_text="TortoiseCodeChunksStore", query_embeddings=[], emb_dim=768, limit=5
+        )
+        assert captured["params"] == ("u", "r", 5, 40, "TortoiseCodeChunksStore", 60)
+        assert "queries(qidx, qvec)" not in captured["sql"]
+        assert "settings" not in captured
+
+        emb = [0.1] * 768
+        await store.get_user_repo_chunks_hybrid(
+            user_id="u",
+            repo_id="r",
+            query_text="x",
+            query_embeddings=[emb],
+            emb_dim=768,
+            limit=5,
+            options=CodeChunksSearchOptions(strategy=ChunkSearchStrategy.BINARY, oversampling=2),
+        )
+        assert captured["params"] == ([tuple(emb)], "u", "r", 5, 40, "x", 60, 80)
+        assert "LIMIT $8" in captured["sql"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("query_text", ["", "   "])
+    async def test_blank_query_text_returns_empty_list(self, query_text):
+        store = TortoiseCodeChunksStore()
+        out = await store.get_user_repo_chunks_hybrid(
+            user_id="u", repo_id="r", query_text=query_text, query_embeddings=[[0.1] * 768], emb_dim=768
+        )
+        assert out == []
+
+
+class TestBatchGetUserRepoChunksMulti:
+    CREATED_AT = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+    @classmethod
+    def _recording_conn(cls, log, fail_on_user=None):
+        """
+        Records every round trip in order. Each request gets two rows naming its user, sent in the
+        reverse of their ranking.
+        """
+
+        def rows(params):
+            user_id, position = params[1], params[-1]
+            if user_id == fail_on_user:
+                raise asyncpg.exceptions.DataError("boom")
+            return [
+                {"batch_position": position, "id": uuid.UUID(int=rank), "created_at": cls.CREATED_AT,
+                 "fusion_score": score, "max_sim": score, "user": user_id}
+                for rank, score in ((2, 0.1), (1, 0.9))
+            ]
+
+        class FakeConn:
+            acquired = 0
+
+            def __init__(self, alias): ...
+            async def __aenter__(self):
+                FakeConn.acquired += 1
+                return self
+            async def __aexit__(self, exc_type, exc, tb): return False
+            async def fetch(self, sql, *params):
+                if sql.startswith("SELECT set_config"):
+                    log.append(("set_config", params))
+                    return []
+                log.append(("fetch", params[1]))
+                return rows(params)
+            async def fetchmany(self, sql, args):
+                assert "AS batch_position" in sql
+                log.append(("fetchmany", [params[1] for params in args]))
+                return [row for params in args for row in rows(params)]
+
+        return FakeConn
+
+    @staticmethod
+    def _request(user_id, options=None, **kwargs):
+        return CodeChunksSearchRequestDTO(
+            user_id=user_id, repo_id="r", query_embeddings=[[0.1] * 768], options=options, **kwargs
+        )
+
+    @pytest.mark.asyncio
+    async def test_pipelines_same_shape_requests_in_one_round_trip(self, monkeypatch):
+        log = []
+        conn_cls = self._recording_conn(log)
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", conn_cls)
+        store = TortoiseCodeChunksStore()
+
+        out = await store.batch_get_user_repo_chunks_multi(
+            [self._request("u1"), self._request("u2", limit=0), self._request("u3")], emb_dim=768
+        )
+
+        assert [[row["user"] for row in rows] for rows in out] == [["u1", "u1"], [], ["u3", "u3"]]
+        # ranked again once split, without the position tag
+        assert [row["fusion_score"] for row in out[0]] == [0.9, 0.1]
+        assert "batch_position" not in out[0][0]
+        assert conn_cls.acquired == 1
+        assert log == [("fetchmany", ["u1", "u3"])]
+
+    @pytest.mark.asyncio
+    async def test_knobs_only_change_between_groups_and_are_reset(self, monkeypatch):
+        log = []
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._recording_conn(log))
+        store = TortoiseCodeChunksStore()
+
+        await store.batch_get_user_repo_chunks_multi(
+            [
+                self._request("u1", CodeChunksSearchOptions(ef_search=200, probes=5)),
+                self._request("u2", CodeChunksSearchOptions(probes=3)),
+                self._request("u3", CodeChunksSearchOptions(ef_search=200, probes=5)),
+                self._request("u4", CodeChunksSearchOptions(probes=3)),
+            ],
+            emb_dim=768,
+        )
+
+        assert log == [
+            ("set_config", ("hnsw.ef_search", "200", "ivfflat.probes", "5")),
+            ("fetchmany", ["u1", "u3"]),
+            ("set_config", ("hnsw.ef_search", None, "ivfflat.probes", "3")),
+            ("fetchmany", ["u2", "u4"]),
+            ("set_config", ("ivfflat.probes", None)),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_a_failing_request_only_empties_its_own_slot(self, monkeypatch):
+        log = []
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", self._recording_conn(log, fail_on_user="u2"))
+        store = TortoiseCodeChunksStore()
+
+        out = await store.batch_get_user_repo_chunks_multi(
+            [self._request("u1"), self._request("u2"), self._request("u3")], emb_dim=768
+        )
+
+        assert [[row["user"] for row in rows] for rows in out] == [["u1", "u1"], [], ["u3", "u3"]]
+        # the failed pipeline is retried request by request
+        assert log == [("fetchmany", ["u1", "u2", "u3"]), ("fetch", "u1"), ("fetch", "u2"), ("fetch", "u3")]
+
+    @pytest.mark.asyncio
+    async def test_a_client_side_error_is_not_retried(self, monkeypatch):
+        log = []
+        conn_cls = self._recording_conn(log)
+
+        async def missing_fetchmany(self, sql, args):
+            raise AttributeError("fetchmany")
+
+        monkeypatch.setattr(conn_cls, "fetchmany", missing_fetchmany)
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", conn_cls)
+
+        out = await TortoiseCodeChunksStore().batch_get_user_repo_chunks_multi(
+            [self._request("u1"), self._request("u2")], emb_dim=768
+        )
+
+        assert out == [[], []]
+        assert log == []
+
+    @pytest.mark.asyncio
+    async def test_no_valid_request_does_not_acquire_a_connection(self, monkeypatch):
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+        store = TortoiseCodeChunksStore()
+
+        out = await store.batch_get_user_repo_chunks_multi([self._request("u1", limit=0)], emb_dim=768)
+        assert out == [[]]
+
+
+class TestGetUserReposChunksMulti:
+    @pytest.mark.asyncio
+    async def test_exact_over_a_repo_list_with_per_repo_cap(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+
+        emb = [0.1] * 768
+        await store.get_user_repos_chunks_multi(
+            user_id="u", repo_ids=["r2", "r1", "r2"], query_embeddings=[emb], emb_dim=768, limit=10, per_repo_limit=3
+        )
+
+        # Params layout: [[emb], user, repo_ids, per_repo_limit, limit]
+        assert captured["params"] == ([tuple(emb)], "u", ["r1", "r2"], 3, 10)
+        sql = captured["sql"]
+        assert "c.user_id = $2 AND c.repo_id = ANY($3::text[])" in sql
+        assert "CROSS JOIN queries AS q" in sql
+        assert "PARTITION BY repo_id" in sql and "repo_rank <= $4" in sql
+        assert "LIMIT $5" in sql
+        assert "c.repo_id," in sql
+        assert "settings" not in captured
+
+    @pytest.mark.asyncio
+    async def test_candidates_over_all_repos_of_the_user(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+
+        emb1, emb2 = [0.1] * 768, [0.2] * 768
+        await store.get_user_repos_chunks_multi(
+            user_id="u",
+            repo_ids=None,
+            query_embeddings=[emb1, emb2],
+            emb_dim=768,
+            limit=5,
+            options=CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF),
+        )
+
+        # Params layout: [[emb1, emb2], user, k, rrf_k, limit]
+        assert captured["params"] == ([tuple(emb1), tuple(emb2)], "u", 40, 60, 5)
+        sql = captured["sql"]
+        assert "WHERE c.user_id = $2\n" in sql and "repo_id = ANY" not in sql
+        assert "CROSS JOIN LATERAL" in sql and "LIMIT $3" in sql
+        assert "SUM(1.0 / ($4::int + rnk))" in sql
+        assert "PARTITION BY repo_id" not in sql
+        assert captured["settings"] == ["SET LOCAL hnsw.ef_search = 40"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"repo_ids": []},
+            {"repo_ids": None, "per_repo_limit": 0},
+            {"repo_ids": None, "limit": 0},
+        ],
+    )
+    async def test_invalid_arguments_return_empty_list(self, monkeypatch, kwargs):
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+        store = TortoiseCodeChunksStore()
+        out = await store.get_user_repos_chunks_multi(
+            user_id="u", query_embeddings=[[0.1] * 768], emb_dim=768, **kwargs
+        )
+        assert out == []
+
+
+class TestSearchKeysetPagination:
+    LAST_ROW = {
+        "id": uuid.UUID(int=7),
+        "created_at": datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc),
+        "fusion_score": 1.5,
+        "max_sim": 0.8,
+    }
+
+    async def _search(self, monkeypatch, method, *args, **kwargs):
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+        await getattr(TortoiseCodeChunksStore(), method)(*args, **kwargs)
+        return captured
+
+    @pytest.mark.asyncio
+    async def test_exact_page_filters_on_the_ranking_tuple(self, monkeypatch):
+        cursor = encode_search_cursor(self.LAST_ROW)
+
+        captured = await self._search(
+            monkeypatch, "get_user_repo_chunks_multi", "u", "r", [[0.1] * 768], 768, limit=5,
+            options=CodeChunksSearchOptions(after=cursor),
+        )
+
+        # Params layout: [vectors, user, repo, limit, cursor fusion_score, max_sim, created_at, id]
+        assert captured["params"][1:] == ("u", "r", 5, *decode_search_cursor(cursor).key())
+        sql = captured["sql"]
+        assert (
+            "AND (COALESCE(a.fusion_score::float8, '-Infinity'), COALESCE(a.max_sim::float8, '-Infinity'), "
+            "a.created_at, a.id) < ($5::float8, $6::float8, $7::timestamptz, $8::uuid)"
+        ) in sql
+        assert "a.created_at DESC, a.id DESC\n            LIMIT $4" in sql
+
+    @pytest.mark.asyncio
+    async def test_candidates_page_filters_the_fused_candidates(self, monkeypatch):
+        captured = await self._search(
+            monkeypatch, "get_user_repo_chunks_multi", "u", "r", [[0.1] * 768], 768, limit=5,
+            options=CodeChunksSearchOptions(
+                strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF,
+                after=encode_search_cursor(self.LAST_ROW),
+            ),
+        )
+
+        # the cursor follows k and rrf_k
+        assert captured["params"][4:6] == (40, 60)
+        assert captured["params"][6:8] == (1.5, 0.8)
+        sql = captured["sql"]
+        assert "FROM agg\n              WHERE (COALESCE(fusion_score::float8" in sql
+        assert "< ($7::float8, $8::float8, $9::timestamptz, $10::uuid)" in sql
+
+    @pytest.mark.asyncio
+    async def test_multi_repo_page_applies_after_the_per_repo_cap(self, monkeypatch):
+        captured = await self._search(
+            monkeypatch, "get_user_repos_chunks_multi", "u", ["r1"], [[0.1] * 768], 768, limit=5,
+            per_repo_limit=2, options=CodeChunksSearchOptions(after=encode_search_cursor(self.LAST_ROW)),
+        )
+
+        assert captured["params"][1:] == ("u", ["r1"], 2, 1.5, 0.8, self.LAST_ROW["created_at"], uuid.UUID(int=7), 5)
+        assert "FROM capped\n              WHERE (COALESCE(fusion_score::float8" in captured["sql"]
+        assert "LIMIT $9" in captured["sql"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "options",
+        [
+            CodeChunksSearchOptions(after="garbage"),
+            CodeChunksSearchOptions(after=encode_search_cursor(LAST_ROW), max_chunks_per_file=1),
+        ],
+    )
+    async def test_invalid_pages_return_empty_without_querying(self, monkeypatch, options):
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+        store = TortoiseCodeChunksStore()
+
+        assert await store.get_user_repo_chunks_multi("u", "r", [[0.1] * 768], 768, options=options) == []
+        assert await store.get_user_repos_chunks_multi("u", None, [[0.1] * 768], 768, options=options) == []
+        assert await store.get_user_repo_chunks_hybrid(
+            "u", "r", "parse", [[0.1] * 768], 768, options=CodeChunksSearchOptions(after=encode_search_cursor(self.LAST_ROW))
+        ) == []
+
+
+class TestMinSimilarity:
+    @pytest.fixture(autouse=True)
+    def _reset_pruning_stats(self):
+        TortoiseCodeChunksStore.similarity_pruning_stats.reset()
+        yield
+        TortoiseCodeChunksStore.similarity_pruning_stats.reset()
+
+    @pytest.mark.asyncio
+    async def test_exact_prunes_while_scanning_and_records_the_counts(self, monkeypatch):
+        captured = {}
+        kept = {"id": uuid.uuid4(), "content": "x", "fusion_score": 0.9, "max_sim": 0.9, "created_at": None}
+        rows = [{**kept, "scored_count": 10, "pruned_count": 7}]
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured, rows)
+        )
+
+        out = await TortoiseCodeChunksStore().get_user_repo_chunks_multi(
+            "u", "r", [[0.1] * 768, [0.2] * 768], 768, limit=5, options=CodeChunksSearchOptions(min_similarity=0.2)
+        )
+
+        assert out == [kept]
+        # Params layout: [vectors, user, repo, limit, min_similarity]
+        assert captured["params"][1:] == ("u", "r", 5, 0.2)
+        sql = captured["sql"]
+        scored_sql = sql[sql.index("scored AS") : sql.index("pruning AS")]
+        assert "AND 1 - (c.embedding <=> q.qvec) >= $5::float8" in scored_sql
+        assert "FROM pruning p\n            LEFT JOIN (agg a" in sql
+        stats = TortoiseCodeChunksStore.similarity_pruning_stats
+        assert (stats.searches, stats.scored, stats.pruned, stats.prune_rate) == (1, 10, 7, 0.7)
+
+    @pytest.mark.asyncio
+    async def test_candidates_prune_after_the_index_scan(self, monkeypatch):
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+
+        await TortoiseCodeChunksStore().get_user_repo_chunks_multi(
+            "u", "r", [[0.1] * 768], 768, limit=5,
+            options=CodeChunksSearchOptions(
+                strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF, min_similarity=0.5
+            ),
+        )
+
+        # Params layout: [vectors, user, repo, limit, k, rrf_k, min_similarity]
+        assert captured["params"][1:] == ("u", "r", 5, 40, 60, 0.5)
+        sql = captured["sql"]
+        # the ORDER BY distance LIMIT k subquery is untouched, so the index scan stops after k rows
+        assert "ORDER BY c.embedding <=> q.qvec\n                LIMIT $5\n              ) AS k" in sql
+        assert "FROM candidates\n              WHERE sim >= $7::float8\n              GROUP BY id" in sql
+        assert "COUNT(*) FILTER (WHERE sim < $7::float8) AS pruned_count" in sql
+
+    @pytest.mark.asyncio
+    async def test_nothing_above_the_threshold_still_reports_the_counts(self, monkeypatch):
+        captured = {}
+        rows = [{"id": None, "content": None, "fusion_score": None, "max_sim": None, "created_at": None,
+                 "scored_count": 4, "pruned_count": 4}]
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured, rows)
+        )
+
+        out = await TortoiseCodeChunksStore().get_user_repos_chunks_multi(
+            "u", None, [[0.1] * 768], 768, limit=5, options=CodeChunksSearchOptions(min_similarity=0.99)
+        )
+
+        assert out == []
+        assert "c.user_id = $2\n                AND c.embedding IS NOT NULL\n                AND 1 - (c.embedding" in captured["sql"]
+        assert TortoiseCodeChunksStore.similarity_pruning_stats.pruned == 4
+
+    @pytest.mark.asyncio
+    async def test_invalid_threshold_and_hybrid_return_empty_without_querying(self, monkeypatch):
+        class BoomConn:
+            def __init__(self, alias):
+                raise AssertionError("should not reach the database")
+
+        monkeypatch.setattr(repo_mod, "PgVectorConnection", BoomConn)
+        store = TortoiseCodeChunksStore()
+        too_high = CodeChunksSearchOptions(min_similarity=1.5)
+
+        assert await store.get_user_repo_chunks_multi("u", "r", [[0.1] * 768], 768, options=too_high) == []
+        assert await store.get_user_repos_chunks_multi("u", None, [[0.1] * 768], 768, options=too_high) == []
+        assert await store.get_user_repo_chunks_hybrid(
+            "u", "r", "parse", [[0.1] * 768], 768, options=CodeChunksSearchOptions(min_similarity=0.2)
+        ) == []
+
+
+class TestSearchStatementShape:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "options",
+        [
+            CodeChunksSearchOptions(),
+            CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF),
+            CodeChunksSearchOptions(strategy=ChunkSearchStrategy.BINARY),
+        ],
+    )
+    async def test_statement_text_does_not_depend_on_the_vector_count(self, monkeypatch, options):
+        store = TortoiseCodeChunksStore()
+        statements = set()
+
+        for n in (1, 2, 5):
+            captured = {}
+            monkeypatch.setattr(
+                repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+            )
+            await store.get_user_repo_chunks_multi("u", "r", [[0.1] * 768] * n, 768, limit=5, options=options)
+            statements.add(captured["sql"])
+            assert len(captured["params"][0]) == n
+
+        # one statement to prepare per connection, whatever the number of query vectors
+        assert len(statements) == 1
+
+    @pytest.mark.asyncio
+    async def test_multi_repo_and_hybrid_statements_are_fixed_too(self, monkeypatch):
+        store = TortoiseCodeChunksStore()
+        multi, hybrid = set(), set()
+
+        for n in (1, 3):
+            captured = {}
+            monkeypatch.setattr(
+                repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+            )
+            vectors = [[0.1] * 768] * n
+            await store.get_user_repos_chunks_multi("u", ["r1", "r2"], vectors, 768, limit=5)
+            multi.add(captured["sql"])
+            await store.get_user_repo_chunks_hybrid("u", "r", "parse", vectors, 768, limit=5)
+            hybrid.add(captured["sql"])
+
+        assert len(multi) == 1 and len(hybrid) == 1
+
+
+class TestHalfVecStore:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("strategy", [ChunkSearchStrategy.EXACT, ChunkSearchStrategy.CANDIDATES])
+    async def test_query_vectors_are_cast_to_halfvec(self, monkeypatch, strategy):
+        store = repo_mod.TortoiseHalfVecCodeChunksStore()
+        captured = {}
+        monkeypatch.setattr(
+            repo_mod, "PgVectorConnection", TestGetUserRepoChunksMultiCandidates._capturing_conn(captured)
+        )
+
+        await store.get_user_repo_chunks_multi(
+            user_id="u",
+            repo_id="r",
+            query_embeddings=[[0.1] * 768, [0.2] * 768],
+            emb_dim=768,
+            limit=5,
+            options=CodeChunksSearchOptions(strategy=strategy),
+        )
+
+        assert "unnest($1::halfvec(768)[])" in captured["sql"]
+        assert "::vector(" not in captured["sql"]
+
+    def test_default_store_keeps_vector_casts(self):
+        sql = TortoiseCodeChunksStore._build_exact_search_sql(768)
+        assert "unnest($1::vector(768)[])" in sql
+
+    def test_streamed_halfvec_embeddings_are_decoded_to_float32(self):
+        import numpy as np
+
+        class HalfVectorLike:
+            def to_numpy(self):
+                return np.array([0.5, 0.25], dtype=">f2")
+
+        dto = TortoiseCodeChunksStore._record_to_dto({"id": uuid.uuid4(), "embedding": HalfVectorLike()})
+        assert dto.embedding.dtype == np.float32
+        assert dto.embedding.tolist() == [0.5, 0.25]
@@ -0,0 +1,287 @@
+import math
+
+import pytest
+
+from models_src.dto.code_chunks import (
+    ChunkSearchStrategy,
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksRequestDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+)
+from models_src.repositories.code_chunks_cache import (
+    CachedCodeChunksStore,
+    SearchResultCache,
+    hash_query_embeddings,
+)
+from models_src.test_doubles.repositories.code_chunks import EMBED_DIM, FakeCodeChunksStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def unit_vector(index: int) -> list[float]:
+    v = [0.0] * EMBED_DIM
+    v[index] = 1.0
+    return v
+
+
+def make_chunk(repo_id="r1", index=0) -> CodeChunksRequestDTO:
+    return CodeChunksRequestDTO(
+        user_id="u1",
+        repo_id=repo_id,
+        content=f"chunk {index}",
+        file_name="main.py",
+        file_path="/main.py",
+        file_size=10,
+        commit_number="c1",
+        embedding=unit_vector(index),
+    )
+
+
+def search_calls(fake: FakeCodeChunksStore) -> int:
+    return sum(1 for name, _, _ in fake.received_calls if name == "get_user_repo_chunks_multi")
+
+
+async def search(store, repo_id="r1", index=0, limit=5, options=None):
+    return await store.get_user_repo_chunks_multi(
+        "u1", repo_id, [unit_vector(index)], EMBED_DIM, limit=limit, options=options
+    )
+
+
+class TestHashQueryEmbeddings:
+    def test_same_vectors_same_digest_lists_or_tuples(self):
+        assert hash_query_embeddings([[0.1, 0.2]]) == hash_query_embeddings([(0.1, 0.2)])
+
+    def test_order_and_split_matter(self):
+        assert hash_query_embeddings([[1.0], [2.0]]) != hash_query_embeddings([[2.0], [1.0]])
+        assert hash_query_embeddings([[1.0, 2.0]]) != hash_query_embeddings([[1.0], [2.0]])
+
+
+class TestSearchResultCache:
+    def test_lru_eviction(self):
+        cache = SearchResultCache(maxsize=2)
+        cache.put("a", "r1", [{"id": 1}])
+        cache.put("b", "r1", [{"id": 2}])
+        assert cache.get("a") == [{"id": 1}]  # "a" is now the most recently used
+        cache.put("c", "r2", [{"id": 3}])
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache.stats.evictions == 1
+
+    def test_ttl_expiration(self):
+        clock = FakeClock()
+        cache = SearchResultCache(ttl_seconds=10, clock=clock)
+        cache.put("a", "r1", [{"id": 1}])
+
+        clock.now = 9.9
+        assert cache.get("a") is not None
+        clock.now = 10.0
+        assert cache.get("a") is None
+        assert cache.stats.expirations == 1 and len(cache) == 0
+
+    def test_invalidate_repo_only_drops_that_repo(self):
+        cache = SearchResultCache()
+        cache.put("a", "r1", [{"id": 1}])
+        cache.put("b", "r1", [{"id": 2}])
+        cache.put("c", "r2", [{"id": 3}])
+
+        assert cache.invalidate_repo("r1") == 2
+        assert cache.get("a") is None and cache.get("b") is None
+        assert cache.get("c") == [{"id": 3}]
+        assert cache.stats.invalidations == 2
+
+    def test_returned_rows_are_copies(self):
+        cache = SearchResultCache()
+        rows = [{"id": 1, "metadata": {"lang": "py"}}]
+        cache.put("a", "r1", rows)
+        rows[0]["metadata"]["lang"] = "go"
+        cache.get("a")[0]["metadata"]["lang"] = "rs"
+        assert cache.get("a") == [{"id": 1, "metadata": {"lang": "py"}}]
+
+    def test_put_skips_rows_computed_before_an_invalidation(self):
+        cache = SearchResultCache()
+        generation = cache.generation(["r1", "*:u1"])
+        cache.invalidate_repo("r1")
+
+        assert cache.put("a", ["r1", "*:u1"], [{"id": 1}], generation=generation) is False
+        assert cache.get("a") is None and cache.stats.stale_fills == 1
+
+        generation = cache.generation("*:u1")
+        cache.invalidate_prefix("*:")
+        assert cache.put("b", "*:u1", [{"id": 1}], generation=generation) is False
+
+        assert cache.put("c", "r1", [{"id": 1}], generation=cache.generation("r1")) is True
+
+    @pytest.mark.parametrize("kwargs", [{"maxsize": 0}, {"ttl_seconds": 0}])
+    def test_rejects_invalid_bounds(self, kwargs):
+        with pytest.raises(ValueError):
+            SearchResultCache(**kwargs)
+
+
+@pytest.mark.asyncio
+class TestCachedCodeChunksStore:
+    async def test_repeated_search_is_served_from_the_cache(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk(index=0), make_chunk(index=1)])
+
+        first = await search(store)
+        second = await search(store)
+
+        assert first == second and first[0]["content"] == "chunk 0"
+        assert search_calls(fake) == 1
+        assert (store.stats.hits, store.stats.misses) == (1, 1)
+        assert math.isclose(store.stats.hit_rate, 0.5)
+
+    async def test_key_covers_vectors_limit_and_options(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk(index=0), make_chunk(index=1)])
+
+        await search(store)
+        await search(store, index=1)
+        await search(store, limit=1)
+        await search(store, options=CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES))
+
+        assert search_calls(fake) == 4 and store.stats.hits == 0
+
+    async def test_writes_invalidate_only_the_touched_repo(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk("r1", 0), make_chunk("r2", 0)])
+
+        await search(store, "r1")
+        await search(store, "r2")
+
+        await store.save(make_chunk("r1", 1))
+        await search(store, "r1")
+        await search(store, "r2")
+
+        assert search_calls(fake) == 3
+        assert store.stats.invalidations == 1
+
+        await store.bulk_save([make_chunk("r2", 2)])
+        await store.save_commit_file_diff(
+            CodeChunksFileDiffRequestDTO(user_id="u1", repo_id="r1", commit_number="c2")
+        )
+        await search(store, "r1")
+        await search(store, "r2")
+        assert search_calls(fake) == 5
+
+    async def test_all_repos_search_is_invalidated_by_a_write_to_any_repo_of_the_user(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk("r1", 0), make_chunk("r2", 1)])
+
+        async def search_all():
+            return await store.get_user_repos_chunks_multi("u1", None, [unit_vector(0)], EMBED_DIM)
+
+        async def search_r2():
+            return await store.get_user_repos_chunks_multi("u1", ["r2"], [unit_vector(0)], EMBED_DIM)
+
+        await search_all()
+        await search_r2()
+        await search_all()
+        await search_r2()
+        assert store.stats.hits == 2
+
+        await store.save(make_chunk("r1", 2))
+        assert store.stats.invalidations == 1  # the all repos entry, r2 wasn't touched
+
+        await search_all()
+        await search_r2()
+        assert store.stats.hits == 3
+
+    async def test_batch_only_sends_the_uncached_requests(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk("r1", 0), make_chunk("r2", 1)])
+
+        def request(repo_id, index):
+            return CodeChunksSearchRequestDTO(
+                user_id="u1", repo_id=repo_id, query_embeddings=[unit_vector(index)], limit=5
+            )
+
+        single = await search(store, "r1")
+        out = await store.batch_get_user_repo_chunks_multi([request("r2", 1), request("r1", 0)], EMBED_DIM)
+
+        assert out[1] == single and out[0][0]["content"] == "chunk 1"
+        batched = [kwargs["requests"] for name, _, kwargs in fake.received_calls if name.startswith("batch")]
+        assert batched == [[request("r2", 1)]]
+
+        # cached per request, so the single call is now served from the batch result
+        await search(store, "r2", index=1)
+        assert search_calls(fake) == 1
+
+    async def test_deleting_a_repo_drops_its_results_and_every_all_repos_result(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk("r1", 0), make_chunk("r2", 0)])
+
+        await search(store, "r1")
+        await search(store, "r2")
+        await store.get_user_repos_chunks_multi("u1", None, [unit_vector(0)], EMBED_DIM)
+
+        assert await store.delete_all_by_repo_id("r1") == 1
+        assert store.stats.invalidations == 2
+        assert len(store.cache) == 1  # r2's result
+
+    async def test_purge_drops_the_repo_results_after_every_batch(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk("r1", 0), make_chunk("r1", 1), make_chunk("r2", 0)])
+        await search(store, "r1")
+        await search(store, "r2")
+        reported = []
+
+        progress = await store.purge_repo_chunks("r1", batch_size=1, pause=0, on_progress=reported.append)
+
+        assert progress.deleted_count == 2 and progress.done
+        assert [p.deleted_count for p in reported] == [1, 2, 2]
+        assert len(store.cache) == 1  # r2's result
+        assert await search(store, "r1") == []
+
+    async def test_write_during_a_search_keeps_its_rows_out_of_the_cache(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await fake.bulk_save([make_chunk(index=0)])
+        search_multi = fake.get_user_repo_chunks_multi
+
+        async def search_then_write(*args, **kwargs):
+            rows = await search_multi(*args, **kwargs)
+            # the write lands while the search is in flight
+            await store.bulk_save([make_chunk(index=1)])
+            return rows
+
+        fake.get_user_repo_chunks_multi = search_then_write
+        stale = await search(store, index=1)
+        fake.get_user_repo_chunks_multi = search_multi
+
+        assert [r["content"] for r in stale] == ["chunk 0"]
+        assert len(store.cache) == 0 and store.stats.stale_fills == 1
+        assert (await search(store, index=1))[0]["content"] == "chunk 1"
+
+    async def test_empty_results_are_not_cached(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+
+        assert await search(store) == []
+        assert await search(store) == []
+        assert search_calls(fake) == 2 and len(store.cache) == 0
+
+    async def test_other_methods_are_delegated(self):
+        fake = FakeCodeChunksStore()
+        store = CachedCodeChunksStore(fake, SearchResultCache())
+        await store.bulk_copy_save([make_chunk()])
+
+        assert len(await store.find_all_by_repo_id_with_limit("r1")) == 1
+        assert len([c async for c in store.stream_all_by_repo_id("r1")]) == 1
+        assert await store.get_repo_file_chunks("u1", "r1", file_name="main") == [{"content": "chunk 0"}]
+        assert await store.get_repo_file_content("u1", "r1", "/main.py") == "chunk 0"
@@ -0,0 +1,74 @@
+import datetime
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from models_src.dto.code_chunks import CodeChunksSearchOptions
+from models_src.repositories.code_chunks_cursor import (
+    SearchCursor,
+    decode_search_cursor,
+    encode_search_cursor,
+    next_search_cursor,
+    resolve_search_cursor,
+    rows_after,
+)
+
+NOW = datetime.datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc)
+
+
+def row(fusion_score, max_sim=0.5, created_at=NOW, row_id=None):
+    return {"id": row_id or uuid.uuid4(), "created_at": created_at, "fusion_score": fusion_score, "max_sim": max_sim}
+
+
+class TestSearchCursorEncoding:
+    def test_round_trip_is_exact(self):
+        last = row(1 / 3, 0.1 + 0.2)
+
+        cursor = decode_search_cursor(encode_search_cursor(last))
+
+        assert cursor == SearchCursor(1 / 3, 0.1 + 0.2, NOW, last["id"])
+
+    def test_missing_scores_rank_last(self):
+        # RRF scores come back from PostgreSQL as Decimal, rows without embedding have NULL scores
+        cursor = decode_search_cursor(encode_search_cursor(row(Decimal("0.0163934426"), None)))
+
+        assert cursor.fusion_score == pytest.approx(0.0163934426)
+        assert cursor.max_sim == float("-inf")
+
+    def test_token_is_opaque_and_url_safe(self):
+        token = encode_search_cursor(row(0.9))
+
+        assert token.isascii() and not set(token) & set("+/=")
+
+    @pytest.mark.parametrize("token", ["", "not a cursor", "WzEsIDJd", encode_search_cursor(row(0.9))[:-4]])
+    def test_invalid_tokens_raise_value_error(self, token):
+        with pytest.raises(ValueError):
+            decode_search_cursor(token)
+
+
+class TestSearchPagination:
+    def test_next_cursor_only_after_a_full_page(self):
+        rows = [row(0.9), row(0.8)]
+
+        assert next_search_cursor(rows, 2) == encode_search_cursor(rows[1])
+        assert next_search_cursor(rows, 3) is None
+        assert next_search_cursor([], 3) is None
+
+    def test_rows_after_keeps_the_rows_ranked_after_the_cursor(self):
+        low, high = uuid.UUID(int=1), uuid.UUID(int=2)
+        ranked = [row(0.9), row(0.5, row_id=high), row(0.5, row_id=low), row(0.1)]
+
+        page = rows_after(ranked, decode_search_cursor(encode_search_cursor(ranked[1])))
+
+        # ties on the scores and created_at are broken by id, descending
+        assert page == ranked[2:]
+        assert rows_after(ranked, None) == ranked
+
+    def test_resolve_rejects_diversified_pages(self):
+        after = encode_search_cursor(row(0.9))
+
+        assert resolve_search_cursor(CodeChunksSearchOptions()) is None
+        assert resolve_search_cursor(CodeChunksSearchOptions(after=after)).fusion_score == 0.9
+        with pytest.raises(ValueError):
+            resolve_search_cursor(CodeChunksSearchOptions(after=after, mmr_lambda=0.5))
@@ -0,0 +1,158 @@
+import asyncio
+import uuid
+
+import pytest
+
+from models_src.dto.code_chunks import CodeChunksRequestDTO
+from models_src.dto.repo import RepoResponseDTO
+from models_src.repositories.code_chunks_ingestion import (
+    CHUNK_ROW_OVERHEAD_BYTES,
+    CodeChunksIngestionPipeline,
+    estimate_chunk_bytes,
+)
+from models_src.test_doubles.repositories.code_chunks import FakeCodeChunksStore
+from models_src.test_doubles.repositories.repo import FakeRepoStore
+
+
+def make_chunk(i, file_path=None, content="x" * 100, embedding=(0.5,) * 8):
+    return CodeChunksRequestDTO(
+        user_id="u1",
+        repo_id="r1",
+        content=content,
+        file_name="f.py",
+        file_path=file_path or f"src/{i // 3}.py",
+        file_size=len(content),
+        commit_number="c1",
+        embedding=list(embedding) if embedding is not None else None,
+    )
+
+
+async def stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class SlowStore(FakeCodeChunksStore):
+    """Tracks the concurrent writes and how far the producer ran ahead of them."""
+
+    def __init__(self, produced):
+        super().__init__()
+        self.produced = produced
+        self.active = self.max_active = 0
+        self.max_ahead = 0
+
+    async def bulk_copy_save(self, create_model):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.max_ahead = max(self.max_ahead, self.produced[0] - len(self.data_store))
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return await super().bulk_copy_save(create_model)
+
+
+def test_estimate_chunk_bytes():
+    assert estimate_chunk_bytes(make_chunk(0, content="é", embedding=None)) == 2 + CHUNK_ROW_OVERHEAD_BYTES
+    assert estimate_chunk_bytes(make_chunk(0, content="", embedding=[0.0] * 768)) == 3072 + CHUNK_ROW_OVERHEAD_BYTES
+
+
+@pytest.mark.asyncio
+class TestCodeChunksIngestionPipeline:
+    async def test_batches_by_rows_and_pushes_repo_counters(self):
+        store, repo_store = FakeCodeChunksStore(), FakeRepoStore()
+        repo = RepoResponseDTO(id=uuid.uuid4(), user_id="u1", repo_id="r1", total_files=0, total_chunks=0)
+        repo_store.set_fake_data([repo])
+        reported = []
+        chunks = [make_chunk(i) for i in range(10)] + [make_chunk(10, embedding=None)]
+
+        progress = await CodeChunksIngestionPipeline(
+            store, writers=2, max_batch_rows=4, repo_store=repo_store, repo_id=str(repo.id), on_progress=reported.append
+        ).run(stream(chunks))
+
+        assert (progress.rows, progress.embeddings, progress.files, progress.batches) == (11, 10, 4, 3)
+        assert progress.done and reported[-1] == progress
+        assert sorted(c.content for c in store.data_store) == sorted(c.content for c in chunks)
+        assert sorted(len(call[2]["create_model"]) for call in store.received_calls) == [3, 4, 4]
+        assert (repo.total_files, repo.total_chunks, repo.total_embeddings) == (4, 11, 10)
+
+    async def test_a_new_run_restarts_the_repo_counters(self):
+        repo_store = FakeRepoStore()
+        repo = RepoResponseDTO(id=uuid.uuid4(), user_id="u1", repo_id="r1", total_files=0, total_chunks=0)
+        repo_store.set_fake_data([repo])
+        chunks = [make_chunk(i) for i in range(6)]
+
+        for _ in range(2):
+            await CodeChunksIngestionPipeline(
+                FakeCodeChunksStore(), max_batch_rows=4, repo_store=repo_store, repo_id=str(repo.id)
+            ).run(stream(chunks))
+        assert (repo.total_files, repo.total_chunks, repo.total_embeddings) == (2, 6, 6)
+
+        await CodeChunksIngestionPipeline(
+            FakeCodeChunksStore(), repo_store=repo_store, repo_id=str(repo.id), reset_repo_counters=False
+        ).run(stream(chunks[:3]))
+        assert (repo.total_files, repo.total_chunks, repo.total_embeddings) == (3, 9, 9)
+
+    async def test_byte_budget_closes_batches_early(self):
+        store = FakeCodeChunksStore()
+        chunk_bytes = estimate_chunk_bytes(make_chunk(0))
+
+        progress = await CodeChunksIngestionPipeline(
+            store, writers=1, max_batch_rows=100, max_batch_bytes=2 * chunk_bytes, use_copy=False
+        ).run(stream([make_chunk(i) for i in range(5)]))
+
+        assert progress.batches == 3 and progress.bytes == 5 * chunk_bytes
+        assert [name for name, _, _ in store.received_calls] == ["bulk_save"] * 3
+
+    async def test_writes_overlap_and_the_producer_is_held_back(self):
+        produced = [0]
+        store = SlowStore(produced)
+
+        async def counting_stream():
+            for i in range(40):
+                produced[0] += 1
+                yield make_chunk(i)
+
+        pipeline = CodeChunksIngestionPipeline(store, writers=3, max_batch_rows=2)
+        await pipeline.run(counting_stream())
+
+        assert store.max_active == 3
+        # one batch being filled, 3 queued, 3 being written
+        assert store.max_ahead <= (2 * 3 + 1) * 2
+        assert len(store.data_store) == 40
+
+    async def test_a_failing_write_stops_the_run(self):
+        store = FakeCodeChunksStore()
+        store.set_exception(store.bulk_copy_save, RuntimeError("db down"))
+
+        with pytest.raises(RuntimeError, match="db down"):
+            await CodeChunksIngestionPipeline(store, writers=2, max_batch_rows=1).run(
+                stream([make_chunk(i) for i in range(20)])
+            )
+
+    async def test_the_other_failures_are_logged(self, caplog):
+        class FailingStore(FakeCodeChunksStore):
+            async def bulk_copy_save(self, create_model):
+                await asyncio.sleep(0)
+                raise RuntimeError(f"db down {create_model[0].content}")
+
+        chunks = [make_chunk(i, content=str(i)) for i in range(2)]
+        with caplog.at_level("ERROR"), pytest.raises(RuntimeError, match="db down") as raised:
+            await CodeChunksIngestionPipeline(FailingStore(), writers=2, max_batch_rows=1).run(stream(chunks))
+
+        logged = [record.exc_info[1] for record in caplog.records if record.exc_info]
+        assert len(logged) == 1 and str(logged[0]) != str(raised.value)
+
+    async def test_a_failing_stream_stops_the_run(self):
+        async def broken():
+            yield make_chunk(0)
+            raise ValueError("embedding failed")
+
+        with pytest.raises(ValueError, match="embedding failed"):
+            await CodeChunksIngestionPipeline(FakeCodeChunksStore()).run(broken())
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [{"writers": 0}, {"max_batch_rows": 0}, {"max_batch_bytes": 0}, {"repo_store": FakeRepoStore()}],
+    )
+    async def test_invalid_arguments(self, kwargs):
+        with pytest.raises(ValueError):
+            CodeChunksIngestionPipeline(FakeCodeChunksStore(), **kwargs)
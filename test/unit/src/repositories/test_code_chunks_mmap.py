@@ -0,0 +1,389 @@
+import asyncio
+import fcntl
+import uuid
+
+import numpy as np
+import pytest
+
+from models_src.dto.code_chunks import (
+    ChunkFusion,
+    ChunkProjection,
+    ChunkSearchStrategy,
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksRequestDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+    FileLookupMode,
+    compute_content_hash,
+)
+from models_src.repositories.code_chunks_cursor import next_search_cursor
+from models_src.repositories.code_chunks_mmap import EMBEDDINGS_FILE, LOCK_FILE, SIDECAR_FILE, MmapCodeChunksStore
+
+DIM = 4
+
+
+def chunk(content, embedding, repo_id="r1", user_id="u1", file_name="a.py", chunk_ordinal=None):
+    return CodeChunksRequestDTO(
+        user_id=user_id,
+        repo_id=repo_id,
+        content=content,
+        file_name=file_name,
+        file_path=f"src/{file_name}",
+        file_size=len(content),
+        commit_number="c1",
+        embedding=embedding,
+        metadata={"lang": "py"},
+        chunk_ordinal=chunk_ordinal,
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MmapCodeChunksStore(tmp_path, dim=DIM)
+
+
+@pytest.mark.asyncio
+class TestMmapCodeChunksStoreSave:
+    async def test_bulk_save_round_trip(self, store, tmp_path):
+        saved = await store.bulk_save([chunk("one", [1, 0, 0, 0]), chunk("two", None)])
+
+        assert saved[0].content_hash == compute_content_hash("one")
+        assert (tmp_path / EMBEDDINGS_FILE).stat().st_size == 2 * DIM * 4
+
+        found = await store.find_all_by_repo_id_with_limit("r1")
+        assert [c.id for c in found] == [c.id for c in saved]
+        assert found[0].embedding.tolist() == [1, 0, 0, 0] and found[1].embedding is None
+        assert found[0].metadata == {"lang": "py"}
+        assert found[0].created_at == saved[0].created_at
+
+    async def test_rejects_wrong_dimension(self, store):
+        with pytest.raises(ValueError):
+            await store.save(chunk("bad", [1, 0]))
+        assert await store.find_all_by_repo_id_with_limit("r1") == []
+
+    async def test_deletes_are_tombstoned(self, store, tmp_path):
+        kept, doomed = await store.bulk_save([chunk("kept", [1, 0, 0, 0], repo_id="r2"), chunk("gone", [1, 0, 0, 0])])
+        other = MmapCodeChunksStore(tmp_path, dim=DIM)
+        assert len(await other.find_all_by_repo_id_with_limit("r1")) == 1
+
+        assert await store.delete_all_by_repo_id("r1") == 1
+        assert await store.delete_all_by_repo_id("r1") == 0
+
+        # the other process drops the chunk on its next call
+        assert await other.find_all_by_repo_id_with_limit("r1") == []
+        assert await other.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0]], DIM) == []
+        assert await other.fetch_contents_by_ids("u1", [doomed.id, kept.id]) == [
+            {"id": kept.id, "file_name": "a.py", "file_path": "src/a.py", "content": "kept"}
+        ]
+        assert (await other.get_repo_chunk_stats("r1")).chunk_count == 0
+
+    async def test_purge_in_batches(self, store):
+        await store.bulk_save([chunk(f"c{i}", [1, 0, 0, 0]) for i in range(5)] + [chunk("r2", None, repo_id="r2")])
+        reported = []
+
+        progress = await store.purge_repo_chunks("r1", batch_size=2, pause=0, on_progress=reported.append)
+
+        assert (progress.deleted_count, progress.batches, progress.total_estimate) == (5, 3, 5)
+        assert [p.deleted_count for p in reported] == [2, 4, 5, 5] and reported[-1].done
+        assert await store.find_all_by_repo_id_with_limit("r1") == []
+        assert len(await store.find_all_by_repo_id_with_limit("r2")) == 1
+
+    async def test_commit_file_diff(self, store):
+        await store.bulk_save(
+            [chunk("old a", [1, 0, 0, 0]), chunk("old b", [0, 1, 0, 0], file_name="b.py"), chunk("c", None, file_name="c.py")]
+        )
+        diff = CodeChunksFileDiffRequestDTO(
+            user_id="u1",
+            repo_id="r1",
+            commit_number="c2",
+            changed_file_paths={"src/a.py"},
+            deleted_file_paths={"src/b.py"},
+            chunks=[CodeChunksRequestDTO(**{**vars(chunk("new a", [0, 0, 1, 0])), "commit_number": "c2"})],
+        )
+
+        result = await store.save_commit_file_diff(diff)
+
+        assert result.deleted_count == 2 and [c.content for c in result.saved] == ["new a"]
+        assert sorted(c.content for c in await store.find_all_by_repo_id_with_limit("r1")) == ["c", "new a"]
+        stats = await store.get_repo_chunk_stats("r1")
+        assert (stats.chunk_count, stats.file_count) == (2, 2)
+
+    async def test_partial_embedding_row_is_truncated(self, store, tmp_path):
+        await store.save(chunk("first", [1, 0, 0, 0]))
+        # a writer crashed in the middle of a row
+        with open(tmp_path / EMBEDDINGS_FILE, "ab") as embeddings:
+            embeddings.write(b"\x00" * 6)
+
+        await store.save(chunk("second", [0, 1, 0, 0]))
+
+        assert (tmp_path / EMBEDDINGS_FILE).stat().st_size == 2 * DIM * 4
+        out = await store.get_user_repo_chunks_multi("u1", "r1", [[0, 1, 0, 0]], DIM, limit=1)
+        assert out[0]["content"] == "second" and out[0]["max_sim"] == pytest.approx(1.0)
+
+    async def test_partial_sidecar_line_is_truncated(self, store, tmp_path):
+        await store.save(chunk("first", [1, 0, 0, 0]))
+        # a writer crashed in the middle of a line
+        with open(tmp_path / SIDECAR_FILE, "ab") as sidecar:
+            sidecar.write(b'{"id": "half')
+
+        await store.save(chunk("second", [0, 1, 0, 0]))
+
+        lines = (tmp_path / SIDECAR_FILE).read_bytes().splitlines()
+        assert len(lines) == 2 and not lines[1].startswith(b'{"id": "half')
+        out = await MmapCodeChunksStore(tmp_path, dim=DIM).get_user_repo_chunks_multi("u1", "r1", [[0, 1, 0, 0]], DIM)
+        assert [r["content"] for r in out] == ["second", "first"]
+
+    async def test_a_held_lock_does_not_block_the_event_loop(self, store, tmp_path):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.001)
+
+        with open(tmp_path / LOCK_FILE, "rb") as lock:
+            # another writer holds the lock
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            save = asyncio.create_task(store.save(chunk("waiting", [1, 0, 0, 0])))
+            clock = asyncio.create_task(ticker())
+            await asyncio.sleep(0.05)
+            assert not save.done() and len(ticks) > 5
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+        assert (await save).content == "waiting"
+        clock.cancel()
+
+    async def test_stream_projects_columns(self, store):
+        await store.bulk_save([chunk(f"c{i}", [1, i, 0, 0]) for i in range(5)])
+
+        rows = [r async for r in store.stream_all_by_repo_id("r1", fetch_size=2, columns=["id", "content"])]
+
+        assert [r.content for r in rows] == [f"c{i}" for i in range(5)]
+        assert all(r.embedding is None and r.file_name is None for r in rows)
+
+    async def test_lookups(self, store):
+        saved = await store.bulk_save(
+            [
+                chunk("readme v1", [1, 0, 0, 0], file_name="README.md"),
+                chunk("code", [0, 1, 0, 0]),
+                chunk("readme v2", [1, 0, 0, 0], file_name="README.md"),
+            ]
+        )
+
+        assert await store.get_repo_file_chunks("u1", "r1", "readme") in (
+            [{"content": "readme v2"}, {"content": "readme v1"}],
+            [{"content": "readme v1"}, {"content": "readme v2"}],
+        )
+        contents = await store.fetch_contents_by_ids("u1", [saved[1].id, uuid.uuid4(), saved[0].id])
+        assert [c["content"] for c in contents] == ["code", "readme v1"]
+        assert await store.fetch_contents_by_ids("other", [saved[0].id]) == []
+
+        found = await store.find_embeddings_by_content_hashes([compute_content_hash("code"), "missing"])
+        assert list(found) == [compute_content_hash("code")]
+
+    async def test_content_hash_lookup_skips_deleted_and_other_users(self, store):
+        first = await store.save(chunk("same", [1, 0, 0, 0]))
+        await store.save(chunk("same", [0, 1, 0, 0], repo_id="r2"))
+        content_hash = compute_content_hash("same")
+
+        assert list((await store.find_embeddings_by_content_hashes([content_hash]))[content_hash]) == [1, 0, 0, 0]
+        assert await store.find_embeddings_by_content_hashes([content_hash], user_id="other") == {}
+
+        await store.delete_all_by_repo_id("r1")
+        assert first.id not in {c.id for c in await store.find_all_by_repo_id_with_limit("r1")}
+        assert list((await store.find_embeddings_by_content_hashes([content_hash]))[content_hash]) == [0, 1, 0, 0]
+        await store.delete_all_by_repo_id("r2")
+        assert await store.find_embeddings_by_content_hashes([content_hash]) == {}
+
+    async def test_chunk_stats_include_other_writers(self, store, tmp_path):
+        await store.bulk_save([chunk("one", [1, 0, 0, 0]), chunk("two", None, file_name="b.py")])
+        # chunks written by another process are counted on the next read
+        await MmapCodeChunksStore(tmp_path, dim=DIM).save(chunk("three", [0, 1, 0, 0]))
+
+        stats = await store.get_repo_chunk_stats("r1")
+
+        assert (stats.chunk_count, stats.embedded_count, stats.content_bytes, stats.file_count) == (3, 2, 11, 2)
+        assert (await store.get_commit_chunk_stats("r1", "c1")).chunk_count == 3
+        assert await store.get_repo_chunk_stats("r2") is None
+
+    async def test_file_lookup_modes_and_reassembly(self, store):
+        await store.bulk_save(
+            [
+                chunk("world", None, file_name="Main.py", chunk_ordinal=1),
+                chunk("hello ", None, file_name="Main.py", chunk_ordinal=0),
+                chunk("x", None, file_name="main_test.py", chunk_ordinal=0),
+            ]
+        )
+
+        exact = await store.get_repo_file_chunks("u1", "r1", "main.py", mode=FileLookupMode.EXACT)
+        assert exact == [
+            {"file_path": "src/Main.py", "chunk_ordinal": 0, "content": "hello "},
+            {"file_path": "src/Main.py", "chunk_ordinal": 1, "content": "world"},
+        ]
+        prefix = await store.get_repo_file_chunks("u1", "r1", "MAIN", mode=FileLookupMode.PREFIX)
+        assert [r["content"] for r in prefix] == ["hello ", "world", "x"]
+
+        assert await store.get_repo_file_content("u1", "r1", "src/Main.py") == "hello world"
+        assert await store.get_repo_file_content("u1", "r1", "src/none.py") is None
+
+
+@pytest.mark.asyncio
+class TestMmapCodeChunksStoreSearch:
+    async def test_exact_search_ranks_by_summed_cosine(self, store):
+        await store.bulk_save(
+            [
+                chunk("near", [1, 0, 0, 0]),
+                chunk("mid", [1, 1, 0, 0]),
+                chunk("far", [0, 0, 1, 0]),
+                chunk("empty", None),
+                chunk("other repo", [1, 0, 0, 0], repo_id="r2"),
+            ]
+        )
+
+        out = await store.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0]], DIM, limit=10)
+
+        assert [r["content"] for r in out] == ["near", "mid", "far"]
+        assert out[0]["fusion_score"] == pytest.approx(1.0)
+        assert out[1]["max_sim"] == pytest.approx(np.sqrt(0.5))
+        assert out[0]["file_path"] == "src/a.py" and out[0]["content"] == "near"
+
+    async def test_candidates_and_projection(self, store):
+        await store.bulk_save([chunk("x", [1, 0, 0, 0]), chunk("y", [0, 1, 0, 0]), chunk("z", [0, 0, 1, 0])])
+        options = CodeChunksSearchOptions(
+            strategy=ChunkSearchStrategy.CANDIDATES,
+            candidates_per_query=2,
+            fusion=ChunkFusion.RRF,
+            projection=ChunkProjection.IDS,
+        )
+
+        out = await store.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0], [0, 1, 0, 0]], DIM, limit=2, options=options)
+
+        assert len(out) == 2 and "content" not in out[0]
+        ids = {r["id"] for r in out}
+        contents = await store.fetch_contents_by_ids("u1", ids)
+        assert {c["content"] for c in contents} == {"x", "y"}
+
+    async def test_diversified_search(self, store):
+        await store.bulk_save(
+            [
+                chunk("a0", [1, 0, 0, 0], file_name="a.py"),
+                chunk("a1", [1, 0.05, 0, 0], file_name="a.py"),
+                chunk("b0", [1, 1, 0, 0], file_name="b.py"),
+            ]
+        )
+        query = [[1, 0, 0, 0]]
+
+        plain = await store.get_user_repo_chunks_multi("u1", "r1", query, DIM, limit=2)
+        capped = await store.get_user_repo_chunks_multi(
+            "u1", "r1", query, DIM, limit=2, options=CodeChunksSearchOptions(max_chunks_per_file=1)
+        )
+
+        assert [r["content"] for r in plain] == ["a0", "a1"]
+        assert [r["content"] for r in capped] == ["a0", "b0"]
+
+        # the multi repo and hybrid searches aren't diversified, they reject the options
+        diversified = CodeChunksSearchOptions(max_chunks_per_file=1)
+        assert await store.get_user_repos_chunks_multi("u1", None, query, DIM, options=diversified) == []
+        assert await store.get_user_repo_chunks_hybrid("u1", "r1", "a0", query, DIM, options=diversified) == []
+
+    async def test_paginated_search(self, store):
+        await store.bulk_save([chunk(f"c{i}", [1, i % 2, 0, 0]) for i in range(5)])
+        query = [[1, 0, 0, 0]]
+        everything = await store.get_user_repo_chunks_multi("u1", "r1", query, DIM, limit=5)
+
+        first = await store.get_user_repo_chunks_multi("u1", "r1", query, DIM, limit=3)
+        options = CodeChunksSearchOptions(after=next_search_cursor(first, 3))
+        second = await store.get_user_repo_chunks_multi("u1", "r1", query, DIM, limit=3, options=options)
+
+        assert [r["id"] for r in first + second] == [r["id"] for r in everything]
+        assert next_search_cursor(second, 3) is None
+
+    async def test_min_similarity(self, store):
+        await store.bulk_save([chunk("same", [1, 0, 0, 0]), chunk("close", [1, 1, 0, 0]), chunk("far", [0, 1, 0, 0])])
+        options = CodeChunksSearchOptions(strategy=ChunkSearchStrategy.CANDIDATES, candidates_per_query=2, min_similarity=0.5)
+
+        out = await store.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0]], DIM, limit=2, options=options)
+
+        assert [r["content"] for r in out] == ["same", "close"]
+        # the 2 candidates of the query vector both pass
+        assert (store.similarity_pruning_stats.scored, store.similarity_pruning_stats.pruned) == (2, 0)
+
+        await store.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0]], DIM, options=CodeChunksSearchOptions(min_similarity=0.9))
+        assert (store.similarity_pruning_stats.scored, store.similarity_pruning_stats.pruned) == (5, 2)
+
+    async def test_hybrid_search(self, store):
+        await store.bulk_save(
+            [
+                chunk("def parse_config(): pass", [0, 1, 0, 0]),
+                chunk("unrelated", [1, 0, 0, 0]),
+                chunk("parse config parse", None),
+            ]
+        )
+
+        out = await store.get_user_repo_chunks_hybrid("u1", "r1", "Parse config", [[1, 0, 0, 0]], DIM, limit=3)
+        lexical_only = await store.get_user_repo_chunks_hybrid("u1", "r1", "parse config", [], DIM, limit=3)
+
+        # ranks: "unrelated" 1st by vector, "parse config parse" 1st by text, the other one 2nd on both
+        assert [r["content"] for r in out] == ["def parse_config(): pass", "unrelated", "parse config parse"]
+        assert out[2]["max_sim"] is None
+        assert [r["content"] for r in lexical_only] == ["parse config parse", "def parse_config(): pass"]
+        assert await store.get_user_repo_chunks_hybrid(
+            "u1", "r1", "parse", [[1, 0, 0, 0]], DIM, options=CodeChunksSearchOptions(min_similarity=0.1)
+        ) == []
+
+    async def test_invalid_input_returns_empty(self, store):
+        await store.save(chunk("x", [1, 0, 0, 0]))
+
+        assert await store.get_user_repo_chunks_multi("u1", "r1", [[1, 0]], 2) == []
+        assert await store.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0]], DIM, limit=0) == []
+        assert await store.get_user_repos_chunks_multi("u1", None, [[1, 0, 0, 0]], DIM, per_repo_limit=0) == []
+
+    async def test_multi_repo_search_with_per_repo_limit(self, store):
+        await store.bulk_save(
+            [
+                chunk("r1 a", [1, 0, 0, 0]),
+                chunk("r1 b", [1, 0.1, 0, 0]),
+                chunk("r2 a", [1, 0.2, 0, 0], repo_id="r2"),
+                chunk("r3 a", [1, 0, 0, 0], repo_id="r3"),
+            ]
+        )
+
+        out = await store.get_user_repos_chunks_multi(
+            "u1", ["r1", "r2"], [[1, 0, 0, 0]], DIM, limit=10, per_repo_limit=1
+        )
+
+        assert [(r["repo_id"], r["content"]) for r in out] == [("r1", "r1 a"), ("r2", "r2 a")]
+
+    async def test_batch_search(self, store):
+        await store.bulk_save([chunk("a", [1, 0, 0, 0]), chunk("b", [0, 1, 0, 0], repo_id="r2")])
+
+        out = await store.batch_get_user_repo_chunks_multi(
+            [
+                CodeChunksSearchRequestDTO("u1", "r1", [[1, 0, 0, 0]]),
+                CodeChunksSearchRequestDTO("u1", "r2", [[1, 0, 0, 0]]),
+            ],
+            DIM,
+        )
+
+        assert [[r["content"] for r in rows] for rows in out] == [["a"], ["b"]]
+
+    async def test_stores_share_one_directory(self, tmp_path):
+        writer, reader = MmapCodeChunksStore(tmp_path, dim=DIM), MmapCodeChunksStore(tmp_path, dim=DIM)
+        await writer.save(chunk("first", [1, 0, 0, 0]))
+
+        assert [r["content"] for r in await reader.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0]], DIM)] == [
+            "first"
+        ]
+
+        await writer.save(chunk("second", [0, 1, 0, 0]))
+        out = await reader.get_user_repo_chunks_multi("u1", "r1", [[0, 1, 0, 0]], DIM)
+        assert [r["content"] for r in out] == ["second", "first"]
+
+    async def test_partially_written_line_is_not_visible(self, store, tmp_path):
+        await store.save(chunk("done", [1, 0, 0, 0]))
+        with open(tmp_path / "chunks.jsonl", "ab") as sidecar:
+            sidecar.write(b'{"id": "half')
+
+        out = await store.get_user_repo_chunks_multi("u1", "r1", [[1, 0, 0, 0]], DIM)
+
+        assert [r["content"] for r in out] == ["done"]
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from models_src.dto.code_chunks import CodeChunksSearchOptions
+from models_src.repositories.code_chunks_mmr import diversify_search_rows, mmr_select, resolve_mmr_pool_size
+
+
+def unit(*components):
+    v = np.array(components, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+class TestResolveMmrPoolSize:
+    def test_off_without_lambda_or_per_file_cap(self):
+        assert resolve_mmr_pool_size(CodeChunksSearchOptions(), 10) is None
+
+    def test_default_and_explicit_pool(self):
+        assert resolve_mmr_pool_size(CodeChunksSearchOptions(mmr_lambda=0.5), 5) == 40
+        assert resolve_mmr_pool_size(CodeChunksSearchOptions(max_chunks_per_file=1), 20) == 80
+        assert resolve_mmr_pool_size(CodeChunksSearchOptions(mmr_lambda=0.5, mmr_pool_size=12), 10) == 12
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            CodeChunksSearchOptions(mmr_lambda=1.5),
+            CodeChunksSearchOptions(mmr_lambda=-0.1),
+            CodeChunksSearchOptions(max_chunks_per_file=0),
+            CodeChunksSearchOptions(mmr_lambda=0.5, mmr_pool_size=5),
+        ],
+    )
+    def test_rejects_invalid_options(self, options):
+        with pytest.raises(ValueError):
+            resolve_mmr_pool_size(options, 10)
+
+
+class TestMmrSelect:
+    def test_lambda_one_keeps_the_relevance_order(self):
+        embeddings = [unit(1, 0), unit(1, 0.01), unit(0, 1)]
+
+        assert mmr_select([0.9, 0.8, 0.1], embeddings, 3, mmr_lambda=1.0) == [0, 1, 2]
+
+    def test_near_duplicates_give_way_to_novel_rows(self):
+        embeddings = [unit(1, 0), unit(1, 0.01), unit(0, 1)]
+
+        assert mmr_select([0.9, 0.85, 0.5], embeddings, 2, mmr_lambda=0.5) == [0, 2]
+
+    def test_per_group_cap(self):
+        embeddings = [unit(1, 0), unit(0.9, 0.1), unit(0.8, 0.2), unit(0, 1)]
+
+        picked = mmr_select([4, 3, 2, 1], embeddings, 3, groups=["a", "a", "b", "b"], max_per_group=1)
+
+        assert picked == [0, 2]
+
+    def test_rows_without_embedding_or_score(self):
+        assert mmr_select([float("-inf"), 0.2], [None, unit(1, 0)], 2, mmr_lambda=0.3) == [1, 0]
+        assert mmr_select([], [], 3) == []
+
+    def test_diversify_search_rows_uses_fusion_score_embedding_and_file_path(self):
+        rows = [
+            {"id": 1, "fusion_score": 0.9, "embedding": unit(1, 0), "file_path": "a.py"},
+            {"id": 2, "fusion_score": 0.8, "embedding": unit(0, 1), "file_path": "a.py"},
+            {"id": 3, "fusion_score": 0.7, "embedding": unit(1, 1), "file_path": "b.py"},
+        ]
+
+        out = diversify_search_rows(rows, 2, CodeChunksSearchOptions(max_chunks_per_file=1))
+
+        assert [r["id"] for r in out] == [1, 3]
@@ -0,0 +1,103 @@
+from models_src.dto.code_chunks import CodeChunksRequestDTO, CodeChunksStatsDTO
+from models_src.repositories.code_chunks_stats import (
+    CodeChunksStatsCounter,
+    chunk_stats_deltas,
+    code_chunks_stats_lock_params,
+    code_chunks_stats_rebuild_sql,
+    code_chunks_stats_update_params,
+    deleted_chunk_stats_deltas,
+    merge_chunk_stats_deltas,
+)
+
+
+def chunk(file_path, commit="c1", content="abc", embedding=(1.0,), repo_id="r"):
+    return CodeChunksRequestDTO(
+        user_id="u",
+        repo_id=repo_id,
+        content=content,
+        file_name=file_path,
+        file_path=file_path,
+        file_size=len(content),
+        commit_number=commit,
+        embedding=list(embedding) if embedding is not None else None,
+    )
+
+
+class TestDeltas:
+    def test_aggregates_per_repo_commit_and_file(self):
+        deltas = chunk_stats_deltas(
+            [chunk("a.py"), chunk("a.py", content="é", embedding=None), chunk("b.py", commit="c2")]
+        )
+
+        assert deltas == {("r", "c1", "a.py"): [2, 1, 5], ("r", "c2", "b.py"): [1, 1, 3]}
+
+    def test_merge_drops_the_keys_cancelling_out(self):
+        removed = deleted_chunk_stats_deltas(
+            [{"repo_id": "r", "commit_number": "c1", "file_path": "a.py", "chunks": 1, "embedded": 1, "bytes": 3}]
+        )
+
+        merged = merge_chunk_stats_deltas(removed, chunk_stats_deltas([chunk("a.py"), chunk("b.py")]))
+
+        assert merged == {("r", "c1", "b.py"): [1, 1, 3]}
+
+    def test_update_params_are_sorted_column_arrays(self):
+        params = code_chunks_stats_update_params(
+            {("r", "c2", "b.py"): [1, 0, 4], ("r", "c1", "a.py"): [-2, -1, -6]}
+        )
+
+        assert params == [["r", "r"], ["c1", "c2"], ["a.py", "b.py"], [-2, 1], [-1, 0], [-6, 4]]
+
+    def test_lock_params_are_the_sorted_distinct_repos(self):
+        params = code_chunks_stats_lock_params(
+            {("r2", "c1", "a.py"): [1, 0, 1], ("r1", "c1", "a.py"): [1, 0, 1], ("r2", "c2", "b.py"): [1, 0, 1]}
+        )
+
+        assert params == [["r1", "r2"]]
+
+    def test_rebuild_clears_then_recounts_the_repo(self):
+        statements = code_chunks_stats_rebuild_sql()
+
+        assert [s.split(" WHERE")[0] for s in statements[:3]] == [
+            "DELETE FROM public.code_chunks_file_stats",
+            "DELETE FROM public.code_chunks_commit_stats",
+            "DELETE FROM public.code_chunks_repo_stats",
+        ]
+        assert all("WHERE repo_id = $1" in s for s in statements)
+        assert "count(DISTINCT file_path)" in statements[-1]
+
+
+class TestCodeChunksStatsCounter:
+    def test_counts_distinct_files_per_commit_and_per_repo(self):
+        counter = CodeChunksStatsCounter()
+        counter.add([chunk("a.py"), chunk("a.py"), chunk("b.py", embedding=None)])
+        counter.add([chunk("a.py", commit="c2")])
+
+        assert counter.repo_stats("r") == CodeChunksStatsDTO(
+            repo_id="r", chunk_count=4, embedded_count=3, content_bytes=12, file_count=2
+        )
+        assert counter.commit_stats("r", "c1").file_count == 2
+        assert counter.commit_stats("r", "c2").file_count == 1
+        assert counter.repo_stats("other") is None
+
+    def test_deletes_move_the_file_counts_back(self):
+        counter = CodeChunksStatsCounter()
+        counter.add([chunk("a.py"), chunk("a.py", commit="c2"), chunk("b.py")])
+
+        # a.py still has chunks in c2
+        counter.add([chunk("a.py"), chunk("b.py")], sign=-1)
+
+        assert counter.commit_stats("r", "c1") == CodeChunksStatsDTO(repo_id="r", commit_number="c1")
+        repo = counter.repo_stats("r")
+        assert (repo.chunk_count, repo.file_count) == (1, 1)
+
+        counter.add([chunk("a.py", commit="c2")], sign=-1)
+        assert counter.repo_stats("r").file_count == 0
+
+    def test_drop_repo(self):
+        counter = CodeChunksStatsCounter()
+        counter.add([chunk("a.py"), chunk("a.py", repo_id="kept")])
+
+        counter.drop_repo("r")
+
+        assert counter.repo_stats("r") is None and counter.commit_stats("r", "c1") is None
+        assert counter.repo_stats("kept").chunk_count == 1
@@ -235,6 +235,50 @@ class TestUpdateAnalysisMetadataById:
         )
 
 
+class TestIncrementProgressCountersById:
+    @pytest.mark.asyncio
+    async def test_bad_or_empty_inputs(self):
+        store = TortoiseRepoStore()
+        assert await store.increment_progress_counters_by_id(" ", total_chunks=1) == -1
+        assert await store.increment_progress_counters_by_id("RID") == 0
+
+    @pytest.mark.asyncio
+    async def test_adds_in_one_update(self, monkeypatch):
+        store = TortoiseRepoStore()
+        qs = make_qs_chain(update_value=1)
+        model = MagicMock()
+        model.filter.return_value = qs
+        monkeypatch.setattr(store, "model", model)
+
+        assert await store.increment_progress_counters_by_id("RID", total_files=1, total_chunks=20, total_embeddings=18) == 1
+
+        model.filter.assert_called_once_with(id="RID")
+        updates = qs.update.await_args.kwargs
+        assert set(updates) == {"total_files", "total_chunks", "total_embeddings"}
+        # F("total_chunks") + 20, evaluated by the database
+        assert updates["total_chunks"].left.name == "total_chunks"
+        assert updates["total_chunks"].right.value == 20
+
+
+class TestResetProgressCountersById:
+    @pytest.mark.asyncio
+    async def test_bad_inputs(self):
+        assert await TortoiseRepoStore().reset_progress_counters_by_id(" ") == -1
+
+    @pytest.mark.asyncio
+    async def test_sets_the_counters_to_zero(self, monkeypatch):
+        store = TortoiseRepoStore()
+        qs = make_qs_chain(update_value=1)
+        model = MagicMock()
+        model.filter.return_value = qs
+        monkeypatch.setattr(store, "model", model)
+
+        assert await store.reset_progress_counters_by_id("RID") == 1
+
+        model.filter.assert_called_once_with(id="RID")
+        qs.update.assert_awaited_once_with(total_files=0, total_chunks=0, total_embeddings=0)
+
+
 class TestUpdateRepoSystemReferenceById:
     @pytest.mark.asyncio
     async def test_bad_inputs_return_minus1(self):
@@ -574,4 +618,3 @@ class TestFindByRepoIdUserIdIntegration:
         assert dto1.user_id == "user1"
         assert dto2.user_id == "user2"
         assert model.filter.call_count == 2
-
@@ -1,5 +1,4 @@
 import datetime
-import logging
 import math
 import random
 import uuid
@@ -8,13 +7,27 @@ from typing import List
 
 import pytest
 
-from models_src.dto.code_chunks import CodeChunksRequestDTO, CodeChunksResponseDTO
+from models_src.dto.code_chunks import (
+    ChunkFusion,
+    ChunkProjection,
+    ChunkSearchStrategy,
+    CodeChunksFileDiffRequestDTO,
+    CodeChunksFileDiffResponseDTO,
+    CodeChunksPurgeProgressDTO,
+    CodeChunksRequestDTO,
+    CodeChunksResponseDTO,
+    CodeChunksSearchOptions,
+    CodeChunksSearchRequestDTO,
+    FileLookupMode,
+    compute_content_hash,
+)
+from models_src.repositories.code_chunks_cursor import next_search_cursor
 from models_src.test_doubles.repositories.code_chunks import (
     EMBED_DIM,
     FakeCodeChunksStore,
     StubCodeChunksStore,
-    ZERO_NORM_TOLERANCE,
 )
+from models_src.test_doubles.repositories.similarity import ZERO_NORM_TOLERANCE
 
 
 def k_hot_vectors(indices: list[int], dim: int = EMBED_DIM, normalize: bool = True) -> list[float]:
@@ -52,7 +65,8 @@ def make_code_chunk_response(**kwargs) -> CodeChunksResponseDTO:
         commit_number=kwargs.get("commit_number", "abc123"),
         embedding=kwargs.get("embedding") if kwargs.get("embedding") else k_hot_vectors([0]),
         metadata=kwargs.get("metadata", {}),
-        created_at=kwargs.get("created_at", now)
+        created_at=kwargs.get("created_at", now),
+        chunk_ordinal=kwargs.get("chunk_ordinal"),
     )
 
 
@@ -111,6 +125,56 @@ class TestFakeCodeChunksStore:
         result = await fake.find_all_by_repo_id_with_limit(repo_id="not-there", limit=5)
         assert result == []
 
+    async def test_stream_all_by_repo_id_projects_columns(self):
+        fake = FakeCodeChunksStore()
+        r1 = make_code_chunk_response(repo_id="r1", content="a")
+        r2 = make_code_chunk_response(repo_id="r2", content="b")
+        r3 = make_code_chunk_response(repo_id="r1", content="c")
+        fake.set_fake_data([r1, r2, r3])
+
+        out = [dto async for dto in fake.stream_all_by_repo_id(repo_id="r1", columns=["id", "content"])]
+
+        assert [(d.id, d.content) for d in out] == [(r1.id, "a"), (r3.id, "c")]
+        assert all(d.embedding is None and d.repo_id is None for d in out)
+
+        with pytest.raises(ValueError):
+            async for _ in fake.stream_all_by_repo_id(repo_id="r1", columns=["nope"]):
+                pass
+
+    async def test_save_commit_file_diff_only_replaces_touched_files(self):
+        fake = FakeCodeChunksStore()
+        untouched = make_code_chunk_response(file_path="keep.py", commit_number="c1")
+        changed = make_code_chunk_response(file_path="a.py", commit_number="c1")
+        deleted = make_code_chunk_response(file_path="gone.py", commit_number="c1")
+        other_repo = make_code_chunk_response(repo_id="other", file_path="a.py", commit_number="c1")
+        fake.set_fake_data([untouched, changed, deleted, other_repo])
+
+        new_chunk = CodeChunksRequestDTO(
+            user_id="user1",
+            repo_id="repo1",
+            content="print('v2')",
+            file_name="a.py",
+            file_path="a.py",
+            file_size=11,
+            commit_number="c2",
+        )
+        out = await fake.save_commit_file_diff(
+            CodeChunksFileDiffRequestDTO(
+                user_id="user1",
+                repo_id="repo1",
+                commit_number="c2",
+                changed_file_paths={"a.py"},
+                deleted_file_paths={"gone.py"},
+                chunks=[new_chunk],
+            )
+        )
+
+        assert out.deleted_count == 2
+        assert [c.content for c in out.saved] == ["print('v2')"]
+        assert fake.total_count == 3
+        assert untouched in fake.data_store and other_repo in fake.data_store
+        assert changed not in fake.data_store and deleted not in fake.data_store
+
     async def test_get_repo_file_chunks(self):
         fake = FakeCodeChunksStore()
 
@@ -135,6 +199,118 @@ class TestFakeCodeChunksStore:
         )
         assert [{"content": chk_2.content}, {"content": chk_1.content}] == result
 
+    async def test_diversified_search_caps_chunks_per_file(self):
+        fake = FakeCodeChunksStore()
+        query = k_hot_vectors([0])
+        fake.set_fake_data(
+            [
+                make_code_chunk_response(file_path="a.py", content="a0", embedding=k_hot_vectors([0])),
+                make_code_chunk_response(file_path="a.py", content="a1", embedding=k_hot_vectors([0, 1])),
+                make_code_chunk_response(file_path="b.py", content="b0", embedding=k_hot_vectors([0, 1, 2])),
+            ]
+        )
+
+        plain = await fake.get_user_repo_chunks_multi("user1", "repo1", [query], EMBED_DIM, limit=2)
+        capped = await fake.get_user_repo_chunks_multi(
+            "user1", "repo1", [query], EMBED_DIM, limit=2,
+            options=CodeChunksSearchOptions(mmr_lambda=0.7, max_chunks_per_file=1),
+        )
+
+        assert [r["content"] for r in plain] == ["a0", "a1"]
+        assert [r["content"] for r in capped] == ["a0", "b0"]
+        assert "embedding" not in capped[0]
+
+        # the multi repo and hybrid searches aren't diversified, they reject the options
+        diversified = CodeChunksSearchOptions(max_chunks_per_file=1)
+        assert await fake.get_user_repos_chunks_multi("user1", None, [query], EMBED_DIM, options=diversified) == []
+        assert await fake.get_user_repo_chunks_hybrid(
+            "user1", "repo1", "a0", [query], EMBED_DIM, options=diversified
+        ) == []
+
+    async def test_embeddings_mutated_in_place_are_scored_again(self):
+        fake = FakeCodeChunksStore()
+        fake.set_fake_data([make_code_chunk_response(content="a", embedding=k_hot_vectors([0]))])
+        query = [k_hot_vectors([0])]
+        assert (await fake.get_user_repo_chunks_multi("user1", "repo1", query, EMBED_DIM))[0]["max_sim"] == 1.0
+
+        fake.data_store[0].embedding[:] = k_hot_vectors([1])
+
+        out = await fake.get_user_repo_chunks_multi("user1", "repo1", query, EMBED_DIM)
+        assert out[0]["max_sim"] == 0.0
+
+    @pytest.mark.parametrize("strategy", [ChunkSearchStrategy.EXACT, ChunkSearchStrategy.CANDIDATES])
+    async def test_min_similarity_prunes_weak_matches(self, strategy):
+        fake = FakeCodeChunksStore()
+        fake.set_fake_data(
+            [
+                make_code_chunk_response(content="same", embedding=k_hot_vectors([0])),
+                make_code_chunk_response(content="close", embedding=k_hot_vectors([0, 1])),
+                make_code_chunk_response(content="far", embedding=k_hot_vectors([1])),
+            ]
+        )
+
+        out = await fake.get_user_repo_chunks_multi(
+            "user1", "repo1", [k_hot_vectors([0])], EMBED_DIM, limit=3,
+            options=CodeChunksSearchOptions(strategy=strategy, min_similarity=0.5),
+        )
+
+        assert [r["content"] for r in out] == ["same", "close"]
+        stats = fake.similarity_pruning_stats
+        assert (stats.searches, stats.scored, stats.pruned) == (1, 3, 1)
+
+    async def test_pages_follow_the_cursor_without_gaps_or_repeats(self):
+        fake = FakeCodeChunksStore()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # ties on every score and created_at, only the id tells them apart
+        fake.set_fake_data(
+            [make_code_chunk_response(content=f"c{i}", embedding=k_hot_vectors([i % 3]), created_at=now) for i in range(7)]
+        )
+        query = [k_hot_vectors([0])]
+        everything = await fake.get_user_repo_chunks_multi("user1", "repo1", query, EMBED_DIM, limit=7)
+
+        pages, after = [], None
+        while True:
+            page = await fake.get_user_repo_chunks_multi(
+                "user1", "repo1", query, EMBED_DIM, limit=3, options=CodeChunksSearchOptions(after=after)
+            )
+            pages.append(page)
+            after = next_search_cursor(page, 3)
+            if after is None:
+                break
+
+        assert [len(p) for p in pages] == [3, 3, 1]
+        assert [r["id"] for p in pages for r in p] == [r["id"] for r in everything]
+
+    async def test_get_repo_file_chunks_modes_return_source_order(self):
+        fake = FakeCodeChunksStore()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        second = make_code_chunk_response(
+            file_name="Parser.py", file_path="src/Parser.py", content="b", chunk_ordinal=1, created_at=now
+        )
+        first = make_code_chunk_response(
+            file_name="Parser.py", file_path="src/Parser.py", content="a", chunk_ordinal=0, created_at=now
+        )
+        other = make_code_chunk_response(
+            file_name="parser_utils.py", file_path="src/parser_utils.py", content="u", chunk_ordinal=0, created_at=now
+        )
+        fake.set_fake_data([second, other, first])
+        scope = {"user_id": first.user_id, "repo_id": first.repo_id}
+
+        exact = await fake.get_repo_file_chunks(**scope, file_name="parser.py", mode=FileLookupMode.EXACT)
+        assert exact == [
+            {"file_path": "src/Parser.py", "chunk_ordinal": 0, "content": "a"},
+            {"file_path": "src/Parser.py", "chunk_ordinal": 1, "content": "b"},
+        ]
+
+        prefix = await fake.get_repo_file_chunks(**scope, file_name="PARSER", mode=FileLookupMode.PREFIX)
+        assert [r["content"] for r in prefix] == ["a", "b", "u"]
+
+        trigram = await fake.get_repo_file_chunks(**scope, file_name="utils", mode=FileLookupMode.TRIGRAM)
+        assert [r["content"] for r in trigram] == ["u"]
+
+        assert await fake.get_repo_file_content(**scope, file_path="src/Parser.py") == "ab"
+        assert await fake.get_repo_file_content(**scope, file_path="missing.py") is None
+
     async def test_get_user_repo_chunks_multi_success(self):
         """
         Two queries; one doc overlaps with both -> highest fusion_score.
@@ -212,6 +388,234 @@ class TestFakeCodeChunksStore:
         out = await fake.get_user_repo_chunks_multi(**kwargs)
         assert out == []
 
+    async def test_get_user_repo_chunks_multi_candidates_only_fuses_top_k_per_query(self):
+        fake = FakeCodeChunksStore()
+
+        q1 = k_hot_vectors([0])
+        q2 = k_hot_vectors([4])
+
+        # best for q1, not a q2 candidate
+        doc_A = make_code_chunk_response(file_name="A", embedding=k_hot_vectors([0]))
+        # best for q2, not a q1 candidate
+        doc_B = make_code_chunk_response(file_name="B", embedding=k_hot_vectors([4]))
+        # decent for both -> candidate of both queries
+        doc_C = make_code_chunk_response(file_name="C", embedding=k_hot_vectors([0, 4, 5]))
+        # no embedding -> never a candidate
+        doc_D = make_code_chunk_response(file_name="D")
+        doc_D.embedding = None
+
+        fake.set_fake_data([doc_A, doc_B, doc_C, doc_D])
+
+        out = await fake.get_user_repo_chunks_multi(
+            user_id=doc_A.user_id,
+            repo_id=doc_A.repo_id,
+            query_embeddings=[q1, q2],
+            emb_dim=EMBED_DIM,
+            limit=2,
+            options=CodeChunksSearchOptions(
+                strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.RRF, candidates_per_query=2
+            ),
+        )
+
+        # k=2: q1 candidates are [A, C], q2 candidates are [B, C]
+        assert len(out) == 2
+        # C is ranked 2nd for both queries -> 2 / (60 + 2)
+        assert out[0]["file_name"] == "C"
+        assert math.isclose(out[0]["fusion_score"], 2 / 62, abs_tol=ZERO_NORM_TOLERANCE)
+        # A and B are ranked 1st for a single query -> 1 / (60 + 1)
+        assert out[1]["file_name"] in {"A", "B"}
+        assert math.isclose(out[1]["fusion_score"], 1 / 61, abs_tol=ZERO_NORM_TOLERANCE)
+
+        out = await fake.get_user_repo_chunks_multi(
+            user_id=doc_A.user_id,
+            repo_id=doc_A.repo_id,
+            query_embeddings=[q1, q2],
+            emb_dim=EMBED_DIM,
+            limit=1,
+            options=CodeChunksSearchOptions(
+                strategy=ChunkSearchStrategy.CANDIDATES, fusion=ChunkFusion.MAX, candidates_per_query=1
+            ),
+        )
+        # k=1: A is the only q1 candidate, B the only q2 one, both with max_sim 1.0
+        assert len(out) == 1 and out[0]["file_name"] in {"A", "B"}
+        assert math.isclose(out[0]["fusion_score"], 1.0, abs_tol=ZERO_NORM_TOLERANCE)
+
+    async def test_get_user_repo_chunks_multi_binary_reranks_the_hamming_prefilter(self):
+        fake = FakeCodeChunksStore()
+
+        query = k_hot_vectors([0])
+        # closest by cosine, but every bit set -> farthest by Hamming distance
+        precise = [1.0] + [0.01] * (EMBED_DIM - 1)
+        doc_precise = make_code_chunk_response(file_name="precise", embedding=precise)
+        # same bits as the query, lower cosine
+        coarse = [0.5, -0.5, -0.5, -0.5, -0.5] + [0.0] * (EMBED_DIM - 5)
+        doc_coarse = make_code_chunk_response(file_name="coarse", embedding=coarse)
+        fake.set_fake_data([doc_precise, doc_coarse])
+
+        async def search(oversampling):
+            return await fake.get_user_repo_chunks_multi(
+                user_id=doc_precise.user_id,
+                repo_id=doc_precise.repo_id,
+                query_embeddings=[query],
+                emb_dim=EMBED_DIM,
+                limit=1,
+                options=CodeChunksSearchOptions(
+                    strategy=ChunkSearchStrategy.BINARY, candidates_per_query=1, oversampling=oversampling
+                ),
+            )
+
+        # prefilter of 1 row: only the Hamming-closest chunk survives
+        assert [r["file_name"] for r in await search(oversampling=1)] == ["coarse"]
+        # prefilter of 2 rows: the exact cosine re-ranking picks the closest one
+        out = await search(oversampling=2)
+        assert [r["file_name"] for r in out] == ["precise"]
+        # 0.01 isn't exact in float32, the precision pgvector (and the fake) computes with
+        assert math.isclose(out[0]["max_sim"], 1 / math.sqrt(1 + 767 * 0.0001), abs_tol=1e-6)
+
+    async def test_search_projection_and_fetch_contents_by_ids(self):
+        fake = FakeCodeChunksStore()
+        near = make_code_chunk_response(file_name="near", content="near body", embedding=k_hot_vectors([0]))
+        far = make_code_chunk_response(file_name="far", content="far body", embedding=k_hot_vectors([0, 1]))
+        fake.set_fake_data([near, far])
+
+        hits = await fake.get_user_repo_chunks_multi(
+            user_id="user1",
+            repo_id="repo1",
+            query_embeddings=[k_hot_vectors([0])],
+            emb_dim=EMBED_DIM,
+            options=CodeChunksSearchOptions(projection=ChunkProjection.IDS),
+        )
+        assert [set(row) for row in hits] == [{"id", "created_at", "fusion_score", "max_sim"}] * 2
+
+        hits = await fake.get_user_repo_chunks_multi(
+            user_id="user1",
+            repo_id="repo1",
+            query_embeddings=[k_hot_vectors([0])],
+            emb_dim=EMBED_DIM,
+            options=CodeChunksSearchOptions(projection=ChunkProjection.METADATA),
+        )
+        assert "content" not in hits[0] and hits[0]["metadata"] == near.metadata
+
+        contents = await fake.fetch_contents_by_ids("user1", [far.id, uuid.uuid4(), near.id])
+        assert [row["content"] for row in contents] == ["far body", "near body"]
+        assert await fake.fetch_contents_by_ids("someone-else", [near.id]) == []
+
+    async def test_delete_all_by_repo_id_only_removes_that_repo(self):
+        fake = FakeCodeChunksStore()
+        fake.set_fake_data(
+            [make_code_chunk_response(repo_id="r1"), make_code_chunk_response(repo_id="r1"), make_code_chunk_response(repo_id="r2")]
+        )
+
+        assert await fake.delete_all_by_repo_id("r1") == 2
+        assert [c.repo_id for c in fake.data_store] == ["r2"] and fake.total_count == 1
+        assert await fake.delete_all_by_repo_id("r1") == 0
+
+    async def test_batch_get_user_repo_chunks_multi_is_aligned_with_the_requests(self):
+        fake = FakeCodeChunksStore()
+        fake.set_fake_data(
+            [
+                make_code_chunk_response(user_id="a", repo_id="r", file_name="a", embedding=k_hot_vectors([0])),
+                make_code_chunk_response(user_id="b", repo_id="r", file_name="b", embedding=k_hot_vectors([1])),
+            ]
+        )
+
+        def request(user_id, **kwargs):
+            return CodeChunksSearchRequestDTO(
+                user_id=user_id, repo_id="r", query_embeddings=[k_hot_vectors([0])], **kwargs
+            )
+
+        out = await fake.batch_get_user_repo_chunks_multi(
+            [request("b"), request("a", limit=0), request("a")], emb_dim=EMBED_DIM
+        )
+        assert [[r["file_name"] for r in rows] for rows in out] == [["b"], [], ["a"]]
+        assert [name for name, _, _ in fake.received_calls] == ["batch_get_user_repo_chunks_multi"]
+
+    async def test_get_user_repos_chunks_multi_spans_repos_with_per_repo_cap(self):
+        fake = FakeCodeChunksStore()
+
+        query = k_hot_vectors([0])
+        big_repo = [
+            make_code_chunk_response(repo_id="big", file_name=f"big{i}", embedding=k_hot_vectors([0, i + 1]))
+            for i in range(3)
+        ]
+        small_repo = [make_code_chunk_response(repo_id="small", file_name="small", embedding=k_hot_vectors([0, 9, 10]))]
+        other_user = [make_code_chunk_response(user_id="someone-else", repo_id="big", embedding=query)]
+        fake.set_fake_data(big_repo + small_repo + other_user)
+
+        out = await fake.get_user_repos_chunks_multi(
+            user_id="user1", repo_ids=None, query_embeddings=[query], emb_dim=EMBED_DIM, limit=3
+        )
+        assert [r["repo_id"] for r in out] == ["big", "big", "big"]
+
+        out = await fake.get_user_repos_chunks_multi(
+            user_id="user1", repo_ids=None, query_embeddings=[query], emb_dim=EMBED_DIM, limit=3, per_repo_limit=2
+        )
+        assert [r["repo_id"] for r in out] == ["big", "big", "small"]
+
+        out = await fake.get_user_repos_chunks_multi(
+            user_id="user1", repo_ids=["small"], query_embeddings=[query], emb_dim=EMBED_DIM, limit=3
+        )
+        assert [r["file_name"] for r in out] == ["small"]
+
+    async def test_get_user_repo_chunks_hybrid_fuses_identifier_matches_with_vector_hits(self):
+        fake = FakeCodeChunksStore()
+
+        query = k_hot_vectors([0])
+        # exact identifier, unrelated embedding -> lexical only
+        doc_lexical = make_code_chunk_response(
+            file_name="lexical", content="def resolve_stream_columns(columns): ...", embedding=k_hot_vectors([9])
+        )
+        # semantically closest, no identifier -> vector only
+        doc_vector = make_code_chunk_response(file_name="vector", content="pick the columns", embedding=query)
+        # both
+        doc_both = make_code_chunk_response(
+            file_name="both", content="resolve_stream_columns(None)", embedding=k_hot_vectors([0, 1])
+        )
+        fake.set_fake_data([doc_lexical, doc_vector, doc_both])
+
+        out = await fake.get_user_repo_chunks_hybrid(
+            user_id=doc_lexical.user_id,
+            repo_id=doc_lexical.repo_id,
+            query_text="resolve_stream_columns",
+            query_embeddings=[query],
+            emb_dim=EMBED_DIM,
+            limit=2,
+            options=CodeChunksSearchOptions(candidates_per_query=2),
+        )
+
+        # k=2: vector ranks [vector, both], lexical ranks [lexical, both]
+        assert out[0]["file_name"] == "both"
+        assert math.isclose(out[0]["fusion_score"], 2 / 62, abs_tol=ZERO_NORM_TOLERANCE)
+        # lexical and vector tie on 1 / 61
+        assert out[1]["file_name"] in {"lexical", "vector"}
+        assert math.isclose(out[1]["fusion_score"], 1 / 61, abs_tol=ZERO_NORM_TOLERANCE)
+
+        # text only: lexical matches, without similarity
+        out = await fake.get_user_repo_chunks_hybrid(
+            user_id=doc_lexical.user_id,
+            repo_id=doc_lexical.repo_id,
+            query_text="resolve_stream_columns",
+            query_embeddings=[],
+            emb_dim=EMBED_DIM,
+            limit=3,
+        )
+        assert {r["file_name"] for r in out} == {"lexical", "both"}
+        assert all(r["max_sim"] is None for r in out)
+
+    async def test_get_user_repo_chunks_multi_rejects_invalid_strategy_options(self):
+        fake = FakeCodeChunksStore()
+        fake.set_fake_data([make_code_chunk_response()])
+
+        out = await fake.get_user_repo_chunks_multi(
+            user_id="user1",
+            repo_id="repo1",
+            query_embeddings=[k_hot_vectors([0])],
+            emb_dim=EMBED_DIM,
+            limit=5,
+            options=CodeChunksSearchOptions(fusion=ChunkFusion.RRF),
+        )
+        assert out == []
+
     async def test_bulk_save_inserts_data(self):
         fake = FakeCodeChunksStore()
 
@@ -239,6 +643,92 @@ class TestFakeCodeChunksStore:
             assert res.created_at is not None
             assert res.repo_id == dto_list[index].repo_id
 
+    async def test_bulk_copy_save_returns_ids_of_stored_chunks(self):
+        fake = FakeCodeChunksStore()
+
+        dto_list = [
+            CodeChunksRequestDTO(
+                user_id="u1",
+                repo_id="r1",
+                content=f"print({i})",
+                file_name="main.py",
+                file_path="/main.py",
+                file_size=10,
+                commit_number="commit1",
+            )
+            for i in range(3)
+        ]
+
+        ids = await fake.bulk_copy_save(create_model=dto_list)
+
+        assert fake.total_count == 3
+        assert ids == [c.id for c in fake.data_store]
+        assert [c.content for c in fake.data_store] == [d.content for d in dto_list]
+
+    async def test_chunk_stats_follow_the_writes(self):
+        fake = FakeCodeChunksStore()
+
+        def make(file_path, commit, embedding=None):
+            return CodeChunksRequestDTO(
+                user_id="u1", repo_id="r1", content="abcd", file_name=file_path, file_path=file_path,
+                file_size=4, commit_number=commit, embedding=embedding,
+            )
+
+        await fake.bulk_save([make("a.py", "c1", k_hot_vectors([0])), make("a.py", "c1"), make("b.py", "c1")])
+        await fake.save(make("b.py", "c2"))
+
+        repo = await fake.get_repo_chunk_stats("r1")
+        assert (repo.chunk_count, repo.embedded_count, repo.content_bytes, repo.file_count) == (4, 1, 16, 2)
+        assert (await fake.get_commit_chunk_stats("r1", "c2")).file_count == 1
+
+        await fake.delete_all_by_repo_id("r1")
+        assert await fake.get_repo_chunk_stats("r1") is None
+
+    async def test_purge_repo_chunks_deletes_by_batches(self):
+        fake = FakeCodeChunksStore()
+        fake.set_fake_data(
+            [make_code_chunk_response(repo_id="r1") for _ in range(5)] + [make_code_chunk_response(repo_id="r2")]
+        )
+        reported = []
+
+        progress = await fake.purge_repo_chunks("r1", batch_size=2, pause=0, on_progress=reported.append)
+
+        assert (progress.deleted_count, progress.batches, progress.total_estimate) == (5, 3, 5)
+        assert [p.deleted_count for p in reported] == [2, 4, 5, 5] and reported[-1].done
+        assert [row.repo_id for row in fake.data_store] == ["r2"]
+
+    async def test_find_embeddings_by_content_hashes_reuses_across_repos(self):
+        fake = FakeCodeChunksStore()
+
+        shared_embedding = generate_random_vector()
+        await fake.bulk_save(
+            create_model=[
+                CodeChunksRequestDTO(
+                    user_id="u1",
+                    repo_id=repo_id,
+                    content="def shared(): pass",
+                    file_name="a.py",
+                    file_path="/a.py",
+                    file_size=10,
+                    commit_number="commit1",
+                    embedding=shared_embedding,
+                )
+                for repo_id in ("r1", "r2")
+            ]
+        )
+        assert fake.data_store[0].content_hash == compute_content_hash("def shared(): pass")
+
+        shared_hash = compute_content_hash("def shared(): pass")
+        new_hash = compute_content_hash("def brand_new(): pass")
+
+        found = await fake.find_embeddings_by_content_hashes([shared_hash, new_hash, shared_hash])
+        assert found == {shared_hash: shared_embedding}
+        assert await fake.find_embeddings_by_content_hashes([shared_hash], user_id="u2") == {}
+
+        stats = fake.embedding_reuse_stats
+        assert (stats.lookups, stats.requested, stats.hits) == (2, 3, 1)
+        assert stats.hit_rate == pytest.approx(1 / 3)
+
 
 @pytest.mark.asyncio
 class TestStubCodeChunksStore:
@@ -247,9 +737,20 @@ class TestStubCodeChunksStore:
 
         save = stub.save
         bulk_save = stub.bulk_save
+        bulk_copy_save = stub.bulk_copy_save
         find_all_by_repo_id_with_limit = stub.find_all_by_repo_id_with_limit
+        stream_all_by_repo_id = stub.stream_all_by_repo_id
+        save_commit_file_diff = stub.save_commit_file_diff
+        find_embeddings_by_content_hashes = stub.find_embeddings_by_content_hashes
         get_repo_file_chunks = stub.get_repo_file_chunks
         get_user_repo_chunks_multi = stub.get_user_repo_chunks_multi
+        get_user_repo_chunks_hybrid = stub.get_user_repo_chunks_hybrid
+        get_user_repos_chunks_multi = stub.get_user_repos_chunks_multi
+        batch_get_user_repo_chunks_multi = stub.batch_get_user_repo_chunks_multi
+        delete_all_by_repo_id = stub.delete_all_by_repo_id
+        fetch_contents_by_ids = stub.fetch_contents_by_ids
+        get_repo_file_content = stub.get_repo_file_content
+        purge_repo_chunks = stub.purge_repo_chunks
 
         generated = make_code_chunk_response()
 
@@ -262,16 +763,38 @@ class TestStubCodeChunksStore:
         expected = {
             save.__name__: generated,
             bulk_save.__name__: [generated],
+            bulk_copy_save.__name__: [generated.id],
             find_all_by_repo_id_with_limit.__name__: [generated, generated],
+            stream_all_by_repo_id.__name__: [generated],
+            save_commit_file_diff.__name__: CodeChunksFileDiffResponseDTO(deleted_count=1, saved=[generated]),
+            find_embeddings_by_content_hashes.__name__: {"h1": generated.embedding},
             get_repo_file_chunks.__name__: [{"content": generated.content}, {"content": generated.content}],
             get_user_repo_chunks_multi.__name__: multi_resp,
+            get_user_repo_chunks_hybrid.__name__: multi_resp,
+            get_user_repos_chunks_multi.__name__: [{**row, "repo_id": generated.repo_id} for row in multi_resp],
+            batch_get_user_repo_chunks_multi.__name__: [multi_resp, []],
+            delete_all_by_repo_id.__name__: 2,
+            fetch_contents_by_ids.__name__: [{"id": generated.id, "content": generated.content}],
+            get_repo_file_content.__name__: generated.content,
+            purge_repo_chunks.__name__: CodeChunksPurgeProgressDTO(repo_id="r1", deleted_count=2, batches=1, done=True),
         }
 
         stub.set_output(save, expected[save.__name__])
         stub.set_output(bulk_save, expected[bulk_save.__name__])
+        stub.set_output(bulk_copy_save, expected[bulk_copy_save.__name__])
         stub.set_output(find_all_by_repo_id_with_limit, expected[find_all_by_repo_id_with_limit.__name__])
+        stub.set_output(stream_all_by_repo_id, expected[stream_all_by_repo_id.__name__])
+        stub.set_output(save_commit_file_diff, expected[save_commit_file_diff.__name__])
+        stub.set_output(find_embeddings_by_content_hashes, expected[find_embeddings_by_content_hashes.__name__])
         stub.set_output(get_repo_file_chunks, expected[get_repo_file_chunks.__name__])
         stub.set_output(get_user_repo_chunks_multi, expected[get_user_repo_chunks_multi.__name__])
+        stub.set_output(get_user_repo_chunks_hybrid, expected[get_user_repo_chunks_hybrid.__name__])
+        stub.set_output(get_user_repos_chunks_multi, expected[get_user_repos_chunks_multi.__name__])
+        stub.set_output(batch_get_user_repo_chunks_multi, expected[batch_get_user_repo_chunks_multi.__name__])
+        stub.set_output(delete_all_by_repo_id, expected[delete_all_by_repo_id.__name__])
+        stub.set_output(fetch_contents_by_ids, expected[fetch_contents_by_ids.__name__])
+        stub.set_output(get_repo_file_content, expected[get_repo_file_content.__name__])
+        stub.set_output(purge_repo_chunks, expected[purge_repo_chunks.__name__])
 
         await save(
             create_model=CodeChunksRequestDTO(
@@ -299,8 +822,22 @@ class TestStubCodeChunksStore:
             ]
         )
 
+        assert await bulk_copy_save(create_model=[]) == [generated.id]
+
         await find_all_by_repo_id_with_limit(repo_id=generated.repo_id, limit=100)
+        assert await delete_all_by_repo_id(repo_id=generated.repo_id) == 2
+        assert (await purge_repo_chunks(repo_id=generated.repo_id)).deleted_count == 2
+        await fetch_contents_by_ids(user_id=generated.user_id, ids=[generated.id])
+        assert [c async for c in stream_all_by_repo_id(repo_id=generated.repo_id)] == [generated]
+        await save_commit_file_diff(
+            diff=CodeChunksFileDiffRequestDTO(user_id="u1", repo_id="r1", commit_number="c2")
+        )
+        await find_embeddings_by_content_hashes(content_hashes=["h1"])
         await get_repo_file_chunks(user_id=generated.user_id, repo_id=generated.repo_id, file_name=generated.file_name)
+        assert (
+            await get_repo_file_content(user_id=generated.user_id, repo_id=generated.repo_id, file_path="/main.py")
+            == generated.content
+        )
 
         await get_user_repo_chunks_multi(
             user_id=generated.user_id,
@@ -309,5 +846,26 @@ class TestStubCodeChunksStore:
             emb_dim=768,
             limit=5,
         )
+        await get_user_repo_chunks_hybrid(
+            user_id=generated.user_id,
+            repo_id=generated.repo_id,
+            query_text="print",
+            query_embeddings=[k_hot_vectors([2, 3])],
+            emb_dim=768,
+        )
+        await get_user_repos_chunks_multi(
+            user_id=generated.user_id,
+            repo_ids=None,
+            query_embeddings=[k_hot_vectors([2, 3])],
+            emb_dim=768,
+        )
+        await batch_get_user_repo_chunks_multi(
+            requests=[
+                CodeChunksSearchRequestDTO(
+                    user_id=generated.user_id, repo_id=generated.repo_id, query_embeddings=[k_hot_vectors([2, 3])]
+                )
+            ],
+            emb_dim=768,
+        )
 
         assert expected == stub._outputs
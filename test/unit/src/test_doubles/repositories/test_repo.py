@@ -195,6 +195,29 @@ class TestFakeRepoStore:
         assert updated == 1
         assert a.status == "completed"
 
+    async def test_increment_progress_counters_by_id_accumulates(self):
+        store = FakeRepoStore()
+        a = make_repo_response(id=uuid.uuid4(), user_id="u1", total_files=1, total_chunks=2)
+        store.set_fake_data([a])
+
+        assert await store.increment_progress_counters_by_id("", total_chunks=1) == -1
+        assert await store.increment_progress_counters_by_id("missing", total_chunks=1) == 0
+        assert await store.increment_progress_counters_by_id(str(a.id)) == 0
+
+        assert await store.increment_progress_counters_by_id(str(a.id), 2, 10, 8) == 1
+        assert await store.increment_progress_counters_by_id(str(a.id), total_chunks=5) == 1
+        assert (a.total_files, a.total_chunks, a.total_embeddings) == (3, 17, 8)
+
+    async def test_reset_progress_counters_by_id(self):
+        store = FakeRepoStore()
+        a = make_repo_response(id=uuid.uuid4(), user_id="u1", total_files=1, total_chunks=2)
+        store.set_fake_data([a])
+
+        assert await store.reset_progress_counters_by_id(" ") == -1
+        assert await store.reset_progress_counters_by_id("missing") == 0
+        assert await store.reset_progress_counters_by_id(str(a.id)) == 1
+        assert (a.total_files, a.total_chunks, a.total_embeddings) == (0, 0, 0)
+
     async def test_save_context_creates_pending_and_id(self):
         store = FakeRepoStore()
         res = await store.save_context(repo_id="rid-ctx", user_id="u1", config={"x": 1})
@@ -390,6 +413,8 @@ class TestStubRepoStoreStore:
         find_by_user_id_and_html_url = stub.find_by_user_id_and_html_url
         save_context = stub.save_context
         update_repo_system_reference_by_id = stub.update_repo_system_reference_by_id
+        increment_progress_counters_by_id = stub.increment_progress_counters_by_id
+        reset_progress_counters_by_id = stub.reset_progress_counters_by_id
         count_by_user_id = stub.count_by_user_id
         find_by_user_and_path = stub.find_by_user_and_path
 
@@ -404,6 +429,8 @@ class TestStubRepoStoreStore:
             find_by_user_id_and_html_url.__name__: generated_response,
             save_context.__name__: generated_response,
             update_repo_system_reference_by_id.__name__: 1,
+            increment_progress_counters_by_id.__name__: 1,
+            reset_progress_counters_by_id.__name__: 1,
             count_by_user_id.__name__: 500,
             find_by_user_and_path.__name__: generated_response
         }
@@ -416,6 +443,8 @@ class TestStubRepoStoreStore:
         stub.set_output(find_by_user_id_and_html_url, expected_result.get(find_by_user_id_and_html_url.__name__))
         stub.set_output(save_context, expected_result.get(save_context.__name__))
         stub.set_output(update_repo_system_reference_by_id, expected_result.get(update_repo_system_reference_by_id.__name__))
+        stub.set_output(increment_progress_counters_by_id, expected_result.get(increment_progress_counters_by_id.__name__))
+        stub.set_output(reset_progress_counters_by_id, expected_result.get(reset_progress_counters_by_id.__name__))
         stub.set_output(count_by_user_id, expected_result.get(count_by_user_id.__name__))
         stub.set_output(find_by_user_and_path, expected_result.get(find_by_user_and_path.__name__))
 
@@ -466,6 +495,8 @@ class TestStubRepoStoreStore:
         await find_by_user_id_and_html_url(user_id=generated_response.user_id, html_url=generated_response.html_url)
         await save_context(repo_id=generated_response.repo_id, user_id=generated_response.user_id, config={})
         await update_repo_system_reference_by_id(id=str(generated_response.id), repo_system_reference=generated_response.repo_system_reference)
+        assert await increment_progress_counters_by_id(id=str(generated_response.id), total_chunks=3) == 1
+        assert await reset_progress_counters_by_id(id=str(generated_response.id)) == 1
         await count_by_user_id(user_id=generated_response.user_id)
         await find_by_user_and_path(user_id=generated_response.user_id, relative_path=generated_response.relative_path)
 
@@ -0,0 +1,102 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from models_src.dto.code_chunks import CodeChunksRequestDTO
+from models_src.test_doubles.repositories.code_chunks import EMBED_DIM, FakeCodeChunksStore
+from models_src.test_doubles.repositories.similarity import EmbeddingMatrix
+
+
+def random_vector(rng: random.Random, dim: int = EMBED_DIM) -> list[float]:
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+def python_cosine(a, b) -> float:
+    return sum(x * y for x, y in zip(a, b)) / (math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b)))
+
+
+class TestEmbeddingMatrix:
+    def test_matches_the_pairwise_cosine(self):
+        rng = random.Random(0)
+        rows = [random_vector(rng) for _ in range(20)]
+        queries = [random_vector(rng) for _ in range(3)]
+
+        sims = EmbeddingMatrix(rows, EMBED_DIM).cosine(queries)
+
+        assert sims.shape == (20, 3) and sims.dtype == np.float64
+        for i, row in enumerate(rows):
+            for j, query in enumerate(queries):
+                assert math.isclose(sims[i, j], python_cosine(row, query), abs_tol=1e-6)
+
+    def test_unusable_rows_and_queries_score_minus_infinity(self):
+        matrix = EmbeddingMatrix([[1.0, 0.0], None, [0.0, 0.0], [1.0]], dim=2)
+
+        sims = matrix.cosine([[1.0, 0.0], [0.0, 0.0]])
+
+        assert sims[0, 0] == 1.0
+        assert np.isneginf(sims[1:, 0]).all()
+        assert np.isneginf(sims[:, 1]).all()
+
+    def test_rows_subset_keeps_the_requested_order(self):
+        matrix = EmbeddingMatrix([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0]], dim=2)
+
+        sims = matrix.cosine([[1.0, 0.0]], rows=[2, 0])
+
+        assert sims[:, 0].tolist() == [-1.0, 1.0]
+        assert matrix.cosine([[1.0, 0.0]], rows=[]).shape == (0, 1)
+
+
+@pytest.mark.asyncio
+class TestFakeCodeChunksStoreScoring:
+    async def test_exact_search_matches_the_pure_python_ranking(self):
+        rng = random.Random(1)
+        fake = FakeCodeChunksStore()
+        chunks = [
+            CodeChunksRequestDTO(
+                user_id="u",
+                repo_id="r",
+                content=f"chunk {i}",
+                file_name=f"f{i}.py",
+                file_path=f"src/f{i}.py",
+                file_size=1,
+                commit_number="c1",
+                embedding=random_vector(rng),
+            )
+            for i in range(50)
+        ]
+        await fake.bulk_save(chunks)
+        queries = [random_vector(rng) for _ in range(2)]
+
+        out = await fake.get_user_repo_chunks_multi("u", "r", queries, EMBED_DIM, limit=10)
+
+        expected = sorted(
+            ((sum(python_cosine(c.embedding, q) for q in queries), c.content) for c in chunks), reverse=True
+        )[:10]
+        assert [row["content"] for row in out] == [content for _, content in expected]
+        for row, (fusion_score, _) in zip(out, expected):
+            assert math.isclose(row["fusion_score"], fusion_score, abs_tol=1e-5)
+
+    async def test_matrix_follows_the_writes(self):
+        fake = FakeCodeChunksStore()
+        query = [1.0] + [0.0] * (EMBED_DIM - 1)
+
+        def chunk(content, embedding):
+            return CodeChunksRequestDTO(
+                user_id="u",
+                repo_id="r",
+                content=content,
+                file_name="a.py",
+                file_path="src/a.py",
+                file_size=1,
+                commit_number="c1",
+                embedding=embedding,
+            )
+
+        await fake.save(chunk("far", [0.0, 1.0] + [0.0] * (EMBED_DIM - 2)))
+        assert [r["content"] for r in await fake.get_user_repo_chunks_multi("u", "r", [query], EMBED_DIM)] == ["far"]
+
+        await fake.save(chunk("near", query))
+        out = await fake.get_user_repo_chunks_multi("u", "r", [query], EMBED_DIM)
+        assert [r["content"] for r in out] == ["near", "far"]
@@ -3,6 +3,8 @@ from typing import Dict, Any, Optional, List
 import logging
 from contextlib import asynccontextmanager
 
+from models_src.models.db import with_vector_codecs
+
 logger = logging.getLogger(__name__)
 
 
@@ -108,9 +110,14 @@ def get_tortoise_config(
 
 
 async def init_tortoise(config: Dict[str, Any]) -> None:
-    """Initialize Tortoise ORM with configuration."""
+    """
+    Initialize Tortoise ORM with configuration.
+
+    The asyncpg connections get the pgvector binary codec on every pooled connection, which the
+    embedding columns need to be written.
+    """
     try:
-        await Tortoise.init(config=config)
+        await Tortoise.init(config=with_vector_codecs(config))
         logger.info("Tortoise ORM initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize Tortoise ORM: {e}")